@@ -0,0 +1,361 @@
+"""Benchmarks du chemin ETL complet sur données synthétiques.
+
+Mesure le débit (lignes/s) et le pic de mémoire de chaque étape :
+- extract   : fetch_records_in_batches contre le stub HTTP local
+- transform : transform_records
+- derive    : calculate_derived_fields
+- load      : upsert_immobilisations contre la base locale (variables MYSQL_*),
+              pour chaque nombre de connexions d'écriture de --shards
+
+Chaque mesure tourne dans un processus neuf (pic RSS propre à l'étape) ;
+seul l'appel de l'étape est chronométré, la préparation de ses entrées
+(génération, étapes amont) ne l'est pas. Les résultats sont écrits en
+JSON dans benchmarks/results/ avec le commit courant, pour comparaison
+entre commits (--compare).
+
+Usage (depuis etl/) :
+    python benchmarks/bench_etl.py --rows 10k,100k,1M
+    MYSQL_DATABASE=etl_bench python benchmarks/bench_etl.py --rows 100k --stages load --reset-db
+    MYSQL_DATABASE=etl_bench python benchmarks/bench_etl.py --rows 1M --stages load --reset-db --batch-size 20000 --shards 1,2,4,8
+    python benchmarks/bench_etl.py --rows 100k --compare benchmarks/results/<base>.json
+"""
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import multiprocessing
+from typing import Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'src')
+for path in (BENCH_DIR, SRC_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from synthetic import iter_pages  # noqa: E402
+from stub_server import serve  # noqa: E402
+
+STAGES = ('extract', 'transform', 'derive', 'load')
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+# --reset-db vide la table de faits : refusé hors d'une base de benchmark
+# (nom contenant 'bench') sauf confirmation explicite BENCH_ALLOW_RESET=1
+ALLOW_RESET = os.getenv('BENCH_ALLOW_RESET', '') == '1'
+
+
+# ============================================================================
+# MESURES (exécutées dans un processus dédié)
+# ============================================================================
+
+def _proc_status_mb(key: str) -> float:
+    """
+    Lit une mesure mémoire de /proc/self/status (VmRSS, VmHWM) en Mo.
+
+    VmHWM repart de zéro à l'exec du processus de mesure, contrairement à
+    ru_maxrss qui hérite du pic du parent : ru_maxrss ne sert que de repli.
+    """
+    try:
+        with open('/proc/self/status') as fh:
+            for line in fh:
+                if line.startswith(f'{key}:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _prepare(records, stage: str):
+    """Construit, sans la chronométrer, l'entrée de l'étape mesurée."""
+    from transform.transform import transform_records, calculate_derived_fields, add_data_quality_flags
+
+    if stage == 'transform':
+        return records
+    df = transform_records(records)
+    if stage == 'derive':
+        return df
+    return add_data_quality_flags(calculate_derived_fields(df))
+
+
+def _run_stage(stage: str, payload, shards: int = 1):
+    """Exécute l'étape mesurée et retourne le nombre de lignes produites."""
+    from transform.transform import transform_records, calculate_derived_fields
+    from load.load import upsert_immobilisations
+
+    if stage == 'transform':
+        return len(transform_records(payload))
+    if stage == 'derive':
+        return len(calculate_derived_fields(payload))
+    return upsert_immobilisations(payload, shards=shards)
+
+
+def _bench_child(stage: str, rows: int, batch_size: int, seed: int, dirty: float,
+                 url: Optional[str], shards: int, queue) -> None:
+    """Point d'entrée du processus de mesure : envoie le résultat dans `queue`."""
+    try:
+        base_rss = _proc_status_mb('VmRSS')
+        elapsed = 0.0
+        produced = 0
+
+        if stage == 'extract':
+            import extract.extract as extract_module
+            extract_module.SEARCH_URL = url
+            start = time.perf_counter()
+            for batch in extract_module.fetch_records_in_batches(rows=batch_size):
+                produced += len(batch)
+            elapsed = time.perf_counter() - start
+        else:
+            for page in iter_pages(rows, batch_size, seed, dirty):
+                payload = _prepare(page, stage)
+                del page
+                start = time.perf_counter()
+                produced += _run_stage(stage, payload, shards)
+                elapsed += time.perf_counter() - start
+                del payload
+                gc.collect()
+
+        result = {
+            'stage': stage,
+            'rows': rows,
+            'batch_size': batch_size,
+            'rows_out': produced,
+            'wall_s': round(elapsed, 3),
+            'rows_per_s': round(rows / elapsed, 1) if elapsed > 0 else None,
+            'base_rss_mb': round(base_rss, 1),
+            'peak_rss_mb': round(_proc_status_mb('VmHWM'), 1),
+        }
+        if stage == 'load':
+            result['shards'] = shards
+        queue.put(result)
+    except Exception as e:
+        queue.put({'stage': stage, 'rows': rows, 'batch_size': batch_size, 'error': repr(e)})
+
+
+def run_bench(stage: str, rows: int, batch_size: int, seed: int = 42, dirty: float = 0.05,
+              url: Optional[str] = None, shards: int = 1) -> Dict:
+    """
+    Mesure une étape sur `rows` lignes synthétiques dans un processus neuf.
+
+    Returns:
+        Résultat de la mesure (débit, durée, pic RSS) ou erreur
+    """
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_bench_child, args=(stage, rows, batch_size, seed, dirty, url, shards, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+# ============================================================================
+# BASE DE DONNÉES LOCALE
+# ============================================================================
+
+def reset_refusal(db_name: str, allow: bool = ALLOW_RESET) -> Optional[str]:
+    """
+    Raison de refuser --reset-db sur la base `db_name`, None si autorisé.
+    """
+    if allow or 'bench' in db_name.lower():
+        return None
+    return (f"--reset-db would TRUNCATE the fact table of '{db_name}': point MYSQL_DATABASE "
+            f"to a benchmark database (name containing 'bench') or set BENCH_ALLOW_RESET=1")
+
+
+def check_database(reset: bool = False) -> Optional[str]:
+    """
+    Vérifie que la base locale est joignable (et la vide si demandé).
+
+    Returns:
+        None si la base est utilisable, sinon la raison de l'échec
+    """
+    from sqlalchemy import text
+    from load.load import get_engine, ensure_schema
+    from models import Immobilisation
+
+    try:
+        engine = get_engine()
+        ensure_schema(engine)
+        if reset:
+            with engine.begin() as conn:
+                conn.execute(text(f'TRUNCATE TABLE {Immobilisation.__tablename__}'))
+        engine.dispose()
+    except Exception as e:
+        return repr(e)
+    return None
+
+
+# ============================================================================
+# RÉSULTATS
+# ============================================================================
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(['git', *args], cwd=BENCH_DIR, capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def save_results(results: List[Dict], params: Dict, out_dir: str = RESULTS_DIR) -> str:
+    """
+    Écrit les résultats en JSON, avec le commit et l'environnement.
+
+    Returns:
+        Chemin du fichier écrit
+    """
+    commit = _git('rev-parse', '--short', 'HEAD') or 'unknown'
+    document = {
+        'commit': commit,
+        'dirty_tree': bool(_git('status', '--porcelain', '--untracked-files=no')),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'params': params,
+        'results': results,
+    }
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"{time.strftime('%Y%m%dT%H%M%S')}_{commit}.json")
+    with open(path, 'w', encoding='utf-8') as fh:
+        json.dump(document, fh, indent=2, ensure_ascii=False)
+    return path
+
+
+def compare_results(base: Dict, current: List[Dict]) -> List[str]:
+    """
+    Compare le débit de chaque mesure à celui d'un fichier de référence.
+
+    Returns:
+        Lignes du tableau de comparaison
+    """
+    reference = {_result_key(r): r for r in base.get('results', []) if 'error' not in r}
+    lines = [f"{'stage':<10} {'rows':>10} {'base rows/s':>14} {'rows/s':>14} {'ratio':>7}"]
+    for result in current:
+        ref = reference.get(_result_key(result))
+        if ref is None or not result.get('rows_per_s') or not ref.get('rows_per_s'):
+            continue
+        ratio = result['rows_per_s'] / ref['rows_per_s']
+        lines.append(f"{_stage_label(result):<10} {result['rows']:>10,} {ref['rows_per_s']:>14,.0f} "
+                     f"{result['rows_per_s']:>14,.0f} {ratio:>6.2f}x")
+    return lines
+
+
+def _result_key(result: Dict):
+    return result['stage'], result['rows'], result.get('shards', 1)
+
+
+def _stage_label(result: Dict) -> str:
+    """Nom de l'étape, suffixé du nombre de shards pour le chargement parallèle."""
+    shards = result.get('shards', 1)
+    return f"{result['stage']}x{shards}" if shards > 1 else result['stage']
+
+
+def scaling_lines(results: List[Dict]) -> List[str]:
+    """
+    Résume le gain de débit du chargement selon le nombre de shards.
+
+    Returns:
+        Lignes du tableau (débit et accélération par rapport au plus petit N)
+    """
+    lines = []
+    loads = [r for r in results if r['stage'] == 'load' and r.get('rows_per_s')]
+    for rows in sorted({r['rows'] for r in loads}):
+        runs = sorted((r for r in loads if r['rows'] == rows), key=lambda r: r.get('shards', 1))
+        if len(runs) < 2:
+            continue
+        base = runs[0]['rows_per_s']
+        lines.append(f"{'shards':>6} {'rows':>10} {'rows/s':>14} {'speedup':>8}")
+        for r in runs:
+            lines.append(f"{r.get('shards', 1):>6} {rows:>10,} {r['rows_per_s']:>14,.0f} "
+                         f"{r['rows_per_s'] / base:>7.2f}x")
+    return lines
+
+
+def parse_size(value: str) -> int:
+    """Convertit '10k', '1M' ou '2500' en nombre de lignes."""
+    value = value.strip().lower()
+    factor = {'k': 1_000, 'm': 1_000_000}.get(value[-1:], 1)
+    return int(float(value[:-1] if factor > 1 else value) * factor)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks ETL sur données synthétiques")
+    parser.add_argument('--rows', default='10k,100k', help='tailles de jeu, ex. 10k,100k,1M,10M')
+    parser.add_argument('--stages', default=','.join(STAGES), help='étapes mesurées')
+    parser.add_argument('--batch-size', type=int, default=1000, help='taille des lots (pages API)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--dirty', type=float, default=0.05, help='proportion de valeurs sales')
+    parser.add_argument('--reset-db', action='store_true',
+                        help='vider la table de faits avant chaque mesure du chargement')
+    parser.add_argument('--shards', default='1',
+                        help="connexions d'écriture mesurées pour le chargement, ex. 1,2,4,8")
+    parser.add_argument('--output', default=RESULTS_DIR, help='répertoire des résultats JSON')
+    parser.add_argument('--compare', help='fichier de résultats de référence')
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    sizes = [parse_size(v) for v in args.rows.split(',') if v.strip()]
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        print(f"Unknown stages: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 2
+    if args.reset_db and 'load' in stages:
+        from config import DB_NAME
+        refusal = reset_refusal(DB_NAME)
+        if refusal:
+            print(refusal, file=sys.stderr)
+            return 2
+
+    shard_counts = [int(v) for v in args.shards.split(',') if v.strip()]
+    runs = [(stage, shards) for stage in stages for shards in (shard_counts if stage == 'load' else [1])]
+
+    results = []
+    for rows in sizes:
+        for stage, shards in runs:
+            label = _stage_label({'stage': stage, 'shards': shards})
+            if stage == 'load':
+                # table vidée avant chaque mesure : sinon les lignes déjà
+                # chargées par la mesure précédente sont ignorées
+                reason = check_database(reset=args.reset_db)
+                if reason:
+                    print(f'{label:<9} {rows:>10,} skipped (database unavailable: {reason})')
+                    results.append({'stage': stage, 'rows': rows, 'batch_size': args.batch_size,
+                                    'shards': shards, 'skipped': reason})
+                    continue
+            if stage == 'extract':
+                with serve(rows, seed=args.seed, dirty=args.dirty) as url:
+                    result = run_bench(stage, rows, args.batch_size, args.seed, args.dirty, url)
+            else:
+                result = run_bench(stage, rows, args.batch_size, args.seed, args.dirty, shards=shards)
+            results.append(result)
+            if 'error' in result:
+                print(f"{label:<9} {rows:>10,} failed: {result['error']}")
+            else:
+                print(f"{label:<9} {rows:>10,} {result['rows_per_s'] or 0:>12,.0f} rows/s "
+                      f"{result['wall_s']:>9.2f}s peak_rss={result['peak_rss_mb']}MB")
+
+    scaling = scaling_lines(results)
+    if scaling:
+        print('\n'.join(['', 'Load scaling:'] + scaling))
+
+    params = {'rows': sizes, 'stages': stages, 'batch_size': args.batch_size,
+              'seed': args.seed, 'dirty': args.dirty, 'reset_db': args.reset_db,
+              'shards': shard_counts}
+    path = save_results(results, params, args.output)
+    print(f'Results written to {path}')
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as fh:
+            print('\n'.join(compare_results(json.load(fh), results)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
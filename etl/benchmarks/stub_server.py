@@ -0,0 +1,129 @@
+"""Serveur HTTP local imitant l'API de recherche OpenData.
+
+Le serveur répond à `GET /api/records/1.0/search?dataset=...&rows=...&start=...`
+avec le même contrat que l'API réelle (`nhits`, `parameters`, `records`)
+en générant chaque page à la demande (voir synthetic.py). Comme l'API,
+il répond 400 au-delà de `max_offset` si cette limite est fixée.
+
+Usage autonome :
+    python benchmarks/stub_server.py --rows 1000000 --port 8099
+"""
+import json
+import argparse
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import urlparse, parse_qs
+
+from synthetic import generate_page
+
+SEARCH_PATH = '/api/records/1.0/search'
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    """Gestionnaire de l'endpoint de recherche paginée."""
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip('/') != SEARCH_PATH:
+            self._send(404, {'error': 'Unknown endpoint'})
+            return
+
+        params = parse_qs(url.query)
+        try:
+            rows = int(params.get('rows', ['10'])[0])
+            start = int(params.get('start', ['0'])[0])
+        except ValueError:
+            self._send(400, {'error': 'Invalid pagination parameters'})
+            return
+
+        server = self.server
+        if server.max_offset is not None and start + rows > server.max_offset:
+            self._send(400, {'error': 'Pagination limit exceeded'})
+            return
+
+        count = max(0, min(rows, server.total - start))
+        self._send(200, {
+            'nhits': server.total,
+            'parameters': {'dataset': params.get('dataset', [''])[0], 'rows': rows, 'start': start},
+            'records': generate_page(start, count, server.seed, server.dirty),
+        })
+
+    def _send(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # une ligne par page fausserait les mesures
+        return
+
+
+def make_server(total: int, port: int = 0, seed: int = 42, dirty: float = 0.05,
+                max_offset: Optional[int] = None) -> ThreadingHTTPServer:
+    """
+    Crée le serveur (port 0 = port libre choisi par le système).
+
+    Args:
+        total: Nombre total d'enregistrements servis
+        port: Port d'écoute sur 127.0.0.1
+        seed: Graine du jeu synthétique
+        dirty: Proportion de valeurs sales
+        max_offset: Limite de pagination au-delà de laquelle répondre 400
+
+    Returns:
+        Serveur prêt à être démarré (`serve_forever`)
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), SearchHandler)
+    server.daemon_threads = True
+    server.total = total
+    server.seed = seed
+    server.dirty = dirty
+    server.max_offset = max_offset
+    return server
+
+
+@contextmanager
+def serve(total: int, **kwargs):
+    """
+    Démarre le serveur dans un thread le temps du bloc.
+
+    Yields:
+        URL de l'endpoint de recherche
+    """
+    server = make_server(total, **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, port = server.server_address
+        yield f'http://{host}:{port}{SEARCH_PATH}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stub de l'API de recherche OpenData")
+    parser.add_argument('--rows', type=int, default=100_000, help="nombre d'enregistrements servis")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--dirty', type=float, default=0.05, help='proportion de valeurs sales')
+    parser.add_argument('--max-offset', type=int, default=None, help='limite de pagination (400 au-delà)')
+    args = parser.parse_args(argv)
+
+    server = make_server(args.rows, args.port, args.seed, args.dirty, args.max_offset)
+    print(f'Serving {args.rows:,} synthetic records on http://127.0.0.1:{args.port}{SEARCH_PATH}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Générateur de données synthétiques au format OpenData.
+
+Ce module produit des enregistrements `{'fields': {...}}` ayant la forme
+du dataset immobilisations-etat-des-amortissements : cardinalités
+réalistes (quelques publications et collectivités, quelques centaines de
+natures, numéros d'immobilisation presque uniques) et une proportion
+réglable de valeurs sales (montants en texte à virgule, dates au format
+français, champs vides ou absents, espaces parasites, noms de champs non
+normalisés).
+
+La génération est déterministe pour un couple (seed, start) : une page
+peut être régénérée à l'identique sans conserver tout le jeu en mémoire,
+ce qui permet de servir 10M de lignes page par page.
+"""
+import datetime
+import numpy as np
+from typing import Any, Dict, Iterator, List
+
+# Cardinalités observées sur le dataset réel (ordres de grandeur)
+PUBLICATIONS = [f'CA {year}' for year in range(2015, 2024)] + ['BP 2024']
+COLLECTIVITES = ['Ville', 'Département', 'VILLE DE PARIS', 'Etat spécial', 'Caisse des écoles']
+NATURE_COUNT = 320
+DESIGNATION_COUNT = 5000
+
+NATURES = [f'{2100 + i // 4}{i % 4} - Nature comptable {i}' for i in range(NATURE_COUNT)]
+DESIGNATION_WORDS = [
+    'Travaux', 'Acquisition', 'Matériel', 'Bâtiment', 'Ecole', 'Voirie', 'Mobilier',
+    'Informatique', 'Réseau', 'Crèche', 'Gymnase', 'Piscine', 'Bibliothèque',
+    'Rénovation', 'Equipement', 'Véhicule', 'Parc', 'Jardin', 'Logement', 'Mairie',
+]
+
+# Durées d'amortissement usuelles (années)
+DUREES = np.array([0, 1, 3, 5, 7, 10, 15, 20, 25, 30, 50])
+DUREE_WEIGHTS = np.array([3, 2, 10, 20, 10, 20, 12, 10, 5, 5, 3], dtype=float)
+
+EPOCH = datetime.date(1980, 1, 1)
+DAY_SPAN = (datetime.date(2023, 12, 31) - EPOCH).days
+
+
+def _designations(rng: np.random.Generator) -> List[str]:
+    words = np.array(DESIGNATION_WORDS)
+    picks = rng.integers(0, len(words), size=(DESIGNATION_COUNT, 3))
+    return [f'{a} {b} {c} lot {i}' for i, (a, b, c) in enumerate(words[picks])]
+
+
+# Vocabulaire fixe, indépendant de la page : mêmes libellés sur tout le jeu
+_DESIGNATIONS = _designations(np.random.default_rng(0))
+
+
+def generate_page(start: int, rows: int, seed: int = 42, dirty: float = 0.05) -> List[Dict[str, Any]]:
+    """
+    Génère une page d'enregistrements OpenData.
+
+    Args:
+        start: Position du premier enregistrement dans le jeu complet
+        rows: Nombre d'enregistrements à produire
+        seed: Graine du jeu de données
+        dirty: Proportion de valeurs sales (0 à 1)
+
+    Returns:
+        Liste d'enregistrements `{'datasetid', 'recordid', 'fields'}`
+    """
+    if rows <= 0:
+        return []
+    rng = np.random.default_rng([seed, start])
+    idx = np.arange(start, start + rows)
+
+    publication = rng.integers(0, len(PUBLICATIONS), rows)
+    collectivite = rng.choice(len(COLLECTIVITES), rows, p=[0.6, 0.25, 0.1, 0.03, 0.02])
+    # loi de Zipf : quelques natures concentrent la majorité des actifs
+    nature = np.minimum(rng.zipf(1.3, rows) - 1, NATURE_COUNT - 1)
+    designation = rng.integers(0, DESIGNATION_COUNT, rows)
+    days = rng.integers(0, DAY_SPAN, rows)
+    valeur = np.round(rng.lognormal(8.5, 2.0, rows), 2)
+    duree = rng.choice(DUREES, rows, p=DUREE_WEIGHTS / DUREE_WEIGHTS.sum())
+    # ~2% de numéros réutilisés (doublons de clé métier comme dans la source)
+    ndeg = np.where(rng.random(rows) < 0.02, idx // 2, idx)
+
+    elapsed = rng.integers(0, 40, rows)
+    annuite = np.divide(valeur, duree, out=np.zeros_like(valeur), where=duree > 0)
+    cumul = np.round(np.minimum(annuite * elapsed, valeur), 2)
+    amort = np.round(np.minimum(annuite, valeur - cumul), 2)
+    vnc_debut = np.round(valeur - cumul, 2)
+    vnc_fin = np.round(vnc_debut - amort, 2)
+
+    dirty_mask = rng.random((rows, 6)) < dirty
+
+    records = []
+    for i in range(rows):
+        date = EPOCH + datetime.timedelta(days=int(days[i]))
+        fields = {
+            'ndeg_immobilisation': f'IMM{int(ndeg[i]):09d}',
+            'publication': PUBLICATIONS[publication[i]],
+            'collectivite': COLLECTIVITES[collectivite[i]],
+            'nature': NATURES[nature[i]],
+            'date_d_acquisition': date.isoformat(),
+            'designation_des_ensembles': _DESIGNATIONS[designation[i]],
+            'valeur_d_acquisition': float(valeur[i]),
+            'duree_amort': int(duree[i]),
+            'cumul_amort_anterieurs': float(cumul[i]),
+            'vnc_debut_exercice': float(vnc_debut[i]),
+            'amort_exercice': float(amort[i]),
+            'vnc_fin_exercice': float(vnc_fin[i]),
+        }
+        flags = dirty_mask[i]
+        if flags.any():
+            _dirty_fields(fields, flags, date)
+        records.append({
+            'datasetid': 'immobilisations-etat-des-amortissements',
+            'recordid': f'{seed:x}{int(idx[i]):012x}',
+            'fields': fields,
+        })
+    return records
+
+
+def _dirty_fields(fields: Dict[str, Any], flags: np.ndarray, date: datetime.date) -> None:
+    """Applique les défauts observés dans la source aux champs sélectionnés."""
+    if flags[0]:
+        # montant publié en texte, virgule décimale et séparateur de milliers
+        fields['valeur_d_acquisition'] = f"{fields['valeur_d_acquisition']:,.2f}".replace(',', ' ').replace('.', ',')
+    if flags[1]:
+        fields['date_d_acquisition'] = date.strftime('%d/%m/%Y')
+    if flags[2]:
+        # champ absent (l'API omet les clés sans valeur)
+        del fields['vnc_fin_exercice']
+    if flags[3]:
+        fields['designation_des_ensembles'] = f"  {fields['designation_des_ensembles']}\n  "
+        fields['collectivite'] = f" {fields['collectivite']} "
+    if flags[4]:
+        fields['duree_amort'] = ''
+    if flags[5]:
+        # nom de champ non normalisé, rattrapé par normalize_field_names
+        fields['Cumul-Amort Anterieurs'] = fields.pop('cumul_amort_anterieurs')
+
+
+def iter_pages(total: int, page_size: int, seed: int = 42, dirty: float = 0.05) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Parcourt le jeu synthétique complet page par page.
+
+    Args:
+        total: Nombre total d'enregistrements
+        page_size: Taille des pages
+        seed: Graine du jeu de données
+        dirty: Proportion de valeurs sales
+
+    Yields:
+        Pages successives d'enregistrements
+    """
+    for start in range(0, total, page_size):
+        yield generate_page(start, min(page_size, total - start), seed, dirty)
@@ -0,0 +1,475 @@
+"""Détection d'anomalies par groupe sur les montants et durées.
+
+Chaque ligne est notée par un score robuste 0.6745 (x - médiane) / MAD
+calculé dans son groupe nature x collectivité, pour valeur_d_acquisition
+(en log10), duree_amort et taux_amortissement. Les statistiques des
+groupes sont des histogrammes à pas fixe tenus à jour lot par lot :
+médiane et MAD de tous les groupes se déduisent des histogrammes cumulés
+en quelques opérations NumPy, sans seconde lecture des données.
+
+Un groupe trop petit (ETL_ANOMALY_MIN_GROUP_ROWS) est remplacé par sa
+nature, puis par l'ensemble des lignes. Les histogrammes du run validé
+précédent servent de référence dès le premier lot ; ceux du run sont
+enregistrés dans etl_anomaly_stats (reprise d'un run interrompu) et les
+lignes signalées dans etl_anomalies, avec le checkpoint de leur lot.
+"""
+import io
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, insert, select
+from config import ANOMALY_MIN_GROUP_ROWS, ANOMALY_THRESHOLD
+from models import EtlAnomaly, EtlAnomalyStats, EtlRun, Immobilisation
+from load.checkpoint import STATUS_COMMITTED
+from load.load import fixed_point_scales
+
+logger = logging.getLogger(__name__)
+
+# Niveaux de regroupement, du plus fin au plus large
+LEVELS = ('nature_collectivite', 'nature', 'all')
+
+# Constante de cohérence du MAD avec l'écart type d'une loi normale
+MAD_SCALE = 0.6745
+
+# Longueur des libellés recopiés dans etl_anomalies (voir dim_nature)
+LABEL_LENGTH = 80
+
+
+@dataclass(frozen=True)
+class Binning:
+    """Classes à pas fixe d'une mesure (échelle log10 pour les montants)."""
+
+    low: float
+    high: float
+    bins: int
+    log: bool = False
+
+    @property
+    def width(self) -> float:
+        return (self.high - self.low) / self.bins
+
+    def position(self, values: np.ndarray) -> np.ndarray:
+        """Valeurs sur l'échelle de notation (NaN : ligne non notée)."""
+        if self.log:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.where(values > 0, np.log10(values), np.nan)
+        return values
+
+    def value(self, positions: np.ndarray) -> np.ndarray:
+        """Inverse de position : retour à l'unité de la colonne."""
+        return np.power(10.0, positions) if self.log else positions
+
+    def classes(self, positions: np.ndarray) -> np.ndarray:
+        """Classe de chaque position (les extrêmes vont aux classes de bord)."""
+        return np.clip(np.floor((positions - self.low) / self.width), 0, self.bins - 1).astype(np.intp)
+
+    def centers(self) -> np.ndarray:
+        return self.low + (np.arange(self.bins) + 0.5) * self.width
+
+
+# Mesures notées : un montant nul ou négatif n'a pas de log et n'est pas noté
+METRICS: Dict[str, Binning] = {
+    # 1 centime à 10 milliards, classes de ~6 %
+    'valeur_d_acquisition': Binning(-2.0, 10.0, 480, log=True),
+    # une classe par année, centrée sur l'entier
+    'duree_amort': Binning(-0.5, 120.5, 121),
+    'taux_amortissement': Binning(0.0, 1.0, 400),
+}
+
+
+def robust_stats(hist: np.ndarray, centers: np.ndarray, floor: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Effectif, médiane et MAD de chaque ligne d'une matrice d'histogrammes.
+
+    La médiane est le centre de la classe qui atteint la moitié de
+    l'effectif ; le MAD est la médiane pondérée des écarts des centres à
+    cette médiane, bornée par le pas des classes (un groupe constant aurait
+    un MAD nul).
+
+    Args:
+        hist: Effectifs (groupes x classes)
+        centers: Centre de chaque classe
+        floor: MAD minimal
+
+    Returns:
+        Effectifs, médianes et MAD (un élément par groupe)
+    """
+    n = hist.sum(axis=1)
+    half = ((n + 1) // 2)[:, None]
+    median = centers[np.argmax(np.cumsum(hist, axis=1) >= half, axis=1)]
+    deviation = np.abs(centers[None, :] - median[:, None])
+    order = np.argsort(deviation, axis=1, kind='stable')
+    reached = np.cumsum(np.take_along_axis(hist, order, axis=1), axis=1) >= half
+    mad = np.take_along_axis(np.take_along_axis(deviation, order, axis=1),
+                             np.argmax(reached, axis=1)[:, None], axis=1)[:, 0]
+    return n, median, np.maximum(mad, floor)
+
+
+class GroupHistograms:
+    """
+    Histogrammes d'une mesure par groupe, indexés par clé de groupe.
+
+    `counts` contient les lots du run, `base` la référence (run validé
+    précédent) : les statistiques portent sur leur somme, seul `counts`
+    est enregistré.
+    """
+
+    def __init__(self, bins: int):
+        self.bins = bins
+        self.keys: Dict[str, int] = {}
+        self.counts = np.zeros((0, bins), dtype=np.int64)
+        self.base = np.zeros((0, bins), dtype=np.int64)
+
+    def ids(self, keys: pd.Series) -> np.ndarray:
+        """Indice de groupe de chaque clé (les nouvelles clés sont ajoutées)."""
+        for key in pd.unique(keys[~keys.isin(self.keys)]):
+            self.keys[key] = len(self.keys)
+        if len(self.keys) > len(self.counts):
+            # croissance par doublement : pas de copie à chaque nouveau groupe
+            size, used = max(len(self.keys), 2 * len(self.counts)), len(self.counts)
+            for name in ('counts', 'base'):
+                grown = np.zeros((size, self.bins), dtype=np.int64)
+                grown[:used] = getattr(self, name)
+                setattr(self, name, grown)
+        return keys.map(self.keys).to_numpy(dtype=np.intp)
+
+    def add(self, ids: np.ndarray, classes: np.ndarray, sign: int = 1) -> None:
+        np.add.at(self.counts, (ids, classes), sign)
+
+    def absorb(self, keys: List[str], counts: np.ndarray, base: bool = False) -> None:
+        """Ajoute des histogrammes enregistrés (run repris ou référence)."""
+        if not len(keys):
+            return
+        ids = self.ids(pd.Series(keys, dtype=object))
+        target = self.base if base else self.counts
+        np.add.at(target, ids, counts)
+
+    def totals(self, ids: np.ndarray) -> np.ndarray:
+        return self.counts[ids] + self.base[ids]
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Clés et histogrammes des groupes observés par le run."""
+        used = self.counts[:len(self.keys)].sum(axis=1) > 0
+        keys = np.array(list(self.keys), dtype=str)
+        return keys[used], self.counts[:len(self.keys)][used]
+
+
+def _group_keys(df: pd.DataFrame) -> Dict[str, pd.Series]:
+    """Clé de chaque ligne à chaque niveau de regroupement."""
+    labels = {
+        name: (df[name].astype(object).where(df[name].notna(), '').astype(str)
+               if name in df.columns else pd.Series('', index=df.index))
+        for name in ('nature', 'collectivite')
+    }
+    return {
+        'nature_collectivite': labels['nature'] + '\x1f' + labels['collectivite'],
+        'nature': labels['nature'],
+        'all': pd.Series('*', index=df.index),
+    }
+
+
+def _serialize(histograms: Dict[str, GroupHistograms]) -> Tuple[bytes, int]:
+    arrays = {}
+    for level, groups in histograms.items():
+        arrays[f'{level}_keys'], arrays[f'{level}_counts'] = groups.arrays()
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue(), len(arrays[f'{LEVELS[0]}_keys'])
+
+
+def _deserialize(blob: bytes) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    with np.load(io.BytesIO(blob), allow_pickle=False) as data:
+        return {level: (data[f'{level}_keys'].tolist(), data[f'{level}_counts']) for level in LEVELS}
+
+
+class AnomalyDetector:
+    """
+    Note les lots d'un run et persiste les lignes signalées avec leur checkpoint.
+
+    Usage :
+        flagged = detector.score(df)    # avant le chargement
+        with engine.begin() as conn:
+            ...
+            detector.save(conn, df['source_hash'])   # même transaction que le lot
+        detector.flush()                # après commit
+        detector.discard()              # lot annulé : retiré des statistiques
+    """
+
+    def __init__(self, run_id: Optional[int] = None, threshold: float = ANOMALY_THRESHOLD,
+                 min_group_rows: int = ANOMALY_MIN_GROUP_ROWS,
+                 metrics: Optional[Dict[str, Binning]] = None):
+        self.run_id = run_id
+        self.threshold = threshold
+        self.min_group_rows = min_group_rows
+        self.metrics = METRICS if metrics is None else metrics
+        self.histograms = {
+            metric: {level: GroupHistograms(binning.bins) for level in LEVELS}
+            for metric, binning in self.metrics.items()
+        }
+        self.scored = {metric: 0 for metric in self.metrics}
+        self.flagged = {metric: 0 for metric in self.metrics}
+        self.pending: Optional[pd.DataFrame] = None
+        self._delta: List[Tuple[str, str, np.ndarray, np.ndarray]] = []
+        self._pending_scored: Dict[str, int] = {}
+
+    @property
+    def total(self) -> int:
+        """Lignes signalées par les lots validés."""
+        return sum(self.flagged.values())
+
+    def score(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Ajoute un lot aux statistiques de ses groupes puis note chaque ligne.
+
+        Chaque ligne est notée au niveau le plus fin dont le groupe atteint
+        `min_group_rows` lignes (lot courant compris). Les montants en
+        centimes sont ramenés à leur valeur.
+
+        Returns:
+            Lignes signalées (une par ligne et colonne), aussi mises en
+            attente pour save()
+        """
+        self.discard()
+        keys = _group_keys(df)
+        scales = fixed_point_scales(df, Immobilisation.__table__)
+        flagged = []
+        for metric, binning in self.metrics.items():
+            if metric not in df.columns:
+                continue
+            values = df[metric].to_numpy(dtype=np.float64, na_value=np.nan) / 10 ** scales.get(metric, 0)
+            positions = binning.position(values)
+            valid = ~np.isnan(positions)
+            self._pending_scored[metric] = int(valid.sum())
+            if not valid.any():
+                continue
+            positions = positions[valid]
+            classes = binning.classes(positions)
+            ids = {}
+            for level in LEVELS:
+                ids[level] = self.histograms[metric][level].ids(keys[level][valid])
+                self.histograms[metric][level].add(ids[level], classes)
+                self._delta.append((metric, level, ids[level], classes))
+            flagged.append(self._flag(df.index[valid], metric, binning, positions, values[valid], ids))
+
+        pending = pd.concat(flagged) if flagged else None
+        if pending is None or pending.empty:
+            return pd.DataFrame(columns=['column_name', 'value', 'group_level', 'score'])
+        for name, length in (('ndeg_immobilisation', 255), ('collectivite', LABEL_LENGTH), ('nature', LABEL_LENGTH)):
+            labels = df[name].reindex(pending.index) if name in df.columns else [None] * len(pending)
+            pending[name] = [None if pd.isna(v) else str(v)[:length] for v in labels]
+        self.pending = pending
+        return pending
+
+    def _flag(self, index: pd.Index, metric: str, binning: Binning, positions: np.ndarray,
+              values: np.ndarray, ids: Dict[str, np.ndarray]) -> pd.DataFrame:
+        """Score de chaque ligne au premier niveau assez peuplé ; lignes au-delà du seuil."""
+        centers = binning.centers()
+        median = np.full(len(positions), np.nan)
+        mad = np.full(len(positions), np.nan)
+        level_of = np.full(len(positions), -1, dtype=np.int8)
+        for rank, level in enumerate(LEVELS):
+            todo = level_of < 0
+            if not todo.any():
+                break
+            # statistiques calculées une fois par groupe présent dans le lot
+            groups, inverse = np.unique(ids[level][todo], return_inverse=True)
+            n, group_median, group_mad = robust_stats(
+                self.histograms[metric][level].totals(groups), centers, binning.width)
+            enough = (n >= self.min_group_rows)[inverse]
+            rows = np.flatnonzero(todo)[enough]
+            median[rows] = group_median[inverse][enough]
+            mad[rows] = group_mad[inverse][enough]
+            level_of[rows] = rank
+
+        scored = level_of >= 0
+        score = np.zeros(len(positions))
+        score[scored] = MAD_SCALE * (positions[scored] - median[scored]) / mad[scored]
+        hit = scored & (np.abs(score) > self.threshold)
+        return pd.DataFrame({
+            'column_name': metric,
+            'value': values[hit],
+            'group_level': np.array(LEVELS)[level_of[hit]],
+            'group_median': binning.value(median[hit]),
+            'group_mad': mad[hit],
+            'score': np.round(score[hit], 4),
+        }, index=index[hit])
+
+    def save(self, conn, source_hash: Optional[pd.Series] = None) -> None:
+        """
+        Insère les lignes signalées du lot sur la connexion (transaction du lot).
+
+        Args:
+            conn: Connexion de la transaction du lot
+            source_hash: Empreintes des lignes du lot (index du DataFrame noté)
+        """
+        if self.pending is None:
+            return
+        rows = self.pending.assign(run_id=self.run_id, source_hash=None)
+        if source_hash is not None:
+            hashes = source_hash.reindex(rows.index)
+            rows['source_hash'] = [None if pd.isna(h) else int(h) for h in hashes]
+        rows = rows.astype(object).where(rows.notna(), None)
+        conn.execute(insert(EtlAnomaly.__table__), rows.to_dict('records'))
+
+    def flush(self) -> int:
+        """
+        Clôt le lot validé : ses valeurs restent dans les statistiques.
+
+        Returns:
+            Nombre de lignes signalées du lot
+        """
+        for metric, count in self._pending_scored.items():
+            self.scored[metric] += count
+        count = 0
+        if self.pending is not None:
+            for metric, flagged in self.pending['column_name'].value_counts().items():
+                self.flagged[metric] += int(flagged)
+            count = len(self.pending)
+        self._reset()
+        return count
+
+    def discard(self) -> None:
+        """Retire des statistiques un lot noté mais non validé (il sera rejoué)."""
+        for metric, level, ids, classes in self._delta:
+            self.histograms[metric][level].add(ids, classes, sign=-1)
+        self._reset()
+
+    def _reset(self) -> None:
+        self.pending = None
+        self._delta = []
+        self._pending_scored = {}
+
+    def counts(self, pending: bool = False) -> Dict[str, Dict[str, int]]:
+        """
+        Lignes notées et signalées par colonne (lots validés).
+
+        Args:
+            pending: Compter aussi le lot noté en attente de validation
+                (enregistrement dans la transaction de son checkpoint)
+        """
+        counts = {metric: {'scored': self.scored[metric], 'flagged': self.flagged[metric]}
+                  for metric in self.metrics}
+        if pending:
+            for metric, count in self._pending_scored.items():
+                counts[metric]['scored'] += count
+            if self.pending is not None:
+                for metric, flagged in self.pending['column_name'].value_counts().items():
+                    counts[metric]['flagged'] += int(flagged)
+        return counts
+
+    def absorb(self, stats: Dict[str, Dict[str, Tuple[list, np.ndarray]]], base: bool = False) -> None:
+        """Ajoute les histogrammes enregistrés d'un run (voir load_stats)."""
+        for metric, levels in stats.items():
+            if metric not in self.histograms:
+                continue
+            for level, (keys, counts) in levels.items():
+                if counts.shape[1:] == (self.metrics[metric].bins,):
+                    self.histograms[metric][level].absorb(keys, counts, base=base)
+
+
+# ============================================================================
+# PERSISTANCE
+# ============================================================================
+
+def save_stats(engine, detector: AnomalyDetector) -> None:
+    """Enregistre (remplace) les histogrammes et compteurs du run dans etl_anomaly_stats."""
+    detector.discard()
+    with engine.begin() as conn:
+        write_stats(conn, detector)
+
+
+def write_stats(conn, detector: AnomalyDetector, pending: bool = False) -> None:
+    """
+    Remplace les histogrammes et compteurs du run sur la connexion.
+
+    Args:
+        conn: Connexion de la transaction (checkpoint d'un lot)
+        detector: Détecteur du run
+        pending: Inclure le lot noté en attente (son checkpoint est dans
+            la même transaction)
+    """
+    counts = detector.counts(pending=pending)
+    rows = []
+    for metric, levels in detector.histograms.items():
+        blob, groups = _serialize(levels)
+        rows.append({
+            'run_id': detector.run_id,
+            'column_name': metric,
+            'rows_scored': counts[metric]['scored'],
+            'rows_flagged': counts[metric]['flagged'],
+            'groups': groups,
+            'histograms': blob,
+        })
+    table = EtlAnomalyStats.__table__
+    conn.execute(delete(table).where(table.c.run_id == detector.run_id))
+    conn.execute(insert(table), rows)
+
+
+def load_stats(engine, run_id: Optional[int]):
+    """
+    Histogrammes et compteurs enregistrés d'un run.
+
+    Returns:
+        (histogrammes par colonne et niveau, compteurs par colonne),
+        None si le run n'en a pas
+    """
+    if run_id is None:
+        return None
+    table = EtlAnomalyStats.__table__
+    with engine.connect() as conn:
+        rows = conn.execute(select(table).where(table.c.run_id == run_id)).all()
+    if not rows:
+        return None
+    histograms = {row.column_name: _deserialize(row.histograms) for row in rows}
+    counts = {row.column_name: {'scored': row.rows_scored, 'flagged': row.rows_flagged} for row in rows}
+    return histograms, counts
+
+
+def reference_run(engine, run_id: int) -> Optional[int]:
+    """Dernier run validé du même dataset avant `run_id` ayant des statistiques de groupes."""
+    runs, stats = EtlRun.__table__, EtlAnomalyStats.__table__
+    dataset = select(runs.c.dataset_id).where(runs.c.run_id == run_id).scalar_subquery()
+    with engine.connect() as conn:
+        return conn.execute(
+            select(runs.c.run_id)
+            .where(runs.c.dataset_id == dataset, runs.c.status == STATUS_COMMITTED,
+                   runs.c.run_id < run_id,
+                   runs.c.run_id.in_(select(stats.c.run_id).distinct()))
+            .order_by(runs.c.run_id.desc()).limit(1)
+        ).scalar()
+
+
+def open_detector(engine, run_id: int, resume: bool = False) -> AnomalyDetector:
+    """
+    Détecteur d'un run : référence du run validé précédent et, pour un run
+    repris, statistiques de ses lots déjà validés.
+    """
+    detector = AnomalyDetector(run_id)
+    reference = load_stats(engine, reference_run(engine, run_id))
+    if reference is not None:
+        detector.absorb(reference[0], base=True)
+    own = load_stats(engine, run_id) if resume else None
+    if own is not None:
+        detector.absorb(own[0])
+        for metric, counts in own[1].items():
+            if metric in detector.scored:
+                detector.scored[metric] += counts['scored']
+                detector.flagged[metric] += counts['flagged']
+    return detector
+
+
+def report_anomalies(engine, detector: AnomalyDetector) -> Dict[str, Dict[str, int]]:
+    """
+    Enregistre les statistiques d'un run terminé et résume ses anomalies.
+
+    Returns:
+        Lignes notées et signalées par colonne
+    """
+    save_stats(engine, detector)
+    counts = detector.counts()
+    for metric, values in counts.items():
+        logger.info('Anomalies %s: %s rows flagged out of %s scored',
+                    metric, f"{values['flagged']:,}", f"{values['scored']:,}")
+    return counts
@@ -0,0 +1,365 @@
+"""Interface en ligne de commande du pipeline ETL, étape par étape.
+
+Chaque étape lit la sortie de la précédente dans un spool disque et y
+écrit la sienne, ce qui permet de rejouer une étape seule (par exemple
+recharger après la correction d'un bug du chargement sans retélécharger
+l'API) ou d'exécuter les étapes sur des machines ou planifications
+différentes :
+
+    python src/cli.py extract    # API -> spool/raw
+    python src/cli.py transform  # spool/raw -> spool/transformed
+    python src/cli.py load       # spool/transformed -> MySQL
+    python src/cli.py run        # pipeline complet (équivalent de main.py)
+    python src/cli.py datasets   # plusieurs datasets en parallèle (voir datasets/)
+    python src/cli.py runs       # derniers runs, lignes chargées et anomalies de chacun
+    python src/cli.py profile N  # profil des données du run N et dérive
+    python src/cli.py duplicates # clusters de quasi-doublons (MinHash/LSH)
+    python src/cli.py rollback N # annule le run N (suppression indexée de ses lignes)
+"""
+import os
+import sys
+import argparse
+import logging
+from config import (
+    BATCH_SIZE, DATASET_ID, SEARCH_URL, SPOOL_DIR, SPOOL_FORMAT, SPOOL_PART_ROWS,
+    DATASETS_FILE, HTTP_WORKERS, DB_WORKERS, LOAD_SHARDS, PROJECTION_YEARS, MONEY_MODE
+)
+from spool.spool import (
+    RAW, TRANSFORMED, FORMATS, SpoolError, SpoolWriter, stage_dir, read_manifest,
+    spool_identity, iter_records, iter_frames
+)
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(
+    level=LOG_LEVEL,
+    format='%(asctime)s %(levelname)s %(name)s %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Les runs de chargement depuis un spool sont suivis sous un identifiant
+# distinct : leur offset compte des lignes du spool, pas des pages de l'API
+SPOOL_RUN_SUFFIX = ':spool'
+
+
+def cmd_extract(args) -> int:
+    """Télécharge les enregistrements bruts de l'API dans spool/raw."""
+    from extract.extract import fetch_records_in_batches
+
+    directory = stage_dir(args.spool, RAW)
+    meta = {'stage': RAW, 'dataset_id': DATASET_ID, 'source': SEARCH_URL, 'start': args.start}
+    with SpoolWriter(directory, 'ndjson', args.part_rows, meta) as writer:
+        for batch in fetch_records_in_batches(rows=args.batch_size, start=args.start):
+            writer.write_records(batch)
+    manifest = read_manifest(directory)
+    if manifest['rows'] == 0:
+        logger.error('ERROR: No records fetched')
+        return 1
+    return 0
+
+
+def cmd_transform(args) -> int:
+    """Transforme spool/raw en DataFrames prêts à charger dans spool/transformed."""
+    from transform.transform import (
+        TARGET_SCHEMA, fixed_point_schema, transform_records, calculate_derived_fields,
+        add_data_quality_flags
+    )
+
+    source = stage_dir(args.spool, RAW)
+    raw = read_manifest(source)
+    meta = {'stage': TRANSFORMED, 'dataset_id': raw.get('dataset_id'),
+            'source_created_at': raw['created_at'], 'source_rows': raw['rows'], 'money': args.money}
+    schema = fixed_point_schema(TARGET_SCHEMA) if args.money == 'cents' else TARGET_SCHEMA
+    with SpoolWriter(stage_dir(args.spool, TRANSFORMED), args.format, args.part_rows, meta) as writer:
+        for records in iter_records(source, batch_size=args.part_rows):
+            df = transform_records(records, schema)
+            df = calculate_derived_fields(df, copy=False)
+            df = add_data_quality_flags(df, copy=False)
+            writer.write_frame(df)
+    return 0
+
+
+def cmd_load(args) -> int:
+    """
+    Charge spool/transformed dans MySQL, lot par lot, avec checkpoint.
+
+    Le chargement est suivi dans etl_runs avec l'identité du spool ; avec
+    --resume, les lignes déjà validées par le dernier chargement
+    interrompu sont sautées (offset en lignes, quelle que soit la taille
+    de lot), à condition que le spool n'ait pas été réécrit depuis.
+    """
+    from load.load import get_engine, upsert_immobilisations
+    from load.checkpoint import STATUS_COMMITTED, STATUS_FAILED, ResumeError, start_run, finish_run
+    from load.dead_letter import DeadLetterStore
+    from snapshot.snapshot import refresh_snapshot
+    from sketches.profile import DatasetProfile, load_profile, report_profile
+    from anomalies.anomalies import open_detector, report_anomalies
+    from dedup.dedup import NearDuplicateIndex
+    from pipeline.pipeline import process_batches
+    from load.run_keys import open_run_keys
+
+    source = stage_dir(args.spool, TRANSFORMED)
+    manifest = read_manifest(source)
+    engine = get_engine()
+    try:
+        state = start_run(engine, f"{manifest.get('dataset_id') or DATASET_ID}{SPOOL_RUN_SUFFIX}",
+                          resume=args.resume, source_id=spool_identity(manifest))
+    except ResumeError as e:
+        logger.error('ERROR: %s', e)
+        return 2
+    table_name = os.getenv('ETL_TABLE', 'immobilisations_amortissements')
+    dead_letters = DeadLetterStore(state.run_id)
+    data_profile = (load_profile(engine, state.run_id) if args.resume else None) or DatasetProfile()
+    detector = open_detector(engine, state.run_id, resume=args.resume)
+    near_duplicates = NearDuplicateIndex(state.run_id)
+    run_keys = open_run_keys(engine, state.run_id, resume=args.resume)
+
+    def batches():
+        # lignes déjà validées par le run repris : sautées
+        for frame in iter_frames(source, start=state.last_offset):
+            for begin in range(0, len(frame), args.batch_size):
+                yield frame.iloc[begin:begin + args.batch_size]
+
+    def load(df, checkpoint, on_reject):
+        return upsert_immobilisations(
+            df,
+            table_name=table_name,
+            checkpoint=checkpoint,
+            copy=False,
+            on_reject=on_reject,
+            shards=args.shards,
+            run_id=state.run_id,
+            engine=engine,
+            run_keys=run_keys,
+        )
+
+    try:
+        state = process_batches(
+            engine,
+            state,
+            batches(),
+            # copie du lot cédée au chargement (copy=False), qui y ajoute
+            # les empreintes des lignes signalées
+            transform=lambda df, on_error: df.copy(),
+            load=load,
+            dead_letters=dead_letters,
+            data_profile=data_profile,
+            detector=detector,
+            near_duplicates=near_duplicates,
+            run_keys=run_keys,
+        )
+    except Exception:
+        # profil et statistiques des lots validés : enregistrés avec leurs
+        # checkpoints, repris par --resume
+        finish_run(engine, state, STATUS_FAILED)
+        raise
+
+    finish_run(engine, state, STATUS_COMMITTED, run_keys=run_keys)
+    refresh_snapshot(engine)
+    report_profile(engine, state.run_id, data_profile)
+    report_anomalies(engine, detector)
+    logger.info('SUCCESS: %s rows loaded from %s (%s dead letters, %s anomalies, %s near-duplicate pairs)',
+                f'{state.rows_loaded:,}', source, dead_letters.total, detector.total, near_duplicates.total)
+    return 0
+
+
+def cmd_run(args) -> int:
+    """Exécute le pipeline complet sans spool (voir main.py)."""
+    from main import run_etl
+
+    run_etl(resume=args.resume)
+    return 0
+
+
+def cmd_datasets(args) -> int:
+    """Ingère plusieurs datasets déclarés en parallèle sur des pools partagés."""
+    from datasets.datasets import load_definitions
+    from datasets.runner import run_datasets
+
+    known = load_definitions(args.file)
+    selected = args.dataset or list(known)
+    unknown = [dataset_id for dataset_id in selected if dataset_id not in known]
+    if unknown:
+        logger.error('ERROR: Unknown datasets %s (known: %s)', unknown, sorted(known))
+        return 2
+    results = run_datasets(
+        [known[dataset_id] for dataset_id in selected],
+        resume=args.resume,
+        http_workers=args.http_workers,
+        db_workers=args.db_workers,
+    )
+    for dataset_id, state in results.runs.items():
+        logger.info('SUCCESS: %s: %s rows loaded', dataset_id, f'{state.rows_loaded:,}')
+    if results.failures:
+        logger.error('ERROR: %s datasets failed: %s', len(results.failures), sorted(results.failures))
+        return 1
+    return 0
+
+
+def cmd_runs(args) -> int:
+    """Liste les derniers runs avec les lignes dont chacun a écrit la version courante et leurs anomalies."""
+    from sqlalchemy import select, func
+    from load.load import get_engine
+    from models import EtlRun, EtlAnomalyStats, Immobilisation
+
+    runs = EtlRun.__table__
+    fact = Immobilisation.__table__
+    stats = EtlAnomalyStats.__table__
+    engine = get_engine()
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(runs.c.run_id, runs.c.dataset_id, runs.c.status, runs.c.started_at,
+                   runs.c.rows_extracted, runs.c.rows_loaded)
+            .order_by(runs.c.run_id.desc()).limit(args.limit)
+        ).all()
+        # comptage par run via l'index idx_immob_run
+        tagged = dict(conn.execute(
+            select(fact.c.run_id, func.count())
+            .where(fact.c.run_id.in_([row.run_id for row in rows]))
+            .group_by(fact.c.run_id)
+        ).all())
+        flagged = dict(conn.execute(
+            select(stats.c.run_id, func.sum(stats.c.rows_flagged))
+            .where(stats.c.run_id.in_([row.run_id for row in rows]))
+            .group_by(stats.c.run_id)
+        ).all())
+    print(f"{'run':>6} {'dataset':<45} {'status':<12} {'started':<20} {'extracted':>10} {'loaded':>10} {'rows':>10} {'anomalies':>10}")
+    for row in rows:
+        anomalies = flagged.get(row.run_id)
+        anomalies = '' if anomalies is None else f'{int(anomalies):,}'
+        print(f'{row.run_id:>6} {row.dataset_id:<45} {row.status:<12} {str(row.started_at):<20} '
+              f'{row.rows_extracted:>10,} {row.rows_loaded:>10,} {tagged.get(row.run_id, 0):>10,} {anomalies:>10}')
+    return 0
+
+
+def cmd_profile(args) -> int:
+    """Affiche le profil des données d'un run et sa dérive (etl_profiles)."""
+    from sqlalchemy import select
+    from load.load import get_engine
+    from models import EtlProfile
+    from sketches.profile import format_report
+
+    profiles = EtlProfile.__table__
+    with get_engine().connect() as conn:
+        rows = conn.execute(
+            select(profiles.c.column_name, profiles.c.rows, profiles.c.distinct_estimate,
+                   profiles.c.stats, profiles.c.drift)
+            .where(profiles.c.run_id == args.run_id).order_by(profiles.c.column_name)
+        ).all()
+    if not rows:
+        logger.error('ERROR: run %s has no data profile', args.run_id)
+        return 2
+    print('\n'.join(format_report(rows)))
+    return 0
+
+
+def cmd_duplicates(args) -> int:
+    """Affiche les clusters de quasi-doublons (etl_near_duplicates), les plus grands d'abord."""
+    from load.load import get_engine
+    from dedup.dedup import near_duplicate_clusters
+
+    members = near_duplicate_clusters(get_engine(), args.collectivite)
+    clusters = members.groupby('cluster', sort=False)
+    print(f'{clusters.ngroups:,} clusters, {len(members):,} assets')
+    for number, (_, cluster) in enumerate(clusters):
+        if number == args.limit:
+            break
+        print(f"\n[{len(cluster)}] {cluster['collectivite'].iat[0] or ''}")
+        for row in cluster.itertuples():
+            print(f'  {row.ndeg_immobilisation or "":<20} {row.designation or ""}')
+    return 0
+
+
+def cmd_rollback(args) -> int:
+    """Annule un run : ses lignes sont supprimées, la vue ne montre plus que les runs validés."""
+    from load.load import get_engine
+    from load.checkpoint import RollbackError, rollback_run
+    from snapshot.snapshot import refresh_snapshot
+
+    engine = get_engine()
+    try:
+        deleted = rollback_run(engine, args.run_id)
+    except RollbackError as e:
+        logger.error('ERROR: %s', e)
+        return 2
+    logger.info('SUCCESS: run %s rolled back (%s rows deleted)', args.run_id, f'{deleted:,}')
+    refresh_snapshot(engine)
+    if args.reproject:
+        from projection.projection import run_projection
+
+        if PROJECTION_YEARS > 0:
+            run_projection(years=PROJECTION_YEARS)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Pipeline ETL immobilisations/amortissements, par étape")
+    parser.add_argument('--spool', default=SPOOL_DIR, help='répertoire du spool (défaut: ETL_SPOOL_DIR)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    extract = sub.add_parser('extract', help="API -> spool/raw (NDJSON gzip)")
+    extract.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='taille des pages API')
+    extract.add_argument('--start', type=int, default=0, help='offset de départ dans la pagination')
+    extract.add_argument('--part-rows', type=int, default=SPOOL_PART_ROWS, help='enregistrements par fichier')
+    extract.set_defaults(func=cmd_extract)
+
+    transform = sub.add_parser('transform', help='spool/raw -> spool/transformed')
+    transform.add_argument('--format', choices=FORMATS, default=SPOOL_FORMAT, help='format du spool transformé')
+    transform.add_argument('--part-rows', type=int, default=SPOOL_PART_ROWS, help='lignes par fichier')
+    transform.add_argument('--money', choices=('float', 'cents'), default=MONEY_MODE,
+                           help='montants en float ou en centimes entiers (défaut: ETL_MONEY_MODE)')
+    transform.set_defaults(func=cmd_transform)
+
+    load = sub.add_parser('load', help='spool/transformed -> MySQL')
+    load.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='lignes par transaction')
+    load.add_argument('--resume', action='store_true', help='reprendre le dernier chargement interrompu')
+    load.add_argument('--shards', type=int, default=LOAD_SHARDS,
+                      help="connexions d'écriture parallèles (défaut: ETL_LOAD_SHARDS)")
+    load.set_defaults(func=cmd_load)
+
+    run = sub.add_parser('run', help='pipeline complet sans spool')
+    run.add_argument('--resume', action='store_true', help='reprendre le dernier run interrompu')
+    run.set_defaults(func=cmd_run)
+
+    datasets = sub.add_parser('datasets', help='plusieurs datasets en parallèle, sans spool')
+    datasets.add_argument('--dataset', action='append', help='dataset à ingérer (répétable, défaut: tous)')
+    datasets.add_argument('--file', default=DATASETS_FILE, help='définitions JSON (défaut: ETL_DATASETS_FILE)')
+    datasets.add_argument('--http-workers', type=int, default=HTTP_WORKERS, help='requêtes API simultanées')
+    datasets.add_argument('--db-workers', type=int, default=DB_WORKERS, help='chargements simultanés')
+    datasets.add_argument('--resume', action='store_true', help='reprendre les runs interrompus')
+    datasets.set_defaults(func=cmd_datasets)
+
+    runs = sub.add_parser('runs', help='derniers runs, lignes écrites et anomalies de chacun')
+    runs.add_argument('--limit', type=int, default=10, help='nombre de runs affichés')
+    runs.set_defaults(func=cmd_runs)
+
+    profile = sub.add_parser('profile', help="profil des données d'un run et dérive par rapport au précédent")
+    profile.add_argument('run_id', type=int, help='run profilé (voir `runs`)')
+    profile.set_defaults(func=cmd_profile)
+
+    duplicates = sub.add_parser('duplicates', help='clusters de quasi-doublons (désignations proches)')
+    duplicates.add_argument('--collectivite', help='restreindre à une collectivité')
+    duplicates.add_argument('--limit', type=int, default=20, help='nombre de clusters affichés')
+    duplicates.set_defaults(func=cmd_duplicates)
+
+    rollback = sub.add_parser('rollback', help="annule un run (suppression de ses lignes)")
+    rollback.add_argument('run_id', type=int, help='run à annuler (voir `runs`)')
+    rollback.add_argument('--reproject', action='store_true',
+                          help='recalculer ensuite la projection des amortissements')
+    rollback.set_defaults(func=cmd_rollback)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except SpoolError as e:
+        logger.error('ERROR: %s', e)
+        return 2
+    except Exception as e:
+        logger.exception('FATAL ERROR: %s', e)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -25,4 +25,53 @@ DB_NAME = os.getenv('MYSQL_DATABASE', 'immobilisations_amortissements')
 DB_URL = f'mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
 
 # Taille des lots pour l'extraction par pagination
-BATCH_SIZE = int(os.getenv('EXTRACTION_BATCH_SIZE', 1000))
\ No newline at end of file
+BATCH_SIZE = int(os.getenv('EXTRACTION_BATCH_SIZE', 1000))
+
+# Connexions d'écriture parallèles du chargement (1 = une transaction par lot) ;
+# les lignes sont réparties par numéro d'immobilisation (backfills initiaux)
+LOAD_SHARDS = max(1, int(os.getenv('ETL_LOAD_SHARDS', 1)))
+
+# Représentation des montants DECIMAL(14,2) : float ou cents (centimes entiers,
+# calculs exacts jusqu'au chargement)
+MONEY_MODE = os.getenv('ETL_MONEY_MODE', 'float')
+
+# Projection des amortissements (0 = désactivée)
+PROJECTION_YEARS = int(os.getenv('ETL_PROJECTION_YEARS', 30))
+# Budget mémoire (Mo) des tableaux NumPy d'un chunk de projection
+PROJECTION_MEMORY_MB = int(os.getenv('ETL_PROJECTION_MEMORY_MB', 256))
+
+# Spool disque entre les étapes (src/cli.py)
+SPOOL_DIR = os.getenv('ETL_SPOOL_DIR', 'spool')
+# Format du spool transformé : ndjson (gzip) ou arrow (Arrow IPC, requiert pyarrow)
+SPOOL_FORMAT = os.getenv('ETL_SPOOL_FORMAT', 'ndjson')
+# Nombre d'enregistrements par fichier du spool
+SPOOL_PART_ROWS = int(os.getenv('ETL_SPOOL_PART_ROWS', 50000))
+
+# Datasets déclaratifs supplémentaires (fichier JSON, voir datasets/datasets.py)
+DATASETS_FILE = os.getenv('ETL_DATASETS_FILE', '')
+# Pools partagés du runner multi-datasets : requêtes HTTP et chargements simultanés
+HTTP_WORKERS = int(os.getenv('ETL_HTTP_WORKERS', 4))
+DB_WORKERS = int(os.getenv('ETL_DB_WORKERS', 2))
+
+# Instantané Arrow (Feather v2) des lignes visibles, publié après chaque run
+# sur un volume partagé avec le frontend (vide : désactivé)
+SNAPSHOT_PATH = os.getenv('ETL_SNAPSHOT_PATH', '')
+# Lignes lues et écrites par lot Arrow de l'instantané
+SNAPSHOT_CHUNK_ROWS = int(os.getenv('ETL_SNAPSHOT_CHUNK_ROWS', 50000))
+
+# Détection d'anomalies par groupe (nature x collectivité) : seuil du score
+# robuste |0.6745 (x - médiane) / MAD| au-delà duquel une ligne est signalée
+ANOMALY_THRESHOLD = float(os.getenv('ETL_ANOMALY_THRESHOLD', 3.5))
+# Lignes minimales d'un groupe pour y noter une ligne (sinon groupe plus large)
+ANOMALY_MIN_GROUP_ROWS = int(os.getenv('ETL_ANOMALY_MIN_GROUP_ROWS', 30))
+# Lots entre deux enregistrements du profil et des statistiques de groupes
+# d'un run en cours (transaction du checkpoint) ; un run interrompu repris
+# par --resume perd au plus les résumés des ETL_SKETCH_SAVE_EVERY - 1
+# derniers lots validés
+SKETCH_SAVE_EVERY = max(1, int(os.getenv('ETL_SKETCH_SAVE_EVERY', 10)))
+
+# Quasi-doublons (MinHash/LSH sur les désignations, même collectivité) :
+# similarité de Jaccard minimale d'une paire candidate
+NEAR_DUP_THRESHOLD = float(os.getenv('ETL_NEAR_DUP_THRESHOLD', 0.8))
+# Lignes au-delà desquelles un bucket LSH (désignation générique) est ignoré
+NEAR_DUP_MAX_BUCKET_ROWS = int(os.getenv('ETL_NEAR_DUP_MAX_BUCKET_ROWS', 50))
@@ -0,0 +1,132 @@
+"""Définitions déclaratives des datasets ingérés par le pipeline ETL.
+
+Un dataset est décrit par son identifiant OpenData, son schéma cible
+(colonne -> type, comme transform.TARGET_SCHEMA), ses champs dérivés et
+sa table cible. Le dataset des immobilisations garde ses transformations
+et son chargement dédiés (dimensions, table de faits) ; les autres sont
+déclarés dans un fichier JSON (ETL_DATASETS_FILE) et chargés dans une
+table générée à partir de leur schéma :
+
+    [
+      {
+        "dataset_id": "<identifiant OpenData>",
+        "table": "<table cible>",
+        "key": "<colonne clé métier>",
+        "schema": {"<colonne>": "string|text|date|decimal|float|int", ...},
+        "derived": {"<colonne>": "<expression pandas.eval>", ...}
+      }
+    ]
+"""
+import json
+import logging
+import pandas as pd
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from config import BATCH_SIZE, DATASET_ID, DATASETS_FILE
+from models import SCHEMA_COLUMN_TYPES, dataset_table
+from transform.transform import TARGET_SCHEMA, calculate_derived_fields, add_data_quality_flags
+from load.load import upsert_immobilisations, upsert_rows
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DatasetDefinition:
+    """Description d'un dataset : source, schéma, dérivations et table cible."""
+
+    dataset_id: str
+    schema: Dict[str, str]
+    table: str
+    # colonne -> expression évaluée par DataFrame.eval sur le lot transformé
+    derived: Dict[str, str] = field(default_factory=dict)
+    key: Optional[str] = None
+    batch_size: int = BATCH_SIZE
+    search_url: Optional[str] = None
+    # transformations propres à un dataset défini dans le code (df -> df, en place)
+    derive_steps: Tuple[Callable, ...] = ()
+    # chargement dédié (signature de upsert_immobilisations), table générée sinon
+    loader: Optional[Callable] = None
+
+    def derive(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Applique les transformations puis les champs dérivés au lot."""
+        for step in self.derive_steps:
+            df = step(df, copy=False)
+        for column, expression in self.derived.items():
+            df[column] = pd.to_numeric(df.eval(expression), errors='coerce')
+        return df
+
+    def target_table(self):
+        """Table générée du dataset (datasets sans chargement dédié)."""
+        return dataset_table(self.table, self.schema, self.derived, self.key)
+
+    def load(self, df: pd.DataFrame, checkpoint: Optional[Callable] = None,
+             on_reject: Optional[Callable] = None, engine=None, run_id: Optional[int] = None,
+             run_keys=None) -> int:
+        """Charge un lot transformé, checkpoint dans la même transaction."""
+        if self.loader is not None:
+            return self.loader(df, table_name=self.table, checkpoint=checkpoint, copy=False,
+                               on_reject=on_reject, run_id=run_id, engine=engine, run_keys=run_keys)
+        return upsert_rows(df, self.target_table(), checkpoint=checkpoint, on_reject=on_reject,
+                           engine=engine, run_id=run_id, key=self.key, run_keys=run_keys)
+
+
+# Dataset historique : immobilisations et état des amortissements
+IMMOBILISATIONS = DatasetDefinition(
+    dataset_id=DATASET_ID,
+    schema=TARGET_SCHEMA,
+    table='immobilisations_amortissements',
+    key='ndeg_immobilisation',
+    derive_steps=(calculate_derived_fields, add_data_quality_flags),
+    loader=upsert_immobilisations,
+)
+
+
+def parse_definitions(entries: List[Dict]) -> List[DatasetDefinition]:
+    """
+    Valide et convertit des définitions JSON en DatasetDefinition.
+
+    Raises:
+        ValueError: définition incomplète ou type de colonne inconnu
+    """
+    definitions = []
+    for entry in entries:
+        missing = {'dataset_id', 'table', 'schema'} - set(entry)
+        if missing:
+            raise ValueError(f"Dataset definition {entry.get('dataset_id', '?')} is missing {sorted(missing)}")
+        unknown = {kind for kind in entry['schema'].values() if kind not in SCHEMA_COLUMN_TYPES}
+        if unknown:
+            raise ValueError(f"Dataset {entry['dataset_id']}: unknown column types {sorted(unknown)}")
+        key = entry.get('key')
+        if key is not None and key not in entry['schema']:
+            raise ValueError(f"Dataset {entry['dataset_id']}: key {key!r} is not in its schema")
+        definitions.append(DatasetDefinition(
+            dataset_id=entry['dataset_id'],
+            schema=dict(entry['schema']),
+            table=entry['table'],
+            derived=dict(entry.get('derived', {})),
+            key=key,
+            batch_size=int(entry.get('batch_size', BATCH_SIZE)),
+            search_url=entry.get('search_url'),
+        ))
+    return definitions
+
+
+def load_definitions(path: str = DATASETS_FILE) -> Dict[str, DatasetDefinition]:
+    """
+    Retourne les datasets connus : immobilisations et ceux du fichier JSON.
+
+    Args:
+        path: Fichier de définitions (vide = immobilisations seulement)
+
+    Returns:
+        Dictionnaire identifiant -> définition
+    """
+    definitions = {IMMOBILISATIONS.dataset_id: IMMOBILISATIONS}
+    if path:
+        with open(path, encoding='utf-8') as fh:
+            for definition in parse_definitions(json.load(fh)):
+                if definition.dataset_id in definitions:
+                    raise ValueError(f'Dataset {definition.dataset_id} is defined twice')
+                definitions[definition.dataset_id] = definition
+        logger.info('Loaded %s dataset definitions from %s', len(definitions) - 1, path)
+    return definitions
@@ -0,0 +1,199 @@
+"""Exécution concurrente de plusieurs datasets sur des pools partagés.
+
+Chaque dataset est piloté par son propre coordinateur (pagination,
+transformation, checkpoint dans etl_runs) ; les requêtes HTTP et les
+chargements MySQL de tous les datasets passent par deux pools de taille
+fixe (ETL_HTTP_WORKERS, ETL_DB_WORKERS) : le nombre de requêtes vers
+l'API et de connexions d'écriture reste borné quel que soit le nombre
+de datasets. La page suivante d'un dataset est demandée pendant la
+transformation et le chargement de la page courante. Les lots suivent la
+même boucle que le pipeline principal (pipeline.process_batches).
+
+Un run validé d'un dataset chargé dans la table de faits (loader
+upsert_immobilisations) republie l'instantané Arrow du frontend.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List
+from config import HTTP_WORKERS, DB_WORKERS
+from extract.extract import fetch_page
+from transform.transform import transform_records
+from load.load import get_engine, upgrade_table, upsert_immobilisations
+from load.checkpoint import (
+    RunState, STATUS_COMMITTED, STATUS_FAILED, ensure_run_tables, start_run, finish_run
+)
+from load.dead_letter import DeadLetterStore
+from load.run_keys import open_run_keys
+from datasets.datasets import DatasetDefinition
+from models import Immobilisation
+from snapshot.snapshot import refresh_snapshot
+from sketches.profile import DatasetProfile, load_profile, report_profile
+from anomalies.anomalies import open_detector, report_anomalies
+from dedup.dedup import NearDuplicateIndex
+from pipeline.pipeline import process_batches
+from utils.memory import get_governor
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DatasetResults:
+    """Issue des datasets d'une exécution : runs validés et échecs, séparés."""
+
+    # dataset -> état du run après le dernier lot validé
+    runs: Dict[str, RunState] = field(default_factory=dict)
+    # dataset -> exception qui a fait échouer son run
+    failures: Dict[str, Exception] = field(default_factory=dict)
+
+
+def run_datasets(
+    definitions: Iterable[DatasetDefinition],
+    resume: bool = False,
+    http_workers: int = HTTP_WORKERS,
+    db_workers: int = DB_WORKERS,
+    engine=None
+) -> DatasetResults:
+    """
+    Ingère plusieurs datasets en parallèle.
+
+    L'échec d'un dataset (run marqué failed) n'interrompt pas les autres.
+
+    Args:
+        definitions: Datasets à ingérer
+        resume: Reprendre le dernier run interrompu de chaque dataset
+        http_workers: Nombre maximal de requêtes API simultanées
+        db_workers: Nombre maximal de chargements simultanés
+        engine: Moteur SQLAlchemy (défaut: get_engine())
+
+    Returns:
+        Runs terminés (DatasetResults.runs) et échecs (DatasetResults.failures)
+    """
+    definitions = list(definitions)
+    engine = engine or get_engine()
+    # créées ici une fois : les coordinateurs démarrent leurs runs en même temps
+    ensure_run_tables(engine)
+    logger.info('Running %s datasets (http_workers=%s, db_workers=%s)',
+                len(definitions), http_workers, db_workers)
+
+    results = DatasetResults()
+    with ThreadPoolExecutor(http_workers, thread_name_prefix='etl-http') as http_pool, \
+            ThreadPoolExecutor(db_workers, thread_name_prefix='etl-db') as db_pool, \
+            ThreadPoolExecutor(max(1, len(definitions)), thread_name_prefix='etl-dataset') as coordinators:
+        futures = {
+            definition.dataset_id: coordinators.submit(
+                run_dataset, definition, engine, http_pool, db_pool, resume
+            )
+            for definition in definitions
+        }
+        for dataset_id, future in futures.items():
+            try:
+                results.runs[dataset_id] = future.result()
+            except Exception as e:
+                logger.exception('Dataset %s failed', dataset_id)
+                results.failures[dataset_id] = e
+    return results
+
+
+def run_dataset(definition: DatasetDefinition, engine, http_pool, db_pool, resume: bool = False) -> RunState:
+    """
+    Ingère un dataset : pages demandées au pool HTTP, lots chargés par le pool DB.
+
+    Les lots passent par la boucle commune (pipeline.process_batches) ; le
+    dataset de la table de faits y ajoute le profil, les anomalies, les
+    quasi-doublons et le budget mémoire du pipeline principal. Les mesures
+    par étape (RunMetrics) restent propres à main.py : le temps SQL y est
+    attribué au run actif du processus, partagé ici entre datasets.
+
+    Returns:
+        État du run après le dernier lot validé
+    """
+    dataset_id = definition.dataset_id
+    publishes = definition.loader is upsert_immobilisations
+    # Table dont les lignes absentes d'un run validé sont retirées (loader
+    # spécifique : table inconnue, aucune ligne retirée)
+    table = Immobilisation.__table__ if publishes else None
+    if definition.loader is None:
+        table = definition.target_table()
+        table.create(engine, checkfirst=True)
+        with engine.begin() as conn:
+            upgrade_table(conn, table)
+
+    state = start_run(engine, dataset_id, resume=resume)
+    dead_letters = DeadLetterStore(state.run_id)
+    run_keys = open_run_keys(engine, state.run_id, resume=resume)
+    data_profile = detector = near_duplicates = governor = None
+    if publishes:
+        data_profile = (load_profile(engine, state.run_id) if resume else None) or DatasetProfile()
+        detector = open_detector(engine, state.run_id, resume=resume)
+        near_duplicates = NearDuplicateIndex(state.run_id)
+        governor = get_governor(definition.batch_size)
+    page_size = (lambda: governor.batch_size) if governor else (lambda: definition.batch_size)
+
+    batches = _prefetch_pages(definition, http_pool, state.last_offset, page_size)
+    try:
+        state = process_batches(
+            engine,
+            state,
+            batches,
+            transform=lambda records, on_error: transform_records(records, definition.schema, on_error=on_error),
+            load=lambda df, checkpoint, on_reject: definition.load(df, checkpoint, on_reject, engine,
+                                                                   state.run_id, run_keys),
+            dead_letters=dead_letters,
+            derive=definition.derive,
+            data_profile=data_profile,
+            detector=detector,
+            near_duplicates=near_duplicates,
+            run_keys=run_keys,
+            governor=governor,
+            execute=lambda function, *args: db_pool.submit(function, *args).result(),
+            label=dataset_id,
+        )
+    except Exception:
+        finish_run(engine, state, STATUS_FAILED)
+        raise
+    finally:
+        # page suivante déjà demandée : annulée si le run s'arrête
+        batches.close()
+
+    status = STATUS_COMMITTED if state.rows_extracted else STATUS_FAILED
+    finish_run(engine, state, status, run_keys=run_keys if table is not None else None, table=table)
+    if status == STATUS_COMMITTED and publishes:
+        refresh_snapshot(engine)
+        report_profile(engine, state.run_id, data_profile)
+        report_anomalies(engine, detector)
+    logger.info('[%s] %s records extracted, %s rows loaded, %s dead letters',
+                dataset_id, f'{state.rows_extracted:,}', f'{state.rows_loaded:,}', dead_letters.total)
+    return state
+
+
+def _prefetch_pages(definition: DatasetDefinition, http_pool, start: int,
+                    page_size: Callable[[], int]) -> Iterator[List[dict]]:
+    """
+    Pages d'un dataset à partir de `start`, la suivante demandée au pool
+    HTTP pendant le traitement de la page courante.
+
+    Args:
+        page_size: Taille de la prochaine page demandée (budget mémoire)
+    """
+    def request(offset, rows):
+        return http_pool.submit(fetch_page, offset, rows, definition.dataset_id, None, definition.search_url)
+
+    rows = page_size()
+    pending = request(start, rows)
+    try:
+        while pending is not None:
+            records = pending.result()
+            if not records:
+                return
+            start += len(records)
+            # page suivante demandée pendant le traitement de celle-ci
+            if len(records) >= rows:
+                rows = page_size()
+                pending = request(start, rows)
+            else:
+                pending = None
+            yield records
+    finally:
+        if pending is not None:
+            pending.cancel()
@@ -0,0 +1,399 @@
+"""Détection des quasi-doublons par MinHash/LSH sur les désignations.
+
+Le dédoublonnage exact (empreinte source_hash, numéro d'immobilisation)
+ne voit pas un même bien ressaisi sous un autre numéro avec une
+désignation légèrement différente. Chaque désignation normalisée (sans
+accents, minuscules, ponctuation retirée) est découpée en n-grammes de
+caractères ; sa signature MinHash (128 permutations) estime la
+similarité de Jaccard entre deux désignations.
+
+Les signatures sont coupées en 16 bandes de 8 valeurs : deux lignes de la
+même collectivité qui partagent une bande tombent dans le même bucket et
+forment une paire candidate (probabilité > 0.9 au-delà de 0.8 de
+similarité). Les buckets et les signatures des lignes chargées sont
+persistés (etl_lsh_buckets, etl_minhash) : chaque nouvelle ligne n'est
+comparée qu'aux lignes de ses buckets, jamais à toute la table. Les
+paires retenues sont écrites dans etl_near_duplicates avec le checkpoint
+de leur lot ; les clusters sont leurs composantes connexes.
+"""
+import logging
+from typing import Dict, Iterator, List, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import insert, select
+from config import NEAR_DUP_MAX_BUCKET_ROWS, NEAR_DUP_THRESHOLD
+from models import EtlLshBucket, EtlMinHash, EtlNearDuplicate
+from sketches.sketches import hash_values
+
+logger = logging.getLogger(__name__)
+
+# Signature : BANDS bandes de ROWS_PER_BAND valeurs
+NUM_PERM = 128
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+# Longueur des n-grammes de caractères
+SHINGLE_SIZE = 4
+
+# Permutations par multiplication-décalage : ((a x + b) mod 2^64) >> 32,
+# universelles pour des n-grammes hachés sur 32 bits (a impair)
+_RANDOM = np.random.default_rng(20240601)
+_A = _RANDOM.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _RANDOM.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64)
+# Permutations évaluées ensemble (mémoire : n-grammes x bloc x 8 octets)
+PERM_BLOCK = 16
+
+# Paramètres liés par requête IN (limite des pilotes)
+IN_CHUNK = 1000
+# Longueur des désignations recopiées dans etl_minhash
+DESIGNATION_LENGTH = 255
+
+
+def normalize_designations(values: pd.Series) -> pd.Series:
+    """Désignations sans accents, en minuscules, ponctuation remplacée par des espaces."""
+    return (
+        values.astype(object).where(values.notna(), '').astype(str)
+        .str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+        .str.lower().str.replace(r'[^a-z0-9]+', ' ', regex=True).str.strip()
+    )
+
+
+def shingle_hashes(texts: List[str]):
+    """
+    Empreintes 32 bits des n-grammes de chaque texte (non vide).
+
+    Returns:
+        (indice du texte de chaque n-gramme, empreintes), triés par texte
+    """
+    shingles = [
+        [text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))]
+        for text in texts
+    ]
+    owners = np.repeat(np.arange(len(texts)), [len(s) for s in shingles])
+    flat = np.array([shingle for row in shingles for shingle in row], dtype=object)
+    return owners, hash_values(flat) & np.uint64(0xFFFFFFFF)
+
+
+def minhash_signatures(owners: np.ndarray, hashes: np.ndarray, count: int) -> np.ndarray:
+    """
+    Signatures MinHash de `count` textes à partir de leurs n-grammes.
+
+    Le minimum de chaque permutation est pris par texte avec
+    np.minimum.reduceat (n-grammes groupés par texte).
+
+    Returns:
+        Matrice (textes x NUM_PERM) d'entiers 32 bits
+    """
+    starts = np.searchsorted(owners, np.arange(count))
+    signature = np.empty((count, NUM_PERM), dtype=np.uint32)
+    for begin in range(0, NUM_PERM, PERM_BLOCK):
+        block = slice(begin, begin + PERM_BLOCK)
+        # débordement voulu : arithmétique modulo 2^64
+        values = (hashes[:, None] * _A[None, block] + _B[None, block]) >> np.uint64(32)
+        signature[:, block] = np.minimum.reduceat(values, starts, axis=0)
+    return signature
+
+
+def band_keys(signature: np.ndarray, groups: pd.Series) -> np.ndarray:
+    """
+    Bucket LSH de chaque ligne pour chaque bande (collectivité comprise).
+
+    Returns:
+        Matrice (lignes x BANDS) d'entiers positifs sur 63 bits
+    """
+    group_hash = hash_values(groups.to_numpy(dtype=object))
+    keys = np.empty((len(signature), BANDS), dtype=np.int64)
+    for band in range(BANDS):
+        columns = pd.DataFrame(signature[:, band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])
+        columns['group'] = group_hash
+        columns['band'] = band
+        keys[:, band] = (pd.util.hash_pandas_object(columns, index=False).to_numpy() >> np.uint64(1)).astype(np.int64)
+    return keys
+
+
+def similarity(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Similarité de Jaccard estimée : part des permutations de même minimum."""
+    return (left == right).mean(axis=1)
+
+
+def _chunks(values: List, size: int = IN_CHUNK) -> Iterator[List]:
+    for begin in range(0, len(values), size):
+        yield values[begin:begin + size]
+
+
+def _records(df: pd.DataFrame) -> List[Dict]:
+    """Lignes à insérer (NULL pour les valeurs manquantes)."""
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def _candidate_pairs(members: pd.DataFrame, max_bucket_rows: int) -> pd.DataFrame:
+    """
+    Paires (ligne du lot, ligne partageant un bucket) des buckets non génériques.
+
+    Args:
+        members: Colonnes bucket, row (position dans le lot) et hash
+            (empreinte indexée, 0 pour une ligne du lot)
+        max_bucket_rows: Taille au-delà de laquelle un bucket est ignoré
+
+    Returns:
+        Colonnes row et other_row (ligne du lot) ou other_hash (ligne indexée)
+    """
+    sizes = members.groupby('bucket')['row'].transform('size')
+    members = members[sizes <= max_bucket_rows]
+    batch = members[members['row'] >= 0]
+    pairs = batch.merge(members, on='bucket', suffixes=('', '_other'))
+    # chaque paire du lot une seule fois, jamais une ligne avec elle-même
+    pairs = pairs[(pairs['row_other'] < 0) | (pairs['row_other'] > pairs['row'])]
+    return pairs[['row', 'row_other', 'hash_other']].drop_duplicates()
+
+
+class NearDuplicateIndex:
+    """
+    Signe les désignations d'un lot puis l'apparie à l'index LSH persistant.
+
+    Usage :
+        index.sign(df)                        # avant le chargement
+        with engine.begin() as conn:
+            ...
+            index.save(conn, df['source_hash'])   # même transaction que le lot
+        index.flush()                         # après commit
+    """
+
+    def __init__(self, run_id: Optional[int] = None, threshold: float = NEAR_DUP_THRESHOLD,
+                 max_bucket_rows: int = NEAR_DUP_MAX_BUCKET_ROWS):
+        self.run_id = run_id
+        self.threshold = threshold
+        self.max_bucket_rows = max_bucket_rows
+        self.pending: Optional[pd.DataFrame] = None
+        self.signatures: Optional[np.ndarray] = None
+        self.keys: Optional[np.ndarray] = None
+        self.pairs: List[Dict] = []
+        self.total = 0
+
+    def sign(self, df: pd.DataFrame) -> int:
+        """
+        Calcule signatures et buckets des lignes du lot ayant une désignation.
+
+        Returns:
+            Nombre de lignes signées
+        """
+        self.discard()
+        if 'designation_des_ensembles' not in df.columns:
+            return 0
+        texts = normalize_designations(df['designation_des_ensembles'])
+        kept = (texts != '').to_numpy()
+        if not kept.any():
+            return 0
+        texts = texts[kept]
+
+        def labels(name, length):
+            if name not in df.columns:
+                return [None] * len(texts)
+            return [None if pd.isna(v) else str(v)[:length] for v in df[name].to_numpy()[kept]]
+
+        self.pending = pd.DataFrame({
+            'collectivite': labels('collectivite', 80),
+            'ndeg_immobilisation': labels('ndeg_immobilisation', 255),
+            'designation': labels('designation_des_ensembles', DESIGNATION_LENGTH),
+        }, index=df.index[kept])
+        owners, hashes = shingle_hashes(texts.tolist())
+        self.signatures = minhash_signatures(owners, hashes, len(texts))
+        groups = pd.Series(self.pending['collectivite'].fillna('').to_numpy(), dtype=object)
+        self.keys = band_keys(self.signatures, groups)
+        return len(texts)
+
+    def save(self, conn, source_hash: Optional[pd.Series]) -> int:
+        """
+        Apparie le lot à l'index et l'y ajoute (transaction du lot).
+
+        Les lignes déjà indexées (chargées inchangées par un run
+        précédent) sont ignorées : leurs paires ont été cherchées lors de
+        leur premier chargement.
+
+        Args:
+            conn: Connexion de la transaction du lot
+            source_hash: Empreintes des lignes du lot (index du DataFrame signé)
+
+        Returns:
+            Nombre de paires quasi-doublons du lot
+        """
+        if self.pending is None or source_hash is None:
+            return 0
+        hashes = source_hash.reindex(self.pending.index).reset_index(drop=True).dropna().astype(np.uint64)
+        known = []
+        signatures, buckets = EtlMinHash.__table__, EtlLshBucket.__table__
+        for chunk in _chunks(hashes.drop_duplicates().tolist()):
+            known.extend(conn.execute(
+                select(signatures.c.source_hash).where(signatures.c.source_hash.in_(chunk))
+            ).scalars())
+        # nouvelles lignes distinctes du lot (positions dans le lot signé)
+        hashes = hashes[~hashes.isin(np.array(known, dtype=np.uint64))].drop_duplicates()
+        if hashes.empty:
+            return 0
+        rows = hashes.index.to_numpy()
+
+        members = pd.DataFrame({
+            'bucket': self.keys[rows].ravel(),
+            'row': np.repeat(rows, BANDS),
+            'hash': 0,
+        })
+        stored = []
+        for chunk in _chunks(pd.unique(members['bucket']).tolist()):
+            stored.extend(conn.execute(
+                select(buckets.c.bucket, buckets.c.source_hash).where(buckets.c.bucket.in_(chunk))
+            ).all())
+        stored = pd.DataFrame(stored, columns=['bucket', 'hash']).assign(row=-1)
+        members = pd.concat([members, stored[['bucket', 'row', 'hash']]], ignore_index=True)
+        pairs = _candidate_pairs(members, self.max_bucket_rows)
+        by_row = pd.Series(hashes.to_numpy(), index=rows)
+        self.pairs = self._verify(conn, pairs, by_row)
+        if self.pairs:
+            conn.execute(insert(EtlNearDuplicate.__table__), self.pairs)
+
+        indexed = self.pending.iloc[rows].assign(
+            source_hash=[int(h) for h in hashes], run_id=self.run_id,
+            signature=[signature.tobytes() for signature in self.signatures[rows]],
+        )
+        conn.execute(insert(signatures), _records(indexed))
+        # un bucket générique (déjà au-delà de la limite) n'est plus alimenté
+        full = stored.groupby('bucket').size()
+        full = full[full > self.max_bucket_rows].index.to_numpy()
+        entries = pd.DataFrame({'bucket': self.keys[rows].ravel(), 'source_hash': np.repeat(hashes.to_numpy(), BANDS)})
+        entries = entries[~entries['bucket'].isin(full)]
+        if entries.empty:
+            return len(self.pairs)
+        conn.execute(insert(buckets), [
+            {'bucket': int(key), 'source_hash': int(h)}
+            for key, h in zip(entries['bucket'].tolist(), entries['source_hash'].tolist())
+        ])
+        return len(self.pairs)
+
+    def _verify(self, conn, pairs: pd.DataFrame, hashes: pd.Series) -> List[Dict]:
+        """
+        Paires candidates dont la similarité estimée atteint le seuil.
+
+        Args:
+            conn: Connexion de la transaction du lot
+            pairs: Paires candidates (voir _candidate_pairs)
+            hashes: Empreinte des nouvelles lignes, indexée par position dans le lot
+        """
+        if pairs.empty:
+            return []
+        row = pairs['row'].to_numpy()
+        other_row = pairs['row_other'].to_numpy()
+        indexed = other_row < 0
+        match = pairs['hash_other'].to_numpy(dtype=np.uint64).copy()
+        match[~indexed] = hashes.loc[other_row[~indexed]].to_numpy()
+        ndeg = self.pending['ndeg_immobilisation'].to_numpy()
+        other = np.empty((len(pairs), NUM_PERM), dtype=np.uint32)
+        other[~indexed] = self.signatures[other_row[~indexed]]
+        other_ndeg = np.empty(len(pairs), dtype=object)
+        other_ndeg[~indexed] = ndeg[other_row[~indexed]]
+        if indexed.any():
+            table = EtlMinHash.__table__
+            found = []
+            for chunk in _chunks([int(h) for h in pd.unique(match[indexed])]):
+                found.extend(conn.execute(
+                    select(table.c.source_hash, table.c.ndeg_immobilisation, table.c.signature)
+                    .where(table.c.source_hash.in_(chunk))
+                ).all())
+            position = pd.Series(np.arange(len(found)), index=np.array([f.source_hash for f in found], dtype=np.uint64))
+            stored = np.frombuffer(b''.join(f.signature for f in found), dtype=np.uint32).reshape(-1, NUM_PERM)
+            at = position.loc[match[indexed]].to_numpy()
+            other[indexed] = stored[at]
+            other_ndeg[indexed] = np.array([f.ndeg_immobilisation for f in found], dtype=object)[at]
+
+        score = similarity(self.signatures[row], other)
+        # un même numéro modifié est une nouvelle version, pas un doublon
+        keep = np.flatnonzero((score >= self.threshold) & (other_ndeg != ndeg[row]))
+        return _records(pd.DataFrame({
+            'run_id': self.run_id,
+            'collectivite': self.pending['collectivite'].to_numpy()[row[keep]],
+            'source_hash': [int(h) for h in hashes.loc[row[keep]]],
+            'match_hash': [int(h) for h in match[keep]],
+            'ndeg_immobilisation': ndeg[row[keep]],
+            'match_ndeg': other_ndeg[keep],
+            'similarity': np.round(score[keep], 4),
+        }))
+
+    def flush(self) -> int:
+        """
+        Clôt le lot validé.
+
+        Returns:
+            Nombre de paires quasi-doublons du lot
+        """
+        count = len(self.pairs)
+        self.total += count
+        self.discard()
+        return count
+
+    def discard(self) -> None:
+        """Abandonne le lot en cours (annulé, il sera rejoué)."""
+        self.pending = None
+        self.signatures = None
+        self.keys = None
+        self.pairs = []
+
+
+def connected_components(left: np.ndarray, right: np.ndarray) -> pd.Series:
+    """
+    Composantes connexes d'un graphe donné par ses arêtes.
+
+    Propagation vectorisée du plus petit identifiant de nœud le long des
+    arêtes jusqu'à stabilité.
+
+    Returns:
+        Identifiant de composante (plus petit nœud) indexé par nœud
+    """
+    nodes, edges = np.unique(np.concatenate([left, right]), return_inverse=True)
+    a, b = edges[:len(left)], edges[len(left):]
+    labels = np.arange(len(nodes))
+    while True:
+        previous = labels.copy()
+        low = np.minimum(labels[a], labels[b])
+        np.minimum.at(labels, a, low)
+        np.minimum.at(labels, b, low)
+        # raccourci : chaque nœud pointe vers le label de son label
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            break
+    return pd.Series(nodes[labels], index=nodes)
+
+
+def near_duplicate_clusters(engine, collectivite: Optional[str] = None) -> pd.DataFrame:
+    """
+    Clusters de quasi-doublons : composantes connexes des paires retenues.
+
+    Args:
+        engine: Moteur SQLAlchemy
+        collectivite: Restreindre à une collectivité
+
+    Returns:
+        Une ligne par bien : cluster, collectivité, numéro et désignation,
+        triées par taille de cluster décroissante
+    """
+    pairs, signatures = EtlNearDuplicate.__table__, EtlMinHash.__table__
+    query = select(pairs.c.source_hash, pairs.c.match_hash)
+    if collectivite is not None:
+        query = query.where(pairs.c.collectivite == collectivite)
+    with engine.connect() as conn:
+        edges = conn.execute(query).all()
+        if not edges:
+            return pd.DataFrame(columns=['cluster', 'size', 'source_hash', 'collectivite',
+                                         'ndeg_immobilisation', 'designation'])
+        left, right = (np.array(column, dtype=object) for column in zip(*edges))
+        clusters = connected_components(left.astype(np.uint64), right.astype(np.uint64))
+        rows = []
+        for chunk in _chunks([int(h) for h in clusters.index]):
+            rows.extend(conn.execute(
+                select(signatures.c.source_hash, signatures.c.collectivite,
+                       signatures.c.ndeg_immobilisation, signatures.c.designation)
+                .where(signatures.c.source_hash.in_(chunk))
+            ).all())
+    members = pd.DataFrame(rows, columns=['source_hash', 'collectivite', 'ndeg_immobilisation', 'designation'])
+    members['source_hash'] = members['source_hash'].astype(np.uint64)
+    members['cluster'] = members['source_hash'].map(clusters)
+    members['size'] = members.groupby('cluster')['source_hash'].transform('size')
+    return members.sort_values(['size', 'cluster', 'ndeg_immobilisation'], ascending=[False, True, True])[
+        ['cluster', 'size', 'source_hash', 'collectivite', 'ndeg_immobilisation', 'designation']
+    ].reset_index(drop=True)
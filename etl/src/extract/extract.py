@@ -7,6 +7,7 @@ import os
 import requests
 import time
 import logging
+from typing import List, Optional
 from config import DATASET_ID, SEARCH_URL
 
 logger = logging.getLogger(__name__)
@@ -15,64 +16,104 @@ logger = logging.getLogger(__name__)
 API_URL = os.getenv('DATASET_API_URL')
 
 
-def fetch_records_in_batches(rows: int = 1000):
+def fetch_page(start: int, rows: int, dataset_id: str = None, on_response=None,
+               search_url: str = None) -> Optional[List]:
+    """
+    Récupère une page d'enregistrements depuis l'API.
+
+    Args:
+        start: Position de la page dans la pagination
+        rows: Nombre d'enregistrements demandés
+        dataset_id: Identifiant du dataset (défaut: DATASET_ID)
+        on_response: Fonction appelée avec la réponse HTTP (instrumentation)
+        search_url: Endpoint de recherche (défaut: SEARCH_URL)
+
+    Returns:
+        Liste d'enregistrements (vide en fin de données), ou None si la
+        pagination doit s'arrêter (limite API atteinte)
+
+    Raises:
+        requests.exceptions.RequestException: requête en échec (autre
+            erreur HTTP, réseau) ; le run est marqué en échec au lieu
+            d'être validé sur des données incomplètes
+    """
+    # Paramètres de la requête API
+    params = {
+        'dataset': dataset_id or DATASET_ID,
+        'rows': rows,
+        'start': start
+    }
+
+    try:
+        logger.debug('Requesting page start=%s rows=%s', start, rows)
+        # Envoyer la requête avec un timeout de 120 secondes
+        resp = requests.get(search_url or SEARCH_URL, params=params, timeout=120)
+        resp.raise_for_status()
+        if on_response is not None:
+            on_response(resp)
+        payload = resp.json()
+    except requests.exceptions.HTTPError as e:
+        # Gérer l'erreur 400 (limite API atteinte)
+        if e.response is not None and e.response.status_code == 400:
+            logger.warning(f"400 error pour start={start}, extraction stoppée (limite API atteinte).")
+            return None
+        logger.error('Request failed for start=%s: %s', start, e)
+        raise
+
+    # La réponse (octets et texte décodé) n'est plus utile une fois parsée
+    del resp
+
+    # Extraire les enregistrements de la réponse
+    records = []
+    if isinstance(payload, dict) and 'records' in payload:
+        records = payload.get('records', [])
+    elif isinstance(payload, list):
+        # Fallback: certains endpoints retournent directement une liste
+        records = payload
+    else:
+        logger.warning('Unexpected format for page: %s', type(payload))
+
+    logger.info('Page start=%s returned %s records', start, len(records))
+    return records
+
+
+def fetch_records_in_batches(rows: int = 1000, start: int = 0, on_response=None, page_size=None,
+                             dataset_id: str = None):
     """
     Récupère les enregistrements par lots depuis l'API.
     
     Args:
         rows: Nombre d'enregistrements par page (défaut: 1000)
+        start: Position de départ dans la pagination (reprise d'un run)
+        on_response: Fonction appelée avec chaque réponse HTTP (instrumentation)
+        page_size: Fonction retournant la taille de la page suivante, consultée
+            avant chaque requête (mode budget mémoire) ; `rows` sinon
+        dataset_id: Identifiant du dataset (défaut: DATASET_ID)
         
     Yields:
         Liste d'enregistrements pour chaque page
     """
-    logger.info("Starting extraction by pagination (streaming by batches)...")
-
-    start = 0  # Position de départ pour la pagination
+    logger.info("Starting extraction by pagination (streaming by batches) from start=%s...", start)
 
     while True:
-        # Paramètres de la requête API
-        params = {
-            'dataset': DATASET_ID,
-            'rows': rows,
-            'start': start
-        }
-
-        try:
-            logger.debug('Requesting page start=%s rows=%s', start, rows)
-            # Envoyer la requête avec un timeout de 120 secondes
-            resp = requests.get(SEARCH_URL, params=params, timeout=120)
-            resp.raise_for_status()
-            payload = resp.json()
-        except requests.exceptions.HTTPError as e:
-            # Gérer l'erreur 400 (limite API atteinte)
-            if e.response is not None and e.response.status_code == 400:
-                logger.warning(f"400 error pour start={start}, extraction stoppée (limite API atteinte).")
-                return
-            logger.error('Request failed for start=%s: %s', start, e)
-            return
-
-        # Extraire les enregistrements de la réponse
-        records = []
-        if isinstance(payload, dict) and 'records' in payload:
-            records = payload.get('records', [])
-        elif isinstance(payload, list):
-            # Fallback: certains endpoints retournent directement une liste
-            records = payload
-        else:
-            logger.warning('Unexpected format for page: %s', type(payload))
-
-        logger.info('Page start=%s returned %s records', start, len(records))
+        if page_size is not None:
+            rows = page_size()
 
+        records = fetch_page(start, rows, dataset_id, on_response)
         if not records:
-            # Plus d'enregistrements disponibles
+            # Plus d'enregistrements disponibles (ou pagination interrompue)
             return
 
-        # Retourner le lot d'enregistrements
+        fetched = len(records)
+
+        # Retourner le lot d'enregistrements (sans en garder de référence :
+        # le consommateur peut le libérer avant de demander la page suivante)
         yield records
+        del records
 
         # Vérifier si c'est la dernière page
-        if len(records) < rows:
+        if fetched < rows:
             return
 
         # Passer à la page suivante
-        start += rows
+        start += fetched
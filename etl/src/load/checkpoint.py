@@ -0,0 +1,448 @@
+"""Points de reprise des runs ETL.
+
+Ce module enregistre l'état de chaque run dans la table etl_runs
+(offset de pagination validé et compteurs par étape). Le checkpoint d'un
+lot est écrit dans la même transaction que ses lignes : après un arrêt
+brutal, un run repris ne recommence qu'au premier lot non validé.
+
+Chaque ligne chargée porte le `run_id` du dernier run qui l'a modifiée,
+le `first_run_id` du run qui l'a introduite et le `retired_run_id` du
+premier run validé dont elle était absente : un run n'écrit que les lignes
+nouvelles ou modifiées, et à sa validation les lignes qu'il n'a pas vues
+(retire_rows). Un run erroné est annulé par suppression indexée des lignes
+qu'il est seul à avoir chargées (rollback_run).
+
+Les identités (row_key) attribuées par un run sont enregistrées avec ses
+checkpoints (etl_run_keys, voir load/run_keys.py) jusqu'à sa validation :
+elles désignent les lignes qu'il a vues, écrites ou non.
+
+Toute modification des données visibles de la table de faits (run du
+dataset principal validé ou annulé) incrémente la version des données
+publiée dans etl_metadata, dans la même transaction : les caches du
+frontend l'incluent dans leurs clés.
+"""
+import os
+import logging
+import dataclasses
+from dataclasses import dataclass
+from typing import List, Optional
+import numpy as np
+from sqlalchemy import inspect, select, update, insert, delete, func, or_, text
+from config import DATASET_ID
+from load.run_keys import RunKeys, delete_run_keys, open_run_keys
+from models import (
+    EtlRun, EtlRunKey, EtlMetadata, Immobilisation, AmortissementProjection, EtlMinHash, EtlLshBucket, EtlNearDuplicate
+)
+
+logger = logging.getLogger(__name__)
+
+STATUS_RUNNING = 'running'
+STATUS_COMMITTED = 'committed'
+STATUS_FAILED = 'failed'
+STATUS_ROLLED_BACK = 'rolled_back'
+
+# Clé de etl_metadata portant la version des données visibles
+DATA_VERSION_KEY = 'data_version'
+
+# Lignes supprimées par transaction lors de l'annulation d'un run
+ROLLBACK_CHUNK_ROWS = int(os.getenv('ETL_ROLLBACK_CHUNK_ROWS', 10000))
+
+# Lignes lues par requête pour trouver celles qu'un run validé n'a pas vues
+RETIRE_SCAN_ROWS = 50000
+
+
+class RollbackError(Exception):
+    """Run inconnu ou encore en cours : il ne peut pas être annulé."""
+
+
+class ResumeError(Exception):
+    """Run interrompu lu depuis une autre source (spool réécrit) : il ne peut pas être repris."""
+
+
+@dataclass(frozen=True)
+class RunState:
+    """État validé d'un run (une ligne de etl_runs)."""
+
+    run_id: int
+    dataset_id: str
+    last_offset: int = 0
+    batches: int = 0
+    rows_extracted: int = 0
+    rows_transformed: int = 0
+    rows_loaded: int = 0
+    resumed: bool = False
+
+    def advance(self, next_offset: int, extracted: int, transformed: int, loaded: int) -> 'RunState':
+        """Retourne l'état après validation d'un lot (l'état courant est inchangé)."""
+        return dataclasses.replace(
+            self,
+            last_offset=next_offset,
+            batches=self.batches + 1,
+            rows_extracted=self.rows_extracted + extracted,
+            rows_transformed=self.rows_transformed + transformed,
+            rows_loaded=self.rows_loaded + loaded,
+        )
+
+
+def _state_from_row(row, resumed: bool = False) -> RunState:
+    return RunState(
+        run_id=row.run_id,
+        dataset_id=row.dataset_id,
+        last_offset=row.last_offset,
+        batches=row.batches,
+        rows_extracted=row.rows_extracted,
+        rows_transformed=row.rows_transformed,
+        rows_loaded=row.rows_loaded,
+        resumed=resumed,
+    )
+
+
+def ensure_run_tables(engine) -> None:
+    """
+    Crée etl_runs, etl_run_keys et etl_metadata, et y amorce la version des données.
+
+    La ligne `data_version` existe ainsi avant tout incrément : deux
+    coordinateurs qui valident en même temps se contentent d'un UPDATE
+    (verrou de ligne), sans course entre UPDATE et INSERT.
+    """
+    EtlRun.__table__.create(engine, checkfirst=True)
+    EtlRunKey.__table__.create(engine, checkfirst=True)
+    EtlMetadata.__table__.create(engine, checkfirst=True)
+    # etl_runs créée avant le suivi de la source des runs
+    if 'source_id' not in {column['name'] for column in inspect(engine).get_columns('etl_runs')}:
+        logger.warning('Adding source_id column to etl_runs')
+        with engine.begin() as conn:
+            conn.execute(text('ALTER TABLE etl_runs ADD COLUMN source_id VARCHAR(100) NULL'))
+    table = EtlMetadata.__table__
+    with engine.begin() as conn:
+        conn.execute(
+            insert(table).prefix_with('IGNORE', dialect='mysql').prefix_with('OR IGNORE', dialect='sqlite')
+            .values(name=DATA_VERSION_KEY, value=0)
+        )
+
+
+def start_run(engine, dataset_id: str, resume: bool = False, source_id: Optional[str] = None) -> RunState:
+    """
+    Démarre un run, ou reprend le dernier run interrompu du dataset.
+
+    Seul le dernier run du dataset peut être repris, s'il n'est pas
+    terminé (running ou failed) et a validé au moins un lot : un run
+    interrompu auquel un run plus récent a succédé, ou qui a échoué avant
+    son premier checkpoint, n'est pas repris. Un nouveau run supprime les
+    identités enregistrées par les runs interrompus du dataset.
+
+    Args:
+        engine: Moteur SQLAlchemy
+        dataset_id: Identifiant du dataset OpenData
+        resume: Reprendre depuis le dernier checkpoint d'un run non terminé
+        source_id: Identité de la source lue (spool), enregistrée sur le
+            run ; None pour l'API
+
+    Returns:
+        État initial du run
+
+    Raises:
+        ResumeError: si le run à reprendre a lu une autre source (son
+            offset ne désigne pas les mêmes lignes)
+    """
+    ensure_run_tables(engine)
+    table = EtlRun.__table__
+
+    with engine.begin() as conn:
+        if resume:
+            row = conn.execute(
+                select(table)
+                .where(table.c.dataset_id == dataset_id)
+                .order_by(table.c.run_id.desc())
+                .limit(1)
+            ).first()
+            if row is not None and row.status in (STATUS_RUNNING, STATUS_FAILED) and row.batches:
+                if row.source_id != source_id:
+                    raise ResumeError(
+                        f'Run {row.run_id} was loaded from source {row.source_id!r}, not {source_id!r}: '
+                        f'it cannot be resumed (start a new run without --resume)'
+                    )
+                conn.execute(
+                    update(table)
+                    .where(table.c.run_id == row.run_id)
+                    .values(status=STATUS_RUNNING, finished_at=None)
+                )
+                state = _state_from_row(row, resumed=True)
+                logger.info('Resuming run %s from offset %s (%s batches already committed)',
+                            state.run_id, state.last_offset, state.batches)
+                return state
+            logger.info('No interrupted run to resume for %s - starting a new run', dataset_id)
+
+        delete_run_keys(conn, select(table.c.run_id).where(table.c.dataset_id == dataset_id))
+        result = conn.execute(
+            insert(table).values(dataset_id=dataset_id, status=STATUS_RUNNING, last_offset=0,
+                                 batches=0, rows_extracted=0, rows_transformed=0, rows_loaded=0,
+                                 source_id=source_id)
+        )
+        run_id = result.inserted_primary_key[0]
+
+    logger.info('Started run %s', run_id)
+    return RunState(run_id=run_id, dataset_id=dataset_id)
+
+
+def save_checkpoint(conn, state: RunState) -> None:
+    """
+    Écrit l'état du run sur une connexion dont la transaction est ouverte.
+
+    À appeler dans la transaction du lot pour que lignes et checkpoint
+    soient validés (ou annulés) ensemble.
+    """
+    table = EtlRun.__table__
+    conn.execute(
+        update(table)
+        .where(table.c.run_id == state.run_id)
+        .values(
+            last_offset=state.last_offset,
+            batches=state.batches,
+            rows_extracted=state.rows_extracted,
+            rows_transformed=state.rows_transformed,
+            rows_loaded=state.rows_loaded,
+        )
+    )
+
+
+def commit_checkpoint(engine, state: RunState) -> None:
+    """Valide un checkpoint seul (lot vide après transformation)."""
+    with engine.begin() as conn:
+        save_checkpoint(conn, state)
+
+
+def bump_data_version(conn) -> int:
+    """
+    Incrémente la version des données sur une connexion en transaction.
+
+    L'incrément est fait par la base (value = value + 1) sur la ligne
+    amorcée par ensure_run_tables : deux runs qui se terminent en même
+    temps obtiennent deux versions distinctes.
+
+    Returns:
+        Nouvelle version
+    """
+    table = EtlMetadata.__table__
+    key = table.c.name == DATA_VERSION_KEY
+    conn.execute(update(table).where(key).values(value=table.c.value + 1))
+    return conn.execute(select(table.c.value).where(key)).scalar()
+
+
+def publishes_data(dataset_id: str) -> bool:
+    """
+    Vrai si le dataset charge la table de faits lue par le frontend.
+
+    Les chargements depuis un spool (`<dataset>:spool`) comptent pour leur
+    dataset (voir models.latest_run_query) ; les datasets déclaratifs ne
+    changent pas les données du frontend.
+    """
+    return dataset_id == DATASET_ID or dataset_id.startswith(f'{DATASET_ID}:')
+
+
+def get_data_version(engine) -> int:
+    """Version courante des données (0 si aucun run n'a encore été validé)."""
+    table = EtlMetadata.__table__
+    with engine.connect() as conn:
+        version = conn.execute(select(table.c.value).where(table.c.name == DATA_VERSION_KEY)).scalar()
+    return version or 0
+
+
+def finish_run(engine, state: RunState, status: str = STATUS_COMMITTED,
+               run_keys: Optional[RunKeys] = None, table=None) -> None:
+    """
+    Marque le run comme terminé (committed) ou en échec (failed).
+
+    Un run validé de la table de faits publie une nouvelle version des
+    données dans la même transaction que son statut (la vue l'expose au
+    même instant, voir publishes_data). Les identités enregistrées d'un run
+    validé sont supprimées : il ne sera plus repris.
+
+    Args:
+        engine: Moteur SQLAlchemy
+        state: État du run
+        status: Statut final
+        run_keys: Identités vues par le run : un run validé retire dans la
+            même transaction les lignes de `table` qu'il n'a pas vues
+            (retire_rows) ; None = aucune ligne retirée
+        table: Table chargée par le run (défaut: table de faits des immobilisations)
+    """
+    table = Immobilisation.__table__ if table is None else table
+    absent = []
+    if status == STATUS_COMMITTED and run_keys is not None:
+        absent = absent_rows(engine, table, run_keys)
+    runs = EtlRun.__table__
+    version = None
+    with engine.begin() as conn:
+        conn.execute(
+            update(runs)
+            .where(runs.c.run_id == state.run_id)
+            .values(status=status, finished_at=func.now())
+        )
+        if absent:
+            retire_rows(conn, table, absent, state.run_id)
+        if status == STATUS_COMMITTED:
+            delete_run_keys(conn, [state.run_id])
+        if status == STATUS_COMMITTED and publishes_data(state.dataset_id):
+            version = bump_data_version(conn)
+    logger.info('Run %s marked as %s', state.run_id, status)
+    if absent:
+        logger.info('Run %s retired %s rows missing from the source', state.run_id, f'{len(absent):,}')
+    if version is not None:
+        logger.info('Published data version %s', version)
+
+
+def absent_rows(engine, table, run_keys: RunKeys, chunk_rows: int = RETIRE_SCAN_ROWS) -> List[int]:
+    """
+    Lignes visibles de `table` qu'un run n'a pas vues (supprimées à la source).
+
+    Les lignes non retirées introduites jusqu'au run sont lues par tranches
+    de `chunk_rows` (pagination sur la clé primaire, `id` et `row_key`
+    seulement) et comparées aux identités du run ; aucune n'est écrite.
+
+    Returns:
+        Identifiants (id) des lignes absentes du run
+    """
+    absent = []
+    last = None
+    with engine.connect() as conn:
+        while True:
+            query = (
+                select(table.c.id, table.c.row_key)
+                .where(table.c.retired_run_id.is_(None), table.c.first_run_id <= run_keys.run_id)
+                .order_by(table.c.id).limit(chunk_rows)
+            )
+            if last is not None:
+                query = query.where(table.c.id > last)
+            rows = conn.execute(query).all()
+            if not rows:
+                break
+            last = rows[-1].id
+            seen = run_keys.contains(np.array([row.row_key for row in rows], dtype=np.uint64))
+            absent.extend(row.id for row, found in zip(rows, seen) if not found)
+    return absent
+
+
+def retire_rows(conn, table, ids: List[int], run_id: int, chunk_rows: int = ROLLBACK_CHUNK_ROWS) -> None:
+    """Marque les lignes `ids` retirées par le run (transaction de sa validation)."""
+    for begin in range(0, len(ids), chunk_rows):
+        conn.execute(
+            update(table).where(table.c.id.in_(ids[begin:begin + chunk_rows]))
+            .values(retired_run_id=run_id, **_unchanged_fetched_at(table))
+        )
+
+
+def _unchanged_fetched_at(table) -> dict:
+    # fetched_at date le dernier chargement des valeurs (ON UPDATE en base)
+    return {'fetched_at': table.c.fetched_at} if 'fetched_at' in table.c else {}
+
+
+def rollback_run(engine, run_id: int, table=None, chunk_rows: int = ROLLBACK_CHUNK_ROWS) -> int:
+    """
+    Annule un run : supprime les lignes qu'il a introduites et le marque rolled_back.
+
+    Seules les lignes introduites par le run (`first_run_id`), qu'aucun run
+    plus récent n'a modifiées (`run_id`) et dont aucun run plus récent n'a
+    besoin sont supprimées : le run validé suivant les a retirées
+    (`retired_run_id`), et un run suivant interrompu ne les a pas vues
+    (identités de ses lots validés). Elles sont lues par tranches de
+    `chunk_rows` lignes, paginées sur `id` par l'index (first_run_id, id) :
+    chaque tranche reprend après la précédente, sans relire les lignes
+    conservées (transactions courtes). Les
+    lignes que le run avait retirées le sont par le run validé suivant, ou
+    redeviennent visibles. Une ligne que le run a modifiée en place garde
+    ses nouvelles valeurs ; un run relancé les corrige. Le dernier run
+    validé restant redevient visible. Les projections des immobilisations
+    supprimées et leurs entrées de l'index des quasi-doublons (signatures,
+    buckets, paires) sont supprimées avec elles.
+
+    Args:
+        engine: Moteur SQLAlchemy
+        run_id: Run à annuler
+        table: Table chargée par le run (défaut: table de faits des immobilisations)
+        chunk_rows: Lignes supprimées par transaction
+
+    Returns:
+        Nombre de lignes supprimées
+
+    Raises:
+        RollbackError: run inconnu ou encore en cours
+    """
+    runs = EtlRun.__table__
+    table = Immobilisation.__table__ if table is None else table
+    ensure_run_tables(engine)
+    with engine.connect() as conn:
+        run = conn.execute(select(runs.c.status, runs.c.dataset_id).where(runs.c.run_id == run_id)).first()
+        if run is not None:
+            # runs suivants du dataset (chargements depuis un spool compris)
+            dataset_id = run.dataset_id.split(':')[0]
+            later = conn.execute(
+                select(runs.c.run_id, runs.c.status)
+                .where(runs.c.run_id > run_id,
+                       or_(runs.c.dataset_id == dataset_id, runs.c.dataset_id.like(f'{dataset_id}:%')))
+                .order_by(runs.c.run_id)
+            ).all()
+    status = run.status if run is not None else None
+    if status is None:
+        raise RollbackError(f'Unknown run {run_id}')
+    if status == STATUS_RUNNING:
+        raise RollbackError(f'Run {run_id} is still running')
+
+    following = next((row.run_id for row in later if row.status == STATUS_COMMITTED), None)
+    interrupted = [open_run_keys(engine, row.run_id, resume=True)
+                   for row in later if row.status in (STATUS_RUNNING, STATUS_FAILED)]
+    condition = [table.c.first_run_id == run_id, table.c.run_id == run_id]
+    if following is not None:
+        condition.append(table.c.retired_run_id == following)
+
+    projection = AmortissementProjection.__table__ if table is Immobilisation.__table__ else None
+    deleted = 0
+    last = None
+    while True:
+        query = select(table.c.id, table.c.row_key, table.c.source_hash).where(*condition)
+        if last is not None:
+            query = query.where(table.c.id > last)
+        with engine.begin() as conn:
+            rows = conn.execute(query.order_by(table.c.id).limit(chunk_rows)).all()
+            if not rows:
+                break
+            last = rows[-1].id
+            if interrupted:
+                keys = np.array([row.row_key for row in rows], dtype=np.uint64)
+                needed = np.zeros(len(rows), dtype=bool)
+                for run_keys in interrupted:
+                    needed |= run_keys.contains(keys)
+                rows = [row for row, keep in zip(rows, needed) if not keep]
+            ids = [row.id for row in rows]
+            if ids:
+                if projection is not None:
+                    conn.execute(delete(projection).where(projection.c.immobilisation_id.in_(ids)))
+                    _delete_near_duplicates(conn, [row.source_hash for row in rows])
+                conn.execute(delete(table).where(table.c.id.in_(ids)))
+        deleted += len(ids)
+
+    with engine.begin() as conn:
+        # lignes retirées par le run : absentes aussi du run validé suivant
+        # (qui ne retire que les lignes visibles), ou de nouveau visibles
+        conn.execute(
+            update(table).where(table.c.retired_run_id == run_id)
+            .values(retired_run_id=following, **_unchanged_fetched_at(table))
+        )
+        conn.execute(
+            update(runs).where(runs.c.run_id == run_id)
+            .values(status=STATUS_ROLLED_BACK, finished_at=func.now())
+        )
+        delete_run_keys(conn, [run_id])
+        if status == STATUS_COMMITTED and publishes_data(run.dataset_id):
+            # les lignes supprimées étaient visibles
+            bump_data_version(conn)
+    logger.info('Run %s rolled back: %s rows deleted from %s', run_id, deleted, table.name)
+    return deleted
+
+
+def _delete_near_duplicates(conn, hashes) -> None:
+    """Retire des lignes supprimées l'index des quasi-doublons (voir dedup/dedup.py)."""
+    signatures, buckets, pairs = EtlMinHash.__table__, EtlLshBucket.__table__, EtlNearDuplicate.__table__
+    conn.execute(delete(pairs).where(or_(pairs.c.source_hash.in_(hashes), pairs.c.match_hash.in_(hashes))))
+    conn.execute(delete(buckets).where(buckets.c.source_hash.in_(hashes)))
+    conn.execute(delete(signatures).where(signatures.c.source_hash.in_(hashes)))
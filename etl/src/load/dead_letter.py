@@ -0,0 +1,119 @@
+"""Stockage des lignes rejetées (dead letters) du pipeline ETL.
+
+Les enregistrements que la transformation ne sait pas lire et les lignes
+que MySQL refuse (valeur trop longue, dépassement de DECIMAL, ...) sont
+mis de côté avec leur erreur au lieu d'interrompre le run. Ils sont
+écrits dans la table etl_dead_letters dans la transaction du lot (avec
+son checkpoint) et, si ETL_DEAD_LETTER_FILE est défini, ajoutés à un
+fichier NDJSON une fois le lot validé.
+"""
+import os
+import json
+import logging
+import datetime
+import pandas as pd
+from typing import Any, Dict, List, Optional
+from sqlalchemy import insert
+from models import EtlDeadLetter
+
+logger = logging.getLogger(__name__)
+
+# Fichier NDJSON optionnel recevant aussi les rejets (vide = table seule)
+DEAD_LETTER_FILE = os.getenv('ETL_DEAD_LETTER_FILE', '')
+
+# Longueur maximale du message d'erreur conservé
+MAX_ERROR_LENGTH = 2000
+
+
+def _json_safe(value: Any) -> Any:
+    """Convertit les valeurs pandas/numpy/dates en types JSON."""
+    if isinstance(value, dict):
+        return {str(k): _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, (datetime.date, datetime.datetime, pd.Timestamp)):
+        return value.isoformat()
+    if hasattr(value, 'item') and not isinstance(value, (str, bytes)):
+        # scalaires numpy
+        value = value.item()
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def _error_text(error: Any) -> str:
+    # l'erreur SQLAlchemy contient l'instruction et ses paramètres : seul
+    # le message du pilote est utile
+    orig = getattr(error, 'orig', None)
+    text = f'{type(orig or error).__name__}: {orig or error}'
+    return text[:MAX_ERROR_LENGTH]
+
+
+class DeadLetterStore:
+    """
+    Collecte les rejets d'un lot puis les persiste avec son checkpoint.
+
+    Usage :
+        store.add('transform', record, error, source_offset=offset + idx)
+        with engine.begin() as conn:
+            ...
+            store.save(conn)          # même transaction que le lot
+        store.flush()                 # après commit : fichier NDJSON
+    """
+
+    def __init__(self, run_id: Optional[int] = None, path: str = DEAD_LETTER_FILE):
+        self.run_id = run_id
+        self.path = path
+        self.pending: List[Dict[str, Any]] = []
+        self.total = 0
+
+    def add(self, stage: str, payload: Any, error: Any, source_offset: Optional[int] = None) -> None:
+        """Met de côté un enregistrement rejeté par l'étape `stage`."""
+        payload = _json_safe(payload)
+        fields = payload.get('fields', payload) if isinstance(payload, dict) else {}
+        ndeg = fields.get('ndeg_immobilisation') if isinstance(fields, dict) else None
+        self.pending.append({
+            'run_id': self.run_id,
+            'stage': stage,
+            'source_offset': source_offset,
+            'ndeg_immobilisation': str(ndeg)[:255] if ndeg is not None else None,
+            'payload': payload,
+            'error': _error_text(error),
+        })
+        logger.warning('Dead letter (%s, offset=%s, ndeg=%s): %s',
+                       stage, source_offset, ndeg, self.pending[-1]['error'])
+
+    def count(self, stage: Optional[str] = None) -> int:
+        """Nombre de rejets en attente (d'une étape donnée si précisée)."""
+        return sum(1 for row in self.pending if stage is None or row['stage'] == stage)
+
+    def save(self, conn) -> None:
+        """Insère les rejets en attente sur la connexion (transaction du lot)."""
+        if self.pending:
+            conn.execute(insert(EtlDeadLetter.__table__), self.pending)
+
+    def flush(self) -> int:
+        """
+        Clôt le lot validé : ajoute les rejets au fichier NDJSON éventuel.
+
+        Returns:
+            Nombre de rejets du lot
+        """
+        count = len(self.pending)
+        if count and self.path:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as fh:
+                for row in self.pending:
+                    fh.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self.total += count
+        self.pending = []
+        return count
+
+    def discard(self) -> None:
+        """Abandonne les rejets d'un lot annulé (il sera rejoué)."""
+        self.pending = []
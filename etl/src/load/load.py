@@ -1,16 +1,26 @@
 ﻿"""
 Module de chargement des données dans la base MySQL.
 
-Ce module insère les données transformées dans la table immobilisations_amortissements.
+Ce module insère les données transformées dans la table de faits
+immobilisations_amortissements_fact (libellés remplacés par des clés de
+dimension) ; la vue immobilisations_amortissements conserve l'ancien format.
 """
 import os
 import json
+import time
 import logging
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import Date, Integer, Numeric, create_engine, func, or_, select, text
+from sqlalchemy.exc import DataError, IntegrityError, OperationalError
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.dialects.mysql import insert as mysql_insert
-from models import Immobilisation, Base
+from config import DATASET_ID
+from models import Immobilisation, Base, DIMENSIONS, COMPAT_VIEW_NAME, compat_view_ddl
+from utils.process import from_fixed_point
+from load.run_keys import RunKeys, occurrence_keys
 
 logger = logging.getLogger(__name__)
 
@@ -36,62 +46,790 @@ def get_engine():
     return create_engine(url, pool_pre_ping=True)
 
 
-def upsert_immobilisations(df: pd.DataFrame, table_name: str = 'immobilisations_amortissements') -> int:
+# ============================================================================
+# DIMENSIONS
+# ============================================================================
+
+class DimensionCache:
+    """
+    Cache mémoire libellé -> clé de substitution d'une table de dimension.
+
+    Le cache est rechargé depuis la base uniquement lorsqu'un libellé
+    inconnu est rencontré ; les libellés absents sont alors insérés
+    (INSERT IGNORE, sûr en cas d'écritures concurrentes) puis relus.
+    Un libellé plus long que la colonne n'est jamais inséré : INSERT IGNORE
+    le tronquerait sans erreur et la relecture ne le retrouverait pas.
+    """
+
+    def __init__(self, model):
+        self.table = model.__table__
+        self.max_length = self.table.c.libelle.type.length
+        self._keys: Dict[str, int] = {}
+
+    def too_long(self, values: pd.Series) -> pd.Series:
+        """Masque des libellés qui ne tiennent pas dans la colonne `libelle`."""
+        return values.notna() & (values.astype(str).str.len() > self.max_length)
+
+    def refresh(self, conn) -> None:
+        """Recharge l'intégralité de la dimension (quelques centaines de lignes)."""
+        rows = conn.execute(select(self.table.c.libelle, self.table.c.id))
+        self._keys = {libelle: key for libelle, key in rows}
+
+    def resolve(self, conn, values: Iterable) -> Dict[str, int]:
+        """
+        Garantit que tous les libellés possèdent une clé et retourne le mapping.
+
+        Args:
+            conn: Connexion SQLAlchemy ouverte
+            values: Libellés rencontrés dans le lot (None ignorés)
+
+        Returns:
+            Dictionnaire libellé -> clé
+        """
+        missing = {
+            v for v in values
+            if v is not None and v not in self._keys and len(str(v)) <= self.max_length
+        }
+        if missing:
+            self.refresh(conn)
+            missing = sorted(v for v in missing if v not in self._keys)
+            if missing:
+                conn.execute(
+                    mysql_insert(self.table).prefix_with('IGNORE'),
+                    [{'libelle': v} for v in missing]
+                )
+                self.refresh(conn)
+        return self._keys
+
+    def clear(self) -> None:
+        self._keys = {}
+
+
+# Un cache par dimension, partagé par tous les lots du processus
+DIMENSION_CACHES: Dict[str, DimensionCache] = {
+    name: DimensionCache(model) for name, model in DIMENSIONS.items()
+}
+
+
+def resolve_dimensions(conn, df: pd.DataFrame, copy: bool = True,
+                       on_reject: Optional[Callable] = None) -> pd.DataFrame:
+    """
+    Remplace les colonnes texte des dimensions par leurs clés (`<colonne>_id`).
+
+    Les lignes dont un libellé dépasse la taille de sa dimension sont
+    retirées du lot et transmises à `on_reject` (sans clé, elles seraient
+    chargées avec une dimension NULL).
+
+    Args:
+        conn: Connexion SQLAlchemy ouverte
+        df: DataFrame transformé contenant les libellés
+        copy: Travailler sur une copie ; False ajoute les colonnes à `df`
+            et en retire les lignes rejetées
+        on_reject: Fonction appelée avec (ligne, erreur) pour chaque ligne retirée
+
+    Returns:
+        DataFrame avec les colonnes `<colonne>_id` en plus des libellés
+    """
+    for name, cache in DIMENSION_CACHES.items():
+        if name not in df.columns:
+            continue
+        too_long = cache.too_long(df[name])
+        if too_long.any():
+            logger.warning('%s rows rejected: %s longer than %s characters',
+                           int(too_long.sum()), name, cache.max_length)
+            error = ValueError(f'{name} is longer than {cache.max_length} characters')
+            for row in df[too_long].to_dict('records'):
+                if on_reject is not None:
+                    on_reject(row, error)
+                else:
+                    logger.error('Rejected row ndeg=%s: %s', row.get('ndeg_immobilisation'), error)
+            if copy:
+                # nouveau DataFrame : la copie n'est plus nécessaire
+                df = df[~too_long].reset_index(drop=True)
+                copy = False
+            else:
+                # lot cédé : l'appelant retrouve les colonnes ajoutées
+                # (empreintes) sur les lignes restantes, index conservé
+                df.drop(index=df.index[too_long.to_numpy()], inplace=True)
+    if copy:
+        df = df.copy()
+    for name, cache in DIMENSION_CACHES.items():
+        if name not in df.columns:
+            continue
+        values = df[name].dropna().unique()
+        keys = cache.resolve(conn, values)
+        df[f'{name}_id'] = df[name].map(keys)
+    return df
+
+
+# ============================================================================
+# MONTANTS EN VIRGULE FIXE
+# ============================================================================
+
+def fixed_point_scales(df: pd.DataFrame, table) -> Dict[str, int]:
+    """
+    Colonnes DECIMAL du lot portées en unités entières (centimes).
+
+    Une colonne DECIMAL(p, s) de dtype entier contient des multiples de
+    10^-s (voir transform.fixed_point_schema) : elle est liée en Decimal
+    exact à l'insertion et hachée comme sa valeur décimale.
+
+    Returns:
+        Dictionnaire colonne -> nombre de décimales
+    """
+    return {
+        column.name: column.type.scale
+        for column in table.columns
+        if isinstance(column.type, Numeric) and column.type.scale
+        and column.name in df.columns and pd.api.types.is_integer_dtype(df[column.name].dtype)
+    }
+
+
+# ============================================================================
+# EMPREINTE DES LIGNES SOURCE
+# ============================================================================
+
+def source_fingerprint(df: pd.DataFrame, columns: List[str], table=None) -> pd.Series:
+    """
+    Calcule une empreinte 64 bits des valeurs source de chaque ligne.
+
+    Les colonnes sont normalisées selon leur type (numérique, date, texte)
+    avant le hachage vectorisé, afin qu'une même ligne produise la même
+    empreinte quel que soit le dtype inféré pour son lot.
+
+    Args:
+        df: DataFrame contenant les colonnes à hacher
+        columns: Colonnes source qui identifient le contenu d'une ligne
+        table: Table cible dont les types guident la normalisation
+            (défaut: table de faits des immobilisations)
+
+    Returns:
+        Série uint64 alignée sur l'index du DataFrame
+    """
+    table = Immobilisation.__table__ if table is None else table
+    scales = fixed_point_scales(df, table)
+    canonical = pd.DataFrame(index=df.index)
+    for col in columns:
+        values = df[col] if col in df.columns else pd.Series(None, index=df.index, dtype=object)
+        col_type = table.c[col].type if col in table.c else None
+        if isinstance(col_type, (Numeric, Integer)):
+            numbers = pd.to_numeric(values, errors='coerce').astype('float64')
+            if col in scales:
+                # même empreinte qu'en float : n / 10^s est le flottant le plus
+                # proche du décimal, comme float('123.45')
+                numbers = numbers / 10 ** scales[col]
+            canonical[col] = numbers.round(6)
+        elif isinstance(col_type, Date):
+            canonical[col] = pd.to_datetime(values, errors='coerce')
+        else:
+            canonical[col] = values.astype(object).where(values.notna(), '').astype(str)
+    return pd.util.hash_pandas_object(canonical, index=False)
+
+
+def row_keys(df: pd.DataFrame, columns: Iterable[str], source_hash: pd.Series, table=None,
+             run_keys: Optional[RunKeys] = None) -> pd.Series:
+    """
+    Calcule l'identité 64 bits de chaque ligne source (colonne `row_key`).
+
+    L'identité est l'empreinte de la clé métier `columns` : une ligne dont
+    les valeurs changent à la source met à jour sa version précédente. Une
+    ligne sans identifiant (première colonne de la clé vide, ou dataset
+    sans clé) est identifiée par l'empreinte de ses valeurs. Les lignes qui
+    partagent une identité sont numérotées dans l'ordre de la source : deux
+    enregistrements identiques restent deux lignes. Avec `run_keys`, le
+    rang est compté depuis le début du run (lots précédents compris) ;
+    sans, dans le lot seul.
+
+    Args:
+        df: Lot à charger (clés de dimension résolues)
+        columns: Colonnes de la clé métier, identifiant en premier
+        source_hash: Empreintes des valeurs (voir source_fingerprint)
+        table: Table cible dont les types guident la normalisation
+        run_keys: Identités déjà attribuées par le run (voir load/run_keys.py)
+
+    Returns:
+        Série uint64 alignée sur l'index du DataFrame
+    """
+    columns = list(columns)
+    keys = source_hash
+    if columns and columns[0] in df.columns:
+        keys = source_fingerprint(df, columns, table).where(df[columns[0]].notna(), source_hash)
+    if run_keys is not None:
+        return run_keys.assign(keys)
+    return occurrence_keys(keys, keys.groupby(keys).cumcount())
+
+
+# ============================================================================
+# SCHÉMA
+# ============================================================================
+
+_schema_ready = False
+
+# Index de la table de faits remplacés par un index plus large de même
+# préfixe (pagination filtrée de l'explorateur) : supprimés à la migration
+OBSOLETE_INDEXES = ('idx_immob_collectivite_nature', 'idx_immob_nature')
+
+
+def ensure_schema(engine) -> None:
+    """
+    Crée les tables (dimensions + faits) et la vue de compatibilité.
+
+    Une ancienne table physique portant le nom de la vue est renommée en
+    `<nom>_legacy` : l'ETL recharge intégralement les données à chaque run.
+    Une table de faits créée avant le suivi par run reçoit la colonne
+    `run_id` et son index, puis `first_run_id`, l'identité `row_key` et
+    `retired_run_id` (upgrade_table) ; les index déclarés depuis (pagination de
+    l'explorateur) sont ajoutés s'ils manquent, ceux qu'ils remplacent
+    supprimés (OBSOLETE_INDEXES).
+    """
+    global _schema_ready
+    if _schema_ready:
+        return
+
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        legacy = conn.execute(
+            text(
+                "SELECT COUNT(*) FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name "
+                "AND TABLE_TYPE = 'BASE TABLE'"
+            ),
+            {'name': COMPAT_VIEW_NAME}
+        ).scalar()
+        if legacy:
+            logger.warning('Renaming legacy table %s to %s_legacy', COMPAT_VIEW_NAME, COMPAT_VIEW_NAME)
+            conn.execute(text(f'RENAME TABLE {COMPAT_VIEW_NAME} TO {COMPAT_VIEW_NAME}_legacy'))
+        fact = Immobilisation.__tablename__
+        has_run_id = conn.execute(
+            text(
+                "SELECT COUNT(*) FROM information_schema.COLUMNS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name AND COLUMN_NAME = 'run_id'"
+            ),
+            {'name': fact}
+        ).scalar()
+        if not has_run_id:
+            logger.warning('Adding run_id column to %s', fact)
+            conn.execute(text(
+                f'ALTER TABLE {fact} ADD COLUMN run_id INT NULL AFTER fetched_at, '
+                f'ADD INDEX idx_immob_run (run_id)'
+            ))
+        upgrade_table(conn, Immobilisation.__table__)
+        drop_indexes(conn, Immobilisation.__table__, OBSOLETE_INDEXES)
+        conn.execute(text(compat_view_ddl(DATASET_ID)))
+    _schema_ready = True
+
+
+def _has_column(conn, table, column: str) -> bool:
+    return bool(conn.execute(
+        text(
+            "SELECT COUNT(*) FROM information_schema.COLUMNS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name AND COLUMN_NAME = :column"
+        ),
+        {'name': table.name, 'column': column}
+    ).scalar())
+
+
+def upgrade_table(conn, table) -> None:
+    """
+    Migre une table chargée par une version précédente, puis crée ses index manquants.
+
+    Le run qui a introduit chaque ligne (`first_run_id`) est initialisé à
+    son `run_id`. La clé unique sur `source_hash` est remplacée par la
+    colonne `row_key` ; les lignes existantes reçoivent leur empreinte
+    comme identité. Elles ne correspondent à aucune clé métier : le run
+    suivant recharge les lignes et les anciennes versions ne sont plus
+    visibles. Les lignes que le dernier run validé n'a pas rechargées
+    (`run_id` plus ancien) reçoivent ce run comme `retired_run_id` : elles
+    restent invisibles sans que les runs suivants réécrivent les autres.
+    """
+    if not _has_column(conn, table, 'first_run_id'):
+        logger.warning('Adding first_run_id column to %s', table.name)
+        conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN first_run_id INT NULL AFTER run_id'))
+        conn.execute(text(f'UPDATE {table.name} SET first_run_id = run_id'))
+    if not _has_column(conn, table, 'row_key'):
+        logger.warning('Adding row_key column to %s', table.name)
+        unique = conn.execute(
+            text(
+                "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name "
+                "AND COLUMN_NAME = 'source_hash' AND NON_UNIQUE = 0"
+            ),
+            {'name': table.name}
+        ).scalars().all()
+        conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN row_key BIGINT UNSIGNED NULL AFTER first_run_id'))
+        conn.execute(text(f'UPDATE {table.name} SET row_key = source_hash'))
+        conn.execute(text(
+            f'ALTER TABLE {table.name} MODIFY row_key BIGINT UNSIGNED NOT NULL'
+            + ''.join(f', DROP INDEX {name}' for name in unique)
+        ))
+    if not _has_column(conn, table, 'retired_run_id'):
+        logger.warning('Adding retired_run_id column to %s', table.name)
+        conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN retired_run_id INT NULL AFTER first_run_id'))
+        latest = conn.execute(text(
+            f"SELECT MAX(r.run_id) FROM etl_runs r WHERE r.status = 'committed' "
+            f"AND EXISTS (SELECT 1 FROM {table.name} f WHERE f.run_id = r.run_id)"
+        )).scalar()
+        if latest is not None:
+            conn.execute(
+                text(f'UPDATE {table.name} SET retired_run_id = :latest WHERE run_id < :latest'),
+                {'latest': latest}
+            )
+    existing = set(conn.execute(
+        text(
+            "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name"
+        ),
+        {'name': table.name}
+    ).scalars())
+    for index in table.indexes:
+        if index.name not in existing:
+            logger.warning('Adding index %s to %s', index.name, table.name)
+            index.create(conn)
+
+
+def drop_indexes(conn, table, names: Iterable[str]) -> None:
+    """Supprime ceux des index `names` que la table possède encore."""
+    existing = set(conn.execute(
+        text(
+            "SELECT DISTINCT INDEX_NAME FROM information_schema.STATISTICS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name"
+        ),
+        {'name': table.name}
+    ).scalars())
+    for name in names:
+        if name in existing:
+            logger.warning('Dropping index %s from %s', name, table.name)
+            conn.execute(text(f'ALTER TABLE {table.name} DROP INDEX {name}'))
+
+
+# ============================================================================
+# CHARGEMENT
+# ============================================================================
+
+# Colonnes chargées mais exclues de l'empreinte : une ligne rechargée par
+# un autre run reste un doublon
+UNHASHED_COLUMNS = ('row_key', 'source_hash', 'run_id', 'first_run_id')
+
+# Clé métier de la table de faits (identifiant en premier, voir row_keys)
+BUSINESS_KEY = ('ndeg_immobilisation', 'publication_id', 'collectivite_id')
+
+# Lignes converties en dictionnaires puis envoyées par instruction : seule
+# une tranche de dictionnaires est vivante à la fois
+INSERT_CHUNK_ROWS = int(os.getenv('ETL_INSERT_CHUNK_ROWS', 2000))
+
+
+def _to_records(df: pd.DataFrame, columns: List[str],
+                scales: Optional[Dict[str, int]] = None) -> List[Dict]:
+    """
+    Convertit une tranche du DataFrame en paramètres d'insertion (NaN -> NULL).
+
+    Les colonnes de `scales` (unités entières, voir fixed_point_scales) sont
+    liées en Decimal : MySQL reçoit la valeur exacte, sans flottant.
+    """
+    scales = scales or {}
+    records = []
+    for row in df.to_dict(orient='records'):
+        # Extraire les valeurs des colonnes à insérer
+        params = {col: row.get(col) for col in columns}
+        
+        # Nettoyer les valeurs NaN (remplacer par None pour SQL NULL)
+        for k, v in list(params.items()):
+            try:
+                if pd.isna(v):
+                    params[k] = None
+            except Exception:
+                pass
+        for k, scale in scales.items():
+            params[k] = from_fixed_point(params[k], scale)
+        records.append(params)
+    return records
+
+
+# Erreurs imputables aux valeurs d'une ligne (longueur, plage, contrainte) :
+# les autres (connexion perdue, deadlock) font échouer le lot entier
+ROW_ERRORS = (DataError, IntegrityError)
+
+# Code d'erreur MySQL d'une transaction choisie comme victime d'un deadlock
+MYSQL_DEADLOCK = 1213
+
+# Nouvelles tentatives d'une transaction victime d'un deadlock (attente croissante)
+DEADLOCK_RETRIES = int(os.getenv('ETL_DEADLOCK_RETRIES', 3))
+DEADLOCK_BACKOFF_S = 0.2
+
+
+def with_deadlock_retry(work: Callable, label: str):
+    """
+    Exécute `work()` (une transaction complète) en la rejouant après un deadlock.
+
+    MySQL annule la transaction victime (erreur 1213) : elle peut être
+    rejouée telle quelle, jusqu'à DEADLOCK_RETRIES fois. Les autres
+    erreurs remontent immédiatement.
+    """
+    for attempt in range(DEADLOCK_RETRIES + 1):
+        try:
+            return work()
+        except OperationalError as e:
+            code = getattr(e.orig, 'args', (None,))[0]
+            if code != MYSQL_DEADLOCK or attempt == DEADLOCK_RETRIES:
+                raise
+            logger.warning('Deadlock on %s, retrying (%s/%s)', label, attempt + 1, DEADLOCK_RETRIES)
+            time.sleep(DEADLOCK_BACKOFF_S * (attempt + 1))
+
+
+def insert_bisect(conn, stmt, records: List[Dict], offset: int = 0) -> List[Tuple[int, Exception]]:
+    """
+    Insère des lignes en isolant par dichotomie celles que la base refuse.
+
+    La tranche est d'abord insérée en une instruction (dans un SAVEPOINT) ;
+    en cas d'erreur de données, elle est coupée en deux et chaque moitié
+    retentée, jusqu'à la ligne fautive. k lignes invalides parmi n coûtent
+    O(k log n) instructions, les lignes valides restent insérées en masse.
+
+    Args:
+        conn: Connexion dont la transaction est ouverte
+        stmt: Instruction INSERT
+        records: Paramètres des lignes
+        offset: Position de `records[0]` dans le lot (pour les positions rendues)
+
+    Returns:
+        Liste (position dans le lot, erreur) des lignes rejetées
+    """
+    if not records:
+        return []
+    try:
+        with conn.begin_nested():
+            conn.execute(stmt, records)
+        return []
+    except ROW_ERRORS as e:
+        if len(records) == 1:
+            return [(offset, e)]
+        middle = len(records) // 2
+        return (
+            insert_bisect(conn, stmt, records[:middle], offset)
+            + insert_bisect(conn, stmt, records[middle:], offset + middle)
+        )
+
+
+def upsert_statement(table, insert_cols: List[str]):
+    """
+    INSERT ... ON DUPLICATE KEY UPDATE sur l'identité `row_key`.
+
+    Une ligne déjà présente n'est réécrite que si son empreinte change
+    (valeurs modifiées à la source) : elle est alors rattachée au run qui
+    la modifie (`run_id`). Une ligne inchangée n'est pas écrite du tout
+    (toutes les affectations rendent ses valeurs) ; sa présence dans le
+    run est connue par ses identités (voir checkpoint.retire_rows). Une
+    ligne retirée par un run validé (`retired_run_id`) qui revient à la
+    source est réintroduite par le run courant (`first_run_id`).
+    `retired_run_id` puis `source_hash` sont affectés en dernier : MySQL
+    évalue les affectations dans l'ordre et les précédentes comparent
+    encore leurs anciennes valeurs.
+    """
+    stmt = mysql_insert(table)
+    revived = table.c.retired_run_id.isnot(None)
+    changed = or_(table.c.source_hash != stmt.inserted.source_hash, revived)
+    updates = [
+        (col, func.if_(changed, stmt.inserted[col], table.c[col]))
+        for col in insert_cols if col not in UNHASHED_COLUMNS
+    ]
+    if 'fetched_at' in table.c:
+        updates.append(('fetched_at', func.if_(changed, func.now(), table.c.fetched_at)))
+    updates.append(('run_id', func.if_(changed, stmt.inserted.run_id, table.c.run_id)))
+    updates.append(('first_run_id', func.if_(revived, stmt.inserted.first_run_id, table.c.first_run_id)))
+    updates.append(('retired_run_id', None))
+    updates.append(('source_hash', stmt.inserted.source_hash))
+    return stmt.on_duplicate_key_update(updates)
+
+
+def _insert_frame(conn, table, df: pd.DataFrame, insert_cols: List[str], table_name: str,
+                  on_reject: Optional[Callable] = None) -> int:
+    """
+    Insère un DataFrame par tranches dans la transaction ouverte de `conn`.
+
+    Une ligne déjà chargée (même `row_key`) est mise à jour si ses valeurs
+    ont changé, laissée intacte sinon (voir upsert_statement).
+
+    Returns:
+        Nombre de lignes acceptées par la base
+    """
+    stmt = upsert_statement(table, insert_cols)
+    inserted = 0
+    rejected = []
+    scales = {c: s for c, s in fixed_point_scales(df, table).items() if c in insert_cols}
+    for begin in range(0, len(df), INSERT_CHUNK_ROWS):
+        records = _to_records(df.iloc[begin:begin + INSERT_CHUNK_ROWS], insert_cols, scales)
+        rejected.extend(insert_bisect(conn, stmt, records, begin))
+        inserted += len(records)
+        del records
+    inserted -= len(rejected)
+    if rejected:
+        logger.warning('%s rows rejected by %s, %s rows kept', len(rejected), table_name, inserted)
+        source_cols = [c for c in df.columns if c not in UNHASHED_COLUMNS]
+        for position, error in rejected:
+            row = df.iloc[position][source_cols].to_dict()
+            for column, scale in scales.items():
+                row[column] = from_fixed_point(row[column], scale)
+            if on_reject is not None:
+                on_reject(row, error)
+            else:
+                logger.error('Rejected row ndeg=%s: %s', row.get('ndeg_immobilisation'),
+                             getattr(error, 'orig', error))
+    return inserted
+
+
+# ============================================================================
+# CHARGEMENT SHARDÉ
+# ============================================================================
+
+# Clé métier de partitionnement : toutes les versions d'une immobilisation
+# sont écrites par le même shard
+SHARD_KEY = 'ndeg_immobilisation'
+
+
+class ShardedLoadError(Exception):
+    """
+    Échec d'au moins un shard d'un chargement parallèle.
+
+    Les shards validés restent en base ; le checkpoint du lot n'est pas
+    écrit et le lot sera rejoué (les lignes déjà présentes sont retrouvées
+    par leur identité `row_key` et laissées intactes).
+    """
+
+    def __init__(self, errors: Dict[int, Exception], inserted: int, shards: int):
+        self.errors = errors
+        self.inserted = inserted
+        self.shards = shards
+        detail = '; '.join(f'shard {shard}: {type(e).__name__}: {e}' for shard, e in sorted(errors.items()))
+        super().__init__(f'{len(errors)}/{shards} shards failed ({inserted} rows committed): {detail}')
+
+
+def shard_of(df: pd.DataFrame, shards: int, key: str = SHARD_KEY) -> np.ndarray:
+    """
+    Attribue chaque ligne à un shard par hachage de sa clé métier.
+
+    Le hachage (pandas, stable d'un processus à l'autre) envoie toujours une
+    même clé au même shard : deux écrivains ne verrouillent jamais les mêmes
+    lignes ni les mêmes entrées d'index.
+
+    Returns:
+        Numéro de shard (0..shards-1) de chaque ligne
+    """
+    values = df[key].astype(str) if key in df.columns else pd.Series('', index=df.index)
+    hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    return (hashes % np.uint64(shards)).astype(np.int64)
+
+
+def upsert_sharded(
+    engine,
+    table,
+    df: pd.DataFrame,
+    insert_cols: List[str],
+    shards: int,
+    checkpoint: Optional[Callable] = None,
+    on_reject: Optional[Callable] = None
+) -> int:
+    """
+    Insère un lot préparé en parallèle sur `shards` connexions.
+
+    Les lignes sont partitionnées par clé métier (shard_of) ; chaque shard
+    insère sa partition dans sa propre transaction, rejouée en cas de
+    deadlock (with_deadlock_retry). La plus petite partition est écrite
+    en dernier, une fois les autres validées, et le checkpoint est écrit
+    dans sa transaction : elle ne garde aucun verrou pendant l'attente.
+    Un lot interrompu est rejoué en entier à la reprise, sans doublon
+    (clé unique `row_key`).
+
+    Args:
+        engine: Moteur SQLAlchemy partagé (le pool par défaut ouvre jusqu'à 15 connexions)
+        table: Table cible
+        df: Lot avec clés de dimension, identité `row_key` et empreinte `source_hash`
+        insert_cols: Colonnes insérées
+        shards: Nombre de connexions d'écriture
+        checkpoint: Fonction appelée avec la connexion du dernier shard avant son commit
+        on_reject: Fonction appelée avec (ligne, erreur) pour chaque ligne refusée
+
+    Returns:
+        Nombre total de lignes insérées
+
+    Raises:
+        ShardedLoadError: au moins un shard a échoué (erreurs par shard)
+    """
+    assignment = shard_of(df, shards)
+    partitions = {
+        shard: df.iloc[np.flatnonzero(assignment == shard)]
+        for shard in range(shards)
+    }
+    order = sorted((shard for shard, part in partitions.items() if not part.empty),
+                   key=lambda shard: -len(partitions[shard]))
+    if not order:
+        if checkpoint is not None:
+            with engine.begin() as conn:
+                checkpoint(conn)
+        return 0
+
+    def write(shard: int, finish: Optional[Callable] = None) -> Tuple[int, List]:
+        # Les rejets sont remis au dernier shard (après les autres) :
+        # on_reject n'est pas forcément sûr entre threads
+        def attempt():
+            rejected = []
+            with engine.connect() as conn:
+                with conn.begin():
+                    inserted = _insert_frame(conn, table, partitions[shard], insert_cols,
+                                             f'{table.name}[{shard}]',
+                                             lambda row, e: rejected.append((row, e)))
+                    if finish is not None:
+                        finish(conn, rejected)
+            return inserted, rejected
+        return with_deadlock_retry(attempt, f'{table.name}[{shard}]')
+
+    inserted = 0
+    rejected: List = []
+    errors: Dict[int, Exception] = {}
+    with ThreadPoolExecutor(len(order), thread_name_prefix='etl-shard') as pool:
+        futures = {shard: pool.submit(write, shard) for shard in order[:-1]}
+        for shard, future in futures.items():
+            try:
+                count, rows = future.result()
+            except Exception as e:
+                logger.error('Shard %s/%s failed: %s', shard, shards, e)
+                errors[shard] = e
+                continue
+            inserted += count
+            rejected.extend(rows)
+        if errors:
+            raise ShardedLoadError(errors, inserted, shards)
+
+        dispatched = []
+
+        def finish(conn, own_rejected: List) -> None:
+            if not dispatched:
+                # une seule fois, même si la transaction est rejouée
+                for row, error in rejected + own_rejected:
+                    if on_reject is not None:
+                        on_reject(row, error)
+                    else:
+                        logger.error('Rejected row ndeg=%s: %s', row.get(SHARD_KEY),
+                                     getattr(error, 'orig', error))
+                dispatched.append(True)
+            if checkpoint is not None:
+                checkpoint(conn)
+
+        last = order[-1]
+        try:
+            count, _ = pool.submit(write, last, finish).result()
+        except Exception as e:
+            logger.error('Shard %s/%s failed: %s', last, shards, e)
+            raise ShardedLoadError({last: e}, inserted, shards) from e
+    return inserted + count
+
+
+def upsert_immobilisations(
+    df: pd.DataFrame,
+    table_name: str = 'immobilisations_amortissements',
+    checkpoint: Optional[Callable] = None,
+    copy: bool = True,
+    on_reject: Optional[Callable] = None,
+    shards: int = 1,
+    run_id: Optional[int] = None,
+    engine=None,
+    run_keys: Optional[RunKeys] = None
+) -> int:
     """
     Insère les données du DataFrame dans la table MySQL.
+
+    Une ligne refusée par la base (valeur trop longue, dépassement de
+    DECIMAL, ...) n'annule plus le lot : elle est isolée par dichotomie
+    (voir insert_bisect) et transmise à `on_reject`, le reste du lot est
+    validé.
     
     Args:
         df: DataFrame contenant les données à insérer
         table_name: Nom de la table cible (défaut: immobilisations_amortissements)
+        checkpoint: Fonction appelée avec la connexion juste avant le commit,
+            pour valider le point de reprise dans la même transaction ;
+            appelée aussi quand aucune ligne ne reste à insérer
+        copy: Travailler sur une copie ; False ajoute les clés de dimension
+            et l'empreinte directement à `df` (l'appelant cède le lot)
+        on_reject: Fonction appelée avec (ligne, erreur) pour chaque ligne
+            refusée, avant `checkpoint` (dead letters)
+        shards: Nombre de connexions d'écriture parallèles (voir upsert_sharded) ;
+            1 = une seule transaction, checkpoint compris
+        run_id: Run (etl_runs) auquel rattacher les lignes chargées
+        engine: Moteur SQLAlchemy partagé par les lots (défaut: get_engine(),
+            un nouveau pool par appel)
+        run_keys: Identités attribuées par le run : rang des clés métier
+            répétées compté d'un lot à l'autre (défaut: dans le lot seul)
         
     Returns:
         Nombre d'enregistrements insérés
     """
-    engine = get_engine()
+    engine = engine or get_engine()
     conn = engine.connect()
     inserted = 0
 
     try:
-        # Créer les tables si elles n'existent pas
-        Base.metadata.create_all(engine)
+        # Créer les tables et la vue si elles n'existent pas
+        ensure_schema(engine)
     except Exception:
         logger.exception('Failed to ensure target table exists')
 
     # Récupérer la définition de la table
     table = Immobilisation.__table__
     
-    # Colonnes à insérer (exclure id et fetched_at qui sont auto-générés)
-    insert_cols = [c.name for c in table.columns if c.name not in ('id', 'fetched_at')]
+    # Colonnes à insérer (exclure id, fetched_at, retired_run_id écrit à la
+    # validation d'un run, et les colonnes générées par MySQL)
+    insert_cols = [
+        c.name for c in table.columns
+        if c.name not in ('id', 'fetched_at', 'retired_run_id') and c.computed is None
+    ]
 
-    # Préparer les enregistrements pour l'insertion
-    records = []
-    for row in df.to_dict(orient='records'):
-        # Extraire les valeurs des colonnes à insérer
-        params = {col: row.get(col) for col in insert_cols}
-        
-        # Nettoyer les valeurs NaN (remplacer par None pour SQL NULL)
-        for k, v in list(params.items()):
-            try:
-                if pd.isna(v):
-                    params[k] = None
-            except Exception:
-                pass
-        records.append(params)
+    # Résoudre les libellés en clés de dimension (transaction courte dédiée :
+    # les libellés insérés restent valides même si le lot échoue ensuite)
+    try:
+        with conn.begin():
+            df = resolve_dimensions(conn, df, copy=copy, on_reject=on_reject)
+    except Exception:
+        conn.close()
+        logger.exception('Dimension lookup failed')
+        raise
 
-    if not records:
+    # Identité par clé métier (clé unique uq_immob_row_key) et empreinte des
+    # valeurs : une ligne déjà présente est mise à jour (et rattachée au run
+    # courant) si ses valeurs ont changé, laissée intacte sinon
+    hashed_cols = [c for c in insert_cols if c not in UNHASHED_COLUMNS]
+    df['source_hash'] = source_fingerprint(df, hashed_cols)
+    df['row_key'] = row_keys(df, BUSINESS_KEY, df['source_hash'], run_keys=run_keys)
+    df['run_id'] = run_id
+    df['first_run_id'] = run_id
+
+    if df.empty:
         logger.info('No records to insert into %s', table_name)
+        try:
+            if checkpoint is not None:
+                # lot entièrement rejeté : ses dead letters et son offset sont
+                # validés quand même, la reprise ne le rejoue pas
+                with conn.begin():
+                    checkpoint(conn)
+        finally:
+            conn.close()
         return 0
 
+    if shards > 1:
+        # Chargement parallèle : une connexion et une transaction par shard
+        conn.close()
+        inserted = upsert_sharded(engine, table, df, insert_cols, shards,
+                                  checkpoint=checkpoint, on_reject=on_reject)
+        logger.info('Inserted %s rows into %s (%s shards)', inserted, table_name, shards)
+        return inserted
+
     # Démarrer une transaction
     trans = conn.begin()
     try:
-        # Insérer tous les enregistrements
-        result = conn.execute(table.insert(), records)
-        try:
-            trans.commit()
-        except Exception:
-            pass
-        inserted = len(records)
+        inserted = _insert_frame(conn, table, df, insert_cols, table_name, on_reject)
+        if checkpoint is not None:
+            checkpoint(conn)
+        # un échec du commit doit remonter : le checkpoint n'est pas validé
+        trans.commit()
     except Exception:
         # En cas d'erreur, annuler la transaction
         trans.rollback()
@@ -102,3 +840,64 @@ def upsert_immobilisations(df: pd.DataFrame, table_name: str = 'immobilisations_
 
     logger.info('Inserted %s rows into %s', inserted, table_name)
     return inserted
+
+
+def upsert_rows(
+    df: pd.DataFrame,
+    table,
+    checkpoint: Optional[Callable] = None,
+    on_reject: Optional[Callable] = None,
+    engine=None,
+    run_id: Optional[int] = None,
+    key: Optional[str] = None,
+    run_keys: Optional[RunKeys] = None
+) -> int:
+    """
+    Insère un DataFrame dans la table d'un dataset déclaratif.
+
+    Même stratégie que upsert_immobilisations (identité `row_key`, empreinte
+    `source_hash`, insertion par tranches, rejets isolés par dichotomie,
+    checkpoint dans la transaction), sans dimensions.
+
+    Args:
+        df: DataFrame transformé (modifié en place : ajout de `row_key` et `source_hash`)
+        table: Table SQLAlchemy cible (voir models.dataset_table)
+        checkpoint: Fonction appelée avec la connexion juste avant le commit
+        on_reject: Fonction appelée avec (ligne, erreur) pour chaque ligne refusée
+        engine: Moteur SQLAlchemy (défaut: get_engine())
+        run_id: Run (etl_runs) auquel rattacher les lignes chargées
+        key: Colonne clé métier (identité par les valeurs si absente)
+        run_keys: Identités attribuées par le run (voir upsert_immobilisations)
+
+    Returns:
+        Nombre d'enregistrements insérés
+    """
+    engine = engine or get_engine()
+    if df.empty:
+        logger.info('No records to insert into %s', table.name)
+        if checkpoint is not None:
+            with engine.begin() as conn:
+                checkpoint(conn)
+        return 0
+
+    insert_cols = [c.name for c in table.columns if c.name not in ('id', 'fetched_at', 'retired_run_id')]
+    hashed_cols = [c for c in insert_cols if c not in UNHASHED_COLUMNS]
+    df['source_hash'] = source_fingerprint(df, hashed_cols, table)
+    df['row_key'] = row_keys(df, [key] if key else [], df['source_hash'], table, run_keys)
+    df['run_id'] = run_id
+    df['first_run_id'] = run_id
+
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            inserted = _insert_frame(conn, table, df, insert_cols, table.name, on_reject)
+            if checkpoint is not None:
+                checkpoint(conn)
+            trans.commit()
+        except Exception:
+            trans.rollback()
+            logger.exception('Bulk insert into %s failed', table.name)
+            raise
+
+    logger.info('Inserted %s rows into %s', inserted, table.name)
+    return inserted
@@ -0,0 +1,151 @@
+"""Identités (row_key) attribuées par un run, lot après lot.
+
+L'identité d'une ligne est l'empreinte de sa clé métier et de son rang
+parmi les lignes de la source qui partagent cette clé (voir
+load.row_keys). Le rang est compté sur tout le run, dans l'ordre de la
+source : deux enregistrements de même clé répartis sur deux lots (ou deux
+pages) gardent les rangs 0 et 1 quelle que soit la taille des lots.
+
+Les identités déjà attribuées sont gardées en mémoire (8 octets par
+ligne, tableaux triés fusionnés par niveaux) et enregistrées dans
+etl_run_keys avec le checkpoint de chaque lot, une ligne par lot : un run
+repris les relit avant de continuer.
+"""
+import logging
+from typing import List, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, insert, select
+from models import EtlRunKey
+
+logger = logging.getLogger(__name__)
+
+
+def occurrence_keys(keys: pd.Series, occurrence) -> pd.Series:
+    """Empreinte 64 bits (clé, rang) : identité `row_key` d'une ligne."""
+    frame = pd.DataFrame({'key': np.asarray(keys, dtype=np.uint64),
+                          'occurrence': np.asarray(occurrence, dtype=np.int64)})
+    hashed = pd.util.hash_pandas_object(frame, index=False)
+    return pd.Series(hashed.to_numpy(), index=getattr(keys, 'index', None))
+
+
+class RunKeys:
+    """
+    Identités attribuées par un run : rang des clés répétées d'un lot à l'autre.
+
+    Usage (une instance par run) :
+        df['row_key'] = run_keys.assign(keys)   # lot en cours
+        run_keys.save(conn, batch_no)           # transaction du checkpoint
+        run_keys.flush()                        # lot validé
+    """
+
+    def __init__(self, run_id: Optional[int] = None):
+        self.run_id = run_id
+        # tableaux triés, du plus grand au plus petit (fusion par niveaux)
+        self._levels: List[np.ndarray] = []
+        self.pending: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return sum(len(level) for level in self._levels)
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        """Masque des identités déjà attribuées par les lots validés du run."""
+        found = np.zeros(len(keys), dtype=bool)
+        for level in self._levels:
+            positions = np.minimum(np.searchsorted(level, keys), len(level) - 1)
+            found |= level[positions] == keys
+        return found
+
+    def add(self, keys: np.ndarray) -> None:
+        """Ajoute des identités ; deux niveaux de taille voisine sont fusionnés."""
+        level = np.unique(np.asarray(keys, dtype=np.uint64))
+        if not len(level):
+            return
+        while self._levels and len(self._levels[-1]) <= 2 * len(level):
+            level = np.union1d(self._levels.pop(), level)
+        self._levels.append(level)
+
+    def assign(self, keys: pd.Series) -> pd.Series:
+        """
+        Identités des lignes d'un lot, rangs comptés depuis le début du run.
+
+        Les rangs déjà attribués à une clé sont contigus (0..n-1) : n est
+        cherché parmi les identités attribuées par doublement puis
+        dichotomie, en O(log n) sondages par clé.
+
+        Args:
+            keys: Empreintes des clés métier du lot, dans l'ordre de la source
+
+        Returns:
+            Série uint64 alignée sur `keys`, aussi mise en attente pour save()
+        """
+        occurrence = keys.groupby(keys).cumcount().to_numpy()
+        if self._levels:
+            unique, inverse = np.unique(keys.to_numpy(dtype=np.uint64), return_inverse=True)
+            # bornes : rang `low` attribué (ou -1), rang `high` libre
+            low = np.full(len(unique), -1, dtype=np.int64)
+            high = np.zeros(len(unique), dtype=np.int64)
+            active = np.arange(len(unique))
+            while len(active):
+                hit = self.contains(occurrence_keys(unique[active], high[active]).to_numpy())
+                active = active[hit]
+                low[active] = high[active]
+                high[active] = 2 * high[active] + 1
+            active = np.flatnonzero(high - low > 1)
+            while len(active):
+                middle = (low[active] + high[active]) // 2
+                hit = self.contains(occurrence_keys(unique[active], middle).to_numpy())
+                low[active[hit]] = middle[hit]
+                high[active[~hit]] = middle[~hit]
+                active = active[high[active] - low[active] > 1]
+            occurrence = occurrence + high[inverse]
+        row_keys = occurrence_keys(keys, occurrence)
+        self.pending = row_keys.to_numpy()
+        return row_keys
+
+    def save(self, conn, batch_no: int) -> None:
+        """Enregistre les identités du lot en attente (transaction de son checkpoint)."""
+        if self.pending is None or not len(self.pending):
+            return
+        conn.execute(insert(EtlRunKey.__table__).values(
+            run_id=self.run_id, batch_no=batch_no, row_keys=self.pending.astype('<u8').tobytes()
+        ))
+
+    def flush(self) -> None:
+        """Clôt le lot validé : ses identités comptent pour les lots suivants."""
+        if self.pending is not None and len(self.pending):
+            self.add(self.pending)
+        self.pending = None
+
+    def discard(self) -> None:
+        """Oublie les identités d'un lot non validé (il sera rejoué)."""
+        self.pending = None
+
+
+def open_run_keys(engine, run_id: int, resume: bool = False) -> RunKeys:
+    """
+    Identités d'un run : vides, ou celles de ses lots validés s'il est repris.
+
+    Args:
+        engine: Moteur SQLAlchemy
+        run_id: Run (etl_runs) en cours
+        resume: Relire les identités enregistrées par les lots déjà validés
+    """
+    table = EtlRunKey.__table__
+    run_keys = RunKeys(run_id)
+    if not resume:
+        return run_keys
+    with engine.connect() as conn:
+        blobs = conn.execute(
+            select(table.c.row_keys).where(table.c.run_id == run_id).order_by(table.c.batch_no)
+        ).scalars().all()
+    if blobs:
+        run_keys.add(np.concatenate([np.frombuffer(blob, dtype='<u8') for blob in blobs]))
+        logger.info('Loaded %s row keys of run %s', f'{len(run_keys):,}', run_id)
+    return run_keys
+
+
+def delete_run_keys(conn, run_ids) -> None:
+    """Supprime les identités enregistrées de runs terminés ou abandonnés (liste ou SELECT de run_id)."""
+    table = EtlRunKey.__table__
+    conn.execute(delete(table).where(table.c.run_id.in_(run_ids)))
@@ -4,15 +4,36 @@ Ce script orchestre l'extraction, la transformation et le chargement
 des données depuis l'API OpenData Paris vers MySQL.
 """
 import os
+import argparse
 import logging
 from extract.extract import fetch_records_in_batches
-from config import BATCH_SIZE
+from config import BATCH_SIZE, DATASET_ID, LOAD_SHARDS, MONEY_MODE, PROJECTION_YEARS
 from transform.transform import (
+    TARGET_SCHEMA,
+    fixed_point_schema,
     transform_records,
     calculate_derived_fields,
     add_data_quality_flags,
 )
-from load.load import upsert_immobilisations
+from load.load import get_engine, upsert_immobilisations
+from load.checkpoint import (
+    RunState,
+    STATUS_COMMITTED,
+    STATUS_FAILED,
+    start_run,
+    finish_run,
+)
+from load.dead_letter import DeadLetterStore
+from load.run_keys import RunKeys, open_run_keys
+from projection.projection import run_projection
+from snapshot.snapshot import refresh_snapshot
+from sketches.profile import DatasetProfile, load_profile, report_profile
+from anomalies.anomalies import AnomalyDetector, open_detector, report_anomalies
+from dedup.dedup import NearDuplicateIndex
+from pipeline.pipeline import process_batches
+from utils.metrics import RunMetrics, save_run_metrics, write_prometheus_textfile
+from utils.profiling import get_profiler
+from utils.memory import get_governor
 
 # Configuration du logging (niveau contrôlé par la variable LOG_LEVEL)
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
@@ -23,17 +44,94 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def run_etl():
+def run_etl(resume: bool = False):
     """
     Exécute le pipeline ETL complet :
     - Extraction depuis l'API OpenData Paris
     - Transformation et nettoyage des données
     - Chargement dans MySQL
+
+    Chaque lot est chargé dans la même transaction que son checkpoint
+    (table etl_runs) : avec resume=True, le pipeline reprend au premier
+    lot non validé du dernier run interrompu.
+
+    Args:
+        resume: Reprendre le dernier run interrompu au lieu d'en démarrer un
     """
     logger.info("%s", "=" * 60)
     logger.info("Starting ETL Pipeline")
     logger.info("%s", "=" * 60)
-    
+
+    # Suivi du run (checkpoint et compteurs validés)
+    engine = get_engine()
+    state = start_run(engine, DATASET_ID, resume=resume)
+    metrics = RunMetrics(state.run_id)
+    # Profilage optionnel (ETL_PROFILE=cpu|mem|all), sans coût si désactivé
+    profiler = get_profiler(state.run_id)
+    # Profil des données (sketches) : un run repris complète le profil
+    # enregistré de ses lots déjà validés
+    data_profile = load_profile(engine, state.run_id) if resume else None
+    data_profile = data_profile or DatasetProfile()
+    # Détection d'anomalies par groupe : référence du run validé précédent
+    # et statistiques des lots déjà validés d'un run repris
+    detector = open_detector(engine, state.run_id, resume=resume)
+    # Identités des lignes vues par le run (lots déjà validés d'un run repris)
+    run_keys = open_run_keys(engine, state.run_id, resume=resume)
+
+    try:
+        state = _process_batches(engine, state, metrics, profiler, data_profile, detector, run_keys)
+    except Exception:
+        # profil et statistiques de groupes des lots validés : enregistrés
+        # avec leurs checkpoints (ETL_SKETCH_SAVE_EVERY), repris par --resume
+        finish_run(engine, state, STATUS_FAILED)
+        raise
+    finally:
+        # Mesures agrégées du run (temps, débit, octets, pic RSS par étape)
+        summary = metrics.summary()
+        save_run_metrics(engine, state.run_id, summary)
+        write_prometheus_textfile(metrics)
+        metrics.close()
+        profiler.close()
+        logger.info("Run metrics: wall=%ss rows/s=%s bytes=%s peak_rss=%sMB",
+                    summary['wall_time_s'], summary['rows_per_s'],
+                    summary['bytes_downloaded'], summary['peak_rss_mb'])
+
+    # Vérifier qu'au moins un enregistrement a été extrait
+    if state.rows_extracted == 0:
+        finish_run(engine, state, STATUS_FAILED)
+        logger.error("ERROR: No records fetched - Aborting ETL")
+        return
+
+    # Lignes absentes du run (supprimées à la source) retirées à sa validation
+    finish_run(engine, state, STATUS_COMMITTED, run_keys=run_keys)
+    # Instantané Arrow du frontend (ETL_SNAPSHOT_PATH)
+    refresh_snapshot(engine)
+    # Rapport de profil et dérive par rapport au run validé précédent
+    report_profile(engine, state.run_id, data_profile)
+    # Histogrammes des groupes et nombre d'anomalies par colonne
+    report_anomalies(engine, detector)
+
+    # Résumé final du pipeline
+    logger.info("SUCCESS: Extraction/Loading completed: %s records extracted, %s rows transformed, %s rows loaded, %s anomalies", f"{state.rows_extracted:,}", f"{state.rows_transformed:,}", f"{state.rows_loaded:,}", f"{detector.total:,}")
+
+    # ========================================
+    # ÉTAPE 3: PROJECTION DES AMORTISSEMENTS
+    # ========================================
+    if PROJECTION_YEARS > 0:
+        logger.info("\nSTEP 3: DEPRECIATION PROJECTION")
+        logger.info("-" * 60)
+        run_projection(years=PROJECTION_YEARS)
+
+
+def _process_batches(engine, state: RunState, metrics: RunMetrics, profiler,
+                     data_profile: DatasetProfile, detector: AnomalyDetector, run_keys: RunKeys) -> RunState:
+    """
+    Extrait, transforme et charge chaque lot à partir du dernier checkpoint
+    (boucle commune pipeline.process_batches).
+
+    Returns:
+        État du run après le dernier lot validé
+    """
     # ========================================
     # ÉTAPE 1: EXTRACTION
     # ========================================
@@ -41,8 +139,6 @@ def run_etl():
     logger.info("-" * 60)
     
     # Extraction en streaming par lots pour gérer de gros volumes
-    total_extracted = 0
-
     logger.info("Streaming extraction in batches (batch_size=%s)", BATCH_SIZE)
     
     # ========================================
@@ -54,48 +150,78 @@ def run_etl():
     # Récupérer le nom de la table cible
     table_name = os.getenv('ETL_TABLE', 'immobilisations_amortissements')
     logger.info("Target table: %s", table_name)
+    if LOAD_SHARDS > 1:
+        logger.info("Sharded load: %s writer connections", LOAD_SHARDS)
+    # Montants en centimes entiers (ETL_MONEY_MODE=cents) ou en float
+    target_schema = fixed_point_schema(TARGET_SCHEMA) if MONEY_MODE == 'cents' else TARGET_SCHEMA
+    logger.info("Monetary columns: %s", MONEY_MODE)
 
-    total_loaded = 0
-    total_transformed = 0
-
-    # Traiter chaque lot d'enregistrements
-    for batch in fetch_records_in_batches(rows=BATCH_SIZE):
-        total_extracted += len(batch)
-        logger.info("Processing batch: %s records", f"{len(batch):,}")
-
-        # Transformer les données brutes en DataFrame structuré
-        df = transform_records(batch)
-        
-        # Calculer les champs dérivés (taux, âge, etc.)
-        df = calculate_derived_fields(df)
-        
-        # Ajouter les indicateurs de qualité des données
-        df = add_data_quality_flags(df)
-
-        if df.empty:
-            logger.warning("Batch produced no rows after transformation - skipping")
-            continue
-            
-        # Compter les lignes transformées
-        total_transformed += len(df)
-        
-        # Charger les données dans MySQL
-        loaded = upsert_immobilisations(df, table_name=table_name)
-        total_loaded += loaded
-        logger.info("Batch loaded: %s rows", f"{loaded:,}")
+    # Mode budget mémoire (ETL_MAX_RSS_MB) : taille des pages ajustée à
+    # l'empreinte mesurée des lots et réduite près du budget
+    governor = get_governor(BATCH_SIZE)
 
-    # Vérifier qu'au moins un enregistrement a été extrait
-    if total_extracted == 0:
-        logger.error("ERROR: No records fetched - Aborting ETL")
-        return
+    batches = fetch_records_in_batches(
+        rows=BATCH_SIZE,
+        start=state.last_offset,
+        on_response=lambda resp: metrics.add_bytes(len(resp.content)),
+        page_size=(lambda: governor.batch_size) if governor else None,
+    )
 
-    # Résumé final du pipeline
-    logger.info("SUCCESS: Extraction/Loading completed: %s records extracted, %s rows transformed, %s rows loaded", f"{total_extracted:,}", f"{total_transformed:,}", f"{total_loaded:,}")
+    def derive(df):
+        # Champs dérivés (taux, montants, etc.) et indicateurs de qualité,
+        # en place : le lot n'est pas réutilisé
+        df = calculate_derived_fields(df, copy=False)
+        return add_data_quality_flags(df, copy=False)
+
+    def load(df, checkpoint, on_reject):
+        return upsert_immobilisations(
+            df,
+            table_name=table_name,
+            checkpoint=checkpoint,
+            copy=False,
+            on_reject=on_reject,
+            shards=LOAD_SHARDS,
+            run_id=state.run_id,
+            engine=engine,
+            run_keys=run_keys,
+        )
+
+    return process_batches(
+        engine,
+        state,
+        batches,
+        transform=lambda batch, on_error: transform_records(batch, target_schema, on_error=on_error),
+        load=load,
+        # Rejets (transformation ou chargement) validés avec le checkpoint du lot
+        dead_letters=DeadLetterStore(state.run_id),
+        derive=derive,
+        metrics=metrics,
+        profiler=profiler,
+        data_profile=data_profile,
+        detector=detector,
+        # Index LSH persistant des désignations (quasi-doublons)
+        near_duplicates=NearDuplicateIndex(state.run_id),
+        # Identités des lignes (rang des clés répétées compté sur tout le run)
+        run_keys=run_keys,
+        governor=governor,
+    )
+
+
+def parse_args(argv=None):
+    """Analyse les arguments de la ligne de commande."""
+    parser = argparse.ArgumentParser(description="Pipeline ETL immobilisations/amortissements")
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help="reprendre le dernier run interrompu depuis son dernier checkpoint"
+    )
+    return parser.parse_args(argv)
 
 
 if __name__ == '__main__':
+    args = parse_args()
     try:
-        run_etl()
+        run_etl(resume=args.resume)
         logger.info("\nETL process exited cleanly")
         exit(0)
     except Exception as e:
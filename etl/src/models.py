@@ -1,21 +1,113 @@
+from typing import Dict, Optional
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import (
-    Column, BigInteger, String, VARCHAR, Text, Date, Integer, Numeric, DateTime, func
+    Column, BigInteger, SmallInteger, String, VARCHAR, Text, Date, Integer, Numeric, DateTime,
+    Float, JSON, LargeBinary, Computed, ForeignKey, Index, MetaData, Table, func
 )
+from sqlalchemy.dialects import mysql
 
 Base = declarative_base()
 
+# Tables des datasets déclaratifs (voir datasets/datasets.py), créées à la demande
+DATASET_METADATA = MetaData()
+
+# Nom de la vue de compatibilité (conserve les colonnes texte utilisées par Superset)
+COMPAT_VIEW_NAME = 'immobilisations_amortissements'
+
+# Champs relatifs à la date du jour : calculés à la lecture par la vue,
+# jamais stockés (une valeur stockée deviendrait fausse dès le lendemain)
+READ_TIME_COLUMNS = {
+    'age_immobilisation': 'ROUND(DATEDIFF(CURDATE(), f.date_d_acquisition) / 365.25, 2)',
+    'duree_amort_restante': (
+        'ROUND(GREATEST(f.duree_amort - DATEDIFF(CURDATE(), f.date_d_acquisition) / 365.25, 0), 2)'
+    ),
+}
+
+# Colonnes internes à la table de faits, non exposées par la vue
+INTERNAL_COLUMNS = ('row_key', 'source_hash', 'first_run_id', 'retired_run_id')
+
+
+def latest_run_query(dataset_id: str) -> str:
+    """
+    Sous-requête du dernier run validé d'un dataset (NULL si aucun).
+
+    Les chargements depuis un spool (`<dataset>:spool`, voir cli.py)
+    comptent pour leur dataset.
+    """
+    quoted = dataset_id.replace("'", "''")
+    return (
+        "(SELECT MAX(run_id) FROM etl_runs WHERE status = 'committed' "
+        f"AND (dataset_id = '{quoted}' OR dataset_id LIKE '{quoted}:%'))"
+    )
+
+
+def visible_runs_filter(dataset_id: str) -> str:
+    """
+    Condition (alias `f`) des lignes visibles d'une table chargée par un dataset.
+
+    Seul le dernier run validé est visible : les lignes introduites par
+    lui ou avant (`first_run_id`) et qu'aucun run validé jusqu'à lui n'a
+    retirées (`retired_run_id`, premier run validé dont la ligne était
+    absente : supprimée à la source). Une ligne introduite par un run non
+    validé, ou retirée, reste invisible ; un run en cours n'écrit que les
+    lignes nouvelles ou modifiées. Les lignes antérieures au suivi par run
+    ne sont visibles que tant qu'aucun run n'est validé.
+    """
+    latest = latest_run_query(dataset_id)
+    return (
+        f"(f.first_run_id <= {latest} AND (f.retired_run_id IS NULL OR f.retired_run_id > {latest})) "
+        f"OR (f.first_run_id IS NULL AND {latest} IS NULL)"
+    )
+
+
+# ============================================================================
+# DIMENSIONS (clés de substitution compactes)
+# ============================================================================
+
+class Publication(Base):
+    __tablename__ = 'dim_publication'
+
+    id = Column(SmallInteger, primary_key=True, autoincrement=True)
+    # binary collation: 'Ville' and 'VILLE' must map to distinct keys like in the source
+    libelle = Column(String(100, collation='utf8mb4_bin'), nullable=False, unique=True)
+
+
+class Collectivite(Base):
+    __tablename__ = 'dim_collectivite'
+
+    id = Column(SmallInteger, primary_key=True, autoincrement=True)
+    libelle = Column(String(80, collation='utf8mb4_bin'), nullable=False, unique=True)
+
+
+class Nature(Base):
+    __tablename__ = 'dim_nature'
+
+    id = Column(SmallInteger, primary_key=True, autoincrement=True)
+    libelle = Column(String(80, collation='utf8mb4_bin'), nullable=False, unique=True)
+
+
+# Colonne texte du DataFrame -> dimension qui la remplace dans la table de faits
+DIMENSIONS = {
+    'publication': Publication,
+    'collectivite': Collectivite,
+    'nature': Nature,
+}
+
+
+# ============================================================================
+# TABLE DE FAITS
+# ============================================================================
 
 class Immobilisation(Base):
-    __tablename__ = 'immobilisations_amortissements'
+    __tablename__ = 'immobilisations_amortissements_fact'
 
     id = Column(BigInteger, primary_key=True, autoincrement=True)
-    # allow duplicates in the business key: do not enforce uniqueness here
-    # allow NULLs for records that don't provide a business key
+    # the source repeats some business keys and omits others: uniqueness is
+    # enforced on row_key, not on this column
     ndeg_immobilisation = Column(String(64), nullable=True)
-    publication = Column(String(100))
-    collectivite = Column(String(80))
-    nature = Column(String(80))
+    publication_id = Column(SmallInteger, ForeignKey('dim_publication.id'))
+    collectivite_id = Column(SmallInteger, ForeignKey('dim_collectivite.id'))
+    nature_id = Column(SmallInteger, ForeignKey('dim_nature.id'))
     date_d_acquisition = Column(Date)
     designation_des_ensembles = Column(Text)
     valeur_d_acquisition = Column(Numeric(14, 2))
@@ -25,13 +117,396 @@ class Immobilisation(Base):
     amort_exercice = Column(Numeric(14, 2))
     vnc_fin_exercice = Column(Numeric(14, 2))
     fetched_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    # last run that wrote the row values (etl_runs.run_id): an unchanged reload
+    # leaves it as is; NULL for rows loaded before run tracking.
+    run_id = Column(Integer)
+    # run that introduced the row: hides rows of runs not committed yet. A run
+    # is rolled back by an indexed delete of the rows it introduced and no
+    # later run needs (checkpoint.rollback_run).
+    first_run_id = Column(Integer)
+    # first committed run the row was missing from (deleted at the source),
+    # set when that run commits; NULL while the source still has the row
+    retired_run_id = Column(Integer)
+
+    # identity of the source row: hash of the business key (ndeg, publication,
+    # collectivite) and of its rank among the rows of the run sharing it, see
+    # load.row_keys. A reloaded row updates its previous version in place.
+    row_key = Column(
+        BigInteger().with_variant(mysql.BIGINT(unsigned=True), 'mysql'), nullable=False
+    )
+    # fingerprint of the source values: unchanged rows are never rewritten
+    source_hash = Column(
+        BigInteger().with_variant(mysql.BIGINT(unsigned=True), 'mysql'), nullable=False
+    )
 
     # Derived / KPI columns
     taux_amortissement = Column(Numeric(12, 6))
     amortissement_total = Column(Numeric(14, 2))
     pct_valeur_restante = Column(Numeric(6, 2))
-    age_immobilisation = Column(Numeric(6, 2))
-    annee_acquisition = Column(Integer)
-    mois_acquisition = Column(Integer)
-    jour_acquisition = Column(Integer)
-    trimestre_acquisition = Column(Integer)
+    # date components are generated by MySQL from date_d_acquisition
+    annee_acquisition = Column(Integer, Computed('YEAR(date_d_acquisition)', persisted=True))
+    mois_acquisition = Column(Integer, Computed('MONTH(date_d_acquisition)', persisted=True))
+    jour_acquisition = Column(Integer, Computed('DAYOFMONTH(date_d_acquisition)', persisted=True))
+    trimestre_acquisition = Column(Integer, Computed('QUARTER(date_d_acquisition)', persisted=True))
+
+    __table_args__ = (
+        Index('uq_immob_row_key', 'row_key', unique=True),
+        Index('idx_immob_source_hash', 'source_hash'),
+        Index('idx_immob_fetched_at', 'fetched_at'),
+        Index('idx_immob_run', 'run_id'),
+        # rollback of a run: (first_run_id, id) keyset pages of the rows it introduced
+        Index('idx_immob_first_run', 'first_run_id', 'id'),
+        Index('idx_immob_retired', 'retired_run_id'),
+        # keyset pagination of the frontend explorer: (sort key, id) seeks
+        Index('idx_immob_valeur', 'valeur_d_acquisition', 'id'),
+        Index('idx_immob_date', 'date_d_acquisition', 'id'),
+        Index('idx_immob_vnc', 'vnc_fin_exercice', 'id'),
+        # same seeks for each combination of the explorer filters: collectivite
+        # and nature, collectivite only, nature only. They also serve the
+        # dimension foreign keys and lookups (no separate dimension index).
+        # Only inserted rows and rows whose indexed values change touch them:
+        # an unchanged reload is not rewritten (load.upsert_statement).
+        Index('idx_immob_coll_nature_valeur', 'collectivite_id', 'nature_id', 'valeur_d_acquisition', 'id'),
+        Index('idx_immob_coll_nature_date', 'collectivite_id', 'nature_id', 'date_d_acquisition', 'id'),
+        Index('idx_immob_coll_nature_vnc', 'collectivite_id', 'nature_id', 'vnc_fin_exercice', 'id'),
+        Index('idx_immob_coll_valeur', 'collectivite_id', 'valeur_d_acquisition', 'id'),
+        Index('idx_immob_coll_date', 'collectivite_id', 'date_d_acquisition', 'id'),
+        Index('idx_immob_coll_vnc', 'collectivite_id', 'vnc_fin_exercice', 'id'),
+        Index('idx_immob_nature_valeur', 'nature_id', 'valeur_d_acquisition', 'id'),
+        Index('idx_immob_nature_date', 'nature_id', 'date_d_acquisition', 'id'),
+        Index('idx_immob_nature_vnc', 'nature_id', 'vnc_fin_exercice', 'id'),
+        # full-text search of the frontend (MATCH ... AGAINST)
+        Index('ft_immob_designation', 'designation_des_ensembles', mysql_prefix='FULLTEXT'),
+    )
+
+
+# ============================================================================
+# PROJECTION DES AMORTISSEMENTS
+# ============================================================================
+
+class AmortissementProjection(Base):
+    __tablename__ = 'amortissement_projection'
+
+    immobilisation_id = Column(BigInteger, primary_key=True, autoincrement=False)
+    annee = Column(SmallInteger, primary_key=True, autoincrement=False)
+    dotation = Column(Numeric(14, 2))
+    vnc = Column(Numeric(14, 2))
+
+
+class AmortissementProjectionAgregat(Base):
+    __tablename__ = 'amortissement_projection_agregat'
+
+    # 0 stands for "unknown" so the key stays NOT NULL
+    nature_id = Column(SmallInteger, primary_key=True, autoincrement=False)
+    collectivite_id = Column(SmallInteger, primary_key=True, autoincrement=False)
+    annee = Column(SmallInteger, primary_key=True, autoincrement=False)
+    nb_actifs = Column(Integer)
+    dotation = Column(Numeric(16, 2))
+    vnc = Column(Numeric(16, 2))
+
+
+# ============================================================================
+# SUIVI DES RUNS ETL
+# ============================================================================
+
+class EtlRun(Base):
+    __tablename__ = 'etl_runs'
+
+    run_id = Column(Integer, primary_key=True, autoincrement=True)
+    dataset_id = Column(String(100), nullable=False)
+    # running | committed | failed
+    status = Column(String(16), nullable=False, default='running')
+    started_at = Column(DateTime, server_default=func.now())
+    finished_at = Column(DateTime)
+    # next API offset to fetch: everything before it is committed
+    last_offset = Column(Integer, nullable=False, default=0)
+    batches = Column(Integer, nullable=False, default=0)
+    rows_extracted = Column(Integer, nullable=False, default=0)
+    rows_transformed = Column(Integer, nullable=False, default=0)
+    rows_loaded = Column(Integer, nullable=False, default=0)
+    # identity of the source read by the run (spool manifest), NULL for the
+    # API: a run is only resumed against the same source
+    source_id = Column(String(100))
+
+    # Run-level metrics (see utils/metrics.py)
+    wall_time_s = Column(Float)
+    rows_per_s = Column(Float)
+    bytes_downloaded = Column(BigInteger)
+    peak_rss_mb = Column(Float)
+    # per-stage totals: {"extract": {"wall_s": ..., "rows": ...}, ...}
+    stage_metrics = Column(JSON)
+
+    __table_args__ = (
+        Index('idx_etl_runs_dataset_status', 'dataset_id', 'status'),
+    )
+
+
+class EtlBatchMetric(Base):
+    __tablename__ = 'etl_batch_metrics'
+
+    run_id = Column(Integer, primary_key=True, autoincrement=False)
+    batch_no = Column(Integer, primary_key=True, autoincrement=False)
+    # extract | transform | derive | load
+    stage = Column(String(16), primary_key=True)
+    wall_s = Column(Float)
+    db_s = Column(Float)
+    rows = Column(Integer)
+    rows_per_s = Column(Float)
+    bytes = Column(BigInteger)
+    peak_rss_mb = Column(Float)
+    recorded_at = Column(DateTime, server_default=func.now())
+
+
+class EtlRunKey(Base):
+    __tablename__ = 'etl_run_keys'
+
+    # row keys assigned by a run, one row per committed batch (uint64
+    # little-endian array, see load/run_keys.py); deleted when the run ends
+    run_id = Column(Integer, primary_key=True, autoincrement=False)
+    batch_no = Column(Integer, primary_key=True, autoincrement=False)
+    row_keys = Column(LargeBinary().with_variant(mysql.MEDIUMBLOB, 'mysql'), nullable=False)
+
+
+class EtlDeadLetter(Base):
+    __tablename__ = 'etl_dead_letters'
+
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    run_id = Column(Integer)
+    # transform | load
+    stage = Column(String(16), nullable=False)
+    # position of the record in the source (API offset) when known
+    source_offset = Column(Integer)
+    ndeg_immobilisation = Column(String(255))
+    payload = Column(JSON)
+    error = Column(Text)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index('idx_dead_letters_run', 'run_id', 'stage'),
+    )
+
+
+class EtlProfile(Base):
+    __tablename__ = 'etl_profiles'
+
+    run_id = Column(Integer, primary_key=True, autoincrement=False)
+    column_name = Column(String(64), primary_key=True)
+    rows = Column(BigInteger, nullable=False, default=0)
+    nulls = Column(BigInteger, nullable=False, default=0)
+    distinct_estimate = Column(BigInteger)
+    # null rate, min/max, quantiles and heavy hitters (see sketches/profile.py)
+    stats = Column(JSON)
+    # comparison with the previous committed run of the dataset
+    drift = Column(JSON)
+    # mergeable sketches (HyperLogLog, KLL, Misra-Gries), zlib-compressed JSON
+    sketch = Column(LargeBinary().with_variant(mysql.MEDIUMBLOB, 'mysql'), nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class EtlAnomaly(Base):
+    __tablename__ = 'etl_anomalies'
+
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    run_id = Column(Integer, nullable=False)
+    # fingerprint of the flagged row in the fact table
+    source_hash = Column(BigInteger().with_variant(mysql.BIGINT(unsigned=True), 'mysql'))
+    ndeg_immobilisation = Column(String(255))
+    collectivite = Column(String(80))
+    nature = Column(String(80))
+    # valeur_d_acquisition | duree_amort | taux_amortissement
+    column_name = Column(String(64), nullable=False)
+    value = Column(Float)
+    # group the row was scored against: nature_collectivite | nature | all
+    group_level = Column(String(24), nullable=False)
+    # group median in the column unit; MAD on the scoring scale (log10 for amounts)
+    group_median = Column(Float)
+    group_mad = Column(Float)
+    # robust z-score 0.6745 * (x - median) / MAD
+    score = Column(Float, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index('idx_anomalies_run', 'run_id', 'column_name'),
+        Index('idx_anomalies_source_hash', 'source_hash'),
+    )
+
+
+class EtlAnomalyStats(Base):
+    __tablename__ = 'etl_anomaly_stats'
+
+    run_id = Column(Integer, primary_key=True, autoincrement=False)
+    column_name = Column(String(64), primary_key=True)
+    rows_scored = Column(BigInteger, nullable=False, default=0)
+    rows_flagged = Column(BigInteger, nullable=False, default=0)
+    groups = Column(Integer, nullable=False, default=0)
+    # per-group histograms of the run's committed batches (see anomalies/anomalies.py)
+    histograms = Column(LargeBinary().with_variant(mysql.MEDIUMBLOB, 'mysql'), nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+class EtlMinHash(Base):
+    __tablename__ = 'etl_minhash'
+
+    # one signature per distinct loaded row (see dedup/dedup.py)
+    source_hash = Column(
+        BigInteger().with_variant(mysql.BIGINT(unsigned=True), 'mysql'), primary_key=True, autoincrement=False
+    )
+    run_id = Column(Integer)
+    collectivite = Column(String(80))
+    ndeg_immobilisation = Column(String(255))
+    designation = Column(String(255))
+    # MinHash signature of the normalized designation shingles (uint32 array)
+    signature = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+
+class EtlLshBucket(Base):
+    __tablename__ = 'etl_lsh_buckets'
+
+    # hash of (collectivite, band, band values): rows sharing a bucket are candidates
+    bucket = Column(BigInteger, primary_key=True, autoincrement=False)
+    source_hash = Column(
+        BigInteger().with_variant(mysql.BIGINT(unsigned=True), 'mysql'), primary_key=True, autoincrement=False
+    )
+
+    __table_args__ = (
+        Index('idx_lsh_buckets_source_hash', 'source_hash'),
+    )
+
+
+class EtlNearDuplicate(Base):
+    __tablename__ = 'etl_near_duplicates'
+
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
+    run_id = Column(Integer)
+    collectivite = Column(String(80))
+    # row loaded by the run and the indexed (or same batch) row it resembles
+    source_hash = Column(BigInteger().with_variant(mysql.BIGINT(unsigned=True), 'mysql'), nullable=False)
+    match_hash = Column(BigInteger().with_variant(mysql.BIGINT(unsigned=True), 'mysql'), nullable=False)
+    ndeg_immobilisation = Column(String(255))
+    match_ndeg = Column(String(255))
+    # Jaccard similarity estimated from the MinHash signatures
+    similarity = Column(Float, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index('idx_near_duplicates_source_hash', 'source_hash'),
+        Index('idx_near_duplicates_match_hash', 'match_hash'),
+        Index('idx_near_duplicates_run', 'run_id'),
+    )
+
+
+class EtlMetadata(Base):
+    __tablename__ = 'etl_metadata'
+
+    # e.g. 'data_version': incremented with every committed or rolled back run
+    name = Column(String(64), primary_key=True)
+    value = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+def compat_view_ddl(dataset_id: str) -> str:
+    """
+    Construit le DDL de la vue de compatibilité.
+
+    La vue réexpose les libellés des dimensions sous les noms de colonnes
+    historiques, dans l'ordre de l'ancienne table, pour que Superset et les
+    requêtes existantes continuent de fonctionner sans modification. Les
+    champs relatifs à la date du jour (âge, durée restante) y sont calculés.
+    Seules les lignes du dernier run validé y figurent (visible_runs_filter).
+
+    Args:
+        dataset_id: Dataset qui charge la table de faits
+
+    Returns:
+        Instruction CREATE OR REPLACE VIEW
+    """
+    fact = Immobilisation.__table__
+    select_cols = []
+    for column in fact.columns:
+        if column.name in INTERNAL_COLUMNS:
+            continue
+        dim_name = column.name[:-len('_id')] if column.name.endswith('_id') else None
+        if dim_name in DIMENSIONS:
+            select_cols.append(f'{dim_name}.libelle AS {dim_name}')
+        else:
+            select_cols.append(f'f.{column.name}')
+    select_cols.extend(f'{expr} AS {name}' for name, expr in READ_TIME_COLUMNS.items())
+
+    joins = [
+        f'LEFT JOIN {model.__tablename__} {dim_name} ON {dim_name}.id = f.{dim_name}_id'
+        for dim_name, model in DIMENSIONS.items()
+    ]
+    return (
+        f'CREATE OR REPLACE VIEW {COMPAT_VIEW_NAME} AS\n'
+        f'SELECT\n  ' + ',\n  '.join(select_cols) + '\n'
+        f'FROM {fact.name} f\n' + '\n'.join(joins) + '\n'
+        f'WHERE {visible_runs_filter(dataset_id)}'
+    )
+
+
+# ============================================================================
+# TABLES DES DATASETS DÉCLARATIFS
+# ============================================================================
+
+# Type déclaré dans un schéma de dataset -> type de colonne
+SCHEMA_COLUMN_TYPES = {
+    'string': lambda: String(255),
+    'text': Text,
+    'date': Date,
+    'decimal': lambda: Numeric(14, 2),
+    'float': Float,
+    'int': Integer,
+}
+
+
+def dataset_table(
+    name: str,
+    schema: Dict[str, str],
+    derived: Optional[Dict[str, str]] = None,
+    key: Optional[str] = None
+) -> Table:
+    """
+    Construit (une fois) la table cible d'un dataset déclaratif.
+
+    Les colonnes reprennent le schéma du dataset ; les champs dérivés sont
+    des DOUBLE. Comme la table de faits, chaque ligne porte une identité
+    `row_key` unique (clé métier, voir load.row_keys), l'empreinte
+    `source_hash` de ses valeurs (un rechargement ne réécrit pas les lignes
+    inchangées), le dernier `run_id` qui l'a modifiée, le run
+    `first_run_id` qui l'a introduite et le run `retired_run_id` qui l'a
+    retirée.
+
+    Args:
+        name: Nom de la table
+        schema: Colonne -> type déclaré (clés de SCHEMA_COLUMN_TYPES)
+        derived: Colonnes dérivées (noms seulement)
+        key: Colonne clé métier, indexée
+
+    Returns:
+        Table SQLAlchemy enregistrée dans DATASET_METADATA
+    """
+    if name in DATASET_METADATA.tables:
+        return DATASET_METADATA.tables[name]
+
+    columns = [Column('id', BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)]
+    columns += [Column(col, SCHEMA_COLUMN_TYPES[kind]()) for col, kind in schema.items()]
+    columns += [Column(col, Float) for col in (derived or {})]
+    columns += [
+        Column('row_key', BigInteger().with_variant(mysql.BIGINT(unsigned=True), 'mysql'), nullable=False),
+        Column('source_hash', BigInteger().with_variant(mysql.BIGINT(unsigned=True), 'mysql'), nullable=False),
+        Column('run_id', Integer),
+        Column('first_run_id', Integer),
+        Column('retired_run_id', Integer),
+        Column('fetched_at', DateTime, server_default=func.now()),
+    ]
+    indexes = [
+        Index(f'uq_{name}_row_key', 'row_key', unique=True),
+        Index(f'idx_{name}_source_hash', 'source_hash'),
+        Index(f'idx_{name}_run', 'run_id'),
+        Index(f'idx_{name}_first_run', 'first_run_id', 'id'),
+        Index(f'idx_{name}_retired', 'retired_run_id'),
+    ]
+    if key:
+        indexes.append(Index(f'idx_{name}_{key}', key))
+    return Table(name, DATASET_METADATA, *columns, *indexes)
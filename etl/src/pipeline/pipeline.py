@@ -0,0 +1,247 @@
+"""Boucle de traitement par lots, commune aux points d'entrée de l'ETL.
+
+Le pipeline principal (main.py), le chargement du spool (cli.py load) et
+le runner multi-datasets (datasets/runner.py) parcourent leurs lots avec
+process_batches : transformation, champs dérivés, profil, anomalies,
+quasi-doublons, puis chargement dans la même transaction que le checkpoint
+du lot (etl_runs), ses rejets, ses anomalies, ses quasi-doublons et les
+identités de ses lignes (etl_run_keys). Tous
+les SKETCH_SAVE_EVERY lots, le profil (sketches) et les statistiques de
+groupes du run sont aussi enregistrés dans cette transaction : un run tué
+garde ceux de ses lots validés, que --resume complète. Seules changent la
+source des lots et la fonction de chargement.
+"""
+import logging
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Iterator, Optional
+import pandas as pd
+from config import SKETCH_SAVE_EVERY
+from load.checkpoint import RunState, save_checkpoint
+from load.dead_letter import DeadLetterStore
+from load.load import ShardedLoadError
+from load.run_keys import RunKeys
+from sketches.profile import DatasetProfile, profile_frame, write_profile
+from anomalies.anomalies import AnomalyDetector, write_stats
+from dedup.dedup import NearDuplicateIndex
+from utils.metrics import RunMetrics, StageStats, save_batch_metrics, write_prometheus_textfile
+from utils.profiling import NullProfiler
+
+logger = logging.getLogger(__name__)
+
+
+def _direct(function: Callable, *args) -> Any:
+    return function(*args)
+
+
+def _commit_empty_batch(engine, checkpoint: Callable) -> None:
+    """Valide le checkpoint (et les rejets) d'un lot vide après transformation."""
+    with engine.begin() as conn:
+        checkpoint(conn)
+
+
+def process_batches(
+    engine,
+    state: RunState,
+    batches: Iterator,
+    transform: Callable,
+    load: Callable,
+    dead_letters: DeadLetterStore,
+    derive: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None,
+    metrics: Optional[RunMetrics] = None,
+    profiler=None,
+    data_profile: Optional[DatasetProfile] = None,
+    detector: Optional[AnomalyDetector] = None,
+    near_duplicates: Optional[NearDuplicateIndex] = None,
+    run_keys: Optional[RunKeys] = None,
+    governor=None,
+    execute: Callable = _direct,
+    label: str = '',
+    sketch_every: int = SKETCH_SAVE_EVERY,
+) -> RunState:
+    """
+    Traite chaque lot de `batches` à partir du dernier checkpoint de `state`.
+
+    Chaque étape (extract, transform, derive, profile, anomaly, dedup, load)
+    est mesurée si `metrics` est fourni et enveloppée par le profileur. Le
+    profil de chaque lot est fusionné dans `data_profile` au checkpoint du
+    lot ; ses anomalies et ses quasi-doublons sont écrits avec son
+    checkpoint, ainsi que le profil et les statistiques de groupes du run
+    tous les `sketch_every` lots. Les étapes profile, anomaly et dedup sont
+    sautées si l'objet correspondant n'est pas fourni.
+
+    Args:
+        engine: Moteur SQLAlchemy (checkpoint des lots vides, mesures)
+        state: État du run (reprise : lots déjà validés exclus de `batches`)
+        batches: Lots à traiter, lus au fil de l'eau (offset state.last_offset)
+        transform: (lot, on_error) -> DataFrame ; on_error(idx, record, e)
+            met l'enregistrement `idx` du lot en dead letter
+        load: (df, checkpoint, on_reject) -> lignes chargées ; appelle
+            checkpoint(conn) juste avant le commit du lot
+        dead_letters: Rejets du run, validés avec le checkpoint de chaque lot
+        derive: Champs dérivés appliqués en place au lot transformé
+        metrics: Mesures du run (etl_batch_metrics), None = non mesuré
+        profiler: Profileur des étapes (défaut: désactivé)
+        data_profile: Profil du run (sketches)
+        detector: Détecteur d'anomalies du run
+        near_duplicates: Index des quasi-doublons du run
+        run_keys: Identités attribuées par le run, à passer aussi à `load`
+            (rang des clés métier répétées compté d'un lot à l'autre)
+        governor: Budget mémoire (MemoryGovernor) ; la source des lots lit
+            sa taille de lot courante
+        execute: Exécute un appel en base, (fonction, *args) -> résultat
+            (défaut: direct ; runner : pool DB partagé)
+        label: Préfixe des messages de log (dataset)
+        sketch_every: Lots entre deux enregistrements du profil et des
+            statistiques de groupes du run
+
+    Returns:
+        État du run après le dernier lot validé
+
+    Raises:
+        RuntimeError: si un lot est chargé sans que son checkpoint soit appelé
+    """
+    profiler = profiler or NullProfiler()
+    prefix = f'[{label}] ' if label else ''
+
+    @contextmanager
+    def stage(name: str, rows: Optional[int] = None):
+        measured = metrics.stage(name, rows=rows) if metrics is not None else nullcontext(StageStats())
+        with measured as stats, profiler.stage(name):
+            yield stats
+
+    def discard():
+        dead_letters.discard()
+        for store in (detector, near_duplicates, run_keys):
+            if store is not None:
+                store.discard()
+
+    offset = state.last_offset
+    try:
+        while True:
+            if governor:
+                governor.apply_backpressure()
+                governor.begin_batch()
+            with stage('extract') as extract_stats:
+                batch = next(batches, None)
+                if batch is not None:
+                    extract_stats.rows += len(batch)
+            if batch is None:
+                break
+
+            extracted = len(batch)
+            batch_start = offset
+            offset += extracted
+            logger.info("%sProcessing batch: %s records", prefix, f"{extracted:,}")
+
+            with stage('transform') as transform_stats:
+                df = transform(
+                    batch,
+                    lambda idx, record, e: dead_letters.add(
+                        'transform', record, e, source_offset=batch_start + idx
+                    ),
+                )
+                transform_stats.rows += len(df)
+            # Les enregistrements bruts ne servent plus : libérés avant la suite
+            del batch
+            if governor:
+                governor.sample()
+
+            if derive is not None:
+                with stage('derive', rows=len(df)):
+                    df = derive(df)
+                if governor:
+                    governor.sample()
+
+            batch_profile = None
+            if not df.empty:
+                # Résumer le lot avant le chargement (qui s'approprie le
+                # DataFrame) ; le résumé n'entre dans le profil du run qu'au
+                # checkpoint du lot
+                if data_profile is not None:
+                    with stage('profile', rows=len(df)):
+                        batch_profile = profile_frame(df)
+                # Noter le lot contre les statistiques de son groupe (lot compris)
+                if detector is not None:
+                    with stage('anomaly', rows=len(df)):
+                        detector.score(df)
+                # Signatures MinHash des désignations, appariées à l'index au checkpoint
+                if near_duplicates is not None:
+                    with stage('dedup', rows=len(df)):
+                        near_duplicates.sign(df)
+
+            # Charger le lot avec son checkpoint (l'état n'avance que si la
+            # transaction est validée) ; les lignes refusées par la base sont
+            # isolées et mises en dead letters
+            transformed = len(df)
+            committed = []
+            merged = []
+
+            def checkpoint(conn):
+                rows_loaded = transformed - dead_letters.count('load')
+                committed.append(state.advance(offset, extracted, transformed, rows_loaded))
+                # empreintes ajoutées au lot par le chargement (copy=False)
+                hashes = df.get('source_hash')
+                if detector is not None:
+                    detector.save(conn, hashes)
+                if near_duplicates is not None:
+                    near_duplicates.save(conn, hashes)
+                if run_keys is not None:
+                    run_keys.save(conn, committed[-1].batches)
+                if batch_profile is not None and not merged:
+                    # une seule fois si la transaction est rejouée (deadlock) ;
+                    # un lot non validé fait échouer le run, dont le profil en
+                    # mémoire n'est plus enregistré
+                    data_profile.merge(batch_profile)
+                    merged.append(True)
+                if transformed and committed[-1].batches % sketch_every == 0:
+                    if data_profile is not None:
+                        write_profile(conn, state.run_id, data_profile)
+                    if detector is not None:
+                        write_stats(conn, detector, pending=True)
+                dead_letters.save(conn)
+                save_checkpoint(conn, committed[-1])
+
+            with stage('load') as load_stats:
+                if df.empty:
+                    logger.warning("%sBatch produced no rows after transformation - skipping", prefix)
+                    execute(_commit_empty_batch, engine, checkpoint)
+                    loaded = 0
+                else:
+                    try:
+                        loaded = execute(
+                            load, df, checkpoint, lambda row, e: dead_letters.add('load', row, e)
+                        )
+                    except ShardedLoadError as e:
+                        # les shards validés restent en base, le lot sera rejoué
+                        logger.error("%sSharded load failed at offset %s: %s", prefix, batch_start, e)
+                        raise
+                load_stats.rows += loaded
+            del df
+            if not committed:
+                raise RuntimeError(f'Batch at offset {batch_start} was loaded without its checkpoint')
+            state = committed[-1]
+            rejected = dead_letters.flush()
+            flagged = detector.flush() if detector is not None else 0
+            paired = near_duplicates.flush() if near_duplicates is not None else 0
+            if run_keys is not None:
+                run_keys.flush()
+            logger.info("%sBatch loaded: %s rows, %s dead letters, %s anomalies, %s near-duplicate pairs "
+                        "(checkpoint offset=%s)", prefix, f"{loaded:,}", rejected, flagged, paired, offset)
+
+            if metrics is not None:
+                save_batch_metrics(engine, metrics.end_batch(state.batches))
+                write_prometheus_textfile(metrics)
+            profiler.end_batch(state.batches)
+            if governor:
+                governor.end_batch(extracted)
+    except Exception:
+        discard()
+        raise
+
+    if dead_letters.total:
+        logger.warning("%s%s records rejected during the run (see etl_dead_letters)",
+                       prefix, f"{dead_letters.total:,}")
+    if near_duplicates is not None and near_duplicates.total:
+        logger.warning("%s%s near-duplicate pairs found during the run (see etl_near_duplicates)",
+                       prefix, f"{near_duplicates.total:,}")
+    return state
@@ -0,0 +1,311 @@
+"""Projection vectorisée des plans d'amortissement.
+
+Ce module projette le plan d'amortissement linéaire de chaque
+immobilisation sur N exercices futurs (dotation et valeur nette comptable)
+en une seule opération NumPy par chunk d'actifs, puis agrège les résultats
+par nature et par collectivité. Seules les immobilisations visibles (dernier
+run validé) sont projetées ; les tables sont reconstruites à part puis
+échangées d'un bloc, les lecteurs ne voient jamais de projection partielle.
+"""
+import re
+import logging
+import datetime
+import numpy as np
+import pandas as pd
+from typing import Dict, Tuple
+from sqlalchemy import select, text
+from config import DATASET_ID, PROJECTION_YEARS, PROJECTION_MEMORY_MB
+from load.load import get_engine, ensure_schema
+from models import (
+    Immobilisation, Publication, AmortissementProjection, AmortissementProjectionAgregat,
+    visible_runs_filter
+)
+
+logger = logging.getLogger(__name__)
+
+# Nombre d'équivalents float64 par cellule (actif x année) vivants en même
+# temps pendant la projection d'un chunk (3 tableaux de calcul, masque,
+# indices et 6 colonnes de sortie) : sert à dimensionner les chunks
+ARRAYS_PER_CELL = 12
+
+# Nombre de lignes par INSERT multi-valeurs
+WRITE_BATCH_SIZE = 10000
+
+# Suffixes des tables de reconstruction et des tables remplacées
+STAGING_SUFFIX = '_next'
+RETIRED_SUFFIX = '_old'
+
+
+# ============================================================================
+# CALCUL VECTORISÉ
+# ============================================================================
+
+def chunk_size_for_budget(years: int, memory_mb: int = PROJECTION_MEMORY_MB) -> int:
+    """
+    Calcule le nombre d'actifs projetables par chunk dans le budget mémoire.
+
+    Args:
+        years: Nombre d'années projetées
+        memory_mb: Budget mémoire en Mo
+
+    Returns:
+        Nombre d'actifs par chunk (au moins 1)
+    """
+    per_asset = max(1, years) * 8 * ARRAYS_PER_CELL
+    return max(1, (memory_mb * 1024 * 1024) // per_asset)
+
+
+def starting_book_value(
+    valeur: np.ndarray,
+    cumul: np.ndarray,
+    amort_exercice: np.ndarray,
+    vnc_fin: np.ndarray
+) -> np.ndarray:
+    """
+    Détermine la VNC de départ : `vnc_fin_exercice`, sinon reconstituée.
+
+    Returns:
+        Tableau float64 de VNC positives ou nulles
+    """
+    rebuilt = np.nan_to_num(valeur) - np.nan_to_num(cumul) - np.nan_to_num(amort_exercice)
+    vnc = np.where(np.isnan(vnc_fin), rebuilt, vnc_fin)
+    return np.clip(vnc, 0.0, None)
+
+
+def project_schedule(
+    valeur: np.ndarray,
+    duree: np.ndarray,
+    vnc_depart: np.ndarray,
+    years: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Projette l'amortissement linéaire de tous les actifs en une opération.
+
+    L'annuité vaut `valeur / duree` ; la VNC de l'année k est
+    `max(vnc_depart - k * annuité, 0)`, la dernière dotation soldant le reste.
+    Un actif sans durée d'amortissement conserve sa VNC.
+
+    Args:
+        valeur: Valeurs d'acquisition (n,)
+        duree: Durées d'amortissement en années (n,)
+        vnc_depart: VNC à la fin du dernier exercice publié (n,)
+        years: Nombre d'exercices futurs à projeter
+
+    Returns:
+        Tuple (dotation, vnc, vnc_ouverture) de tableaux (n, years)
+    """
+    valeur = np.nan_to_num(np.asarray(valeur, dtype=np.float64))
+    duree = np.nan_to_num(np.asarray(duree, dtype=np.float64))
+    vnc0 = np.clip(np.nan_to_num(np.asarray(vnc_depart, dtype=np.float64)), 0.0, None)
+
+    annuite = np.divide(valeur, duree, out=np.zeros_like(valeur), where=duree > 0)
+    k = np.arange(1, years + 1, dtype=np.float64)
+
+    vnc = np.maximum(vnc0[:, None] - annuite[:, None] * k[None, :], 0.0)
+    opening = np.empty_like(vnc)
+    opening[:, 0] = vnc0
+    opening[:, 1:] = vnc[:, :-1]
+    dotation = opening - vnc
+    return dotation, vnc, opening
+
+
+def exercise_years(labels: Dict[int, str], default_year: int) -> Dict[int, int]:
+    """
+    Extrait l'année d'exercice des libellés de publication ('CA 2017' -> 2017).
+
+    Args:
+        labels: Dictionnaire clé de publication -> libellé
+        default_year: Année utilisée si le libellé ne contient pas d'année
+
+    Returns:
+        Dictionnaire clé de publication -> année d'exercice
+    """
+    years = {}
+    for key, label in labels.items():
+        match = re.search(r'(19|20)\d{2}', label or '')
+        years[key] = int(match.group(0)) if match else default_year
+    return years
+
+
+def project_chunk(chunk: pd.DataFrame, base_years: np.ndarray, years: int) -> pd.DataFrame:
+    """
+    Projette un chunk d'actifs et retourne les lignes non soldées.
+
+    Seules les années où l'actif a encore une valeur à l'ouverture sont
+    émises : un actif totalement amorti ne produit plus de ligne.
+
+    Args:
+        chunk: Colonnes id, nature_id, collectivite_id et montants du fait
+        base_years: Année d'exercice de départ de chaque actif (n,)
+        years: Nombre d'exercices projetés
+
+    Returns:
+        DataFrame (immobilisation_id, nature_id, collectivite_id, annee, dotation, vnc)
+    """
+    vnc0 = starting_book_value(
+        chunk['valeur_d_acquisition'].to_numpy(dtype=np.float64, na_value=np.nan),
+        chunk['cumul_amort_anterieurs'].to_numpy(dtype=np.float64, na_value=np.nan),
+        chunk['amort_exercice'].to_numpy(dtype=np.float64, na_value=np.nan),
+        chunk['vnc_fin_exercice'].to_numpy(dtype=np.float64, na_value=np.nan),
+    )
+    dotation, vnc, opening = project_schedule(
+        chunk['valeur_d_acquisition'].to_numpy(dtype=np.float64, na_value=np.nan),
+        chunk['duree_amort'].to_numpy(dtype=np.float64, na_value=np.nan),
+        vnc0,
+        years,
+    )
+    asset_idx, year_idx = np.nonzero(opening > 0)
+
+    return pd.DataFrame({
+        'immobilisation_id': chunk['id'].to_numpy()[asset_idx],
+        'nature_id': chunk['nature_id'].fillna(0).to_numpy(dtype=np.int64)[asset_idx],
+        'collectivite_id': chunk['collectivite_id'].fillna(0).to_numpy(dtype=np.int64)[asset_idx],
+        'annee': base_years[asset_idx] + year_idx + 1,
+        'dotation': np.round(dotation[asset_idx, year_idx], 2),
+        'vnc': np.round(vnc[asset_idx, year_idx], 2),
+    })
+
+
+def aggregate_projection(rows: pd.DataFrame) -> pd.DataFrame:
+    """Agrège les lignes projetées par nature, collectivité et année."""
+    return (
+        rows.groupby(['nature_id', 'collectivite_id', 'annee'], sort=False)
+        .agg(
+            nb_actifs=('immobilisation_id', 'size'),
+            dotation=('dotation', 'sum'),
+            vnc=('vnc', 'sum'),
+        )
+        .reset_index()
+    )
+
+
+# ============================================================================
+# EXÉCUTION SUR LA BASE
+# ============================================================================
+
+_ASSET_QUERY = text(
+    "SELECT id, nature_id, collectivite_id, publication_id, "
+    "CAST(valeur_d_acquisition AS DOUBLE) AS valeur_d_acquisition, duree_amort, "
+    "CAST(cumul_amort_anterieurs AS DOUBLE) AS cumul_amort_anterieurs, "
+    "CAST(amort_exercice AS DOUBLE) AS amort_exercice, "
+    "CAST(vnc_fin_exercice AS DOUBLE) AS vnc_fin_exercice "
+    f"FROM {Immobilisation.__tablename__} f WHERE ({visible_runs_filter(DATASET_ID)}) "
+    "AND f.id > :last_id ORDER BY f.id LIMIT :limit"
+)
+
+
+def _write_rows(conn, table_name: str, columns, frame: pd.DataFrame) -> None:
+    """Écrit un DataFrame par INSERT multi-valeurs de WRITE_BATCH_SIZE lignes."""
+    placeholders = ', '.join(['%s'] * len(columns))
+    sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+    frame = frame[columns]
+    # conversion en objets Python tranche par tranche pour borner la mémoire
+    for start in range(0, len(frame), WRITE_BATCH_SIZE):
+        values = frame.iloc[start:start + WRITE_BATCH_SIZE].to_numpy(dtype=object).tolist()
+        conn.exec_driver_sql(sql, values)
+
+
+def _create_staging(conn, table) -> str:
+    """Crée (vide) la table de reconstruction de `table` et retourne son nom."""
+    staging = f'{table.name}{STAGING_SUFFIX}'
+    conn.execute(text(f'DROP TABLE IF EXISTS {staging}'))
+    conn.execute(text(f'CREATE TABLE {staging} LIKE {table.name}'))
+    return staging
+
+
+def _swap_tables(conn, tables) -> None:
+    """
+    Remplace chaque table par sa reconstruction en un seul RENAME TABLE.
+
+    Le renommage de toutes les tables est atomique : une requête lit
+    l'ancienne projection complète ou la nouvelle, jamais un mélange.
+    """
+    renames = []
+    for table in tables:
+        retired = f'{table.name}{RETIRED_SUFFIX}'
+        conn.execute(text(f'DROP TABLE IF EXISTS {retired}'))
+        renames.append(f'{table.name} TO {retired}')
+        renames.append(f'{table.name}{STAGING_SUFFIX} TO {table.name}')
+    conn.execute(text('RENAME TABLE ' + ', '.join(renames)))
+    for table in tables:
+        conn.execute(text(f'DROP TABLE {table.name}{RETIRED_SUFFIX}'))
+
+
+def run_projection(
+    years: int = PROJECTION_YEARS,
+    memory_mb: int = PROJECTION_MEMORY_MB,
+    engine=None
+) -> int:
+    """
+    Recalcule les tables amortissement_projection et son agrégat.
+
+    Les actifs visibles (dernier run validé) sont lus par chunks
+    (pagination par clé sur `id`) dont la taille respecte le budget
+    mémoire ; chaque chunk est projeté en une opération vectorisée puis
+    écrit dans la table de reconstruction (`<table>_next`), dans sa propre
+    transaction. Les deux tables sont ensuite échangées d'un bloc
+    (_swap_tables) : la projection précédente reste lisible jusqu'au bout.
+
+    Args:
+        years: Nombre d'exercices futurs à projeter
+        memory_mb: Budget mémoire des tableaux d'un chunk (Mo)
+        engine: Moteur SQLAlchemy (défaut: get_engine())
+
+    Returns:
+        Nombre de lignes de projection écrites
+    """
+    engine = engine or get_engine()
+    ensure_schema(engine)
+    chunk_size = chunk_size_for_budget(years, memory_mb)
+    logger.info('Projecting depreciation over %s years (chunk_size=%s)', years, chunk_size)
+
+    projection = AmortissementProjection.__table__
+    agregat = AmortissementProjectionAgregat.__table__
+    projection_cols = [c.name for c in projection.columns]
+
+    with engine.begin() as conn:
+        labels = dict(conn.execute(select(Publication.__table__.c.id, Publication.__table__.c.libelle)))
+        staging = _create_staging(conn, projection)
+        staging_agregat = _create_staging(conn, agregat)
+
+    default_year = datetime.date.today().year - 1
+    base_by_publication = exercise_years(labels, default_year)
+
+    written = 0
+    last_id = 0
+    aggregates = []
+    while True:
+        with engine.begin() as conn:
+            chunk = pd.read_sql(_ASSET_QUERY, conn, params={'last_id': last_id, 'limit': chunk_size})
+            if chunk.empty:
+                break
+            last_id = int(chunk['id'].iloc[-1])
+
+            base_years = (
+                chunk['publication_id'].map(base_by_publication)
+                .fillna(default_year).to_numpy(dtype=np.int64)
+            )
+            rows = project_chunk(chunk, base_years, years)
+            del chunk
+
+            _write_rows(conn, staging, projection_cols, rows)
+            aggregates.append(aggregate_projection(rows))
+            written += len(rows)
+            logger.debug('Projection chunk up to id=%s: %s rows', last_id, len(rows))
+
+    if aggregates:
+        totals = (
+            pd.concat(aggregates, ignore_index=True)
+            .groupby(['nature_id', 'collectivite_id', 'annee'], sort=True)
+            .sum()
+            .reset_index()
+        )
+        totals[['dotation', 'vnc']] = totals[['dotation', 'vnc']].round(2)
+        with engine.begin() as conn:
+            _write_rows(conn, staging_agregat, [c.name for c in agregat.columns], totals)
+
+    with engine.begin() as conn:
+        _swap_tables(conn, (projection, agregat))
+
+    logger.info('Projection written: %s rows', f'{written:,}')
+    return written
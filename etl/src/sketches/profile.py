@@ -0,0 +1,336 @@
+"""Profil des données d'un run, construit lot par lot.
+
+Chaque lot transformé est résumé colonne par colonne (taux de NULL,
+HyperLogLog, KLL, valeurs fréquentes) ; le profil du lot est fusionné dans
+celui du run une fois le lot validé. Le profil est enregistré dans
+etl_profiles (statistiques lisibles et résumés sérialisés) : un run repris
+fusionne le profil déjà enregistré, et la dérive par rapport au run validé
+précédent se calcule sur les résumés, sans relire les données.
+"""
+import json
+import zlib
+import logging
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, insert, select
+from models import EtlProfile, EtlRun, Immobilisation
+from load.checkpoint import STATUS_COMMITTED
+from load.load import fixed_point_scales
+from transform.transform import TARGET_SCHEMA
+from sketches.sketches import HyperLogLog, KLLSketch, TopK, hash_values
+
+logger = logging.getLogger(__name__)
+
+NUMERIC, DATE, TEXT = 'numeric', 'date', 'text'
+
+_KINDS = {'decimal': NUMERIC, 'float': NUMERIC, 'int': NUMERIC, 'cents': NUMERIC, 'date': DATE}
+
+# Colonnes profilées : schéma cible et champs dérivés
+PROFILE_COLUMNS: Dict[str, str] = {
+    **{column: _KINDS.get(data_type, TEXT) for column, data_type in TARGET_SCHEMA.items()},
+    'taux_amortissement': NUMERIC,
+    'amortissement_total': NUMERIC,
+    'pct_valeur_restante': NUMERIC,
+}
+
+# Rangs publiés dans le rapport
+QUANTILES = {'p01': 0.01, 'p25': 0.25, 'p50': 0.5, 'p75': 0.75, 'p99': 0.99}
+# Valeurs fréquentes publiées dans le rapport (clés tronquées)
+REPORT_TOP_K = 10
+TOP_K_KEY_LENGTH = 120
+
+# Seuils de dérive entre deux runs (le rapport des nombres de valeurs
+# distinctes est publié sans seuil : il suit le nombre de lignes)
+DRIFT_THRESHOLDS = {
+    'null_rate_delta': 0.05,   # écart absolu du taux de NULL
+    'ks': 0.1,                 # distance de Kolmogorov-Smirnov (KLL)
+    'top_k_shift': 0.2,        # variation totale des fréquences des valeurs fréquentes
+}
+
+
+def _number_key(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _day_key(days: int) -> str:
+    return str(np.datetime64(int(days), 'D'))
+
+
+class ColumnProfile:
+    """Résumés fusionnables d'une colonne."""
+
+    def __init__(self, name: str, kind: str):
+        self.name = name
+        self.kind = kind
+        self.rows = 0
+        self.nulls = 0
+        self.distinct = HyperLogLog()
+        self.quantiles = KLLSketch() if kind in (NUMERIC, DATE) else None
+        self.top = TopK()
+
+    def update(self, values: pd.Series, scale: int = 0) -> None:
+        """
+        Résume les valeurs d'un lot.
+
+        Args:
+            values: Colonne du lot
+            scale: Décimales d'une colonne en unités entières (centimes)
+        """
+        present = values.notna()
+        self.rows += len(values)
+        self.nulls += int(len(values) - present.sum())
+        values = values[present]
+        if not len(values):
+            return
+        if self.kind == NUMERIC:
+            numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+            numbers = numbers[~np.isnan(numbers)]
+            if scale:
+                numbers = numbers / 10 ** scale
+            self.distinct.update(hash_values(numbers))
+            self.quantiles.update(numbers)
+            self.top.update_counts(pd.Series(numbers).value_counts(), _number_key)
+        elif self.kind == DATE:
+            dates = pd.to_datetime(values, errors='coerce').dropna()
+            days = dates.to_numpy(dtype='datetime64[D]').astype(np.int64)
+            self.distinct.update(hash_values(days))
+            self.quantiles.update(days.astype(np.float64))
+            self.top.update_counts(pd.Series(days).value_counts(), _day_key)
+        else:
+            strings = values.astype(str).to_numpy(dtype=object)
+            self.distinct.update(hash_values(strings))
+            self.top.update_counts(pd.Series(strings).value_counts(), lambda v: v[:TOP_K_KEY_LENGTH])
+
+    def merge(self, other: 'ColumnProfile') -> None:
+        self.rows += other.rows
+        self.nulls += other.nulls
+        self.distinct.merge(other.distinct)
+        if self.quantiles is not None and other.quantiles is not None:
+            self.quantiles.merge(other.quantiles)
+        self.top.merge(other.top)
+
+    @property
+    def null_rate(self) -> float:
+        return self.nulls / self.rows if self.rows else 0.0
+
+    def _render(self, value: Optional[float]):
+        if value is None or self.kind != DATE:
+            return value
+        return _day_key(value)
+
+    def stats(self) -> Dict:
+        """Statistiques lisibles : taux de NULL, distincts, bornes, quantiles, valeurs fréquentes."""
+        stats = {
+            'kind': self.kind,
+            'null_rate': round(self.null_rate, 6),
+            'top_k': self.top.top(REPORT_TOP_K),
+        }
+        if self.quantiles is not None and self.quantiles.count:
+            stats['min'] = self._render(self.quantiles.min)
+            stats['max'] = self._render(self.quantiles.max)
+            values = self.quantiles.quantiles(list(QUANTILES.values()))
+            stats['quantiles'] = {name: self._render(v) for name, v in zip(QUANTILES, values)}
+        return stats
+
+    def to_bytes(self) -> bytes:
+        state = {
+            'kind': self.kind, 'rows': self.rows, 'nulls': self.nulls,
+            'hll': self.distinct.to_dict(), 'top': self.top.to_dict(),
+            'kll': self.quantiles.to_dict() if self.quantiles is not None else None,
+        }
+        return zlib.compress(json.dumps(state, separators=(',', ':')).encode('utf-8'))
+
+    @classmethod
+    def from_bytes(cls, name: str, blob: bytes) -> 'ColumnProfile':
+        state = json.loads(zlib.decompress(blob))
+        profile = cls(name, state['kind'])
+        profile.rows, profile.nulls = state['rows'], state['nulls']
+        profile.distinct = HyperLogLog.from_dict(state['hll'])
+        profile.top = TopK.from_dict(state['top'])
+        if state['kll'] is not None:
+            profile.quantiles = KLLSketch.from_dict(state['kll'])
+        return profile
+
+
+class DatasetProfile:
+    """Profil d'un lot ou d'un run : un ColumnProfile par colonne."""
+
+    def __init__(self, columns: Optional[Dict[str, str]] = None):
+        columns = PROFILE_COLUMNS if columns is None else columns
+        self.columns: Dict[str, ColumnProfile] = {
+            name: ColumnProfile(name, kind) for name, kind in columns.items()
+        }
+
+    @property
+    def rows(self) -> int:
+        return max((column.rows for column in self.columns.values()), default=0)
+
+    def observe(self, df: pd.DataFrame) -> 'DatasetProfile':
+        """Résume un lot transformé (montants en centimes ramenés à leur valeur)."""
+        scales = fixed_point_scales(df, Immobilisation.__table__)
+        for name, column in self.columns.items():
+            values = df[name] if name in df.columns else pd.Series(None, index=df.index, dtype=object)
+            column.update(values, scales.get(name, 0))
+        return self
+
+    def merge(self, other: 'DatasetProfile') -> None:
+        for name, column in other.columns.items():
+            if name in self.columns:
+                self.columns[name].merge(column)
+            else:
+                self.columns[name] = column
+
+
+def profile_frame(df: pd.DataFrame, columns: Optional[Dict[str, str]] = None) -> DatasetProfile:
+    """Profil d'un lot (à fusionner dans celui du run une fois le lot validé)."""
+    return DatasetProfile(columns).observe(df)
+
+
+# ============================================================================
+# DÉRIVE ENTRE RUNS
+# ============================================================================
+
+def column_drift(current: ColumnProfile, baseline: ColumnProfile) -> Dict:
+    """
+    Compare deux profils d'une colonne à partir de leurs résumés seuls.
+
+    Returns:
+        Écart de taux de NULL, rapport des distincts, distance KS (KLL),
+        variation des valeurs fréquentes et indicateur `drifted`
+    """
+    drift = {'null_rate_delta': round(current.null_rate - baseline.null_rate, 6)}
+    before = baseline.distinct.estimate()
+    drift['distinct_ratio'] = round(current.distinct.estimate() / before, 4) if before else None
+    if current.quantiles is not None and baseline.quantiles is not None \
+            and current.quantiles.count and baseline.quantiles.count:
+        points = np.concatenate([current.quantiles.items(), baseline.quantiles.items()])
+        distance = np.abs(current.quantiles.cdf(points) - baseline.quantiles.cdf(points)).max()
+        drift['ks'] = round(float(distance), 6)
+    present = current.rows - current.nulls, baseline.rows - baseline.nulls
+    if all(present):
+        keys = set(current.top.counters) | set(baseline.top.counters)
+        shift = sum(abs(current.top.counters.get(k, 0) / present[0] - baseline.top.counters.get(k, 0) / present[1])
+                    for k in keys) / 2
+        drift['top_k_shift'] = round(shift, 6)
+    drift['drifted'] = any(abs(drift[name]) > limit
+                           for name, limit in DRIFT_THRESHOLDS.items() if name in drift)
+    return drift
+
+
+def compare_profiles(current: DatasetProfile, baseline: DatasetProfile) -> Dict[str, Dict]:
+    """Dérive de chaque colonne présente dans les deux profils."""
+    return {
+        name: column_drift(column, baseline.columns[name])
+        for name, column in current.columns.items()
+        if name in baseline.columns and column.rows and baseline.columns[name].rows
+    }
+
+
+# ============================================================================
+# PERSISTANCE
+# ============================================================================
+
+def save_profile(engine, run_id: int, profile: DatasetProfile,
+                 baseline: Optional[DatasetProfile] = None) -> Dict[str, Dict]:
+    """
+    Enregistre le profil d'un run (remplace le précédent) dans etl_profiles.
+
+    Args:
+        engine: Moteur SQLAlchemy
+        run_id: Run profilé
+        profile: Profil fusionné des lots validés
+        baseline: Profil du run de référence (dérive), None = pas de comparaison
+
+    Returns:
+        Dérive par colonne (vide sans référence)
+    """
+    drift = compare_profiles(profile, baseline) if baseline is not None else {}
+    with engine.begin() as conn:
+        write_profile(conn, run_id, profile, drift)
+    return drift
+
+
+def write_profile(conn, run_id: int, profile: DatasetProfile,
+                  drift: Optional[Dict[str, Dict]] = None) -> None:
+    """Remplace le profil d'un run sur la connexion (transaction du checkpoint d'un lot)."""
+    drift = drift or {}
+    rows = [{
+        'run_id': run_id,
+        'column_name': name,
+        'rows': column.rows,
+        'nulls': column.nulls,
+        'distinct_estimate': column.distinct.estimate(),
+        'stats': column.stats(),
+        'drift': drift.get(name),
+        'sketch': column.to_bytes(),
+    } for name, column in profile.columns.items()]
+    table = EtlProfile.__table__
+    conn.execute(delete(table).where(table.c.run_id == run_id))
+    conn.execute(insert(table), rows)
+
+
+def load_profile(engine, run_id: Optional[int]) -> Optional[DatasetProfile]:
+    """Profil enregistré d'un run, None s'il n'en a pas."""
+    if run_id is None:
+        return None
+    table = EtlProfile.__table__
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(table.c.column_name, table.c.sketch).where(table.c.run_id == run_id)
+        ).all()
+    if not rows:
+        return None
+    profile = DatasetProfile({})
+    for row in rows:
+        profile.columns[row.column_name] = ColumnProfile.from_bytes(row.column_name, row.sketch)
+    return profile
+
+
+def baseline_run(engine, run_id: int) -> Optional[int]:
+    """Dernier run validé et profilé du même dataset avant `run_id`."""
+    runs, profiles = EtlRun.__table__, EtlProfile.__table__
+    dataset = select(runs.c.dataset_id).where(runs.c.run_id == run_id).scalar_subquery()
+    with engine.connect() as conn:
+        return conn.execute(
+            select(runs.c.run_id)
+            .where(runs.c.dataset_id == dataset, runs.c.status == STATUS_COMMITTED,
+                   runs.c.run_id < run_id,
+                   runs.c.run_id.in_(select(profiles.c.run_id).distinct()))
+            .order_by(runs.c.run_id.desc()).limit(1)
+        ).scalar()
+
+
+def report_profile(engine, run_id: int, profile: DatasetProfile) -> Dict[str, Dict]:
+    """
+    Publie le profil d'un run validé et sa dérive par rapport au run validé précédent.
+
+    Returns:
+        Dérive par colonne (vide pour le premier run du dataset)
+    """
+    reference = baseline_run(engine, run_id)
+    drift = save_profile(engine, run_id, profile, load_profile(engine, reference))
+    for name, column in profile.columns.items():
+        stats = column.stats()
+        logger.info('Profile %s: rows=%s null_rate=%.2f%% distinct~%s p50=%s',
+                    name, column.rows, column.null_rate * 100, column.distinct.estimate(),
+                    stats.get('quantiles', {}).get('p50'))
+    drifted = sorted(name for name, values in drift.items() if values['drifted'])
+    if drifted:
+        logger.warning('Data drift against run %s on %s columns: %s', reference, len(drifted), drifted)
+    elif reference is not None:
+        logger.info('No data drift against run %s', reference)
+    return drift
+
+
+def format_report(rows: List) -> List[str]:
+    """Lignes du rapport texte d'un profil (cli.py profile)."""
+    lines = [f"{'column':<28} {'rows':>9} {'null %':>7} {'distinct':>9} {'p50':>14} {'drift':>6}"]
+    for row in rows:
+        p50 = (row.stats or {}).get('quantiles', {}).get('p50')
+        p50 = '' if p50 is None else (f'{p50:.6g}' if isinstance(p50, float) else str(p50))
+        drifted = '' if row.drift is None else ('yes' if row.drift.get('drifted') else 'no')
+        null_rate = (row.stats or {}).get('null_rate', 0) * 100
+        lines.append(f'{row.column_name:<28} {row.rows:>9,} {null_rate:>6.1f}% '
+                     f'{row.distinct_estimate:>9,} {p50:>14} {drifted:>6}')
+    return lines
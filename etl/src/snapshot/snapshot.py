@@ -0,0 +1,135 @@
+"""Instantané Arrow des colonnes analytiques, publié après chaque run.
+
+Après un run validé (ou une annulation), les lignes visibles de la vue
+immobilisations_amortissements sont relues par tranches (curseur côté
+serveur) et écrites dans un fichier Arrow IPC (Feather v2) non compressé,
+sur un volume partagé avec le frontend. Le frontend le projette en mémoire
+(mmap) une fois par processus : toutes les sessions lisent les mêmes
+pages du cache du système, sans copie ni requête MySQL.
+
+Le fichier est écrit sous un nom temporaire puis renommé : un lecteur
+garde l'ancien instantané tant qu'il le projette, le suivant voit le
+nouveau. La version des données et la date de génération sont inscrites
+dans les métadonnées du schéma.
+"""
+import os
+import logging
+from datetime import datetime, timezone
+from typing import Iterator
+import pandas as pd
+from sqlalchemy import text
+from config import SNAPSHOT_PATH, SNAPSHOT_CHUNK_ROWS
+from load.checkpoint import get_data_version
+from models import COMPAT_VIEW_NAME
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # instantané désactivé sans pyarrow
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+
+class SnapshotError(RuntimeError):
+    """Instantané impossible à écrire (pyarrow absent)."""
+
+
+def snapshot_schema():
+    """Colonnes de l'instantané (montants en float64 : agrégats et graphiques)."""
+    return pa.schema([
+        ('id', pa.int64()),
+        ('collectivite', pa.string()),
+        ('nature', pa.string()),
+        ('date_d_acquisition', pa.date32()),
+        ('annee_acquisition', pa.int16()),
+        ('trimestre_acquisition', pa.int8()),
+        ('mois_acquisition', pa.int8()),
+        ('valeur_d_acquisition', pa.float64()),
+        ('duree_amort', pa.int32()),
+        ('vnc_fin_exercice', pa.float64()),
+        ('amortissement_total', pa.float64()),
+        ('taux_amortissement', pa.float64()),
+    ])
+
+
+def _iter_chunks(engine, source: str, columns, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Lignes de `source` par tranches, lues par un curseur côté serveur."""
+    sql = text(f"SELECT {', '.join(columns)} FROM {source} ORDER BY id")
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=chunk_rows)
+        yield from pd.read_sql(sql, conn, chunksize=chunk_rows, coerce_float=True)
+
+
+def _record_batch(chunk: pd.DataFrame, schema) -> 'pa.RecordBatch':
+    """Convertit une tranche au schéma de l'instantané (NULL conservés)."""
+    chunk['date_d_acquisition'] = pd.to_datetime(chunk['date_d_acquisition'], errors='coerce').dt.date
+    arrays = []
+    for field in schema:
+        values = chunk[field.name]
+        if pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+            values = pd.to_numeric(values, errors='coerce')
+        arrays.append(pa.array(values, type=field.type, from_pandas=True))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_snapshot(engine, path: str = SNAPSHOT_PATH, version: int = None,
+                   source: str = COMPAT_VIEW_NAME, chunk_rows: int = SNAPSHOT_CHUNK_ROWS) -> int:
+    """
+    Écrit l'instantané Arrow des lignes visibles.
+
+    Args:
+        engine: Moteur SQLAlchemy
+        path: Fichier de destination (.arrow)
+        version: Version des données inscrite dans les métadonnées
+        source: Table ou vue lue (défaut: vue des runs validés)
+        chunk_rows: Lignes lues et écrites par lot Arrow
+
+    Returns:
+        Nombre de lignes écrites
+
+    Raises:
+        SnapshotError: pyarrow n'est pas installé
+    """
+    if pa is None:
+        raise SnapshotError('Arrow snapshot requires pyarrow (pip install pyarrow)')
+    schema = snapshot_schema().with_metadata({
+        'data_version': str(version if version is not None else ''),
+        'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    })
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    rows = 0
+    try:
+        # sans compression : les tampons du fichier sont utilisables tels
+        # quels depuis la projection mémoire
+        with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+            for chunk in _iter_chunks(engine, source, schema.names, chunk_rows):
+                if len(chunk):
+                    writer.write_batch(_record_batch(chunk, schema))
+                    rows += len(chunk)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    logger.info('Wrote Arrow snapshot of %s rows to %s (data version %s)', f'{rows:,}', path, version)
+    return rows
+
+
+def refresh_snapshot(engine, path: str = SNAPSHOT_PATH) -> None:
+    """
+    Republie l'instantané après un changement des données visibles.
+
+    Sans effet si ETL_SNAPSHOT_PATH n'est pas défini. Un échec est
+    journalisé sans interrompre le pipeline : le run est déjà validé et le
+    frontend garde l'instantané précédent.
+    """
+    if not path:
+        return
+    try:
+        write_snapshot(engine, path, version=get_data_version(engine))
+    except Exception as e:
+        logger.error('Arrow snapshot not refreshed: %s', e)
@@ -0,0 +1,295 @@
+"""Spool disque entre les étapes du pipeline ETL.
+
+Chaque étape peut écrire sa sortie dans un répertoire de spool et l'étape
+suivante la relire, sur une autre machine ou à un autre moment :
+- `raw/`         : enregistrements bruts de l'API (NDJSON compressé gzip)
+- `transformed/` : DataFrames transformés (NDJSON gzip ou Arrow IPC)
+
+Un spool est une suite de fichiers `part-NNNNN.<ext>` écrits de façon
+atomique (fichier temporaire puis renommage) et d'un `manifest.json`
+écrit en dernier : un spool sans manifeste complet est incomplet et
+n'est pas relu. Il est écrit dans un répertoire voisin `<étape>.tmp`,
+renommé à la place du précédent une fois complet : une écriture
+interrompue laisse le spool précédent intact. Chaque manifeste porte un
+identifiant unique (`spool_id`) : un chargement repris vérifie qu'il
+relit le même spool.
+"""
+import os
+import gzip
+import json
+import time
+import uuid
+import shutil
+import logging
+import pandas as pd
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # Arrow IPC est optionnel : NDJSON reste disponible
+    pa = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+# Répertoires voisins : spool en cours d'écriture, spool remplacé
+STAGING_SUFFIX = '.tmp'
+RETIRED_SUFFIX = '.old'
+FORMATS = ('ndjson', 'arrow')
+EXTENSIONS = {'ndjson': 'ndjson.gz', 'arrow': 'arrow'}
+
+# Stages (sous-répertoires) du spool
+RAW = 'raw'
+TRANSFORMED = 'transformed'
+
+
+class SpoolError(RuntimeError):
+    """Spool absent, incomplet ou d'un format non supporté."""
+
+
+def stage_dir(spool_dir: str, stage: str) -> str:
+    return os.path.join(spool_dir, stage)
+
+
+def _part_path(directory: str, index: int, fmt: str) -> str:
+    return os.path.join(directory, f'part-{index:05d}.{EXTENSIONS[fmt]}')
+
+
+# ============================================================================
+# ÉCRITURE
+# ============================================================================
+
+class SpoolWriter:
+    """
+    Écrit la sortie d'une étape dans un répertoire de spool.
+
+    Les enregistrements bruts sont ajoutés au fichier courant, qui est
+    clos tous les `part_rows` enregistrements ; chaque DataFrame écrit
+    forme son propre fichier. Les fichiers sont écrits dans
+    `<directory>.tmp`, qui ne remplace le spool précédent qu'à la clôture.
+
+    Usage :
+        with SpoolWriter(stage_dir(spool, RAW), meta={'dataset_id': ...}) as writer:
+            for batch in batches:
+                writer.write_records(batch)
+    """
+
+    def __init__(self, directory: str, fmt: str = 'ndjson', part_rows: int = 50000,
+                 meta: Optional[Dict[str, Any]] = None):
+        if fmt not in FORMATS:
+            raise SpoolError(f'Unknown spool format {fmt!r} (expected one of {FORMATS})')
+        if fmt == 'arrow' and pa is None:
+            raise SpoolError('Arrow spool requires pyarrow (pip install pyarrow)')
+        self.directory = directory
+        self.staging = f'{directory.rstrip(os.sep)}{STAGING_SUFFIX}'
+        self.fmt = fmt
+        self.part_rows = part_rows
+        self.meta = dict(meta or {})
+        self.parts: List[Dict[str, Any]] = []
+        self.dtypes: Dict[str, str] = {}
+        self._fh = None
+        self._path = None
+        self._tmp_path = None
+        self._part_count = 0
+
+        # reste d'une écriture interrompue
+        shutil.rmtree(self.staging, ignore_errors=True)
+        os.makedirs(self.staging)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._abort()
+
+    def _open_part(self) -> Tuple[str, str]:
+        path = _part_path(self.staging, len(self.parts), self.fmt)
+        return path, f'{path}.tmp'
+
+    def _commit_part(self, path: str, tmp_path: str, rows: int) -> None:
+        os.replace(tmp_path, path)
+        self.parts.append({'file': os.path.basename(path), 'rows': rows,
+                           'bytes': os.path.getsize(path)})
+
+    def write_records(self, records: List[Dict[str, Any]]) -> None:
+        """Ajoute des enregistrements bruts (dictionnaires JSON) au spool NDJSON."""
+        if self.fmt != 'ndjson':
+            raise SpoolError('Raw records can only be spooled as NDJSON')
+        for record in records:
+            if self._fh is None:
+                self._path, self._tmp_path = self._open_part()
+                self._fh = gzip.open(self._tmp_path, 'wt', encoding='utf-8', compresslevel=6)
+                self._part_count = 0
+            self._fh.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+            self._fh.write('\n')
+            self._part_count += 1
+            if self._part_count >= self.part_rows:
+                self._close_part()
+
+    def _close_part(self) -> None:
+        if self._fh is None:
+            return
+        self._fh.close()
+        self._fh = None
+        self._commit_part(self._path, self._tmp_path, self._part_count)
+
+    def write_frame(self, df: pd.DataFrame) -> None:
+        """Écrit un DataFrame comme un nouveau fichier du spool."""
+        if df.empty:
+            return
+        for column, dtype in df.dtypes.items():
+            self.dtypes.setdefault(column, str(dtype))
+        path, tmp_path = self._open_part()
+        if self.fmt == 'arrow':
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            options = pa.ipc.IpcWriteOptions(compression='zstd')
+            with pa.OSFile(tmp_path, 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                    writer.write_table(table)
+        else:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8', compresslevel=6) as fh:
+                df.to_json(fh, orient='records', lines=True, date_format='iso', force_ascii=False)
+        self._commit_part(path, tmp_path, len(df))
+
+    def close(self) -> Dict[str, Any]:
+        """
+        Clôt le dernier fichier, écrit le manifeste et publie le spool complet.
+
+        Returns:
+            Contenu du manifeste
+        """
+        self._close_part()
+        manifest = {
+            **self.meta,
+            'format': self.fmt,
+            'spool_id': uuid.uuid4().hex,
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'rows': sum(p['rows'] for p in self.parts),
+            'bytes': sum(p['bytes'] for p in self.parts),
+            'dtypes': self.dtypes,
+            'parts': self.parts,
+            'complete': True,
+        }
+        with open(os.path.join(self.staging, MANIFEST), 'w', encoding='utf-8') as fh:
+            json.dump(manifest, fh, indent=2, ensure_ascii=False)
+        self._publish()
+        logger.info('Spool written to %s: %s rows in %s parts (%s bytes)',
+                    self.directory, f"{manifest['rows']:,}", len(self.parts), f"{manifest['bytes']:,}")
+        return manifest
+
+    def _publish(self) -> None:
+        """Remplace le spool précédent par le répertoire d'écriture."""
+        retired = f'{self.directory.rstrip(os.sep)}{RETIRED_SUFFIX}'
+        shutil.rmtree(retired, ignore_errors=True)
+        if os.path.exists(self.directory):
+            os.replace(self.directory, retired)
+        os.replace(self.staging, self.directory)
+        shutil.rmtree(retired, ignore_errors=True)
+
+    def _abort(self) -> None:
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+
+# ============================================================================
+# LECTURE
+# ============================================================================
+
+def read_manifest(directory: str) -> Dict[str, Any]:
+    """
+    Lit le manifeste d'un spool complet.
+
+    Raises:
+        SpoolError: si le spool est absent ou incomplet
+    """
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        raise SpoolError(f'No complete spool in {directory} (missing {MANIFEST})')
+    with open(path, encoding='utf-8') as fh:
+        manifest = json.load(fh)
+    if not manifest.get('complete'):
+        raise SpoolError(f'Spool in {directory} is incomplete')
+    return manifest
+
+
+def spool_identity(manifest: Dict[str, Any]) -> str:
+    """Identité d'un spool écrit (date d'écriture pour un manifeste antérieur à `spool_id`)."""
+    return manifest.get('spool_id') or manifest['created_at']
+
+
+def iter_records(directory: str, batch_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Relit un spool d'enregistrements bruts par lots.
+
+    Yields:
+        Listes d'au plus `batch_size` enregistrements
+    """
+    manifest = read_manifest(directory)
+    batch: List[Dict[str, Any]] = []
+    for part in manifest['parts']:
+        with gzip.open(os.path.join(directory, part['file']), 'rt', encoding='utf-8') as fh:
+            for line in fh:
+                batch.append(json.loads(line))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+def _restore_dtypes(df: pd.DataFrame, dtypes: Dict[str, str]) -> pd.DataFrame:
+    """Restaure les types perdus par NDJSON (dates, numériques)."""
+    for column, dtype in dtypes.items():
+        if column not in df.columns:
+            df[column] = None
+        if dtype.startswith('datetime64'):
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+        elif dtype.startswith(('float', 'int')):
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+        elif dtype.startswith('Int'):
+            # entiers nullables (montants en centimes)
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype(dtype)
+        elif dtype in ('bool', 'boolean'):
+            # booléen nullable : astype(bool) ferait d'une valeur absente True
+            values = df[column].astype('boolean')
+            df[column] = values.astype(bool) if dtype == 'bool' and not values.isna().any() else values
+    return df[list(dtypes)] if dtypes else df
+
+
+def iter_frames(directory: str, start: int = 0) -> Iterator[pd.DataFrame]:
+    """
+    Relit un spool de DataFrames, un fichier à la fois.
+
+    Args:
+        directory: Répertoire du spool
+        start: Première ligne à relire ; les fichiers entièrement avant
+            elle ne sont pas lus (reprise d'un chargement)
+
+    Yields:
+        DataFrame de chaque fichier, avec ses types d'origine
+    """
+    manifest = read_manifest(directory)
+    fmt = manifest.get('format', 'ndjson')
+    if fmt == 'arrow' and pa is None:
+        raise SpoolError('Reading an Arrow spool requires pyarrow')
+    position = 0
+    for part in manifest['parts']:
+        begin = position
+        position += part['rows']
+        if position <= start:
+            continue
+        path = os.path.join(directory, part['file'])
+        if fmt == 'arrow':
+            with pa.memory_map(path) as source:
+                df = pa.ipc.open_file(source).read_all().to_pandas()
+        else:
+            with gzip.open(path, 'rt', encoding='utf-8') as fh:
+                df = pd.read_json(fh, lines=True, dtype=False, convert_dates=False)
+            df = _restore_dtypes(df, manifest.get('dtypes', {}))
+        yield df.iloc[start - begin:] if start > begin else df
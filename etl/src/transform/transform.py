@@ -3,12 +3,15 @@
 Ce module transforme les données brutes de l'API OpenData Paris
 vers un format structuré pour la base de données.
 """
+import logging
 import pandas as pd
 import uuid
 from datetime import datetime
 from typing import Dict, Any, List, Optional, Callable
 
-from utils.process import to_date, to_decimal, to_int, to_string, to_text
+from utils.process import MAX_CENTS, to_cents, to_date, to_decimal, to_int, to_string, to_text
+
+logger = logging.getLogger(__name__)
 
 # Définition du schéma cible : colonnes attendues et leurs types
 TARGET_SCHEMA: Dict[str, str] = {
@@ -36,10 +39,25 @@ TYPE_CONVERTERS: Dict[str, Callable] = {
     'int': to_int,
     'decimal': to_decimal,
     'float': to_decimal,
+    'cents': to_cents,
     'string': to_string,
     'text': to_text,
 }
 
+# Montants en virgule fixe : centimes entiers (dtype Int64) au lieu de float
+FIXED_POINT_TYPES: Dict[str, str] = {'decimal': 'cents'}
+
+
+def fixed_point_schema(target_schema: Dict[str, str] = TARGET_SCHEMA) -> Dict[str, str]:
+    """
+    Variante d'un schéma dont les colonnes DECIMAL sont lues en centimes.
+
+    Les montants restent exacts de la lecture au chargement : les champs
+    dérivés sont calculés en entiers et load.py les lie en décimaux exacts.
+    """
+    return {column: FIXED_POINT_TYPES.get(data_type, data_type)
+            for column, data_type in target_schema.items()}
+
 
 # ============================================================================
 # EXTRACTION ET NORMALISATION DES CHAMPS
@@ -96,9 +114,16 @@ def transform_single_record(
 def transform_records(
     records_list: List[Any],
     target_schema: Dict[str, str] = TARGET_SCHEMA,
-    normalize_names: bool = True
+    normalize_names: bool = True,
+    on_error: Optional[Callable[[int, Any, Exception], None]] = None
 ) -> pd.DataFrame:
-    """Transforme une liste d'enregistrements en DataFrame."""
+    """
+    Transforme une liste d'enregistrements en DataFrame.
+
+    Un enregistrement illisible est écarté sans interrompre le lot ; il est
+    transmis à `on_error(position, enregistrement, erreur)` (dead letters)
+    ou, à défaut, journalisé.
+    """
     rows: List[Dict[str, Any]] = []
 
     # Traiter chaque enregistrement
@@ -107,15 +132,22 @@ def transform_records(
             transformed = transform_single_record(record, target_schema, normalize_names)
             rows.append(transformed)
         except Exception as e:
-            # Logger l'erreur et continuer le traitement du lot
-            print(f"Erreur lors du traitement de l'enregistrement {idx}: {e}")
-
-    # Créer le DataFrame
-    df = pd.DataFrame(rows)
+            # Écarter l'enregistrement et continuer le traitement du lot
+            if on_error is not None:
+                on_error(idx, record, e)
+            else:
+                logger.warning('Failed to transform record %s: %r', idx, e)
 
-    # Assurer l'ordre des colonnes selon le schéma cible
+    # Créer le DataFrame directement dans l'ordre du schéma cible
+    # (évite la copie d'un reindex a posteriori)
     column_order = list(target_schema.keys())
-    df = df.reindex(columns=column_order)
+    df = pd.DataFrame(rows, columns=column_order)
+
+    # Centimes en entiers 64 bits nullables (exacts jusqu'à 2^53 au passage
+    # par float64, au-delà de la plage de DECIMAL(14,2))
+    for column, data_type in target_schema.items():
+        if data_type == 'cents':
+            df[column] = df[column].astype('Int64')
 
     return df
 
@@ -124,9 +156,53 @@ def transform_records(
 # TRANSFORMATIONS SUPPLÉMENTAIRES
 # ============================================================================
 
-def calculate_derived_fields(df: pd.DataFrame) -> pd.DataFrame:
-    """Calcule des champs dérivés à partir des colonnes existantes."""
-    df = df.copy()
+def is_fixed_point(df: pd.DataFrame) -> bool:
+    """Vrai si les montants du lot sont en centimes entiers (fixed_point_schema)."""
+    return ('valeur_d_acquisition' in df.columns
+            and pd.api.types.is_integer_dtype(df['valeur_d_acquisition'].dtype))
+
+
+def _pct_hundredths(vnc: pd.Series, valeur: pd.Series) -> pd.Series:
+    """
+    Part de la valeur restante en centièmes de pour cent, à partir des
+    montants en centimes (Int64), arrondie au plus proche, les demis
+    s'éloignant de zéro.
+
+    Arithmétique entière : même résultat en virgule fixe et en float (les
+    montants float sont d'abord ramenés en centimes).
+    """
+    valeur = valeur.where(valeur > 0)
+    scaled = vnc * 10000
+    pct = (2 * scaled.abs() + valeur) // (2 * valeur)
+    return pct.where(scaled >= 0, -pct)
+
+
+def _float_cents(values: pd.Series) -> pd.Series:
+    """
+    Montants float ramenés en centimes (Int64). Un montant hors de
+    DECIMAL(14,2), que la base refusera, devient NA : au-delà d'int64, la
+    conversion échouerait pour tout le lot.
+    """
+    cents = pd.to_numeric(values, errors='coerce').mul(100).round()
+    return cents.where(cents.abs() <= MAX_CENTS).astype('Int64')
+
+
+def calculate_derived_fields(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+    """
+    Calcule des champs dérivés à partir des colonnes existantes.
+
+    En virgule fixe (montants en centimes), `amortissement_total` reste en
+    centimes et `pct_valeur_restante` est calculé en centièmes de pour cent,
+    par arithmétique entière ; en float, il suit la même règle d'arrondi
+    (voir _pct_hundredths).
+
+    Args:
+        df: DataFrame transformé
+        copy: Travailler sur une copie ; False modifie `df` en place (le
+            pipeline, qui ne réutilise pas le lot, évite ainsi une copie)
+    """
+    if copy:
+        df = df.copy()
     
     # ========================================================================
     # 1. TAUX D'AMORTISSEMENT
@@ -138,27 +214,17 @@ def calculate_derived_fields(df: pd.DataFrame) -> pd.DataFrame:
         )
     
     # ========================================================================
-    # 2. COMPOSANTS DE DATE (Année, Mois, Jour, Trimestre)
+    # 2. DATE D'ACQUISITION
     # ========================================================================
+    # Les composants de date (année, mois, jour, trimestre) sont des colonnes
+    # générées par MySQL et l'âge est calculé à la lecture par la vue : aucun
+    # champ dépendant de la date du jour n'est stocké.
     if 'date_d_acquisition' in df.columns:
         # Convertir en datetime si nécessaire
         df['date_d_acquisition'] = pd.to_datetime(df['date_d_acquisition'], errors='coerce')
-        
-        # Extraire les composants de date
-        df['annee_acquisition'] = df['date_d_acquisition'].dt.year
-        df['mois_acquisition'] = df['date_d_acquisition'].dt.month
-        df['jour_acquisition'] = df['date_d_acquisition'].dt.day
-        df['trimestre_acquisition'] = df['date_d_acquisition'].dt.quarter
-    
-    # ========================================================================
-    # 3. ÂGE DE L'IMMOBILISATION (en années)
-    # ========================================================================
-    if 'date_d_acquisition' in df.columns:
-        today = pd.Timestamp.now()
-        df['age_immobilisation'] = ((today - df['date_d_acquisition']).dt.days / 365.25).round(2)
     
     # ========================================================================
-    # 4. AMORTISSEMENT TOTAL
+    # 3. AMORTISSEMENT TOTAL
     # ========================================================================
     if 'cumul_amort_anterieurs' in df.columns and 'amort_exercice' in df.columns:
         df['amortissement_total'] = (
@@ -167,21 +233,22 @@ def calculate_derived_fields(df: pd.DataFrame) -> pd.DataFrame:
         )
     
     # ========================================================================
-    # 5. POURCENTAGE DE VALEUR RESTANTE
+    # 4. POURCENTAGE DE VALEUR RESTANTE
     # ========================================================================
-    if 'vnc_fin_exercice' in df.columns and 'valeur_d_acquisition' in df.columns:
-        df['pct_valeur_restante'] = (
-            (df['vnc_fin_exercice'] / df['valeur_d_acquisition'] * 100)
-            .where(df['valeur_d_acquisition'] > 0, None)
-            .round(2)
-        )
+    if 'vnc_fin_exercice' in df.columns and 'valeur_d_acquisition' in df.columns and is_fixed_point(df):
+        # centièmes de pour cent
+        df['pct_valeur_restante'] = _pct_hundredths(df['vnc_fin_exercice'], df['valeur_d_acquisition'])
+    elif 'vnc_fin_exercice' in df.columns and 'valeur_d_acquisition' in df.columns:
+        cents = [_float_cents(df[c]) for c in ('vnc_fin_exercice', 'valeur_d_acquisition')]
+        df['pct_valeur_restante'] = _pct_hundredths(*cents).astype('float64') / 100
     
     return df
 
 
-def add_data_quality_flags(df: pd.DataFrame) -> pd.DataFrame:
-    """Ajoute des indicateurs de qualité des données."""
-    df = df.copy()
+def add_data_quality_flags(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
+    """Ajoute des indicateurs de qualité des données (`copy=False` : en place)."""
+    if copy:
+        df = df.copy()
     
     # Vérifier que les champs critiques sont présents
     critical_fields = ['ndeg_immobilisation', 'date_d_acquisition', 'valeur_d_acquisition']
@@ -192,5 +259,5 @@ def add_data_quality_flags(df: pd.DataFrame) -> pd.DataFrame:
         df['_is_duplicate'] = df.duplicated(subset=['ndeg_immobilisation'], keep=False)
     
     # Supprimer les flags temporaires pour éviter leur persistance
-    df = df.drop(columns=[c for c in ['_is_complete', '_is_duplicate'] if c in df.columns])
+    df.drop(columns=[c for c in ['_is_complete', '_is_duplicate'] if c in df.columns], inplace=True)
     return df
\ No newline at end of file
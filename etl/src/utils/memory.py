@@ -0,0 +1,155 @@
+"""Exécution du pipeline ETL sous budget mémoire.
+
+Activé par ETL_MAX_RSS_MB, ce module mesure la mémoire résidente (RSS)
+réellement consommée par chaque lot, en déduit un coût par ligne et
+ajuste la taille du lot suivant pour rester sous le budget. Avant chaque
+nouvelle page, si le processus reste au-dessus du seuil haut après
+libération explicite de la mémoire inutilisée, la page demandée est
+réduite (contre-pression) : attendre ne ferait pas baisser la RSS.
+"""
+import os
+import gc
+import ctypes
+import ctypes.util
+import logging
+import resource
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Budget de mémoire résidente du processus en Mo (0 = désactivé)
+MAX_RSS_MB = int(os.getenv('ETL_MAX_RSS_MB', 0))
+# Taille de lot plancher du mode budget
+MIN_BATCH_SIZE = int(os.getenv('ETL_MIN_BATCH_SIZE', 100))
+
+_PAGE_MB = os.sysconf('SC_PAGE_SIZE') / 1024 / 1024 if hasattr(os, 'sysconf') else 4096 / 1024 / 1024
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6')
+    _malloc_trim = _libc.malloc_trim
+except (OSError, AttributeError):  # hors glibc : gc.collect seul
+    _malloc_trim = None
+
+
+def current_rss_mb() -> float:
+    """Mémoire résidente actuelle du processus (Mo)."""
+    try:
+        with open('/proc/self/statm') as fh:
+            return int(fh.read().split()[1]) * _PAGE_MB
+    except (OSError, ValueError, IndexError):
+        # repli : pic depuis le démarrage (Ko sous Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def release_memory() -> None:
+    """Collecte les cycles et rend au système la mémoire libérée par malloc."""
+    gc.collect()
+    if _malloc_trim is not None:
+        _malloc_trim(0)
+
+
+class MemoryGovernor:
+    """
+    Régule la taille des lots d'après l'empreinte mesurée de chaque lot.
+
+    L'empreinte d'un lot est l'écart entre la RSS au début du lot et le
+    maximum relevé aux frontières d'étapes ; rapportée au nombre de lignes
+    (moyenne lissée), elle donne la taille de lot qui tient dans la marge
+    restante sous `high_water * max_rss_mb`.
+
+    Usage :
+        governor.apply_backpressure()    # avant de demander la page suivante
+        governor.begin_batch()
+        ...; governor.sample()           # après chaque étape
+        governor.end_batch(len(batch))   # ajuste governor.batch_size
+    """
+
+    def __init__(self, max_rss_mb: int, batch_size: int, min_batch_size: int = MIN_BATCH_SIZE,
+                 high_water: float = 0.85, smoothing: float = 0.5):
+        self.max_rss_mb = max_rss_mb
+        self.max_batch_size = batch_size
+        self.min_batch_size = max(1, min(min_batch_size, batch_size))
+        self.high_water = high_water
+        self.smoothing = smoothing
+        self.batch_size = batch_size
+        self.mb_per_row: Optional[float] = None
+        self._start = 0.0
+        self._peak = 0.0
+
+    @property
+    def limit_mb(self) -> float:
+        """Seuil haut au-delà duquel la page suivante est réduite."""
+        return self.max_rss_mb * self.high_water
+
+    def begin_batch(self) -> None:
+        self._start = self._peak = current_rss_mb()
+
+    def sample(self) -> float:
+        """Relève la RSS courante (à appeler entre deux étapes)."""
+        rss = current_rss_mb()
+        self._peak = max(self._peak, rss)
+        return rss
+
+    def end_batch(self, rows: int) -> int:
+        """
+        Enregistre l'empreinte du lot, libère la mémoire et recalcule la taille.
+
+        Args:
+            rows: Nombre d'enregistrements du lot
+
+        Returns:
+            Taille du prochain lot
+        """
+        self.sample()
+        if rows > 0:
+            per_row = max(self._peak - self._start, 0.0) / rows
+            if self.mb_per_row is None:
+                self.mb_per_row = per_row
+            else:
+                self.mb_per_row = self.smoothing * per_row + (1 - self.smoothing) * self.mb_per_row
+        release_memory()
+
+        if self.mb_per_row:
+            headroom = self.limit_mb - current_rss_mb()
+            target = int(headroom / self.mb_per_row) if headroom > 0 else self.min_batch_size
+            size = max(self.min_batch_size, min(self.max_batch_size, target))
+            if size != self.batch_size:
+                logger.info('Memory budget: batch size %s -> %s (%.1f KB/row, peak %.0f/%s MB)',
+                            self.batch_size, size, self.mb_per_row * 1024, self._peak, self.max_rss_mb)
+            self.batch_size = size
+        return self.batch_size
+
+    def apply_backpressure(self) -> int:
+        """
+        Réduit la page suivante tant que la RSS dépasse le seuil haut.
+
+        La mémoire libérée est d'abord rendue au système ; si la RSS reste
+        au-dessus du seuil, la taille de lot est réduite à proportion du
+        dépassement (au moins de moitié), sans descendre sous le plancher.
+
+        Returns:
+            Taille du prochain lot
+        """
+        if current_rss_mb() <= self.limit_mb:
+            return self.batch_size
+        release_memory()
+        rss = current_rss_mb()
+        if rss <= self.limit_mb:
+            return self.batch_size
+        size = max(self.min_batch_size, min(self.batch_size // 2, int(self.batch_size * self.limit_mb / rss)))
+        if size != self.batch_size:
+            logger.warning('RSS %.0f MB above the %.0f MB threshold: batch size %s -> %s',
+                           rss, self.limit_mb, self.batch_size, size)
+        self.batch_size = size
+        return size
+
+
+def get_governor(batch_size: int, max_rss_mb: int = MAX_RSS_MB) -> Optional[MemoryGovernor]:
+    """
+    Retourne le régulateur du mode budget (ETL_MAX_RSS_MB), None si désactivé.
+    """
+    if max_rss_mb <= 0:
+        return None
+    logger.info('Memory budget mode: max RSS %s MB (batch size %s..%s)',
+                max_rss_mb, min(MIN_BATCH_SIZE, batch_size), batch_size)
+    return MemoryGovernor(max_rss_mb, batch_size)
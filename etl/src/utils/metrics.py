@@ -0,0 +1,236 @@
+"""Instrumentation des étapes du pipeline ETL.
+
+Ce module mesure, pour chaque étape (extract, transform, derive, profile,
+anomaly, dedup, load), le temps écoulé, le nombre de lignes, le débit, les octets
+téléchargés, le temps passé en base et la mémoire résidente (RSS) relevée
+à l'entrée et à la sortie de l'étape, par lot et par run.
+Les mesures sont persistées dans etl_runs / etl_batch_metrics et
+exportées au format textfile de Prometheus.
+"""
+import os
+import time
+import logging
+import resource
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+from sqlalchemy import event, insert, update
+from sqlalchemy.engine import Engine
+from models import EtlRun, EtlBatchMetric
+from utils.memory import current_rss_mb
+
+logger = logging.getLogger(__name__)
+
+# Étapes instrumentées, dans l'ordre du pipeline
+STAGES = ('extract', 'transform', 'derive', 'profile', 'anomaly', 'dedup', 'load')
+
+# Fichier textfile Prometheus (node_exporter textfile collector), vide = désactivé
+METRICS_TEXTFILE = os.getenv('ETL_METRICS_TEXTFILE', '')
+
+
+def peak_rss_mb() -> float:
+    """Pic de mémoire résidente du processus depuis son démarrage (Mo)."""
+    # ru_maxrss est exprimé en Ko sous Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@dataclass
+class StageStats:
+    """Compteurs cumulés d'une étape."""
+
+    wall_s: float = 0.0
+    db_s: float = 0.0
+    rows: int = 0
+    bytes: int = 0
+    peak_rss_mb: float = 0.0
+
+    @property
+    def rows_per_s(self) -> float:
+        return self.rows / self.wall_s if self.wall_s > 0 else 0.0
+
+    def add(self, other: 'StageStats') -> None:
+        self.wall_s += other.wall_s
+        self.db_s += other.db_s
+        self.rows += other.rows
+        self.bytes += other.bytes
+        self.peak_rss_mb = max(self.peak_rss_mb, other.peak_rss_mb)
+
+    def as_dict(self) -> Dict[str, float]:
+        data = asdict(self)
+        data['rows_per_s'] = round(self.rows_per_s, 2)
+        return data
+
+
+# Run dont l'étape courante reçoit le temps des requêtes SQL
+_active: Optional['RunMetrics'] = None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_etl_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_etl_query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if _active is not None:
+        _active.add_db_time(elapsed)
+
+
+event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+class RunMetrics:
+    """
+    Collecte les mesures d'un run, lot par lot.
+
+    Usage :
+        with metrics.stage('transform', rows=len(batch)):
+            df = transform_records(batch)
+        save_batch_metrics(engine, metrics.end_batch(batch_no))
+    """
+
+    def __init__(self, run_id: int):
+        global _active
+        self.run_id = run_id
+        self.started = time.perf_counter()
+        self.batch_no = 0
+        self.batch: Dict[str, StageStats] = {}
+        self.totals: Dict[str, StageStats] = {name: StageStats() for name in STAGES}
+        self._current: Optional[StageStats] = None
+        _active = self
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None):
+        """
+        Mesure une étape du lot courant (temps, temps SQL, RSS).
+
+        La RSS courante est relevée à l'entrée et à la sortie de l'étape ;
+        l'étape garde le maximum de ses relevés (ru_maxrss ne donne que le
+        pic du processus depuis son démarrage).
+        """
+        stats = self.batch.setdefault(name, StageStats())
+        previous, self._current = self._current, stats
+        stats.peak_rss_mb = max(stats.peak_rss_mb, current_rss_mb())
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.wall_s += time.perf_counter() - start
+            stats.peak_rss_mb = max(stats.peak_rss_mb, current_rss_mb())
+            if rows is not None:
+                stats.rows += rows
+            self._current = previous
+
+    def add_bytes(self, nbytes: int) -> None:
+        self.batch.setdefault('extract', StageStats()).bytes += nbytes
+
+    def add_db_time(self, seconds: float) -> None:
+        if self._current is not None:
+            self._current.db_s += seconds
+
+    def end_batch(self, batch_no: int) -> List[Dict]:
+        """
+        Clôt le lot courant et retourne ses mesures (une ligne par étape).
+
+        Args:
+            batch_no: Numéro du lot dans le run (continue après une reprise)
+
+        Returns:
+            Lignes prêtes pour etl_batch_metrics
+        """
+        self.batch_no = batch_no
+        rows = []
+        for name, stats in self.batch.items():
+            self.totals.setdefault(name, StageStats()).add(stats)
+            rows.append({'run_id': self.run_id, 'batch_no': self.batch_no, 'stage': name,
+                         **stats.as_dict()})
+        self.batch = {}
+        return rows
+
+    def summary(self) -> Dict:
+        """Mesures agrégées du run (durée totale, débit, octets, pic RSS)."""
+        wall = time.perf_counter() - self.started
+        loaded = self.totals.get('load', StageStats()).rows
+        return {
+            'wall_time_s': round(wall, 3),
+            'rows_per_s': round(loaded / wall, 2) if wall > 0 else 0.0,
+            'bytes_downloaded': sum(s.bytes for s in self.totals.values()),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'stage_metrics': {name: stats.as_dict() for name, stats in self.totals.items()},
+        }
+
+    def close(self) -> None:
+        global _active
+        if _active is self:
+            _active = None
+
+
+# ============================================================================
+# PERSISTANCE ET EXPORT
+# ============================================================================
+
+def save_batch_metrics(engine, rows: List[Dict]) -> None:
+    """Insère les mesures d'un lot dans etl_batch_metrics."""
+    if not rows:
+        return
+    with engine.begin() as conn:
+        conn.execute(insert(EtlBatchMetric.__table__), rows)
+
+
+def save_run_metrics(engine, run_id: int, summary: Dict) -> None:
+    """Écrit les mesures agrégées du run dans sa ligne etl_runs."""
+    table = EtlRun.__table__
+    with engine.begin() as conn:
+        conn.execute(update(table).where(table.c.run_id == run_id).values(**summary))
+
+
+def write_prometheus_textfile(metrics: RunMetrics, path: str = METRICS_TEXTFILE) -> None:
+    """
+    Exporte les mesures du run au format textfile de Prometheus.
+
+    Le fichier est écrit à côté puis renommé pour que le collecteur ne
+    lise jamais un fichier partiel.
+    """
+    if not path:
+        return
+    summary = metrics.summary()
+    lines = [
+        '# HELP etl_run_id Identifiant du run ETL courant',
+        '# TYPE etl_run_id gauge',
+        f'etl_run_id {metrics.run_id}',
+        '# HELP etl_run_duration_seconds Durée écoulée du run',
+        '# TYPE etl_run_duration_seconds gauge',
+        f"etl_run_duration_seconds {summary['wall_time_s']}",
+        '# HELP etl_batches_total Lots traités par le run',
+        '# TYPE etl_batches_total counter',
+        f'etl_batches_total {metrics.batch_no}',
+        '# HELP etl_bytes_downloaded_total Octets téléchargés depuis l\'API',
+        '# TYPE etl_bytes_downloaded_total counter',
+        f"etl_bytes_downloaded_total {summary['bytes_downloaded']}",
+        '# HELP etl_peak_rss_bytes Pic de mémoire résidente du processus',
+        '# TYPE etl_peak_rss_bytes gauge',
+        f"etl_peak_rss_bytes {int(summary['peak_rss_mb'] * 1024 * 1024)}",
+    ]
+    per_stage = (
+        ('etl_stage_seconds_total', 'counter', 'Temps écoulé par étape', 'wall_s'),
+        ('etl_stage_db_seconds_total', 'counter', 'Temps passé en base par étape', 'db_s'),
+        ('etl_stage_rows_total', 'counter', 'Lignes traitées par étape', 'rows'),
+        ('etl_stage_rows_per_second', 'gauge', 'Débit par étape', 'rows_per_s'),
+    )
+    for metric, kind, help_text, key in per_stage:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for stage, values in summary['stage_metrics'].items():
+            lines.append(f'{metric}{{stage="{stage}"}} {values[key]}')
+
+    tmp_path = f'{path}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as fh:
+            fh.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
+    except OSError:
+        logger.exception('Failed to write Prometheus textfile %s', path)
@@ -5,12 +5,18 @@ en types appropriés (date, int, decimal, string, text).
 """
 from typing import Any, Optional
 import datetime
+from decimal import Decimal, ROUND_HALF_UP
 import pandas as pd
 
 # ============================================================================
 # FONCTIONS DE CONVERSION DE TYPES
 # ============================================================================
 
+_UNIT = Decimal(1)
+
+# Plus grand montant en centimes d'une colonne DECIMAL(14,2)
+MAX_CENTS = 10 ** 14 - 1
+
 def to_date(value: Any) -> Optional[datetime.date]:
     """
     Convertit une valeur en date, gère plusieurs formats.
@@ -88,6 +94,73 @@ def to_decimal(value: Any) -> Optional[float]:
         return None
 
 
+def to_cents(value: Any) -> Optional[int]:
+    """
+    Convertit un montant en centimes entiers (virgule fixe, sans flottant).
+
+    Le texte est lu en décimal exact et arrondi au centime (moitié à
+    l'écart de zéro, comme MySQL pour DECIMAL(14,2)) ; un flottant JSON
+    est lu par sa représentation la plus courte : 0.1 donne 10 centimes.
+
+    Args:
+        value: Valeur à convertir
+
+    Returns:
+        int (centimes) ou None si conversion impossible
+
+    Raises:
+        ValueError: montant hors de DECIMAL(14,2) ; l'enregistrement est
+            écarté (dead letters) au lieu de dépasser l'Int64 du lot
+    """
+    cents = _parse_cents(value)
+    if cents is not None and abs(cents) > MAX_CENTS:
+        raise ValueError(f'amount {value!r} is out of DECIMAL(14,2) range')
+    return cents
+
+
+def _parse_cents(value: Any) -> Optional[int]:
+    if value in (None, '') or pd.isna(value):
+        return None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value * 100
+
+    try:
+        if isinstance(value, str):
+            value = value.replace(',', '.').replace(' ', '')
+            # chemin rapide : au plus deux décimales, sans arrondi
+            whole, _, fraction = value.lstrip('+-').partition('.')
+            if whole.isdigit() and len(fraction) <= 2 and (not fraction or fraction.isdigit()):
+                cents = int(whole) * 100 + int(fraction.ljust(2, '0'))
+                return -cents if value.startswith('-') else cents
+        else:
+            cents = float(value) * 100
+            nearest = round(cents)
+            # chemin rapide : montant au centime près (l'écart n'est que
+            # l'erreur de représentation binaire, loin d'une moitié)
+            if abs(cents - nearest) < 1e-6:
+                return int(nearest)
+            value = repr(float(value))
+        return int(Decimal(value).scaleb(2).quantize(_UNIT, rounding=ROUND_HALF_UP))
+    except (ArithmeticError, ValueError, TypeError):
+        return None
+
+
+def from_fixed_point(units: Any, scale: int = 2) -> Optional[Decimal]:
+    """
+    Convertit des unités entières (centimes pour scale=2) en décimal exact.
+
+    Args:
+        units: Nombre entier d'unités de 10^-scale
+        scale: Nombre de décimales
+
+    Returns:
+        Decimal ou None pour une valeur manquante
+    """
+    if units is None or pd.isna(units):
+        return None
+    return Decimal(int(units)).scaleb(-scale)
+
+
 def to_string(value: Any) -> Optional[str]:
     """
     Convertit une valeur en chaîne, normalise les espaces.
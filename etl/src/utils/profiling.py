@@ -0,0 +1,149 @@
+"""Profilage optionnel des étapes du pipeline ETL.
+
+Activé par la variable ETL_PROFILE (cpu, mem ou all), ce module enveloppe
+les étapes extract, transform, derive et load avec cProfile et/ou
+tracemalloc. Tous les ETL_PROFILE_EVERY lots, les statistiques de chaque
+étape sont écrites dans un répertoire propre au run ; un résumé des
+fonctions les plus coûteuses est produit en fin de run.
+
+Désactivé, le profileur est un objet nul dont `stage()` retourne un
+contexte vide partagé : aucun coût par lot.
+"""
+import os
+import io
+import time
+import pstats
+import logging
+import cProfile
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODE = os.getenv('ETL_PROFILE', '').strip().lower()
+PROFILE_EVERY = int(os.getenv('ETL_PROFILE_EVERY', 10))
+PROFILE_DIR = os.getenv('ETL_PROFILE_DIR', 'profiles')
+PROFILE_TOP = int(os.getenv('ETL_PROFILE_TOP', 20))
+
+_NULL_CONTEXT = nullcontext()
+
+
+class NullProfiler:
+    """Profileur désactivé : aucune mesure, aucune allocation."""
+
+    enabled = False
+
+    def stage(self, name: str):
+        return _NULL_CONTEXT
+
+    def end_batch(self, batch_no: int) -> None:
+        return None
+
+    def close(self) -> Optional[str]:
+        return None
+
+
+class StageProfiler:
+    """
+    Profileur par étape (cProfile et/ou tracemalloc).
+
+    Les statistiques cProfile sont cumulées par étape sur tout le run ;
+    le profil et les principaux allocateurs du lot courant sont écrits
+    tous les `every` lots.
+    """
+
+    enabled = True
+
+    def __init__(self, run_id: int, mode: str = 'all', every: int = PROFILE_EVERY,
+                 base_dir: str = PROFILE_DIR, top: int = PROFILE_TOP):
+        self.cpu = mode in ('cpu', 'all')
+        self.mem = mode in ('mem', 'all')
+        self.every = max(1, every)
+        self.top = top
+        self.run_dir = os.path.join(base_dir, f'run_{run_id}_{time.strftime("%Y%m%dT%H%M%S")}')
+        os.makedirs(self.run_dir, exist_ok=True)
+
+        self._batches_seen = 0
+        self._batch_profiles: Dict[str, cProfile.Profile] = {}
+        self._batch_snapshots: Dict[str, Tuple[tracemalloc.Snapshot, tracemalloc.Snapshot]] = {}
+        self._run_stats: Dict[str, pstats.Stats] = {}
+        # le traçage démarré par l'appelant (tests, python -X tracemalloc) lui est laissé
+        self._owns_tracing = self.mem and not tracemalloc.is_tracing()
+        if self._owns_tracing:
+            tracemalloc.start(25)
+        logger.info('Profiling enabled (mode=%s, every=%s batches) -> %s', mode, self.every, self.run_dir)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Profile une étape du lot courant."""
+        profile = self._batch_profiles.setdefault(name, cProfile.Profile()) if self.cpu else None
+        # les instantanés mémoire sont coûteux : uniquement pour les lots écrits
+        sampled = self.mem and (self._batches_seen + 1) % self.every == 0
+        before = tracemalloc.take_snapshot() if sampled else None
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            if before is not None:
+                # allocations nettes de l'étape : différence avec l'état d'entrée
+                self._batch_snapshots[name] = (before, tracemalloc.take_snapshot())
+
+    def end_batch(self, batch_no: int) -> None:
+        """Cumule les profils du lot et les écrit tous les `every` lots."""
+        self._batches_seen += 1
+        dump = self._batches_seen % self.every == 0
+        for name, profile in self._batch_profiles.items():
+            if name in self._run_stats:
+                self._run_stats[name].add(profile)
+            else:
+                self._run_stats[name] = pstats.Stats(profile)
+            if dump:
+                profile.dump_stats(os.path.join(self.run_dir, f'batch_{batch_no:05d}_{name}.prof'))
+        for name, (before, after) in self._batch_snapshots.items():
+            path = os.path.join(self.run_dir, f'batch_{batch_no:05d}_{name}_alloc.txt')
+            with open(path, 'w', encoding='utf-8') as fh:
+                for stat in after.compare_to(before, 'lineno')[:self.top]:
+                    fh.write(f'{stat}\n')
+        self._batch_profiles = {}
+        self._batch_snapshots = {}
+
+    def close(self) -> Optional[str]:
+        """
+        Écrit le résumé des fonctions les plus coûteuses par étape.
+
+        Returns:
+            Chemin du fichier de résumé
+        """
+        summary_path = os.path.join(self.run_dir, 'summary.txt')
+        with open(summary_path, 'w', encoding='utf-8') as fh:
+            for name, stats in self._run_stats.items():
+                stats.dump_stats(os.path.join(self.run_dir, f'run_{name}.prof'))
+                buffer = io.StringIO()
+                stats.stream = buffer
+                stats.sort_stats('cumulative').print_stats(self.top)
+                fh.write(f'===== {name} =====\n{buffer.getvalue()}\n')
+            if self.mem:
+                current, peak = tracemalloc.get_traced_memory()
+                fh.write(f'tracemalloc: current={current / 1e6:.1f}MB peak={peak / 1e6:.1f}MB\n')
+        if self._owns_tracing:
+            tracemalloc.stop()
+        logger.info('Profiling summary written to %s', summary_path)
+        return summary_path
+
+
+def get_profiler(run_id: int, mode: str = PROFILE_MODE):
+    """
+    Retourne le profileur du run selon ETL_PROFILE (cpu, mem, all).
+
+    Returns:
+        StageProfiler si le profilage est demandé, NullProfiler sinon
+    """
+    if mode in ('cpu', 'mem', 'all'):
+        return StageProfiler(run_id, mode)
+    if mode:
+        logger.warning('Unknown ETL_PROFILE=%s (expected cpu, mem or all) - profiling disabled', mode)
+    return NullProfiler()
@@ -0,0 +1,29 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+sys.path.insert(0, os.path.join(os.getcwd(), 'benchmarks'))
+import pytest
+from sqlalchemy import create_engine
+from synthetic import generate_page
+from models import EtlRun, EtlProfile, EtlAnomaly, EtlAnomalyStats
+from transform.transform import transform_records, calculate_derived_fields
+
+
+@pytest.fixture
+def engine():
+    """Base SQLite des runs et de leurs statistiques (profil, anomalies)."""
+    engine = create_engine('sqlite://')
+    for model in (EtlRun, EtlProfile, EtlAnomaly, EtlAnomalyStats):
+        model.__table__.create(engine)
+    return engine
+
+
+@pytest.fixture
+def batch():
+    """Fabrique de lots transformés (pages synthétiques, 10 % de valeurs sales)."""
+    def make(seed, rows=2000, schema=None):
+        records = generate_page(0, rows, seed=seed, dirty=0.1)
+        if schema is None:
+            return calculate_derived_fields(transform_records(records))
+        return calculate_derived_fields(transform_records(records, schema))
+    return make
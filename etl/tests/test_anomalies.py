@@ -0,0 +1,99 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func
+from load.checkpoint import start_run, finish_run, STATUS_COMMITTED
+from models import EtlAnomaly
+from transform.transform import fixed_point_schema
+from anomalies.anomalies import (
+    METRICS, AnomalyDetector, open_detector, report_anomalies, robust_stats, save_stats
+)
+
+
+def test_histogram_median_and_mad_match_exact_values():
+    rng = np.random.default_rng(5)
+    binning = METRICS['valeur_d_acquisition']
+    samples = [rng.normal(3, 0.5, 5000), rng.normal(6, 1.0, 3000)]
+    hist = np.zeros((2, binning.bins), dtype=np.int64)
+    for group, values in enumerate(samples):
+        np.add.at(hist, (group, binning.classes(values)), 1)
+
+    n, median, mad = robust_stats(hist, binning.centers(), binning.width)
+    assert n.tolist() == [5000, 3000]
+    for group, values in enumerate(samples):
+        exact = np.median(values)
+        assert abs(median[group] - exact) <= binning.width
+        assert abs(mad[group] - np.median(np.abs(values - exact))) <= 2 * binning.width
+
+
+def test_outliers_are_flagged_in_both_money_modes(batch):
+    floats, cents = batch(1, rows=3000), batch(1, rows=3000, schema=fixed_point_schema())
+    floats.loc[0, 'valeur_d_acquisition'] = 5e9
+    cents.loc[0, 'valeur_d_acquisition'] = 500_000_000_000
+    flagged = AnomalyDetector().score(floats)
+    same = AnomalyDetector().score(cents)
+
+    values = flagged[flagged['column_name'] == 'valeur_d_acquisition']
+    assert 0 in values.index
+    assert values.loc[0, 'score'] > 3.5 and values.loc[0, 'value'] == 5e9
+    assert values.loc[0, 'nature'] == floats.loc[0, 'nature']
+    assert len(values) < len(floats) * 0.01
+    assert same.index.tolist() == flagged.index.tolist()
+    assert same['score'].tolist() == flagged['score'].tolist()
+
+
+def test_batches_are_saved_with_checkpoint_or_discarded(engine, batch):
+    run = start_run(engine, 'ds')
+    detector = AnomalyDetector(run.run_id)
+    df = batch(1, rows=3000)
+    df.loc[0, 'duree_amort'] = 110
+    detector.score(df)
+    groups = detector.histograms['duree_amort']['all']
+    assert groups.counts.sum() == df['duree_amort'].notna().sum()
+    # lot annulé : retiré des statistiques, rien d'écrit
+    detector.discard()
+    assert groups.counts.sum() == 0 and detector.total == 0
+
+    flagged = detector.score(df)
+    df['source_hash'] = np.arange(len(df), dtype=np.uint64) + 1
+    with engine.begin() as conn:
+        detector.save(conn, df['source_hash'])
+    assert detector.flush() == len(flagged)
+    assert detector.total == len(flagged)
+    table = EtlAnomaly.__table__
+    with engine.connect() as conn:
+        row = conn.execute(select(table).where(table.c.column_name == 'duree_amort',
+                                               table.c.source_hash == 1)).one()
+        assert conn.execute(select(func.count()).select_from(table)).scalar() == len(flagged)
+    assert row.run_id == run.run_id and row.value == 110 and row.score > 3.5
+
+
+def test_resume_and_reference_from_saved_histograms(engine, batch):
+    first = start_run(engine, 'ds')
+    detector = AnomalyDetector(first.run_id)
+    for seed in (1, 2):
+        detector.score(batch(seed, rows=3000))
+        detector.flush()
+    counts = report_anomalies(engine, detector)
+    finish_run(engine, first, STATUS_COMMITTED)
+
+    resumed = open_detector(engine, first.run_id, resume=True)
+    assert resumed.counts() == counts
+    for metric, levels in detector.histograms.items():
+        for level, groups in levels.items():
+            keys, hist = groups.arrays()
+            again = resumed.histograms[metric][level]
+            assert hist.sum() == again.counts.sum()
+            assert np.array_equal(again.counts[again.ids(pd.Series(keys, dtype=object))], hist)
+
+    # run suivant : histogrammes du run validé en référence, compteurs à zéro
+    second = start_run(engine, 'ds')
+    following = open_detector(engine, second.run_id)
+    groups = following.histograms['valeur_d_acquisition']['nature_collectivite']
+    assert groups.counts.sum() == 0
+    assert groups.base.sum() == counts['valeur_d_acquisition']['scored']
+    save_stats(engine, following)
+    keys, hist = groups.arrays()
+    assert len(keys) == 0 and following.total == 0
@@ -0,0 +1,66 @@
+import sys
+import os
+from unittest.mock import patch
+import pytest
+import requests
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+sys.path.insert(0, os.path.join(os.getcwd(), 'benchmarks'))
+from synthetic import generate_page, NATURE_COUNT
+from stub_server import serve
+from bench_etl import compare_results, parse_size, reset_refusal
+import extract.extract as extract_module
+from transform.transform import transform_records
+
+
+def test_generate_page_is_deterministic_and_dirty():
+    page = generate_page(1000, 500, seed=7, dirty=0.2)
+    assert page == generate_page(1000, 500, seed=7, dirty=0.2)
+    assert len(page) == 500 and all('fields' in r for r in page)
+
+    natures = {r['fields']['nature'] for r in page}
+    assert 1 < len(natures) <= NATURE_COUNT
+    assert any(isinstance(r['fields']['valeur_d_acquisition'], str) for r in page)
+    assert any('vnc_fin_exercice' not in r['fields'] for r in page)
+
+    df = transform_records(page)
+    assert len(df) == 500
+    # les valeurs sales restent convertibles
+    assert df['valeur_d_acquisition'].notna().all()
+    assert df['date_d_acquisition'].notna().all()
+
+
+def test_stub_server_serves_search_contract(monkeypatch):
+    with serve(2500, seed=1) as url:
+        monkeypatch.setattr(extract_module, 'SEARCH_URL', url)
+        batches = list(extract_module.fetch_records_in_batches(rows=1000))
+    assert [len(b) for b in batches] == [1000, 1000, 500]
+    assert batches[2] == generate_page(2000, 500, seed=1)
+
+
+def test_stub_server_pagination_limit(monkeypatch):
+    with serve(5000, max_offset=2000) as url:
+        monkeypatch.setattr(extract_module, 'SEARCH_URL', url)
+        batches = list(extract_module.fetch_records_in_batches(rows=1000))
+    assert len(batches) == 2
+
+
+def test_server_errors_fail_the_extraction():
+    response = requests.Response()
+    response.status_code = 503
+    # seule la limite de pagination (400) termine l'extraction normalement
+    with patch.object(extract_module.requests, 'get', return_value=response):
+        with pytest.raises(requests.exceptions.HTTPError):
+            list(extract_module.fetch_records_in_batches(rows=1000))
+
+
+def test_compare_results_and_sizes():
+    assert parse_size('10k') == 10_000 and parse_size('1.5M') == 1_500_000 and parse_size('250') == 250
+    base = {'results': [{'stage': 'derive', 'rows': 10_000, 'rows_per_s': 1000.0}]}
+    lines = compare_results(base, [{'stage': 'derive', 'rows': 10_000, 'rows_per_s': 2000.0}])
+    assert lines[1].endswith('2.00x')
+
+
+def test_reset_db_refused_outside_bench_database():
+    assert 'BENCH_ALLOW_RESET' in reset_refusal('immobilisations_amortissements', allow=False)
+    assert reset_refusal('immobilisations_bench', allow=False) is None
+    assert reset_refusal('immobilisations_amortissements', allow=True) is None
@@ -0,0 +1,133 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+import pytest
+from sqlalchemy import create_engine, select, text
+from load.checkpoint import (
+    start_run, save_checkpoint, commit_checkpoint, finish_run, ResumeError, STATUS_FAILED, STATUS_COMMITTED
+)
+from config import DATASET_ID
+from models import EtlRun
+
+
+def _engine():
+    return create_engine('sqlite://')
+
+
+def _status(engine, run_id):
+    with engine.connect() as conn:
+        return conn.execute(
+            select(EtlRun.__table__.c.status).where(EtlRun.__table__.c.run_id == run_id)
+        ).scalar()
+
+
+def test_resume_continues_from_last_committed_offset():
+    engine = _engine()
+    state = start_run(engine, 'ds')
+    state = state.advance(2000, extracted=1000, transformed=990, loaded=990)
+    commit_checkpoint(engine, state)
+    finish_run(engine, state, STATUS_FAILED)
+
+    resumed = start_run(engine, 'ds', resume=True)
+    assert resumed.resumed
+    assert resumed.run_id == state.run_id
+    assert resumed.last_offset == 2000
+    assert resumed.rows_loaded == 990
+    assert _status(engine, resumed.run_id) == 'running'
+
+
+def test_checkpoint_rolls_back_with_batch_transaction():
+    engine = _engine()
+    state = start_run(engine, 'ds')
+    try:
+        with engine.begin() as conn:
+            save_checkpoint(conn, state.advance(1000, 1000, 1000, 1000))
+            raise RuntimeError('insert failed')
+    except RuntimeError:
+        pass
+
+    resumed = start_run(engine, 'ds', resume=True)
+    assert resumed.last_offset == 0
+
+
+def test_resume_without_interrupted_run_starts_fresh():
+    engine = _engine()
+    state = start_run(engine, 'ds')
+    finish_run(engine, state, STATUS_COMMITTED)
+
+    fresh = start_run(engine, 'ds', resume=True)
+    assert fresh.run_id != state.run_id
+    assert not fresh.resumed
+
+
+def test_resume_only_latest_run_with_checkpoint():
+    engine = _engine()
+    interrupted = start_run(engine, 'ds')
+    commit_checkpoint(engine, interrupted.advance(1000, 1000, 1000, 1000))
+    finish_run(engine, interrupted, STATUS_FAILED)
+    newer = start_run(engine, 'ds')
+    finish_run(engine, newer, STATUS_COMMITTED)
+
+    # un run validé a succédé au run interrompu
+    fresh = start_run(engine, 'ds', resume=True)
+    assert not fresh.resumed and fresh.run_id not in (interrupted.run_id, newer.run_id)
+
+    # échec avant le premier checkpoint : rien à reprendre
+    finish_run(engine, fresh, STATUS_FAILED)
+    again = start_run(engine, 'ds', resume=True)
+    assert not again.resumed and again.last_offset == 0
+
+
+def test_data_version_increments_on_commit_and_rollback():
+    from load.checkpoint import get_data_version, rollback_run
+    engine = _engine()
+    state = start_run(engine, DATASET_ID)
+    assert get_data_version(engine) == 0
+    finish_run(engine, state, STATUS_FAILED)
+    assert get_data_version(engine) == 0
+
+    first = start_run(engine, DATASET_ID)
+    finish_run(engine, first, STATUS_COMMITTED)
+    second = start_run(engine, f'{DATASET_ID}:spool')
+    finish_run(engine, second, STATUS_COMMITTED)
+    assert get_data_version(engine) == 2
+    # un dataset déclaratif ne change pas les données du frontend
+    other = start_run(engine, 'other')
+    finish_run(engine, other, STATUS_COMMITTED)
+    assert get_data_version(engine) == 2
+
+    from models import dataset_table
+    table = dataset_table('versioned_rows', {'code': 'string'})
+    table.create(engine)
+    rollback_run(engine, second.run_id, table=table)
+    assert get_data_version(engine) == 3
+    # un run en échec n'était pas visible : son annulation ne change rien
+    rollback_run(engine, state.run_id, table=table)
+    rollback_run(engine, other.run_id, table=table)
+    assert get_data_version(engine) == 3
+
+
+def test_resume_requires_the_same_source():
+    engine = _engine()
+    state = start_run(engine, 'ds:spool', source_id='spool-a')
+    commit_checkpoint(engine, state.advance(100, 100, 100, 100))
+    finish_run(engine, state, STATUS_FAILED)
+
+    with pytest.raises(ResumeError, match='spool-a'):
+        start_run(engine, 'ds:spool', resume=True, source_id='spool-b')
+    resumed = start_run(engine, 'ds:spool', resume=True, source_id='spool-a')
+    assert resumed.run_id == state.run_id and resumed.last_offset == 100
+
+
+def test_run_table_gains_source_column():
+    engine = _engine()
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE etl_runs (run_id INTEGER PRIMARY KEY, dataset_id VARCHAR(100) NOT NULL, '
+                          'status VARCHAR(16) NOT NULL, started_at DATETIME, finished_at DATETIME, '
+                          'last_offset INTEGER NOT NULL, batches INTEGER NOT NULL, rows_extracted INTEGER NOT NULL, '
+                          'rows_transformed INTEGER NOT NULL, rows_loaded INTEGER NOT NULL, wall_time_s FLOAT, '
+                          'rows_per_s FLOAT, bytes_downloaded BIGINT, peak_rss_mb FLOAT, stage_metrics JSON)'))
+    state = start_run(engine, 'ds:spool', source_id='spool-a')
+    with engine.connect() as conn:
+        assert conn.execute(select(EtlRun.__table__.c.source_id)).scalar() == 'spool-a'
+    assert state.run_id == 1
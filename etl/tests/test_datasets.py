@@ -0,0 +1,134 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+sys.path.insert(0, os.path.join(os.getcwd(), 'benchmarks'))
+import json
+import threading
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, select, func
+from stub_server import serve
+from datasets.datasets import (
+    IMMOBILISATIONS, DatasetDefinition, parse_definitions, load_definitions
+)
+from datasets.runner import run_datasets
+from load.checkpoint import RunState
+from models import EtlRun, EtlDeadLetter
+from transform.transform import TARGET_SCHEMA
+
+
+def _engine(tmp_path):
+    # base fichier : une connexion par thread, comme avec MySQL
+    return create_engine(f"sqlite:///{tmp_path / 'etl.db'}")
+
+
+def test_parse_definitions_validates_schema():
+    entries = [{
+        'dataset_id': 'budget', 'table': 'budget_lines', 'key': 'code',
+        'schema': {'code': 'string', 'montant': 'decimal', 'taux': 'float'},
+        'derived': {'montant_ttc': 'montant * (1 + taux)'},
+    }]
+    [definition] = parse_definitions(entries)
+    assert definition.derived == {'montant_ttc': 'montant * (1 + taux)'}
+    table = definition.target_table()
+    assert {'code', 'montant', 'taux', 'montant_ttc', 'source_hash'} <= set(table.c.keys())
+
+    with pytest.raises(ValueError, match='unknown column types'):
+        parse_definitions([{'dataset_id': 'x', 'table': 't', 'schema': {'a': 'blob'}}])
+    with pytest.raises(ValueError, match='missing'):
+        parse_definitions([{'dataset_id': 'x', 'schema': {}}])
+    with pytest.raises(ValueError, match='key'):
+        parse_definitions([{'dataset_id': 'x', 'table': 't', 'key': 'b', 'schema': {'a': 'int'}}])
+
+
+def test_load_definitions_keeps_immobilisations(tmp_path):
+    path = tmp_path / 'datasets.json'
+    path.write_text(json.dumps([{'dataset_id': 'budget', 'table': 'budget_lines', 'schema': {'a': 'int'}}]))
+    definitions = load_definitions(str(path))
+    assert definitions[IMMOBILISATIONS.dataset_id] is IMMOBILISATIONS
+    assert 'budget' in definitions
+    assert load_definitions('') == {IMMOBILISATIONS.dataset_id: IMMOBILISATIONS}
+
+
+def test_derived_expressions_are_evaluated():
+    definition = DatasetDefinition('d', {'a': 'float', 'b': 'float'}, 't', derived={'c': 'a / b'})
+    df = definition.derive(pd.DataFrame({'a': [1.0, 2.0], 'b': [2.0, 0.5]}))
+    assert df['c'].tolist() == [0.5, 4.0]
+    empty = definition.derive(pd.DataFrame({'a': [], 'b': []}))
+    assert 'c' in empty.columns
+
+
+def test_runner_ingests_datasets_on_shared_pools(tmp_path):
+    engine = _engine(tmp_path)
+    loaded = {}
+    run_ids = set()
+    active = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def loader(df, table_name, checkpoint, copy, on_reject, run_id, engine=None, run_keys=None):
+        with lock:
+            active.append(table_name)
+            peak[0] = max(peak[0], len(active))
+        try:
+            with engine.begin() as conn:
+                checkpoint(conn)
+            loaded.setdefault(table_name, []).append(len(df))
+            run_ids.add(run_id)
+            return len(df)
+        finally:
+            with lock:
+                active.remove(table_name)
+
+    with serve(2500, seed=3) as url_a, serve(1200, seed=4, dirty=0.0) as url_b:
+        definitions = [
+            DatasetDefinition('a', TARGET_SCHEMA, 'table_a', batch_size=1000,
+                              search_url=url_a, loader=loader),
+            DatasetDefinition('b', TARGET_SCHEMA, 'table_b', batch_size=500,
+                              search_url=url_b, loader=loader),
+        ]
+        results = run_datasets(definitions, http_workers=2, db_workers=1, engine=engine)
+
+    assert not results.failures
+    runs = results.runs
+    assert isinstance(runs['a'], RunState) and isinstance(runs['b'], RunState)
+    assert runs['a'].rows_extracted == 2500 and runs['a'].last_offset == 2500
+    assert runs['b'].rows_extracted == 1200 and runs['b'].batches == 3
+    assert sum(loaded['table_a']) == runs['a'].rows_loaded
+    assert peak[0] == 1
+    assert run_ids == {runs['a'].run_id, runs['b'].run_id}
+
+    with engine.connect() as conn:
+        statuses = conn.execute(select(EtlRun.__table__.c.dataset_id, EtlRun.__table__.c.status)).all()
+    assert sorted(statuses) == [('a', 'committed'), ('b', 'committed')]
+
+
+def test_runner_isolates_failing_dataset(tmp_path):
+    engine = _engine(tmp_path)
+    EtlDeadLetter.__table__.create(engine)
+
+    def loader(df, table_name, checkpoint, copy, on_reject, run_id, engine=None, run_keys=None):
+        if table_name == 'broken':
+            raise RuntimeError('load failed')
+        on_reject(df.iloc[0].to_dict(), ValueError('bad row'))
+        with engine.begin() as conn:
+            checkpoint(conn)
+        return len(df) - 1
+
+    with serve(300, seed=5, dirty=0.0) as url:
+        definitions = [
+            DatasetDefinition('ok', TARGET_SCHEMA, 'ok', batch_size=100, search_url=url, loader=loader),
+            DatasetDefinition('ko', TARGET_SCHEMA, 'broken', batch_size=100, search_url=url, loader=loader),
+        ]
+        results = run_datasets(definitions, engine=engine)
+
+    assert list(results.runs) == ['ok'] and list(results.failures) == ['ko']
+    assert isinstance(results.failures['ko'], RuntimeError)
+    assert results.runs['ok'].rows_loaded == 297
+    with engine.connect() as conn:
+        rejected = conn.execute(select(func.count()).select_from(EtlDeadLetter.__table__)).scalar()
+        status = conn.execute(
+            select(EtlRun.__table__.c.status).where(EtlRun.__table__.c.dataset_id == 'ko')
+        ).scalar()
+    assert rejected == 3
+    assert status == 'failed'
@@ -0,0 +1,96 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+import json
+import math
+from contextlib import nullcontext
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import DataError, OperationalError
+import pytest
+from load.load import insert_bisect
+from load.dead_letter import DeadLetterStore
+from models import EtlDeadLetter
+from transform.transform import transform_records
+
+
+class BisectConn:
+    """Connexion factice : refuse toute instruction contenant une ligne invalide."""
+
+    def __init__(self):
+        self.statements = 0
+        self.inserted = []
+
+    def begin_nested(self):
+        return nullcontext()
+
+    def execute(self, stmt, records):
+        self.statements += 1
+        if any(r.get('bad') for r in records):
+            raise DataError('INSERT', {}, Exception('(1406) Data too long'))
+        self.inserted.extend(records)
+
+
+def test_bisect_isolates_bad_rows_in_few_statements():
+    n = 1024
+    records = [{'i': i, 'bad': i in (3, 700)} for i in range(n)]
+    conn = BisectConn()
+
+    rejected = insert_bisect(conn, None, records, offset=5000)
+    assert [position for position, _ in rejected] == [5003, 5700]
+    assert len(conn.inserted) == n - 2
+    # O(k log n) statements instead of one per row
+    assert conn.statements <= 1 + 2 * 2 * math.log2(n)
+
+
+def test_bisect_clean_batch_is_one_statement():
+    conn = BisectConn()
+    assert insert_bisect(conn, None, [{'i': i} for i in range(100)]) == []
+    assert conn.statements == 1
+
+
+def test_bisect_reraises_non_data_errors():
+    class DownConn(BisectConn):
+        def execute(self, stmt, records):
+            raise OperationalError('INSERT', {}, Exception('(2013) Lost connection'))
+
+    with pytest.raises(OperationalError):
+        insert_bisect(DownConn(), None, [{'i': 1}, {'i': 2}])
+
+
+def test_dead_letters_saved_with_batch_and_file(tmp_path):
+    engine = create_engine('sqlite://')
+    EtlDeadLetter.__table__.create(engine)
+    path = str(tmp_path / 'dead.ndjson')
+    store = DeadLetterStore(run_id=3, path=path)
+
+    store.add('transform', {'fields': {'ndeg_immobilisation': 'A1'}}, KeyError('fields'), source_offset=42)
+    store.add('load', {'ndeg_immobilisation': 'X' * 80, 'valeur_d_acquisition': np.float64(1e15),
+                       'date_d_acquisition': pd.Timestamp('2020-01-02'), 'nature': np.nan},
+              DataError('INSERT', {}, Exception('(1264) Out of range value')))
+    assert store.count('load') == 1
+
+    with engine.begin() as conn:
+        store.save(conn)
+    assert store.flush() == 2 and store.pending == [] and store.total == 2
+
+    with engine.connect() as conn:
+        rows = conn.execute(select(EtlDeadLetter.__table__).order_by(EtlDeadLetter.__table__.c.id)).all()
+    assert rows[0].stage == 'transform' and rows[0].source_offset == 42
+    assert rows[1].payload['date_d_acquisition'] == '2020-01-02T00:00:00'
+    assert rows[1].payload['nature'] is None
+    assert rows[1].error.startswith('Exception: (1264)')
+
+    lines = [json.loads(line) for line in open(path, encoding='utf-8')]
+    assert [line['run_id'] for line in lines] == [3, 3]
+
+
+def test_transform_reports_unreadable_records():
+    errors = []
+    df = transform_records(
+        [{'fields': {'ndeg_immobilisation': '1'}}, {'no_fields': True}],
+        on_error=lambda idx, record, e: errors.append((idx, record, e)),
+    )
+    assert len(df) == 1
+    assert errors[0][0] == 1 and isinstance(errors[0][2], KeyError)
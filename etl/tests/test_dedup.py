@@ -0,0 +1,91 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, select, func
+from models import EtlMinHash, EtlLshBucket, EtlNearDuplicate
+from dedup.dedup import (
+    SHINGLE_SIZE, NearDuplicateIndex, connected_components, minhash_signatures,
+    near_duplicate_clusters, normalize_designations, shingle_hashes, similarity
+)
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    for model in (EtlMinHash, EtlLshBucket, EtlNearDuplicate):
+        model.__table__.create(engine)
+    return engine
+
+
+def _frame(rows, first_hash):
+    df = pd.DataFrame(rows, columns=['ndeg_immobilisation', 'collectivite', 'designation_des_ensembles'])
+    df['source_hash'] = np.arange(len(df), dtype=np.uint64) + first_hash
+    return df
+
+
+def _load(engine, index, df):
+    index.sign(df)
+    with engine.begin() as conn:
+        index.save(conn, df['source_hash'])
+    return index.flush()
+
+
+def test_signatures_estimate_jaccard_similarity():
+    texts = normalize_designations(pd.Series([
+        'Rénovation du GYMNASE Jean-Jaurès', 'renovation du gymnase jean jaures (lot 2)', 'Piscine Keller',
+    ])).tolist()
+    assert texts[0] == 'renovation du gymnase jean jaures'
+    owners, hashes = shingle_hashes(texts)
+    signatures = minhash_signatures(owners, hashes, len(texts))
+    shingles = [{t[i:i + SHINGLE_SIZE] for i in range(len(t) - SHINGLE_SIZE + 1)} for t in texts]
+    exact = len(shingles[0] & shingles[1]) / len(shingles[0] | shingles[1])
+    estimate = similarity(signatures[[0, 0]], signatures[[1, 2]])
+    assert abs(estimate[0] - exact) < 0.15
+    assert estimate[1] < 0.1
+
+
+def test_near_duplicates_found_across_batches_in_same_collectivite(engine):
+    index = NearDuplicateIndex(run_id=1, threshold=0.7)
+    first = _frame([
+        ('A1', 'Ville', 'Rénovation du gymnase Jean-Jaurès'),
+        ('A2', 'Ville', 'Acquisition mobilier école Pajol'),
+        ('A3', 'Département', 'Rénovation du gymnase Jean-Jaurès'),
+    ], first_hash=1)
+    assert _load(engine, index, first) == 0
+
+    second = _frame([
+        ('B7', 'Ville', 'RENOVATION DU GYMNASE JEAN JAURES'),
+        ('A2', 'Ville', 'Acquisition mobilier ecole Pajol'),
+        ('B8', 'Ville', 'Travaux voirie rue de Rivoli'),
+    ], first_hash=10)
+    assert _load(engine, index, second) == 1
+    # lot rejoué : lignes déjà indexées, aucune nouvelle paire
+    assert _load(engine, index, second) == 0
+
+    with engine.connect() as conn:
+        pair = conn.execute(select(EtlNearDuplicate.__table__)).one()
+        assert conn.execute(select(func.count()).select_from(EtlMinHash.__table__)).scalar() == 6
+    assert (pair.source_hash, pair.match_hash, pair.collectivite) == (10, 1, 'Ville')
+    assert (pair.ndeg_immobilisation, pair.match_ndeg) == ('B7', 'A1') and pair.similarity == 1.0
+
+    clusters = near_duplicate_clusters(engine)
+    assert clusters['ndeg_immobilisation'].tolist() == ['A1', 'B7']
+    assert clusters['cluster'].nunique() == 1
+    assert near_duplicate_clusters(engine, 'Département').empty
+
+
+def test_generic_designations_are_ignored(engine):
+    index = NearDuplicateIndex(run_id=1, max_bucket_rows=3)
+    rows = [(f'N{i}', 'Ville', 'Mobilier de bureau') for i in range(5)]
+    assert _load(engine, index, _frame(rows, first_hash=1)) == 0
+    assert _load(engine, index, _frame([('N9', 'Ville', 'Mobilier de bureau')], first_hash=20)) == 0
+
+
+def test_connected_components():
+    left = np.array([1, 2, 10, 5], dtype=np.uint64)
+    right = np.array([2, 3, 11, 3], dtype=np.uint64)
+    labels = connected_components(left, right)
+    assert labels.to_dict() == {1: 1, 2: 1, 3: 1, 5: 1, 10: 10, 11: 10}
@@ -0,0 +1,122 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+import pandas as pd
+from sqlalchemy import create_engine
+import load.load as load_mod
+from load.load import DimensionCache, resolve_dimensions, DIMENSION_CACHES
+from models import Collectivite
+
+
+class DimConn:
+    """Connexion factice : une seule table de dimension en mémoire."""
+
+    def __init__(self, existing=None):
+        self.rows = dict(existing or {})
+        self.selects = 0
+        self.inserts = 0
+
+    def execute(self, stmt, params=None):
+        if stmt.is_select:
+            self.selects += 1
+            return list(self.rows.items())
+        self.inserts += 1
+        for p in params:
+            self.rows.setdefault(p['libelle'], len(self.rows) + 1)
+        return None
+
+
+def test_resolve_uses_cache_until_miss():
+    conn = DimConn({'VILLE': 1})
+    cache = DimensionCache(Collectivite)
+
+    assert cache.resolve(conn, ['VILLE']) == {'VILLE': 1}
+    assert conn.selects == 1
+    # second lookup of a known value hits the cache only
+    cache.resolve(conn, ['VILLE', None])
+    assert conn.selects == 1
+    assert conn.inserts == 0
+
+
+def test_resolve_inserts_unknown_values():
+    conn = DimConn({'VILLE': 1})
+    cache = DimensionCache(Collectivite)
+
+    keys = cache.resolve(conn, ['VILLE', 'DEPARTEMENT'])
+    assert conn.inserts == 1
+    assert keys['DEPARTEMENT'] == 2
+    assert keys['VILLE'] == 1
+
+
+def test_resolve_dimensions_adds_key_columns():
+    conn = DimConn({'VILLE': 7})
+    for cache in DIMENSION_CACHES.values():
+        cache.clear()
+    df = pd.DataFrame([{'collectivite': 'VILLE', 'nature': None, 'publication': None}])
+
+    out = resolve_dimensions(conn, df)
+    assert out.loc[0, 'collectivite_id'] == 7
+    assert pd.isna(out.loc[0, 'nature_id'])
+    # input frame is left untouched
+    assert 'collectivite_id' not in df.columns
+
+
+def test_labels_too_long_for_dimension_are_rejected():
+    conn = DimConn({'VILLE': 7})
+    for cache in DIMENSION_CACHES.values():
+        cache.clear()
+    long_label = 'X' * (DIMENSION_CACHES['collectivite'].max_length + 1)
+    df = pd.DataFrame([
+        {'ndeg_immobilisation': 'A1', 'collectivite': long_label, 'nature': None, 'publication': None},
+        {'ndeg_immobilisation': 'A2', 'collectivite': 'VILLE', 'nature': None, 'publication': None},
+    ])
+    rejected = []
+
+    out = resolve_dimensions(conn, df, on_reject=lambda row, e: rejected.append((row, e)))
+    # never inserted: MySQL would truncate it and the lookup would miss
+    assert conn.inserts == 0
+    assert out['ndeg_immobilisation'].tolist() == ['A2']
+    assert out.loc[0, 'collectivite_id'] == 7
+    assert [row['ndeg_immobilisation'] for row, _ in rejected] == ['A1']
+
+
+def test_fully_rejected_batch_still_commits_its_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(load_mod, 'ensure_schema', lambda engine: None)
+    for cache in DIMENSION_CACHES.values():
+        cache.clear()
+    long_label = 'X' * (DIMENSION_CACHES['collectivite'].max_length + 1)
+    df = pd.DataFrame([
+        {'ndeg_immobilisation': f'A{i}', 'collectivite': long_label, 'nature': None, 'publication': None}
+        for i in range(3)
+    ])
+    rejected, checkpoints = [], []
+
+    inserted = load_mod.upsert_immobilisations(
+        df, checkpoint=checkpoints.append, copy=False,
+        on_reject=lambda row, e: rejected.append(row['ndeg_immobilisation']),
+        engine=create_engine(f"sqlite:///{tmp_path / 'rejected.db'}"))
+    assert inserted == 0
+    assert rejected == ['A0', 'A1', 'A2']
+    # offset et dead letters validés : la reprise ne rejoue pas le lot
+    assert len(checkpoints) == 1
+
+
+def test_rejected_labels_are_dropped_in_place_from_a_ceded_batch(tmp_path, monkeypatch):
+    monkeypatch.setattr(load_mod, 'ensure_schema', lambda engine: None)
+    monkeypatch.setattr(load_mod, '_insert_frame', lambda conn, table, df, *args: len(df))
+    for cache in DIMENSION_CACHES.values():
+        cache.clear()
+    long_label = 'X' * (DIMENSION_CACHES['nature'].max_length + 1)
+    df = pd.DataFrame([
+        {'ndeg_immobilisation': 'A1', 'collectivite': None, 'nature': long_label, 'publication': None},
+        {'ndeg_immobilisation': 'A2', 'collectivite': None, 'nature': None, 'publication': None},
+    ])
+    hashes = []
+
+    load_mod.upsert_immobilisations(
+        df, checkpoint=lambda conn: hashes.append(df.get('source_hash')), copy=False,
+        on_reject=lambda row, e: None,
+        engine=create_engine(f"sqlite:///{tmp_path / 'ceded.db'}"))
+    # le checkpoint de l'appelant voit les empreintes des lignes chargées
+    assert df['ndeg_immobilisation'].tolist() == ['A2']
+    assert hashes[0] is not None and hashes[0].index.tolist() == [1]
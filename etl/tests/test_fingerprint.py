@@ -0,0 +1,103 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+import datetime
+import pandas as pd
+from load.load import BUSINESS_KEY, row_keys, source_fingerprint
+from load.run_keys import RunKeys, open_run_keys
+from models import EtlRun, EtlRunKey
+
+COLUMNS = ['ndeg_immobilisation', 'date_d_acquisition', 'valeur_d_acquisition', 'duree_amort']
+
+
+def test_fingerprint_is_stable_across_dtypes():
+    typed = pd.DataFrame([{
+        'ndeg_immobilisation': 'A1',
+        'date_d_acquisition': pd.Timestamp('2020-01-02'),
+        'valeur_d_acquisition': 10.5,
+        'duree_amort': 5,
+    }])
+    loose = pd.DataFrame([{
+        'ndeg_immobilisation': 'A1',
+        'date_d_acquisition': datetime.date(2020, 1, 2),
+        'valeur_d_acquisition': '10.5',
+        'duree_amort': 5.0,
+    }], dtype=object)
+    assert source_fingerprint(typed, COLUMNS)[0] == source_fingerprint(loose, COLUMNS)[0]
+
+
+def test_fingerprint_changes_with_source_value():
+    df = pd.DataFrame([
+        {'ndeg_immobilisation': 'A1', 'valeur_d_acquisition': 10.5},
+        {'ndeg_immobilisation': 'A1', 'valeur_d_acquisition': 10.6},
+        {'ndeg_immobilisation': 'A1', 'valeur_d_acquisition': None},
+    ])
+    hashes = source_fingerprint(df, COLUMNS)
+    assert hashes.nunique() == 3
+
+
+def test_row_key_follows_business_key_not_values():
+    df = pd.DataFrame([
+        {'ndeg_immobilisation': 'A1', 'publication_id': 1, 'collectivite_id': 2, 'valeur_d_acquisition': 10.5},
+        {'ndeg_immobilisation': 'A1', 'publication_id': 1, 'collectivite_id': 2, 'valeur_d_acquisition': 10.5},
+        {'ndeg_immobilisation': 'A1', 'publication_id': 1, 'collectivite_id': 3, 'valeur_d_acquisition': 10.5},
+        {'ndeg_immobilisation': None, 'publication_id': 1, 'collectivite_id': 2, 'valeur_d_acquisition': 7.0},
+        {'ndeg_immobilisation': None, 'publication_id': 1, 'collectivite_id': 2, 'valeur_d_acquisition': 8.0},
+    ])
+    keys = row_keys(df, BUSINESS_KEY, source_fingerprint(df, COLUMNS))
+    # enregistrements identiques : deux lignes distinctes
+    assert keys.nunique() == 5
+
+    changed = df.assign(valeur_d_acquisition=[11.0, 10.5, 10.5, 7.0, 9.0])
+    again = row_keys(changed, BUSINESS_KEY, source_fingerprint(changed, COLUMNS))
+    # valeur modifiée : même identité ; sans identifiant : identité par les valeurs
+    assert again[:4].tolist() == keys[:4].tolist()
+    assert again[4] != keys[4]
+
+
+def _run_row_keys(df, sizes, run_keys):
+    # lots successifs validés un à un (checkpoint puis flush)
+    keys, begin = [], 0
+    for size in sizes:
+        part = df.iloc[begin:begin + size]
+        keys.extend(row_keys(part, BUSINESS_KEY, source_fingerprint(part, COLUMNS), run_keys=run_keys))
+        run_keys.flush()
+        begin += size
+    return keys
+
+
+def test_row_key_rank_spans_batches():
+    df = pd.DataFrame([
+        {'ndeg_immobilisation': 'A1', 'publication_id': 1, 'collectivite_id': 2, 'valeur_d_acquisition': 10.5},
+        {'ndeg_immobilisation': 'B1', 'publication_id': 1, 'collectivite_id': 2, 'valeur_d_acquisition': 3.0},
+        {'ndeg_immobilisation': 'A1', 'publication_id': 1, 'collectivite_id': 2, 'valeur_d_acquisition': 10.5},
+        {'ndeg_immobilisation': 'A1', 'publication_id': 1, 'collectivite_id': 2, 'valeur_d_acquisition': 12.0},
+        {'ndeg_immobilisation': None, 'publication_id': 1, 'collectivite_id': 2, 'valeur_d_acquisition': 7.0},
+        {'ndeg_immobilisation': None, 'publication_id': 1, 'collectivite_id': 2, 'valeur_d_acquisition': 7.0},
+    ])
+    whole = row_keys(df, BUSINESS_KEY, source_fingerprint(df, COLUMNS)).tolist()
+    assert len(set(whole)) == 6
+
+    # clé répétée d'un lot à l'autre : mêmes identités quelle que soit la taille des lots
+    for sizes in ([2, 4], [1, 1, 1, 1, 1, 1], [3, 3], [5, 1]):
+        assert _run_row_keys(df, sizes, RunKeys(1)) == whole
+
+
+def test_resumed_run_continues_row_key_ranks(engine):
+    EtlRun.__table__.create(engine, checkfirst=True)
+    EtlRunKey.__table__.create(engine, checkfirst=True)
+    df = pd.DataFrame([
+        {'ndeg_immobilisation': 'A1', 'publication_id': 1, 'collectivite_id': 2, 'valeur_d_acquisition': 10.5},
+    ] * 3)
+    whole = row_keys(df, BUSINESS_KEY, source_fingerprint(df, COLUMNS)).tolist()
+
+    run_keys = open_run_keys(engine, 1)
+    first = row_keys(df.iloc[:1], BUSINESS_KEY, source_fingerprint(df.iloc[:1], COLUMNS), run_keys=run_keys)
+    with engine.begin() as conn:
+        run_keys.save(conn, 1)
+    run_keys.flush()
+    # lot 2 non validé (run tué) : ses identités ne sont pas enregistrées
+    row_keys(df.iloc[1:2], BUSINESS_KEY, source_fingerprint(df.iloc[1:2], COLUMNS), run_keys=run_keys)
+
+    resumed = open_run_keys(engine, 1, resume=True)
+    assert first.tolist() + _run_row_keys(df.iloc[1:], [2], resumed) == whole
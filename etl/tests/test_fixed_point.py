@@ -0,0 +1,107 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+from decimal import Decimal
+import pandas as pd
+from utils.process import to_cents
+from transform.transform import (
+    TARGET_SCHEMA, fixed_point_schema, transform_records, calculate_derived_fields
+)
+from load.load import source_fingerprint, fixed_point_scales, _to_records
+from models import Immobilisation
+from spool.spool import SpoolWriter, iter_frames
+
+RECORDS = [
+    {'fields': {'ndeg_immobilisation': 'A1', 'valeur_d_acquisition': '1000.10', 'duree_amort': 3,
+                'cumul_amort_anterieurs': 0.1, 'amort_exercice': 0.2, 'vnc_fin_exercice': 333.37}},
+    {'fields': {'ndeg_immobilisation': 'B2', 'amort_exercice': '5'}},
+]
+
+
+def test_to_cents_is_exact():
+    assert to_cents('1 234,56') == 123456
+    assert to_cents(0.1) == 10
+    assert to_cents(1.005) == 101
+    assert to_cents('-0.015') == -2
+    assert to_cents(7) == 700
+    assert to_cents('abc') is None
+    assert to_cents(float('nan')) is None
+    assert to_cents('999999999999.99') == 99999999999999
+
+
+def test_amounts_out_of_decimal_range_are_dead_lettered():
+    records = [
+        {'fields': {'ndeg_immobilisation': 'A1', 'valeur_d_acquisition': '1e20'}},
+        {'fields': {'ndeg_immobilisation': 'A2', 'valeur_d_acquisition': 10 ** 18}},
+        {'fields': {'ndeg_immobilisation': 'A3', 'valeur_d_acquisition': '12.34'}},
+    ]
+    errors = []
+    df = transform_records(records, fixed_point_schema(),
+                           on_error=lambda idx, record, e: errors.append(idx))
+    assert errors == [0, 1]
+    assert df['valeur_d_acquisition'].tolist() == [1234]
+
+
+def test_derived_fields_use_integer_arithmetic():
+    df = calculate_derived_fields(transform_records(RECORDS, fixed_point_schema()))
+    assert str(df['valeur_d_acquisition'].dtype) == 'Int64'
+    assert df['amortissement_total'].tolist() == [30, 500]
+    # centièmes de pour cent : 333.37 / 1000.10 = 33.334 %
+    assert df['pct_valeur_restante'].iloc[0] == 3333
+    assert pd.isna(df['pct_valeur_restante'].iloc[1])
+
+
+def test_cents_are_bound_as_decimals_with_float_fingerprint():
+    table = Immobilisation.__table__
+    cents = calculate_derived_fields(transform_records(RECORDS, fixed_point_schema()))
+    floats = calculate_derived_fields(transform_records(RECORDS, TARGET_SCHEMA))
+    columns = [c.name for c in table.columns if c.name in cents.columns]
+
+    scales = fixed_point_scales(cents, table)
+    assert scales['valeur_d_acquisition'] == 2 and scales['pct_valeur_restante'] == 2
+    assert fixed_point_scales(floats, table) == {}
+    record = _to_records(cents, columns, scales)[0]
+    assert record['amortissement_total'] == Decimal('0.30')
+    assert record['pct_valeur_restante'] == Decimal('33.33')
+    assert record['vnc_debut_exercice'] is None
+    # même empreinte qu'un chargement en float : pas de doublon au changement de mode
+    assert source_fingerprint(cents, columns).equals(source_fingerprint(floats, columns))
+
+
+def test_cents_survive_the_ndjson_spool(tmp_path):
+    df = calculate_derived_fields(transform_records(RECORDS, fixed_point_schema()))
+    with SpoolWriter(str(tmp_path), 'ndjson', 100) as writer:
+        writer.write_frame(df)
+    restored = next(iter_frames(str(tmp_path)))
+    assert str(restored['amortissement_total'].dtype) == 'Int64'
+    assert restored['vnc_fin_exercice'].tolist()[0] == 33337
+
+
+def test_pct_rounding_is_the_same_in_both_modes():
+    records = [
+        # 0.01 / 200 = 0.005 % : un demi centième de pour cent
+        {'fields': {'valeur_d_acquisition': '200.00', 'vnc_fin_exercice': '0.01'}},
+        {'fields': {'valeur_d_acquisition': '200.00', 'vnc_fin_exercice': '-0.01'}},
+        {'fields': {'valeur_d_acquisition': '3.00', 'vnc_fin_exercice': '-1.00'}},
+        {'fields': {'valeur_d_acquisition': '0', 'vnc_fin_exercice': '1.00'}},
+    ]
+    cents = calculate_derived_fields(transform_records(records, fixed_point_schema(TARGET_SCHEMA)))
+    floats = calculate_derived_fields(transform_records(records))
+
+    # demis arrondis en s'éloignant de zéro
+    assert cents['pct_valeur_restante'].tolist()[:3] == [1, -1, -3333]
+    assert pd.isna(cents['pct_valeur_restante'].iloc[3])
+    assert floats['pct_valeur_restante'].tolist()[:3] == [0.01, -0.01, -33.33]
+    assert pd.isna(floats['pct_valeur_restante'].iloc[3])
+
+
+def test_float_amounts_out_of_decimal_range_have_no_pct():
+    records = [
+        {'fields': {'valeur_d_acquisition': '1e20', 'vnc_fin_exercice': '1.00'}},
+        {'fields': {'valeur_d_acquisition': '4.00', 'vnc_fin_exercice': '1e20'}},
+        {'fields': {'valeur_d_acquisition': '4.00', 'vnc_fin_exercice': '1.00'}},
+    ]
+    df = calculate_derived_fields(transform_records(records))
+    # lignes refusées au chargement, le reste du lot est calculé
+    assert df['pct_valeur_restante'].isna().tolist() == [True, True, False]
+    assert df['pct_valeur_restante'].iloc[2] == 25.0
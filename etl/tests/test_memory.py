@@ -0,0 +1,97 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+sys.path.insert(0, os.path.join(os.getcwd(), 'benchmarks'))
+import pandas as pd
+import utils.memory as memory
+from utils.memory import MemoryGovernor, get_governor
+from stub_server import serve
+from synthetic import generate_page
+import extract.extract as extract_module
+from transform.transform import transform_records, calculate_derived_fields, add_data_quality_flags
+
+
+class FakeRss:
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self):
+        return self.value
+
+
+def test_governor_shrinks_batch_to_fit_budget(monkeypatch):
+    rss = FakeRss(100.0)
+    monkeypatch.setattr(memory, 'current_rss_mb', rss)
+    monkeypatch.setattr(memory, 'release_memory', lambda: None)
+    governor = MemoryGovernor(max_rss_mb=200, batch_size=5000, min_batch_size=100)
+
+    governor.begin_batch()
+    rss.value = 180.0  # 80 MB for 1000 rows
+    governor.sample()
+    rss.value = 120.0
+    size = governor.end_batch(1000)
+    # (200 * 0.85 - 120) MB / 0.08 MB per row
+    assert size == 625
+    assert governor.batch_size == 625
+
+
+def test_governor_grows_back_within_bounds(monkeypatch):
+    rss = FakeRss(50.0)
+    monkeypatch.setattr(memory, 'current_rss_mb', rss)
+    monkeypatch.setattr(memory, 'release_memory', lambda: None)
+    governor = MemoryGovernor(max_rss_mb=1000, batch_size=2000, min_batch_size=100)
+    governor.batch_size = 100
+
+    governor.begin_batch()
+    rss.value = 51.0
+    governor.end_batch(100)
+    assert governor.batch_size == 2000
+
+
+def test_backpressure_shrinks_next_page(monkeypatch):
+    rss = FakeRss(150.0)
+    monkeypatch.setattr(memory, 'current_rss_mb', rss)
+    monkeypatch.setattr(memory, 'release_memory', lambda: None)
+    governor = MemoryGovernor(max_rss_mb=200, batch_size=1000, min_batch_size=50)
+
+    # under the 170 MB threshold: unchanged
+    assert governor.apply_backpressure() == 1000
+    rss.value = 180.0
+    # at least halved
+    assert governor.apply_backpressure() == 500
+    rss.value = 680.0
+    # 500 * 170 / 680
+    assert governor.apply_backpressure() == 125
+    # floor
+    assert governor.apply_backpressure() == 50
+
+
+def test_backpressure_releases_memory_first(monkeypatch):
+    rss = FakeRss(180.0)
+    monkeypatch.setattr(memory, 'current_rss_mb', rss)
+    monkeypatch.setattr(memory, 'release_memory', lambda: setattr(rss, 'value', 100.0))
+    governor = MemoryGovernor(max_rss_mb=200, batch_size=1000, min_batch_size=50)
+
+    assert governor.apply_backpressure() == 1000
+
+
+def test_disabled_without_budget():
+    assert get_governor(1000, max_rss_mb=0) is None
+
+
+def test_extract_follows_page_size(monkeypatch):
+    sizes = iter([1000, 300, 300, 5000])
+    with serve(1750) as url:
+        monkeypatch.setattr(extract_module, 'SEARCH_URL', url)
+        batches = list(extract_module.fetch_records_in_batches(page_size=lambda: next(sizes)))
+    assert [len(b) for b in batches] == [1000, 300, 300, 150]
+    # offsets continuous despite the varying page size
+    assert batches[1][0] == generate_page(1000, 300)[0]
+
+
+def test_in_place_transforms_match_copies():
+    df = transform_records(generate_page(0, 200, dirty=0.2))
+    expected = add_data_quality_flags(calculate_derived_fields(df))
+    out = add_data_quality_flags(calculate_derived_fields(df, copy=False), copy=False)
+    assert out is df
+    pd.testing.assert_frame_equal(out, expected)
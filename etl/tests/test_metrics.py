@@ -0,0 +1,86 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+import utils.metrics as metrics_module
+from sqlalchemy import create_engine, select, text
+from load.checkpoint import start_run
+from models import EtlRun, EtlBatchMetric
+from utils.metrics import (
+    RunMetrics, save_batch_metrics, save_run_metrics, write_prometheus_textfile
+)
+
+
+def test_stage_metrics_per_batch_and_run():
+    metrics = RunMetrics(run_id=1)
+    try:
+        with metrics.stage('extract') as stats:
+            stats.rows += 100
+        metrics.add_bytes(2048)
+        with metrics.stage('load', rows=90):
+            pass
+        rows = metrics.end_batch(1)
+        with metrics.stage('load', rows=10):
+            pass
+        metrics.end_batch(2)
+    finally:
+        metrics.close()
+
+    by_stage = {r['stage']: r for r in rows}
+    assert by_stage['extract']['rows'] == 100
+    assert by_stage['extract']['bytes'] == 2048
+    assert by_stage['load']['batch_no'] == 1
+
+    summary = metrics.summary()
+    assert summary['stage_metrics']['load']['rows'] == 100
+    assert summary['bytes_downloaded'] == 2048
+    assert summary['peak_rss_mb'] > 0
+
+
+def test_stage_rss_is_sampled_at_stage_boundaries(monkeypatch):
+    samples = iter([120.0, 300.0, 150.0, 140.0])
+    monkeypatch.setattr(metrics_module, 'current_rss_mb', lambda: next(samples))
+    metrics = RunMetrics(run_id=1)
+    try:
+        with metrics.stage('transform'):
+            pass
+        with metrics.stage('load'):
+            pass
+        rows = metrics.end_batch(1)
+    finally:
+        metrics.close()
+    # each stage keeps its own maximum, not the process-wide peak
+    assert {r['stage']: r['peak_rss_mb'] for r in rows} == {'transform': 300.0, 'load': 150.0}
+
+
+def test_db_time_is_attributed_to_current_stage():
+    engine = create_engine('sqlite://')
+    metrics = RunMetrics(run_id=1)
+    try:
+        with metrics.stage('load') as stats:
+            with engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+    finally:
+        metrics.close()
+    assert stats.db_s > 0
+
+
+def test_metrics_are_persisted_and_exported(tmp_path):
+    engine = create_engine('sqlite://')
+    EtlBatchMetric.__table__.create(engine)
+    state = start_run(engine, 'ds')
+    metrics = RunMetrics(state.run_id)
+    try:
+        with metrics.stage('transform', rows=5):
+            pass
+        save_batch_metrics(engine, metrics.end_batch(1))
+        save_run_metrics(engine, state.run_id, metrics.summary())
+        prom = tmp_path / 'etl.prom'
+        write_prometheus_textfile(metrics, str(prom))
+    finally:
+        metrics.close()
+
+    with engine.connect() as conn:
+        assert conn.execute(select(EtlBatchMetric.__table__.c.rows)).scalar() == 5
+        run = conn.execute(select(EtlRun.__table__)).first()
+    assert run.stage_metrics['transform']['rows'] == 5
+    assert 'etl_stage_rows_total{stage="transform"} 5' in prom.read_text()
@@ -0,0 +1,94 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+import pandas as pd
+import pytest
+from sqlalchemy import select, func
+from load.checkpoint import start_run
+from load.dead_letter import DeadLetterStore
+from models import EtlRun, EtlDeadLetter
+from pipeline.pipeline import process_batches
+from sketches.profile import DatasetProfile, load_profile
+from anomalies.anomalies import AnomalyDetector, load_stats
+
+
+def _transform(batch, on_error):
+    # enregistrement sans montant : rejeté à la transformation
+    for idx, record in enumerate(batch):
+        if record['v'] is None:
+            on_error(idx, record, ValueError('missing amount'))
+    return pd.DataFrame([record for record in batch if record['v'] is not None])
+
+
+def test_batches_share_checkpoint_dead_letters_and_profile(engine):
+    EtlDeadLetter.__table__.create(engine)
+    state = start_run(engine, 'd')
+    loaded = []
+
+    def load(df, checkpoint, on_reject):
+        on_reject(df.iloc[0].to_dict(), ValueError('bad row'))
+        with engine.begin() as conn:
+            checkpoint(conn)
+        loaded.append(len(df))
+        return len(df) - 1
+
+    batches = iter([
+        [{'v': 1.0}, {'v': None}, {'v': 3.0}],
+        # lot entièrement rejeté : checkpoint validé sans chargement
+        [{'v': None}],
+        [{'v': 4.0}, {'v': 5.0}],
+    ])
+    data_profile = DatasetProfile()
+    state = process_batches(engine, state, batches, _transform, load, DeadLetterStore(state.run_id),
+                            data_profile=data_profile)
+
+    assert loaded == [2, 2]
+    assert (state.batches, state.last_offset) == (3, 6)
+    assert (state.rows_transformed, state.rows_loaded) == (4, 2)
+    assert data_profile.rows == 4
+    with engine.connect() as conn:
+        offset = conn.execute(select(EtlRun.__table__.c.last_offset)).scalar()
+        rejected = conn.execute(
+            select(EtlDeadLetter.__table__.c.stage, func.count())
+            .group_by(EtlDeadLetter.__table__.c.stage).order_by(EtlDeadLetter.__table__.c.stage)
+        ).all()
+    assert offset == 6
+    assert rejected == [('load', 2), ('transform', 2)]
+
+
+def test_batch_loaded_without_checkpoint_fails(engine):
+    EtlDeadLetter.__table__.create(engine)
+    state = start_run(engine, 'd')
+    dead_letters = DeadLetterStore(state.run_id)
+
+    with pytest.raises(RuntimeError, match='without its checkpoint'):
+        process_batches(engine, state, iter([[{'v': None}, {'v': 1.0}]]), _transform,
+                        lambda df, checkpoint, on_reject: len(df), dead_letters)
+    # rejets du lot non validé : écartés
+    assert dead_letters.total == 0
+
+
+def test_killed_run_keeps_sketches_of_saved_checkpoints(engine, batch):
+    state = start_run(engine, 'd')
+    frames = [batch(seed, rows=500) for seed in range(5)]
+    loaded = []
+
+    def load(df, checkpoint, on_reject):
+        if len(loaded) == 3:
+            raise RuntimeError('killed')
+        with engine.begin() as conn:
+            checkpoint(conn)
+        loaded.append(len(df))
+        return len(df)
+
+    detector = AnomalyDetector(state.run_id)
+    with pytest.raises(RuntimeError, match='killed'):
+        process_batches(engine, state, iter(frames), lambda df, on_error: df.copy(), load,
+                        DeadLetterStore(state.run_id), data_profile=DatasetProfile(),
+                        detector=detector, sketch_every=2)
+
+    # profil et statistiques enregistrés avec le checkpoint du lot 2 :
+    # le lot 3, validé ensuite, manque ; le lot 4 n'a jamais été validé
+    assert load_profile(engine, state.run_id).rows == 1000
+    _, counts = load_stats(engine, state.run_id)
+    assert counts['duree_amort']['scored'] == sum(int(f['duree_amort'].notna().sum()) for f in frames[:2])
@@ -0,0 +1,40 @@
+import sys
+import os
+import tracemalloc
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+from utils.profiling import get_profiler, NullProfiler, StageProfiler
+
+
+def test_disabled_profiler_is_a_shared_no_op():
+    profiler = get_profiler(run_id=1, mode='')
+    assert isinstance(profiler, NullProfiler)
+    assert profiler.stage('load') is profiler.stage('extract')
+    profiler.end_batch(1)
+    assert profiler.close() is None
+
+
+def test_profiler_dumps_every_n_batches_and_summary(tmp_path):
+    profiler = StageProfiler(run_id=7, mode='all', every=2, base_dir=str(tmp_path))
+
+    for batch_no in (1, 2):
+        with profiler.stage('transform'):
+            sorted(range(1000), key=lambda x: -x)
+        profiler.end_batch(batch_no)
+    summary = profiler.close()
+
+    files = os.listdir(profiler.run_dir)
+    assert 'batch_00002_transform.prof' in files
+    assert 'batch_00002_transform_alloc.txt' in files
+    assert 'batch_00001_transform.prof' not in files
+    assert 'transform' in open(summary, encoding='utf-8').read()
+
+
+def test_profiler_leaves_callers_tracing_running(tmp_path):
+    tracemalloc.start()
+    try:
+        StageProfiler(run_id=8, mode='mem', base_dir=str(tmp_path)).close()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+    StageProfiler(run_id=9, mode='mem', base_dir=str(tmp_path)).close()
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,55 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+import numpy as np
+import pandas as pd
+from projection.projection import (
+    project_schedule, project_chunk, aggregate_projection, chunk_size_for_budget, exercise_years
+)
+
+
+def test_straight_line_schedule_ends_at_zero():
+    dotation, vnc, _ = project_schedule(
+        np.array([1000.0]), np.array([4.0]), np.array([600.0]), years=5
+    )
+    assert dotation[0].tolist() == [250.0, 250.0, 100.0, 0.0, 0.0]
+    assert vnc[0].tolist() == [350.0, 100.0, 0.0, 0.0, 0.0]
+
+
+def test_asset_without_duration_keeps_value():
+    dotation, vnc, _ = project_schedule(
+        np.array([500.0]), np.array([np.nan]), np.array([500.0]), years=3
+    )
+    assert dotation[0].tolist() == [0.0, 0.0, 0.0]
+    assert vnc[0].tolist() == [500.0, 500.0, 500.0]
+
+
+def test_project_chunk_emits_only_open_years_and_aggregates():
+    chunk = pd.DataFrame({
+        'id': [1, 2],
+        'nature_id': [3, 3],
+        'collectivite_id': [5, None],
+        'valeur_d_acquisition': [100.0, 300.0],
+        'duree_amort': [2, 3],
+        'cumul_amort_anterieurs': [50.0, 0.0],
+        'amort_exercice': [0.0, 0.0],
+        'vnc_fin_exercice': [np.nan, 300.0],
+    })
+    rows = project_chunk(chunk, np.array([2020, 2021]), years=4)
+
+    assert rows[rows['immobilisation_id'] == 1]['annee'].tolist() == [2021]
+    assert rows[rows['immobilisation_id'] == 2]['annee'].tolist() == [2022, 2023, 2024]
+    assert rows['vnc'].min() == 0.0
+
+    agg = aggregate_projection(rows)
+    assert agg['nb_actifs'].sum() == len(rows)
+    assert set(agg['collectivite_id']) == {0, 5}
+
+
+def test_chunk_size_respects_budget():
+    size = chunk_size_for_budget(30, memory_mb=64)
+    assert size * 30 * 8 * 12 <= 64 * 1024 * 1024
+
+
+def test_exercise_years_parses_publication():
+    assert exercise_years({1: 'CA 2017', 2: 'BP'}, default_year=2024) == {1: 2017, 2: 2024}
@@ -0,0 +1,150 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, insert, select, text
+from sqlalchemy.dialects import mysql
+from load.checkpoint import (
+    start_run, finish_run, rollback_run, RollbackError, STATUS_COMMITTED, STATUS_FAILED
+)
+from load.load import UNHASHED_COLUMNS, upsert_statement
+from load.run_keys import RunKeys
+from config import DATASET_ID
+from models import EtlRun, compat_view_ddl, dataset_table, visible_runs_filter
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    EtlRun.__table__.create(engine)
+    return engine
+
+
+def _load(engine, table, run_id, rows, first=0):
+    with engine.begin() as conn:
+        conn.execute(insert(table), [
+            {'code': f'C{first + i}', 'row_key': first + i, 'source_hash': first + i,
+             'run_id': run_id, 'first_run_id': run_id}
+            for i in range(rows)
+        ])
+
+
+def _finish(engine, state, table, seen, status=STATUS_COMMITTED):
+    # identités des lignes vues par le run (retrouvées inchangées : non écrites)
+    run_keys = RunKeys(state.run_id)
+    run_keys.add(np.array(list(seen), dtype=np.uint64))
+    finish_run(engine, state, status, run_keys=run_keys, table=table)
+
+
+def _count(engine, table, where='1 = 1'):
+    with engine.connect() as conn:
+        return conn.execute(text(f'SELECT COUNT(*) FROM {table.name} f WHERE {where}')).scalar()
+
+
+def test_view_shows_only_latest_committed_run(engine):
+    table = dataset_table('runs_visible', {'code': 'string'})
+    table.create(engine)
+    visible = visible_runs_filter('ds')
+    _load(engine, table, None, 2, first=200)
+    assert _count(engine, table, visible) == 2
+
+    first = start_run(engine, 'ds')
+    _load(engine, table, first.run_id, 5)
+    assert _count(engine, table, visible) == 2
+    _finish(engine, first, table, range(5))
+    assert _count(engine, table, visible) == 5
+
+    # run suivant : 3 lignes retrouvées, 2 nouvelles ; invisible tant qu'il
+    # n'est pas validé, sans masquer les lignes qu'il a retrouvées
+    second = start_run(engine, 'ds')
+    _load(engine, table, second.run_id, 2, first=100)
+    assert _count(engine, table, visible) == 5
+    _finish(engine, second, table, [0, 1, 2, 100, 101], STATUS_FAILED)
+    assert _count(engine, table, visible) == 5
+
+    third = start_run(engine, 'ds:spool')
+    _finish(engine, third, table, range(3))
+    other = start_run(engine, 'other')
+    finish_run(engine, other, STATUS_COMMITTED)
+    # lignes absentes du dernier run validé : supprimées à la source, retirées
+    # sans réécrire les lignes retrouvées
+    assert _count(engine, table, visible) == 3
+    assert _count(engine, table, f'retired_run_id = {third.run_id}') == 4
+    assert _count(engine, table, f'run_id = {third.run_id}') == 0
+    assert visible_runs_filter(DATASET_ID) in compat_view_ddl(DATASET_ID)
+
+
+def test_rollback_deletes_only_the_run_rows(engine):
+    table = dataset_table('runs_rollback', {'code': 'string'})
+    table.create(engine)
+    good = start_run(engine, 'ds')
+    _load(engine, table, good.run_id, 25)
+    _finish(engine, good, table, range(25))
+    bad = start_run(engine, 'ds')
+    _load(engine, table, bad.run_id, 42, first=1000)
+
+    with pytest.raises(RollbackError, match='still running'):
+        rollback_run(engine, bad.run_id, table=table)
+    finish_run(engine, bad, STATUS_FAILED)
+
+    assert rollback_run(engine, bad.run_id, table=table, chunk_rows=10) == 42
+    assert _count(engine, table) == 25
+    with engine.connect() as conn:
+        status = conn.execute(
+            select(EtlRun.__table__.c.status).where(EtlRun.__table__.c.run_id == bad.run_id)
+        ).scalar()
+    assert status == 'rolled_back'
+    with pytest.raises(RollbackError, match='Unknown run'):
+        rollback_run(engine, 999, table=table)
+
+    # run plus ancien : les lignes retrouvées depuis par un run validé sont conservées
+    later = start_run(engine, 'ds')
+    _finish(engine, later, table, range(10))
+    assert rollback_run(engine, good.run_id, table=table, chunk_rows=4) == 15
+    assert _count(engine, table) == 10
+
+
+def test_rollback_keeps_rows_of_interrupted_run_and_restores_retired_rows(engine):
+    table = dataset_table('runs_restore', {'code': 'string'})
+    table.create(engine)
+    base = start_run(engine, 'ds')
+    _load(engine, table, base.run_id, 4, first=100)
+    _finish(engine, base, table, range(100, 104))
+    bad = start_run(engine, 'ds')
+    _load(engine, table, bad.run_id, 5)
+    # run validé sans les lignes 102 et 103 : retirées
+    _finish(engine, bad, table, [100, 101, *range(5)])
+    assert _count(engine, table, visible_runs_filter('ds')) == 7
+
+    # run suivant interrompu : lignes 0 et 1 vues par son lot validé
+    interrupted = start_run(engine, 'ds')
+    run_keys = RunKeys(interrupted.run_id)
+    run_keys.pending = np.array([0, 1], dtype=np.uint64)
+    with engine.begin() as conn:
+        run_keys.save(conn, 1)
+    finish_run(engine, interrupted, STATUS_FAILED)
+
+    assert rollback_run(engine, bad.run_id, table=table) == 3
+    # lignes retirées par le run annulé : de nouveau visibles
+    assert _count(engine, table, visible_runs_filter('ds')) == 4
+    assert _count(engine, table, 'retired_run_id IS NOT NULL') == 0
+    assert _count(engine, table) == 6
+
+
+def test_upsert_rewrites_only_changed_rows():
+    sql = str(upsert_statement(dataset_table('runs_upsert', {'code': 'string'}),
+                               ['code', 'row_key', 'source_hash', 'run_id', 'first_run_id'])
+              .compile(dialect=mysql.dialect()))
+    # ligne inchangée : toutes les affectations rendent ses valeurs
+    assert 'run_id = if(' in sql
+    assert 'first_run_id = if(' in sql
+    assert sql.index('retired_run_id = ') < sql.index('source_hash = VALUES')
+
+
+def test_run_id_is_indexed_and_not_fingerprinted():
+    table = dataset_table('runs_index', {'code': 'string'})
+    assert any(list(index.columns.keys()) == ['run_id'] for index in table.indexes)
+    # annulation : tranches paginées sur id parmi les lignes introduites par le run
+    assert any(list(index.columns.keys()) == ['first_run_id', 'id'] for index in table.indexes)
+    assert 'run_id' in UNHASHED_COLUMNS
@@ -0,0 +1,117 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+sys.path.insert(0, os.path.join(os.getcwd(), 'benchmarks'))
+import threading
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+import load.load as load_mod
+from load.load import shard_of, upsert_sharded, ShardedLoadError
+from bench_etl import scaling_lines, compare_results
+from models import Immobilisation
+
+
+def _frame(n=1000):
+    return pd.DataFrame({
+        'ndeg_immobilisation': [f'IMMO-{i % 400:05d}' for i in range(n)],
+        'valeur': range(n),
+    })
+
+
+def test_shard_of_is_stable_by_key():
+    df = _frame()
+    shards = shard_of(df, 4)
+    assert set(shards) == {0, 1, 2, 3}
+    # toutes les lignes d'une même clé vont au même shard
+    assert (pd.Series(shards).groupby(df['ndeg_immobilisation']).nunique() == 1).all()
+    assert (shard_of(df.iloc[::-1], 4) == shards[::-1]).all()
+    assert (shard_of(df, 1) == 0).all()
+
+
+@pytest.fixture
+def engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'shards.db'}")
+
+
+def test_sharded_load_writes_partitions_in_parallel(engine, monkeypatch):
+    seen = {}
+    threads = set()
+
+    def fake_insert(conn, table, part, insert_cols, table_name, on_reject=None):
+        threads.add(threading.get_ident())
+        seen[table_name] = part
+        if len(part):
+            on_reject(part.iloc[0].to_dict(), ValueError('too long'))
+        return len(part) - 1 if len(part) else 0
+
+    monkeypatch.setattr(load_mod, '_insert_frame', fake_insert)
+    df = _frame()
+    rejected = []
+    checkpoints = []
+    inserted = upsert_sharded(engine, Immobilisation.__table__, df, ['ndeg_immobilisation'], 4,
+                              checkpoint=checkpoints.append,
+                              on_reject=lambda row, e: rejected.append(row['ndeg_immobilisation']))
+
+    assert inserted == len(df) - len(seen)
+    assert len(rejected) == len(seen)
+    assert sum(len(p) for p in seen.values()) == len(df)
+    keys = [set(p['ndeg_immobilisation']) for p in seen.values()]
+    assert all(a.isdisjoint(b) for i, a in enumerate(keys) for b in keys[i + 1:])
+    assert len(checkpoints) == 1
+    assert threading.get_ident() not in threads
+
+
+def test_sharded_load_reports_failed_shards(engine, monkeypatch):
+    def fake_insert(conn, table, part, insert_cols, table_name, on_reject=None):
+        if table_name.endswith('[1]'):
+            raise RuntimeError('deadlock')
+        return len(part)
+
+    monkeypatch.setattr(load_mod, '_insert_frame', fake_insert)
+    checkpoints = []
+    with pytest.raises(ShardedLoadError) as excinfo:
+        upsert_sharded(engine, Immobilisation.__table__, _frame(), ['ndeg_immobilisation'], 3,
+                       checkpoint=checkpoints.append)
+    assert list(excinfo.value.errors) == [1]
+    assert excinfo.value.inserted > 0
+    assert 'shard 1' in str(excinfo.value)
+    assert checkpoints == []
+
+
+def test_deadlock_is_retried_and_checkpoint_commits_with_last_shard(engine, monkeypatch):
+    attempts = {}
+    connections = {}
+
+    def fake_insert(conn, table, part, insert_cols, table_name, on_reject=None):
+        attempts[table_name] = attempts.get(table_name, 0) + 1
+        if attempts[table_name] == 1 and table_name.endswith('[0]'):
+            raise OperationalError('INSERT', {}, Exception(1213, 'Deadlock found'))
+        connections[table_name] = conn
+        return len(part)
+
+    monkeypatch.setattr(load_mod, '_insert_frame', fake_insert)
+    monkeypatch.setattr(load_mod, 'DEADLOCK_BACKOFF_S', 0)
+    df = _frame()
+    checkpoints = []
+    inserted = upsert_sharded(engine, Immobilisation.__table__, df, ['ndeg_immobilisation'], 3,
+                              checkpoint=checkpoints.append)
+
+    assert inserted == len(df)
+    assert attempts['immobilisations_amortissements_fact[0]'] == 2
+    sizes = pd.Series(shard_of(df, 3)).value_counts()
+    last = f'immobilisations_amortissements_fact[{sizes.idxmin()}]'
+    assert checkpoints == [connections[last]]
+
+
+def test_benchmark_scaling_summary():
+    results = [
+        {'stage': 'load', 'rows': 1000, 'shards': s, 'rows_per_s': 1000.0 * s ** 0.5}
+        for s in (1, 2, 4)
+    ]
+    lines = scaling_lines(results)
+    assert len(lines) == 4
+    assert lines[-1].rstrip().endswith('2.00x')
+    lines = compare_results({'results': results}, [dict(results[2], rows_per_s=4000.0)])
+    assert lines[1].startswith('loadx4')
@@ -0,0 +1,71 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+import numpy as np
+import pandas as pd
+from load.checkpoint import start_run, finish_run, STATUS_COMMITTED
+from transform.transform import fixed_point_schema
+from sketches.sketches import HyperLogLog, KLLSketch, TopK, hash_values
+from sketches.profile import profile_frame, load_profile, report_profile, save_profile
+
+
+def test_sketches_merge_like_a_single_pass():
+    rng = np.random.default_rng(3)
+    values = rng.normal(size=100_000)
+    whole, parts = HyperLogLog(), HyperLogLog()
+    quantiles = KLLSketch()
+    whole.update(hash_values(values))
+    for chunk in np.array_split(values, 10):
+        part = HyperLogLog()
+        part.update(hash_values(chunk))
+        parts.merge(part)
+        batch = KLLSketch()
+        batch.update(chunk)
+        quantiles.merge(batch)
+
+    assert parts.estimate() == whole.estimate()
+    assert abs(whole.estimate() - 100_000) < 5_000
+    assert sum(len(level) for level in quantiles.levels) < 3 * quantiles.k
+    assert abs(quantiles.quantiles([0.5])[0]) < 0.1
+    assert quantiles.min == values.min() and quantiles.max == values.max()
+
+
+def test_top_k_keeps_heavy_hitters():
+    top = TopK(capacity=4)
+    for seed in range(5):
+        values = pd.Series(['a'] * 50 + ['b'] * 30 + [f'u{seed}-{i}' for i in range(40)])
+        top.update_counts(values.value_counts())
+    assert [key for key, _ in top.top(2)] == ['a', 'b']
+    assert len(top.counters) <= 4
+
+
+def test_profile_matches_between_money_modes(batch):
+    floats = profile_frame(batch(1)).columns['valeur_d_acquisition']
+    cents = profile_frame(batch(1, schema=fixed_point_schema())).columns['valeur_d_acquisition']
+    assert floats.nulls == cents.nulls
+    assert floats.distinct.estimate() == cents.distinct.estimate()
+    assert floats.stats()['max'] == cents.stats()['max']
+
+
+def test_profile_round_trip_and_drift(engine, batch):
+    first = start_run(engine, 'ds')
+    profile = profile_frame(batch(1))
+    profile.merge(profile_frame(batch(2)))
+    save_profile(engine, first.run_id, profile)
+    finish_run(engine, first, STATUS_COMMITTED)
+
+    stored = load_profile(engine, first.run_id)
+    assert stored.rows == 4000
+    assert stored.columns['collectivite'].top.top(3) == profile.columns['collectivite'].top.top(3)
+    assert load_profile(engine, 999) is None
+
+    second = start_run(engine, 'ds')
+    drifted = batch(3)
+    drifted['valeur_d_acquisition'] *= 10
+    drift = report_profile(engine, second.run_id, profile_frame(drifted))
+    assert drift['valeur_d_acquisition']['drifted']
+    assert drift['valeur_d_acquisition']['ks'] > 0.3
+    assert not drift['collectivite']['drifted']
+    assert not drift['date_d_acquisition']['drifted']
+    # premier run : profil publié sans référence
+    assert report_profile(engine, first.run_id, profile) == {}
@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc
+from sqlalchemy import create_engine
+from snapshot.snapshot import write_snapshot, refresh_snapshot, snapshot_schema
+
+
+def _source(engine, n=25):
+    pd.DataFrame({
+        'id': range(1, n + 1),
+        'collectivite': ['Ville', None] + ['Dept'] * (n - 2),
+        'nature': 'Bâtiment',
+        'date_d_acquisition': ['2001-02-03', None] + ['2010-06-30'] * (n - 2),
+        'annee_acquisition': [2001, None] + [2010] * (n - 2),
+        'trimestre_acquisition': [1, None] + [2] * (n - 2),
+        'mois_acquisition': [2, None] + [6] * (n - 2),
+        'valeur_d_acquisition': [1000.25, None] + [10.5] * (n - 2),
+        'duree_amort': [5, None] + [10] * (n - 2),
+        'vnc_fin_exercice': 1.0,
+        'amortissement_total': 2.0,
+        'taux_amortissement': 0.2,
+    }).to_sql('snapshot_source', engine, index=False)
+
+
+def test_snapshot_is_written_in_batches_and_memory_mappable(tmp_path):
+    engine = create_engine('sqlite://')
+    _source(engine)
+    path = str(tmp_path / 'shared' / 'immobilisations.arrow')
+
+    assert write_snapshot(engine, path, version=7, source='snapshot_source', chunk_rows=10) == 25
+
+    with pa.memory_map(path, 'r') as source:
+        reader = pa.ipc.open_file(source)
+        table = reader.read_all()
+        assert reader.num_record_batches == 3
+    assert table.schema.equals(snapshot_schema())
+    assert table.schema.metadata[b'data_version'] == b'7'
+    assert table.num_rows == 25
+    assert table.column('valeur_d_acquisition').null_count == 1
+    assert table.column('date_d_acquisition')[0].as_py().isoformat() == '2001-02-03'
+    assert table.column('collectivite').to_pylist()[:2] == ['Ville', None]
+    assert os.listdir(tmp_path / 'shared') == ['immobilisations.arrow']
+
+
+def test_refresh_snapshot_is_best_effort(tmp_path):
+    engine = create_engine('sqlite://')
+    path = str(tmp_path / 'immobilisations.arrow')
+    refresh_snapshot(engine, path='')
+    # vue absente : l'erreur est journalisée, le run n'échoue pas
+    refresh_snapshot(engine, path=path)
+    assert not os.path.exists(path)
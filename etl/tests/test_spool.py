@@ -0,0 +1,179 @@
+import sys
+import os
+sys.path.insert(0, os.path.join(os.getcwd(), 'src'))
+sys.path.insert(0, os.path.join(os.getcwd(), 'benchmarks'))
+import pandas as pd
+import pytest
+from sqlalchemy import text
+from synthetic import generate_page
+from stub_server import serve
+import extract.extract as extract_module
+from spool.spool import (
+    RAW, TRANSFORMED, SpoolError, SpoolWriter, stage_dir, read_manifest, iter_records, iter_frames
+)
+from transform.transform import transform_records, calculate_derived_fields
+import cli
+
+
+def test_raw_spool_roundtrip_and_parts(tmp_path):
+    records = generate_page(0, 250, seed=3)
+    directory = str(tmp_path / RAW)
+    with SpoolWriter(directory, part_rows=100, meta={'dataset_id': 'x'}) as writer:
+        writer.write_records(records[:120])
+        writer.write_records(records[120:])
+
+    manifest = read_manifest(directory)
+    assert manifest['rows'] == 250 and [p['rows'] for p in manifest['parts']] == [100, 100, 50]
+    assert manifest['dataset_id'] == 'x'
+    batches = list(iter_records(directory, batch_size=80))
+    assert [len(b) for b in batches] == [80, 80, 80, 10]
+    assert sum(batches, []) == records
+
+
+@pytest.mark.parametrize('fmt', ['ndjson', 'arrow'])
+def test_frame_spool_keeps_dtypes(tmp_path, fmt):
+    df = calculate_derived_fields(transform_records(generate_page(0, 300, seed=5, dirty=0.2)))
+    directory = str(tmp_path / TRANSFORMED)
+    with SpoolWriter(directory, fmt) as writer:
+        writer.write_frame(df.iloc[:200])
+        writer.write_frame(df.iloc[200:])
+
+    restored = pd.concat(list(iter_frames(directory)), ignore_index=True)
+    assert list(restored.columns) == list(df.columns)
+    assert restored['date_d_acquisition'].dtype.kind == 'M'
+    pd.testing.assert_series_equal(restored['valeur_d_acquisition'], df['valeur_d_acquisition'])
+    assert restored['ndeg_immobilisation'].tolist() == df['ndeg_immobilisation'].tolist()
+
+
+def test_incomplete_spool_is_rejected(tmp_path):
+    directory = str(tmp_path / RAW)
+    with pytest.raises(RuntimeError):
+        with SpoolWriter(directory) as writer:
+            writer.write_records(generate_page(0, 10))
+            raise RuntimeError('interrupted')
+    with pytest.raises(SpoolError):
+        read_manifest(directory)
+    assert os.listdir(tmp_path) == []
+
+
+def test_interrupted_rewrite_keeps_previous_spool(tmp_path):
+    directory = str(tmp_path / RAW)
+    with SpoolWriter(directory) as writer:
+        writer.write_records(generate_page(0, 10))
+    with pytest.raises(RuntimeError):
+        with SpoolWriter(directory) as writer:
+            writer.write_records(generate_page(10, 5))
+            raise RuntimeError('interrupted')
+    assert read_manifest(directory)['rows'] == 10
+
+    with SpoolWriter(directory) as writer:
+        writer.write_records(generate_page(10, 5))
+    assert read_manifest(directory)['rows'] == 5
+    assert os.listdir(tmp_path) == [RAW]
+
+
+def test_missing_booleans_stay_missing(tmp_path):
+    directory = str(tmp_path / TRANSFORMED)
+    with SpoolWriter(directory) as writer:
+        writer.write_frame(pd.DataFrame({'flag': [True, False]}))
+        writer.write_frame(pd.DataFrame({'flag': pd.array([None, True], dtype='boolean')}))
+
+    first, second = iter_frames(directory)
+    assert first['flag'].dtype == bool
+    assert second['flag'].isna().tolist() == [True, False]
+    assert second['flag'].tolist()[1] is True
+
+
+def test_cli_extract_then_transform(tmp_path, monkeypatch):
+    spool = str(tmp_path)
+    with serve(2300, seed=9) as url:
+        monkeypatch.setattr(extract_module, 'SEARCH_URL', url)
+        assert cli.main(['--spool', spool, 'extract', '--batch-size', '1000']) == 0
+    assert read_manifest(stage_dir(spool, RAW))['rows'] == 2300
+
+    assert cli.main(['--spool', spool, 'transform', '--part-rows', '1000']) == 0
+    manifest = read_manifest(stage_dir(spool, TRANSFORMED))
+    assert manifest['rows'] == 2300 and len(manifest['parts']) == 3
+    assert manifest['source_rows'] == 2300
+
+
+def test_cli_reports_missing_spool(tmp_path):
+    assert cli.main(['--spool', str(tmp_path), 'transform']) == 2
+
+
+def test_iter_frames_starts_at_row_offset(tmp_path):
+    directory = str(tmp_path / TRANSFORMED)
+    with SpoolWriter(directory, 'ndjson', part_rows=100) as writer:
+        for begin in range(0, 250, 100):
+            writer.write_frame(pd.DataFrame({'row_no': range(begin, min(begin + 100, 250))}))
+    # fichier 1 sauté sans lecture, fichier 2 coupé à la ligne 130
+    frames = list(iter_frames(directory, start=130))
+    assert [len(f) for f in frames] == [70, 50]
+    assert pd.concat(frames)['row_no'].tolist() == list(range(130, 250))
+
+
+def _load_spool(spool, monkeypatch, engine, loaded, fail_after=None):
+    import load.load as load_module
+
+    def upsert(df, table_name, checkpoint, copy, on_reject, shards, run_id, engine, run_keys):
+        if fail_after is not None and len(loaded) == fail_after:
+            raise RuntimeError('killed')
+        with engine.begin() as conn:
+            checkpoint(conn)
+        loaded.append(df['row_no'].tolist())
+        return len(df)
+
+    monkeypatch.setattr(load_module, 'get_engine', lambda: engine)
+    monkeypatch.setattr(load_module, 'upsert_immobilisations', upsert)
+
+
+def test_cli_load_resumes_at_row_offset_of_same_spool(tmp_path, monkeypatch, engine, batch):
+    from models import EtlDeadLetter, EtlMinHash, EtlLshBucket, EtlNearDuplicate
+    for model in (EtlDeadLetter, EtlMinHash, EtlLshBucket, EtlNearDuplicate):
+        model.__table__.create(engine)
+    with engine.begin() as conn:
+        # table de faits réduite (colonnes générées propres à MySQL) : une
+        # ligne d'un run précédent, absente du spool
+        conn.execute(text(
+            'CREATE TABLE immobilisations_amortissements_fact (id INTEGER PRIMARY KEY, row_key INTEGER, '
+            'run_id INTEGER, first_run_id INTEGER, retired_run_id INTEGER, fetched_at TIMESTAMP)'
+        ))
+        conn.execute(text('INSERT INTO immobilisations_amortissements_fact VALUES (1, 7, 0, 0, NULL, NULL)'))
+    spool = str(tmp_path)
+    df = batch(1, rows=600).reset_index(drop=True)
+    df['row_no'] = range(len(df))
+    with SpoolWriter(stage_dir(spool, TRANSFORMED), 'ndjson', meta={'dataset_id': 'x'}) as writer:
+        for begin in range(0, len(df), 200):
+            writer.write_frame(df.iloc[begin:begin + 200])
+
+    loaded = []
+    _load_spool(spool, monkeypatch, engine, loaded, fail_after=3)
+    assert cli.main(['--spool', spool, 'load', '--batch-size', '150']) == 1
+    # reprise avec une autre taille de lot : à la ligne 350, au milieu du
+    # deuxième fichier, sans trou ni doublon (un lot ne chevauche pas deux fichiers)
+    _load_spool(spool, monkeypatch, engine, loaded)
+    assert cli.main(['--spool', spool, 'load', '--batch-size', '250', '--resume']) == 0
+    assert [len(rows) for rows in loaded] == [150, 50, 150, 50, 200]
+    assert sum(loaded, []) == list(range(600))
+    # retirée à la validation du chargement
+    with engine.connect() as conn:
+        retired = conn.execute(text('SELECT retired_run_id FROM immobilisations_amortissements_fact')).scalar()
+    assert retired == 1
+
+
+def test_cli_load_refuses_to_resume_another_spool(tmp_path, monkeypatch, engine, batch):
+    spool = str(tmp_path)
+    directory = stage_dir(spool, TRANSFORMED)
+    df = batch(2, rows=300).reset_index(drop=True)
+    df['row_no'] = range(len(df))
+    with SpoolWriter(directory, 'ndjson', meta={'dataset_id': 'x'}) as writer:
+        writer.write_frame(df)
+    first = read_manifest(directory)['spool_id']
+    _load_spool(spool, monkeypatch, engine, [], fail_after=1)
+    assert cli.main(['--spool', spool, 'load', '--batch-size', '100']) == 1
+
+    # spool réécrit (même contenu) : le run interrompu ne peut pas être repris
+    with SpoolWriter(directory, 'ndjson', meta={'dataset_id': 'x'}) as writer:
+        writer.write_frame(df)
+    assert read_manifest(directory)['spool_id'] != first
+    assert cli.main(['--spool', spool, 'load', '--resume']) == 2
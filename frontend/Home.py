@@ -1,7 +1,7 @@
 import streamlit as st
-from PIL import Image
-from pathlib import Path
 from datetime import datetime
+import assets
+import manifest
 
 # Configuration de la page
 st.set_page_config(
@@ -119,22 +119,19 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Chemin vers les dashboards
-DASHBOARD_DIR = Path(__file__).parent / "Dashboards"
-
 def count_dashboard_images():
-    """Compte le nombre d'images dans les dashboards"""
+    """Nombre d'images par dashboard (manifeste, sans parcours des répertoires)"""
     try:
-        vue_exec = DASHBOARD_DIR / "VUE EXÉCUTIVE"
-        analyse_temp = DASHBOARD_DIR / "ANALYSE TEMPORELLE"
-        
-        vue_count = len(list(vue_exec.glob("*.jpg"))) if vue_exec.exists() else 0
-        analyse_count = len(list(analyse_temp.glob("*.jpg"))) if analyse_temp.exists() else 0
-        
-        return vue_count, analyse_count
-    except:
+        dashboards = manifest.load_manifest()['dashboards']
+        return len(dashboards["VUE EXÉCUTIVE"]['charts']), len(dashboards["ANALYSE TEMPORELLE"]['charts'])
+    except Exception:
         return 0, 0
 
+def show_thumbnail(name):
+    """Affiche la vignette WebP du dashboard complet"""
+    chart = manifest.dashboard(name)['charts'][0]
+    st.image(assets.get_bytes(manifest.asset_path(chart), 'thumb'), use_column_width=True)
+
 # Sidebar
 with st.sidebar:
     st.markdown("# 📊 Navigation")
@@ -144,6 +141,7 @@ with st.sidebar:
     st.info("""
     - 👁️ **Vue Exécutive**
     - 📅 **Analyse Temporelle**
+    - 🔎 **Explorateur** (lignes filtrées)
     
     Utilisez le menu ci-dessus pour naviguer.
     """)
@@ -195,6 +193,7 @@ with col1:
         </ul>
     </div>
     """, unsafe_allow_html=True)
+    show_thumbnail("VUE EXÉCUTIVE")
 
 with col2:
     st.markdown("""
@@ -209,6 +208,7 @@ with col2:
         </ul>
     </div>
     """, unsafe_allow_html=True)
+    show_thumbnail("ANALYSE TEMPORELLE")
 
 st.markdown("---")
 
@@ -220,12 +220,14 @@ st.info("""
 - Chaque dashboard affiche une vue complète ainsi que des graphiques individuels
 
 **Modes d'affichage :**
-- **Vue Dashboard** : Aperçu complet du tableau de bord
-- **Graphiques Détaillés** : Analyse détaillée de chaque indicateur
+- **Données en Direct** : Indicateurs calculés sur la base MySQL, à jour après chaque run ETL
+- **Vue Dashboard** : Aperçu complet du tableau de bord (export Superset)
+- **Graphiques Détaillés** : Analyse détaillée de chaque indicateur (exports Superset)
 
 **Images :**
-- Toutes les visualisations sont des images statiques exportées depuis Superset
+- Les exports Superset sont des images statiques
 - Téléchargement disponible pour chaque graphique
+- Vignettes et variantes WebP générées une fois puis servies depuis le cache
 """)
 
 # Footer
@@ -0,0 +1,178 @@
+"""Images des dashboards : variantes pré-générées et cache LRU en mémoire.
+
+Chaque export JPG de Dashboards/ est décliné une fois en variantes WebP
+redimensionnées (affichage, vignette), écrites dans ASSET_CACHE_DIR sous
+un nom qui inclut le mtime et la taille du fichier source : une image
+remplacée produit de nouvelles variantes, les anciennes sont ignorées.
+Les octets servis (variantes et original pour les téléchargements) sont
+gardés dans un LRU borné à ASSET_CACHE_MB : un changement d'onglet ou un
+rerun ne relit ni ne décode plus les images.
+
+Pré-génération (au démarrage du conteneur) :
+    python assets.py
+"""
+import io
+import os
+import sys
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_ROOT = Path(__file__).parent / "Dashboards"
+ASSET_CACHE_DIR = Path(os.getenv('FRONTEND_ASSET_CACHE_DIR', Path(__file__).parent / ".asset_cache"))
+# Budget mémoire (Mo) des octets d'images gardés par le processus Streamlit
+ASSET_CACHE_MB = int(os.getenv('FRONTEND_ASSET_CACHE_MB', 64))
+
+ORIGINAL = 'original'
+# Variante -> (largeur maximale en pixels, qualité WebP)
+VARIANTS: Dict[str, Tuple[int, int]] = {
+    'display': (1600, 85),
+    'thumb': (360, 75),
+}
+
+
+class ByteLRU:
+    """Cache LRU d'octets borné en taille totale, partagé entre sessions."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[bytes]:
+        with self._lock:
+            data = self._items.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data: bytes) -> None:
+        with self._lock:
+            if key in self._items:
+                self.size -= len(self._items.pop(key))
+            if len(data) > self.max_bytes:
+                # plus gros que le cache entier : servi sans être gardé
+                return
+            self._items[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+_cache = ByteLRU(ASSET_CACHE_MB * 1024 * 1024)
+
+
+def _source_key(path: Path) -> Tuple[str, int, int]:
+    """Identifie une version du fichier source (chemin, mtime, taille)."""
+    stat = path.stat()
+    return str(path), stat.st_mtime_ns, stat.st_size
+
+
+def variant_path(path: Path, variant: str, cache_dir: Path = None) -> Path:
+    """Chemin de la variante WebP d'une image, dérivé de son mtime et de sa taille."""
+    _, mtime_ns, size = _source_key(path)
+    cache_dir = ASSET_CACHE_DIR if cache_dir is None else cache_dir
+    relative = path.parent.name
+    return cache_dir / relative / f"{path.stem}.{variant}.{mtime_ns:x}-{size:x}.webp"
+
+
+def _render_variant(path: Path, variant: str) -> bytes:
+    """Décode l'image source et encode la variante WebP demandée."""
+    max_width, quality = VARIANTS[variant]
+    with Image.open(path) as img:
+        img = img.convert('RGB')
+        if img.width > max_width:
+            height = round(img.height * max_width / img.width)
+            img = img.resize((max_width, height), Image.LANCZOS)
+        out = io.BytesIO()
+        img.save(out, format='WEBP', quality=quality, method=4)
+    return out.getvalue()
+
+
+def ensure_variant(path: Path, variant: str, cache_dir: Path = None) -> Path:
+    """
+    Génère la variante sur disque si elle n'existe pas encore.
+
+    L'écriture passe par un fichier temporaire renommé : un lecteur
+    concurrent ne voit jamais une variante tronquée.
+
+    Returns:
+        Chemin de la variante
+    """
+    target = variant_path(path, variant, cache_dir)
+    if not target.exists():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(f'.{os.getpid()}.tmp')
+        tmp.write_bytes(_render_variant(path, variant))
+        os.replace(tmp, target)
+        # variantes d'une version précédente de la même image
+        for stale in target.parent.glob(f"{path.stem}.{variant}.*.webp"):
+            if stale != target:
+                stale.unlink(missing_ok=True)
+    return target
+
+
+def get_bytes(path: Path, variant: str = 'display') -> bytes:
+    """
+    Octets d'une image (variante WebP ou `original`), via le cache LRU.
+
+    Args:
+        path: Image source (JPG des exports Superset)
+        variant: 'display', 'thumb' ou 'original' (téléchargement)
+
+    Returns:
+        Contenu de l'image
+
+    Raises:
+        FileNotFoundError: image source absente
+    """
+    path = Path(path)
+    key = (*_source_key(path), variant)
+    data = _cache.get(key)
+    if data is None:
+        source = path if variant == ORIGINAL else ensure_variant(path, variant)
+        data = source.read_bytes()
+        _cache.put(key, data)
+    return data
+
+
+def pregenerate(root: Path = DASHBOARD_ROOT, cache_dir: Path = None) -> int:
+    """
+    Génère toutes les variantes des images de `root`.
+
+    Returns:
+        Nombre d'images traitées
+    """
+    count = 0
+    for path in sorted(root.glob('*/*.jpg')):
+        for variant in VARIANTS:
+            ensure_variant(path, variant, cache_dir)
+        count += 1
+    return count
+
+
+def cache_stats() -> Dict[str, int]:
+    """Taille et efficacité du cache LRU (diagnostic)."""
+    return {'entries': len(_cache), 'bytes': _cache.size, 'hits': _cache.hits, 'misses': _cache.misses}
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    processed = pregenerate()
+    logger.info('Generated variants for %s images in %s', processed, ASSET_CACHE_DIR)
+    sys.exit(0)
@@ -0,0 +1,405 @@
+"""Accès MySQL partagé par les pages Streamlit.
+
+Le moteur SQLAlchemy (et son pool de connexions) est créé une fois par
+processus (st.cache_resource). Chaque agrégat est mis en cache par
+st.cache_data, pour toutes les sessions, sous une clé qui inclut la
+version des données publiée par l'ETL (etl_metadata.data_version,
+incrémentée à chaque run validé) : un agrégat est recalculé une seule
+fois après chaque chargement, et jamais sinon. La version elle-même est
+lue par clé primaire, au plus une fois toutes les VERSION_CHECK_TTL
+secondes.
+
+Les requêtes lisent la vue immobilisations_amortissements, qui n'expose
+que les lignes du dernier run ETL validé.
+"""
+import os
+import pandas as pd
+import streamlit as st
+from sqlalchemy import create_engine, text
+import search
+
+# Intervalle (secondes) entre deux lectures de la version des données
+VERSION_CHECK_TTL = int(os.getenv('FRONTEND_VERSION_CHECK_TTL', 10))
+
+# Versions gardées en cache par agrégat (les plus anciennes sont évincées)
+CACHE_MAX_ENTRIES = 4
+
+# Vue lue par le tableau de bord (libellés des dimensions, runs validés)
+SOURCE_VIEW = 'immobilisations_amortissements'
+# Table de faits sous la vue (clés de dimension, index de pagination)
+FACT_TABLE = 'immobilisations_amortissements_fact'
+
+# Dataset chargé par l'ETL dans la table de faits
+DATASET_ID = os.getenv('DATASET_ID', 'immobilisations-etat-des-amortissements')
+
+# Dernier run validé du dataset (chargements depuis un spool compris)
+LATEST_RUN = (
+    "(SELECT MAX(run_id) FROM etl_runs WHERE status = 'committed' "
+    f"AND (dataset_id = '{DATASET_ID}' OR dataset_id LIKE '{DATASET_ID}:%'))"
+)
+
+# Lignes de la table de faits (alias f) visibles par la vue : même condition
+# que models.visible_runs_filter côté ETL
+VISIBLE_ROWS = (
+    f"((f.first_run_id <= {LATEST_RUN} AND (f.retired_run_id IS NULL OR f.retired_run_id > {LATEST_RUN})) "
+    f"OR (f.first_run_id IS NULL AND {LATEST_RUN} IS NULL))"
+)
+
+
+@st.cache_resource
+def get_engine():
+    """
+    Crée le moteur SQLAlchemy partagé par toutes les sessions.
+
+    FRONTEND_DATABASE_URL remplace la connexion MySQL (base locale,
+    par exemple SQLite pour le développement).
+
+    Returns:
+        Engine SQLAlchemy configuré avec les variables MYSQL_*
+    """
+    local_url = os.getenv('FRONTEND_DATABASE_URL')
+    if local_url:
+        return create_engine(local_url)
+    user = os.getenv('MYSQL_USER', 'root')
+    pw = os.getenv('MYSQL_PASSWORD', '')
+    host = os.getenv('MYSQL_HOST', 'mysql')
+    port = os.getenv('MYSQL_PORT', 3306)
+    db = os.getenv('MYSQL_DATABASE')
+    url = f'mysql+pymysql://{user}:{pw}@{host}:{port}/{db}'
+    # pool réduit : les requêtes sont rares grâce au cache ; recyclage avant
+    # le wait_timeout de MySQL
+    return create_engine(url, pool_pre_ping=True, pool_size=2, max_overflow=3, pool_recycle=1800)
+
+
+def run_query(sql: str, **params) -> pd.DataFrame:
+    """Exécute une requête sur le moteur partagé (DECIMAL convertis en float)."""
+    with get_engine().connect() as conn:
+        return pd.read_sql(text(sql), conn, params=params, coerce_float=True)
+
+
+@st.cache_data(ttl=VERSION_CHECK_TTL, show_spinner=False)
+def data_version() -> int:
+    """
+    Version des données publiée par l'ETL (lecture par clé primaire).
+
+    Returns:
+        Version courante, 0 si aucun run n'a encore été validé
+    """
+    with get_engine().connect() as conn:
+        version = conn.execute(
+            text("SELECT value FROM etl_metadata WHERE name = 'data_version'")
+        ).scalar()
+    return int(version or 0)
+
+
+# ============================================================================
+# AGRÉGATS (Vue Exécutive)
+# Le paramètre `version` (data_version()) ne sert qu'à la clé de cache.
+# ============================================================================
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def kpi_totals(version: int) -> pd.DataFrame:
+    """Nombre d'actifs, valeur d'acquisition et VNC totales."""
+    return run_query(
+        f"SELECT COUNT(*) AS nb_actifs, "
+        f"SUM(valeur_d_acquisition) AS valeur_totale, "
+        f"SUM(vnc_fin_exercice) AS vnc_totale, "
+        f"SUM(amortissement_total) AS amortissement_total "
+        f"FROM {SOURCE_VIEW}"
+    )
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def acquisitions_by_year(version: int) -> pd.DataFrame:
+    """Nombre et valeur des acquisitions par année."""
+    return run_query(
+        f"SELECT annee_acquisition AS annee, COUNT(*) AS nb_acquisitions, "
+        f"SUM(valeur_d_acquisition) AS valeur_acquisition "
+        f"FROM {SOURCE_VIEW} WHERE annee_acquisition IS NOT NULL "
+        f"GROUP BY annee_acquisition ORDER BY annee_acquisition"
+    )
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def breakdown_by_nature(version: int, limit: int = 15) -> pd.DataFrame:
+    """Nombre et valeur des actifs des `limit` natures les plus représentées."""
+    return run_query(
+        f"SELECT COALESCE(nature, 'Non renseignée') AS nature, COUNT(*) AS nb_actifs, "
+        f"SUM(valeur_d_acquisition) AS valeur_acquisition "
+        f"FROM {SOURCE_VIEW} GROUP BY nature ORDER BY nb_actifs DESC LIMIT :limit",
+        limit=limit,
+    )
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def top_assets(version: int, limit: int = 10) -> pd.DataFrame:
+    """Les `limit` immobilisations de plus forte valeur d'acquisition."""
+    return run_query(
+        f"SELECT ndeg_immobilisation, designation_des_ensembles, nature, collectivite, "
+        f"date_d_acquisition, valeur_d_acquisition, vnc_fin_exercice "
+        f"FROM {SOURCE_VIEW} WHERE valeur_d_acquisition IS NOT NULL "
+        f"ORDER BY valeur_d_acquisition DESC LIMIT :limit",
+        limit=limit,
+    )
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def value_by_collectivite(version: int) -> pd.DataFrame:
+    """Valeur d'acquisition et nombre d'actifs par collectivité."""
+    return run_query(
+        f"SELECT COALESCE(collectivite, 'Non renseignée') AS collectivite, COUNT(*) AS nb_actifs, "
+        f"SUM(valeur_d_acquisition) AS valeur_acquisition "
+        f"FROM {SOURCE_VIEW} GROUP BY collectivite ORDER BY valeur_acquisition DESC"
+    )
+
+
+# ============================================================================
+# AGRÉGATS (Analyse Temporelle)
+# ============================================================================
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def acquisitions_by_quarter(version: int) -> pd.DataFrame:
+    """Nombre et valeur des acquisitions par année et trimestre."""
+    return run_query(
+        f"SELECT annee_acquisition AS annee, trimestre_acquisition AS trimestre, "
+        f"COUNT(*) AS nb_acquisitions, SUM(valeur_d_acquisition) AS valeur_acquisition "
+        f"FROM {SOURCE_VIEW} WHERE annee_acquisition IS NOT NULL "
+        f"GROUP BY annee_acquisition, trimestre_acquisition ORDER BY annee, trimestre"
+    )
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def acquisitions_by_month(version: int) -> pd.DataFrame:
+    """Nombre d'acquisitions par année et mois."""
+    return run_query(
+        f"SELECT annee_acquisition AS annee, mois_acquisition AS mois, COUNT(*) AS nb_acquisitions "
+        f"FROM {SOURCE_VIEW} WHERE annee_acquisition IS NOT NULL "
+        f"GROUP BY annee_acquisition, mois_acquisition ORDER BY annee, mois"
+    )
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def cumulative_depreciation(version: int) -> pd.DataFrame:
+    """Amortissement et valeur d'acquisition cumulés par année d'acquisition."""
+    df = run_query(
+        f"SELECT annee_acquisition AS annee, SUM(amortissement_total) AS amortissement, "
+        f"SUM(valeur_d_acquisition) AS valeur_acquisition "
+        f"FROM {SOURCE_VIEW} WHERE annee_acquisition IS NOT NULL "
+        f"GROUP BY annee_acquisition ORDER BY annee_acquisition"
+    )
+    df['amortissement_cumule'] = df['amortissement'].astype(float).cumsum()
+    df['valeur_cumulee'] = df['valeur_acquisition'].astype(float).cumsum()
+    return df
+
+
+# ============================================================================
+# EXPLORATEUR (pagination par clé)
+# Une page est lue par recherche dans l'index (clé de tri, id) à partir de
+# la dernière ligne de la page précédente : coût constant quelle que soit
+# la profondeur, sans OFFSET ni COUNT(*).
+# ============================================================================
+
+EXPLORER_PAGE_SIZE = int(os.getenv('FRONTEND_EXPLORER_PAGE_SIZE', 50))
+
+# Clé de tri -> libellé ; chacune est indexée avec id (idx_immob_valeur, ...),
+# et derrière chaque combinaison de dimensions filtrées
+# (idx_immob_coll_nature_valeur, idx_immob_coll_valeur, idx_immob_nature_valeur, ...)
+SORT_KEYS = {
+    'id': "Ordre de chargement",
+    'valeur_d_acquisition': "Valeur d'acquisition",
+    'date_d_acquisition': "Date d'acquisition",
+    'vnc_fin_exercice': "VNC fin d'exercice",
+}
+
+EXPLORER_COLUMNS = [
+    'id', 'ndeg_immobilisation', 'collectivite', 'nature', 'date_d_acquisition',
+    'designation_des_ensembles', 'valeur_d_acquisition', 'duree_amort', 'vnc_fin_exercice',
+]
+
+# Dimensions filtrables -> table de libellés
+DIMENSION_TABLES = {'collectivite': 'dim_collectivite', 'nature': 'dim_nature'}
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES, show_spinner=False)
+def dimension_values(version: int, dimension: str) -> list:
+    """Libellés d'une dimension filtrable (collectivite, nature)."""
+    df = run_query(f"SELECT libelle FROM {DIMENSION_TABLES[dimension]} ORDER BY libelle")
+    return df['libelle'].tolist()
+
+
+def filter_clauses(filters: dict, fact: bool = False) -> tuple:
+    """
+    Traduit les filtres de l'explorateur en conditions SQL paramétrées.
+
+    Args:
+        filters: collectivite, nature (libellés), annee_min/annee_max,
+            valeur_min/valeur_max ; une valeur None est ignorée
+        fact: Conditions sur la table de faits (alias f) : les libellés sont
+            traduits en clés de dimension, au lieu des colonnes de la vue
+
+    Returns:
+        Tuple (liste de conditions, paramètres)
+    """
+    prefix = 'f.' if fact else ''
+    clauses, params = [], {}
+    for dimension, table in DIMENSION_TABLES.items():
+        if filters.get(dimension):
+            if fact:
+                clauses.append(f"f.{dimension}_id = (SELECT id FROM {table} WHERE libelle = :{dimension})")
+            else:
+                clauses.append(f"{dimension} = :{dimension}")
+            params[dimension] = filters[dimension]
+    for bound, column, op in (
+        ('annee_min', 'annee_acquisition', '>='), ('annee_max', 'annee_acquisition', '<='),
+        ('valeur_min', 'valeur_d_acquisition', '>='), ('valeur_max', 'valeur_d_acquisition', '<='),
+    ):
+        if filters.get(bound) is not None:
+            clauses.append(f"{prefix}{column} {op} :{bound}")
+            params[bound] = filters[bound]
+    return clauses, params
+
+
+def keyset_query(filters: dict, sort: str, descending: bool, after: tuple = None,
+                 limit: int = EXPLORER_PAGE_SIZE) -> tuple:
+    """
+    Construit la requête d'une page de l'explorateur.
+
+    Les lignes sont ordonnées par (clé de tri, id) ; la page suivante
+    commence strictement après `after`, la dernière ligne affichée. Les
+    lignes dont la clé de tri est NULL sont exclues du tri (sauf tri par id).
+    Les ids de la page sont cherchés dans la table de faits (filtres par clé
+    de dimension, lignes visibles, index (dimensions, clé de tri, id)) ;
+    seules ces lignes passent par les jointures de la vue.
+
+    Args:
+        filters: Filtres (voir filter_clauses)
+        sort: Clé de tri (SORT_KEYS)
+        descending: Ordre décroissant
+        after: (clé de tri, id) de la dernière ligne de la page précédente
+        limit: Lignes lues (la page plus une, pour savoir s'il en reste)
+
+    Returns:
+        Tuple (requête SQL, paramètres)
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError(f"Unknown sort key: {sort}")
+    clauses, params = filter_clauses(filters, fact=True)
+    clauses.append(VISIBLE_ROWS)
+    op, direction = ('<', 'DESC') if descending else ('>', 'ASC')
+    if sort == 'id':
+        keys = ['id']
+        if after is not None:
+            clauses.append(f"f.id {op} :after_id")
+            params['after_id'] = after[1]
+    else:
+        keys = [sort, 'id']
+        clauses.append(f"f.{sort} IS NOT NULL")
+        if after is not None:
+            clauses.append(f"(f.{sort}, f.id) {op} (:after_key, :after_id)")
+            params['after_key'], params['after_id'] = after
+    params['limit'] = limit
+    columns = ', '.join(f'v.{c}' for c in EXPLORER_COLUMNS)
+    sql = (
+        f"SELECT {columns} FROM ("
+        f"  SELECT f.id FROM {FACT_TABLE} f"
+        f"  WHERE {' AND '.join(clauses)}"
+        f"  ORDER BY {', '.join(f'f.{k} {direction}' for k in keys)} LIMIT :limit"
+        f") p JOIN {SOURCE_VIEW} v ON v.id = p.id "
+        f"ORDER BY {', '.join(f'v.{k} {direction}' for k in keys)}"
+    )
+    return sql, params
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def explore_page(version: int, filters: dict, sort: str, descending: bool,
+                 after: tuple = None, page_size: int = EXPLORER_PAGE_SIZE) -> pd.DataFrame:
+    """
+    Une page de l'explorateur (page_size + 1 lignes au plus).
+
+    La ligne supplémentaire indique qu'une page suivante existe ; seules
+    les lignes de la page sont lues.
+    """
+    sql, params = keyset_query(filters, sort, descending, after, page_size + 1)
+    return run_query(sql, **params)
+
+
+def page_cursor(row: pd.Series, sort: str) -> tuple:
+    """Curseur (clé de tri, id) d'une ligne, en types Python natifs (paramètres SQL)."""
+    key = row[sort]
+    if hasattr(key, 'item'):
+        key = key.item()
+    return key, int(row['id'])
+
+
+# ============================================================================
+# RECHERCHE PLEIN TEXTE (designation_des_ensembles)
+# MySQL : index FULLTEXT ft_immob_designation, classement par MATCH ... AGAINST.
+# Autre moteur : index inversé en mémoire (search.InvertedIndex).
+# ============================================================================
+
+SEARCH_LIMIT = 50
+
+SEARCH_COLUMNS = ['id', 'ndeg_immobilisation', 'collectivite', 'nature', 'date_d_acquisition',
+                  'designation_des_ensembles', 'valeur_d_acquisition']
+
+
+@st.cache_resource(max_entries=1, show_spinner="Indexation des désignations...")
+def designation_index(version: int) -> search.InvertedIndex:
+    """Index inversé des désignations visibles (une construction par version)."""
+    with get_engine().connect() as conn:
+        rows = conn.execute(text(f"SELECT id, designation_des_ensembles FROM {SOURCE_VIEW}"))
+        return search.InvertedIndex((row.id, row.designation_des_ensembles) for row in rows)
+
+
+def _fulltext_search(terms: list, limit: int) -> pd.DataFrame:
+    """Recherche par l'index FULLTEXT de la table de faits (dernier run validé)."""
+    columns = ', '.join(f'v.{c}' for c in SEARCH_COLUMNS)
+    return run_query(
+        f"SELECT {columns}, m.score FROM ("
+        f"  SELECT f.id, MATCH(f.designation_des_ensembles) AGAINST (:q IN BOOLEAN MODE) AS score"
+        f"  FROM {FACT_TABLE} f"
+        f"  WHERE MATCH(f.designation_des_ensembles) AGAINST (:q IN BOOLEAN MODE)"
+        f"  AND {VISIBLE_ROWS}"
+        f"  ORDER BY score DESC, f.id LIMIT :limit"
+        f") m JOIN {SOURCE_VIEW} v ON v.id = m.id ORDER BY m.score DESC, v.id",
+        q=search.boolean_query(terms), limit=limit,
+    )
+
+
+def _index_search(version: int, terms: list, limit: int) -> pd.DataFrame:
+    """Recherche par l'index inversé, puis lecture des lignes trouvées par clé primaire."""
+    ranked = designation_index(version).search(terms, limit)
+    if not ranked:
+        return pd.DataFrame(columns=SEARCH_COLUMNS + ['score'])
+    ids = [doc_id for doc_id, _ in ranked]
+    placeholders = ', '.join(f':id{i}' for i in range(len(ids)))
+    df = run_query(
+        f"SELECT {', '.join(SEARCH_COLUMNS)} FROM {SOURCE_VIEW} WHERE id IN ({placeholders})",
+        **{f'id{i}': doc_id for i, doc_id in enumerate(ids)},
+    )
+    df['score'] = df['id'].map(dict(ranked))
+    return df.sort_values(['score', 'id'], ascending=[False, True], ignore_index=True)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def search_designations(version: int, query: str, limit: int = SEARCH_LIMIT) -> pd.DataFrame:
+    """
+    Immobilisations dont la désignation contient tous les termes de `query`.
+
+    Les termes sont cherchés par préfixe, sans tenir compte des accents ni
+    de la casse ; les résultats sont classés par pertinence décroissante.
+
+    Args:
+        version: Version des données (clé de cache)
+        query: Texte saisi
+        limit: Nombre maximal de résultats
+
+    Returns:
+        DataFrame des lignes trouvées (colonne `score` : pertinence)
+    """
+    terms = search.query_terms(query)
+    if not terms:
+        return pd.DataFrame(columns=SEARCH_COLUMNS + ['score'])
+    if get_engine().dialect.name == 'mysql':
+        return _fulltext_search(terms, limit)
+    return _index_search(version, terms, limit)
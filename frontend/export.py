@@ -0,0 +1,229 @@
+"""Export des lignes filtrées (CSV, Parquet) sans matérialisation complète.
+
+Les lignes sont lues par un curseur côté serveur (stream_results : MySQL
+envoie le résultat au fil de la lecture) par tranches de
+EXPORT_CHUNK_ROWS lignes. Chaque tranche est encodée puis écrite dans un
+fichier sur disque, sous le dossier statique de Streamlit
+(server.enableStaticServing) : le navigateur le télécharge par son URL,
+servie par morceaux, sans que le fichier passe par la mémoire de la
+session. Seule une tranche de lignes est vivante à la fois. Le nom du
+fichier est aléatoire ; les fichiers plus anciens que EXPORT_TTL_S sont
+supprimés au fil des exports.
+
+Les montants sont exportés en décimaux exacts (DECIMAL(14,2)), sans
+passage par des flottants.
+"""
+import os
+import time
+import secrets
+from decimal import Decimal
+from typing import Callable, Iterator, Optional
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import text
+import db
+
+EXPORT_CHUNK_ROWS = int(os.getenv('FRONTEND_EXPORT_CHUNK_ROWS', 10000))
+# Taille maximale (Mo) d'un fichier d'export (espace disque)
+EXPORT_MAX_MB = int(os.getenv('FRONTEND_EXPORT_MAX_MB', 2048))
+# Dossier des exports, servi par Streamlit sous EXPORT_URL
+EXPORT_DIR = os.getenv(
+    'FRONTEND_EXPORT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'exports')
+)
+EXPORT_URL = 'app/static/exports'
+# Durée de vie (secondes) d'un fichier d'export sur disque
+EXPORT_TTL_S = int(os.getenv('FRONTEND_EXPORT_TTL_S', 3600))
+
+
+class ExportTooLarge(Exception):
+    """Fichier d'export au-delà de EXPORT_MAX_MB : filtres à resserrer."""
+
+_money = pa.decimal128(14, 2)
+
+# Colonnes exportées et leur type Parquet (schéma fixe : une tranche dont une
+# colonne est entièrement NULL garde le type des autres tranches)
+EXPORT_SCHEMA = pa.schema([
+    ('id', pa.int64()),
+    ('ndeg_immobilisation', pa.string()),
+    ('publication', pa.string()),
+    ('collectivite', pa.string()),
+    ('nature', pa.string()),
+    ('date_d_acquisition', pa.date32()),
+    ('designation_des_ensembles', pa.string()),
+    ('valeur_d_acquisition', _money),
+    ('duree_amort', pa.int32()),
+    ('cumul_amort_anterieurs', _money),
+    ('vnc_debut_exercice', _money),
+    ('amort_exercice', _money),
+    ('vnc_fin_exercice', _money),
+    ('taux_amortissement', pa.decimal128(12, 6)),
+    ('amortissement_total', _money),
+    ('pct_valeur_restante', pa.decimal128(6, 2)),
+])
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def export_query(filters: dict) -> tuple:
+    """
+    Requête d'export des lignes filtrées (filtres de l'explorateur), par id.
+
+    Returns:
+        Tuple (requête SQL, paramètres)
+    """
+    clauses, params = db.filter_clauses(filters)
+    where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+    sql = f"SELECT {', '.join(EXPORT_SCHEMA.names)} FROM {db.SOURCE_VIEW} {where}ORDER BY id"
+    return sql, params
+
+
+def iter_chunks(engine, sql: str, params: dict,
+                chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Lit le résultat d'une requête par tranches, via un curseur côté serveur.
+
+    Yields:
+        DataFrame de `chunk_rows` lignes au plus (DECIMAL conservés en Decimal)
+    """
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True, max_row_buffer=chunk_rows)
+        yield from pd.read_sql(text(sql), conn, params=params, chunksize=chunk_rows, coerce_float=False)
+
+
+def _to_decimal(scale: int) -> Callable:
+    exponent = Decimal(1).scaleb(-scale)
+
+    def convert(value):
+        if value is None or value != value:
+            return None
+        return Decimal(str(value)).quantize(exponent)
+    return convert
+
+
+def _normalize(chunk: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aligne une tranche sur EXPORT_SCHEMA : dates en datetime.date, montants
+    en Decimal à l'échelle de la colonne (une base locale les rend en float).
+    """
+    dates = pd.to_datetime(chunk['date_d_acquisition'], errors='coerce')
+    chunk['date_d_acquisition'] = dates.dt.date.astype(object).where(dates.notna(), None)
+    for field in EXPORT_SCHEMA:
+        if pa.types.is_decimal(field.type):
+            chunk[field.name] = chunk[field.name].map(_to_decimal(field.type.scale))
+    return chunk
+
+
+def write_csv(chunks: Iterator[pd.DataFrame], out) -> int:
+    """Encode les tranches en CSV UTF-8 (en-tête une fois). Retourne le nombre de lignes."""
+    rows = 0
+    header = True
+    for chunk in chunks:
+        out.write(_normalize(chunk).to_csv(index=False, header=header).encode('utf-8'))
+        header = False
+        rows += len(chunk)
+    if header:
+        out.write((','.join(EXPORT_SCHEMA.names) + '\n').encode('utf-8'))
+    return rows
+
+
+def write_parquet(chunks: Iterator[pd.DataFrame], out) -> int:
+    """Encode les tranches en Parquet (un groupe de lignes par tranche). Retourne le nombre de lignes."""
+    rows = 0
+    with pq.ParquetWriter(out, EXPORT_SCHEMA, compression='zstd') as writer:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(_normalize(chunk), schema=EXPORT_SCHEMA, preserve_index=False)
+            writer.write_table(table)
+            rows += len(chunk)
+    return rows
+
+
+WRITERS = {'csv': write_csv, 'parquet': write_parquet}
+
+
+def export_url(path: str) -> str:
+    """URL relative (servie par Streamlit) d'un fichier d'export."""
+    return f'{EXPORT_URL}/{os.path.basename(path)}'
+
+
+def remove_export(path: Optional[str]) -> None:
+    """Supprime un fichier d'export (déjà supprimé : ignoré)."""
+    if path is None:
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def purge_exports(directory: str = EXPORT_DIR, max_age_s: int = EXPORT_TTL_S) -> int:
+    """
+    Supprime les exports plus anciens que `max_age_s` (sessions fermées
+    sans avoir libéré leur fichier).
+
+    Returns:
+        Nombre de fichiers supprimés
+    """
+    if not os.path.isdir(directory):
+        return 0
+    limit = time.time() - max_age_s
+    removed = 0
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.stat().st_mtime < limit:
+            remove_export(entry.path)
+            removed += 1
+    return removed
+
+
+def export_rows(filters: dict, fmt: str, engine=None,
+                on_progress: Optional[Callable[[int], None]] = None,
+                max_mb: int = EXPORT_MAX_MB, directory: str = EXPORT_DIR) -> tuple:
+    """
+    Exporte les lignes filtrées dans un fichier de `directory`.
+
+    Le fichier est écrit sous un nom temporaire (`.part`) puis renommé :
+    un export interrompu n'est jamais servi.
+
+    Args:
+        filters: Filtres de l'explorateur (db.filter_clauses)
+        fmt: 'csv' ou 'parquet'
+        engine: Moteur SQLAlchemy (défaut: moteur partagé)
+        on_progress: Appelé avec le nombre de lignes encodées après chaque tranche
+        max_mb: Taille maximale du fichier produit (Mo)
+        directory: Dossier des exports (défaut: dossier statique de Streamlit)
+
+    Returns:
+        Tuple (chemin du fichier, nombre de lignes)
+
+    Raises:
+        ExportTooLarge: si le fichier dépasse `max_mb` (lecture interrompue)
+    """
+    engine = db.get_engine() if engine is None else engine
+    sql, params = export_query(filters)
+    os.makedirs(directory, exist_ok=True)
+    purge_exports(directory)
+    path = os.path.join(directory, f'{secrets.token_urlsafe(16)}.{FORMATS[fmt][1]}')
+    partial = f'{path}.part'
+
+    def tracked(chunks):
+        done = 0
+        for chunk in chunks:
+            yield chunk
+            done += len(chunk)
+            # taille de ce qui est déjà encodé (tranche précédente comprise)
+            if out.tell() > max_mb * 1024 * 1024:
+                raise ExportTooLarge(f'Export larger than {max_mb} MB after {done:,} rows')
+            if on_progress is not None:
+                on_progress(done)
+
+    try:
+        with open(partial, 'wb') as out:
+            rows = WRITERS[fmt](tracked(iter_chunks(engine, sql, params)), out)
+        os.replace(partial, path)
+    except BaseException:
+        remove_export(partial)
+        raise
+    return path, rows
@@ -0,0 +1,217 @@
+"""Manifeste des images de dashboards.
+
+Le catalogue (titres et descriptions des exports Superset) est complété,
+une seule fois à la construction de l'image Docker, par les métadonnées
+de chaque fichier : taille, dimensions, empreinte SHA-256 et date de
+modification. Le résultat est écrit dans MANIFEST_PATH (JSON).
+
+Une image du catalogue absente fait échouer la construction. Les pages lisent
+le manifeste via load_manifest() : une lecture par processus (relue
+seulement si le fichier change), sans parcours des répertoires.
+
+Construction :
+    python manifest.py
+"""
+import os
+import sys
+import json
+import hashlib
+import logging
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_ROOT = Path(__file__).parent / "Dashboards"
+MANIFEST_PATH = Path(os.getenv('FRONTEND_MANIFEST', DASHBOARD_ROOT / "manifest.json"))
+
+MANIFEST_FORMAT = 1
+
+# Catalogue des exports Superset (ordre d'affichage des graphiques)
+CATALOG: Dict[str, dict] = {
+    "VUE EXÉCUTIVE": {
+        "icon": "👁️",
+        "color": "#667eea",
+        "description": "Vue d'ensemble stratégique des actifs immobilisés",
+        "charts": [
+            {
+                "title": "Dashboard Complet",
+                "file": "VUE EXÉCUTIVE dashboard.jpg",
+                "description": "Vue d'ensemble complète du tableau de bord"
+            },
+            {
+                "title": "Nombre Total d'Actifs",
+                "file": "nombre-total-d-actifs.jpg",
+                "description": "Compteur du nombre total d'immobilisations"
+            },
+            {
+                "title": "Acquisitions par Année",
+                "file": "totale-d-acquisition-par-annee.jpg",
+                "description": "Évolution des acquisitions au fil des années"
+            },
+            {
+                "title": "Répartition par Nature",
+                "file": "repartition-par-nature.jpg",
+                "description": "Distribution des actifs selon leur nature"
+            },
+            {
+                "title": "Top 10 par Valeur",
+                "file": "top-10-immobilisations-par-valeur.jpg",
+                "description": "Les 10 immobilisations les plus valorisées"
+            },
+            {
+                "title": "Valeur par Collectivité",
+                "file": "valleur-dacquisition-par-collectivite.jpg",
+                "description": "Répartition de la valeur d'acquisition par collectivité"
+            }
+        ]
+    },
+    "ANALYSE TEMPORELLE": {
+        "icon": "📅",
+        "color": "#764ba2",
+        "description": "Évolution temporelle et analyse des tendances",
+        "charts": [
+            {
+                "title": "Dashboard Complet",
+                "file": "ANALYSE TEMPORELLE dashboard.jpg",
+                "description": "Vue d'ensemble complète du tableau de bord"
+            },
+            {
+                "title": "Acquisitions par Année",
+                "file": "acquisitions-par-annee.jpg",
+                "description": "Évolution annuelle des acquisitions"
+            },
+            {
+                "title": "Acquisitions par Trimestre",
+                "file": "acquisitions-par-trimestre.jpg",
+                "description": "Répartition trimestrielle des acquisitions"
+            },
+            {
+                "title": "Acquisitions par Mois",
+                "file": "nombre-dacquisitions-par-mois-annee.jpg",
+                "description": "Distribution mensuelle des acquisitions par année"
+            },
+            {
+                "title": "Amortissement Cumulé",
+                "file": "amortissement-cumule.jpg",
+                "description": "Évolution de l'amortissement cumulé"
+            }
+        ]
+    },
+}
+
+
+class ManifestError(Exception):
+    """Image du catalogue absente ou illisible."""
+
+
+def _describe(path: Path) -> dict:
+    """Métadonnées d'une image : taille, dimensions, empreinte, date de modification."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    with Image.open(path) as img:
+        width, height = img.size
+    stat = path.stat()
+    return {
+        'bytes': stat.st_size,
+        'width': width,
+        'height': height,
+        'sha256': digest.hexdigest(),
+        'mtime': datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(timespec='seconds'),
+    }
+
+
+def build_manifest(root: Path = DASHBOARD_ROOT, catalog: Dict[str, dict] = CATALOG) -> dict:
+    """
+    Construit le manifeste à partir du catalogue et des fichiers de `root`.
+
+    Args:
+        root: Répertoire des exports (un sous-répertoire par dashboard)
+        catalog: Titres et fichiers attendus par dashboard
+
+    Returns:
+        Manifeste (dictionnaire sérialisable en JSON)
+
+    Raises:
+        ManifestError: une ou plusieurs images du catalogue sont absentes ou illisibles
+    """
+    problems: List[str] = []
+    dashboards = {}
+    for name, info in catalog.items():
+        charts = []
+        for chart in info['charts']:
+            path = root / name / chart['file']
+            try:
+                meta = _describe(path)
+            except (OSError, Image.UnidentifiedImageError) as e:
+                problems.append(f"{name}/{chart['file']}: {e}")
+                continue
+            charts.append({**chart, 'path': f"{name}/{chart['file']}", **meta})
+        dashboards[name] = {**info, 'charts': charts}
+    if problems:
+        raise ManifestError('Invalid dashboard images:\n' + '\n'.join(problems))
+    return {
+        'format': MANIFEST_FORMAT,
+        'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'dashboards': dashboards,
+    }
+
+
+def write_manifest(manifest: dict, path: Path = MANIFEST_PATH) -> None:
+    """Écrit le manifeste (fichier temporaire renommé : jamais de lecture partielle)."""
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding='utf-8')
+    os.replace(tmp, path)
+
+
+@lru_cache(maxsize=1)
+def _read_manifest(path: str, mtime_ns: int) -> dict:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_manifest(path: Path = MANIFEST_PATH) -> dict:
+    """
+    Manifeste des images, lu une fois par processus (relu si le fichier change).
+
+    Hors image Docker (manifeste jamais construit), il est construit puis
+    écrit au premier appel.
+
+    Returns:
+        Manifeste des dashboards
+    """
+    try:
+        mtime_ns = path.stat().st_mtime_ns
+    except FileNotFoundError:
+        logger.warning('Manifest %s not found - building it now', path)
+        write_manifest(build_manifest(), path)
+        mtime_ns = path.stat().st_mtime_ns
+    return _read_manifest(str(path), mtime_ns)
+
+
+def dashboard(name: str) -> dict:
+    """Entrée du manifeste d'un dashboard (icône, couleur, description, graphiques)."""
+    return load_manifest()['dashboards'][name]
+
+
+def asset_path(chart: dict, root: Path = DASHBOARD_ROOT) -> Path:
+    """Chemin de l'image d'une entrée du manifeste."""
+    return root / chart['path']
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    try:
+        built = build_manifest()
+    except ManifestError as e:
+        logger.error('%s', e)
+        sys.exit(1)
+    write_manifest(built)
+    count = sum(len(d['charts']) for d in built['dashboards'].values())
+    logger.info('Wrote manifest of %s images to %s', count, MANIFEST_PATH)
+    sys.exit(0)
@@ -1,6 +1,7 @@
 import streamlit as st
-from PIL import Image
-from pathlib import Path
+import assets
+import db
+import manifest
 
 # Configuration de la page
 st.set_page_config(
@@ -110,60 +111,58 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Chemin vers les dashboards
-DASHBOARD_DIR = Path(__file__).parent.parent / "Dashboards" / "VUE EXÉCUTIVE"
+# Informations sur le dashboard (manifeste construit avec l'image Docker)
+DASHBOARD_INFO = manifest.dashboard("VUE EXÉCUTIVE")
+DASHBOARD_CHART = DASHBOARD_INFO['charts'][0]
 
-# Informations sur le dashboard
-DASHBOARD_INFO = {
-    "icon": "👁️",
-    "color": "#667eea",
-    "description": "Vue d'ensemble stratégique des actifs immobilisés",
-    "charts": [
-        {
-            "title": "Dashboard Complet",
-            "file": "VUE EXÉCUTIVE dashboard.jpg",
-            "description": "Vue d'ensemble complète du tableau de bord"
-        },
-        {
-            "title": "Nombre Total d'Actifs",
-            "file": "nombre-total-d-actifs.jpg",
-            "description": "Compteur du nombre total d'immobilisations"
-        },
-        {
-            "title": "Acquisitions par Année",
-            "file": "totale-d-acquisition-par-annee.jpg",
-            "description": "Évolution des acquisitions au fil des années"
-        },
-        {
-            "title": "Répartition par Nature",
-            "file": "repartition-par-nature.jpg",
-            "description": "Distribution des actifs selon leur nature"
-        },
-        {
-            "title": "Top 10 par Valeur",
-            "file": "top-10-immobilisations-par-valeur.jpg",
-            "description": "Les 10 immobilisations les plus valorisées"
-        },
-        {
-            "title": "Valeur par Collectivité",
-            "file": "valleur-dacquisition-par-collectivite.jpg",
-            "description": "Répartition de la valeur d'acquisition par collectivité"
-        }
-    ]
-}
-
-def load_image(image_path):
-    """Charge une image avec gestion d'erreur"""
+def load_image(chart, variant='display'):
+    """Charge l'image d'un graphique du manifeste (variante WebP en cache)"""
     try:
-        if image_path.exists():
-            return Image.open(image_path)
-        else:
-            st.error(f"Image non trouvée: {image_path.name}")
-            return None
+        return assets.get_bytes(manifest.asset_path(chart), variant)
     except Exception as e:
         st.error(f"Erreur lors du chargement de l'image: {e}")
         return None
 
+def describe_asset(chart):
+    """Fichier, dimensions et taille d'une image (métadonnées du manifeste)"""
+    return f"📄 {chart['file']} · {chart['width']}×{chart['height']} px · {chart['bytes'] / 1024:.0f} Ko"
+
+def format_euros(value):
+    """Formate un montant en euros (séparateur de milliers : espace)"""
+    if value is None or value != value:
+        return "-"
+    return f"{value:,.0f} €".replace(",", " ")
+
+def render_live():
+    """Affiche les indicateurs calculés sur MySQL (agrégats en cache)"""
+    version = db.data_version()
+    totals = db.kpi_totals(version).iloc[0]
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("🏢 Nombre Total d'Actifs", f"{int(totals['nb_actifs']):,}".replace(",", " "))
+    col2.metric("💶 Valeur d'Acquisition", format_euros(totals['valeur_totale']))
+    col3.metric("📉 Amortissement Total", format_euros(totals['amortissement_total']))
+    col4.metric("📘 VNC Fin d'Exercice", format_euros(totals['vnc_totale']))
+
+    tabs = st.tabs([chart['title'] for chart in DASHBOARD_INFO['charts'][2:]])
+
+    with tabs[0]:
+        df = db.acquisitions_by_year(version)
+        st.bar_chart(df, x="annee", y="valeur_acquisition")
+        st.caption(f"{int(df['nb_acquisitions'].sum()):,} acquisitions datées".replace(",", " "))
+
+    with tabs[1]:
+        df = db.breakdown_by_nature(version)
+        st.bar_chart(df, x="nature", y="nb_actifs")
+
+    with tabs[2]:
+        st.dataframe(db.top_assets(version), use_container_width=True, hide_index=True)
+
+    with tabs[3]:
+        df = db.value_by_collectivite(version)
+        st.bar_chart(df, x="collectivite", y="valeur_acquisition")
+
+    st.caption(f"🔄 Version des données : {version} (recalcul après chaque run ETL)")
+
 # Header
 st.markdown(f"""
 <div class="dashboard-header">
@@ -175,30 +174,35 @@ st.markdown(f"""
 # Mode d'affichage
 view_mode = st.radio(
     "Mode d'affichage",
-    ["📊 Dashboard Complet", "📈 Graphiques Détaillés"],
+    ["⚡ Données en Direct", "📊 Dashboard Complet", "📈 Graphiques Détaillés"],
     horizontal=True,
     help="Choisissez le mode de visualisation"
 )
 
 st.markdown("---")
 
-if view_mode == "📊 Dashboard Complet":
+if view_mode == "⚡ Données en Direct":
+    try:
+        render_live()
+    except Exception as e:
+        st.error(f"Base de données indisponible : {e}")
+        st.info("Les exports Superset restent consultables via les autres modes d'affichage.")
+
+elif view_mode == "📊 Dashboard Complet":
     # Affichage du dashboard complet
-    dashboard_file = DASHBOARD_DIR / "VUE EXÉCUTIVE dashboard.jpg"
-    dashboard_img = load_image(dashboard_file)
+    dashboard_img = load_image(DASHBOARD_CHART)
     
     if dashboard_img:
         st.markdown("### 📊 Vue d'Ensemble")
         st.image(dashboard_img, use_column_width=True)
         
         # Bouton de téléchargement
-        with open(dashboard_file, "rb") as file:
-            btn = st.download_button(
-                label="📥 Télécharger le Dashboard",
-                data=file,
-                file_name="vue_executive_dashboard.jpg",
-                mime="image/jpeg"
-            )
+        btn = st.download_button(
+            label="📥 Télécharger le Dashboard",
+            data=assets.get_bytes(manifest.asset_path(DASHBOARD_CHART), assets.ORIGINAL),
+            file_name="vue_executive_dashboard.jpg",
+            mime="image/jpeg"
+        )
     else:
         st.warning("Le dashboard complet n'est pas disponible actuellement.")
 
@@ -207,14 +211,13 @@ else:
     st.markdown("### 📈 Graphiques Détaillés")
     
     # Créer les onglets pour chaque graphique (sauf le dashboard complet)
-    chart_list = [chart for chart in DASHBOARD_INFO['charts'] if chart['title'] != "Dashboard Complet"]
+    chart_list = DASHBOARD_INFO['charts'][1:]
     tab_names = [chart['title'] for chart in chart_list]
     tabs = st.tabs(tab_names)
     
     for tab, chart in zip(tabs, chart_list):
         with tab:
-            chart_file = DASHBOARD_DIR / chart['file']
-            chart_img = load_image(chart_file)
+            chart_img = load_image(chart)
             
             if chart_img:
                 st.markdown(f"""
@@ -229,16 +232,15 @@ else:
                 # Informations sur l'image
                 col1, col2 = st.columns([3, 1])
                 with col1:
-                    st.caption(f"📄 {chart['file']}")
+                    st.caption(describe_asset(chart))
                 with col2:
-                    with open(chart_file, "rb") as file:
-                        st.download_button(
-                            label="📥 Télécharger",
-                            data=file,
-                            file_name=chart['file'],
-                            mime="image/jpeg",
-                            key=f"download_{chart['file']}"
-                        )
+                    st.download_button(
+                        label="📥 Télécharger",
+                        data=assets.get_bytes(manifest.asset_path(chart), assets.ORIGINAL),
+                        file_name=chart['file'],
+                        mime="image/jpeg",
+                        key=f"download_{chart['file']}"
+                    )
             else:
                 st.warning(f"Le graphique '{chart['title']}' n'est pas disponible actuellement.")
 
@@ -261,10 +263,10 @@ with col1:
 with col2:
     st.success("""
     **Sources de données :**
-    - Base de données : `immobilisations_amortissements`
+    - Base de données : `immobilisations_amortissements` (runs ETL validés)
     - Période couverte : Historique complet
-    - Mise à jour : Temps réel
-    - Exports disponibles : JPEG, PDF
+    - Mise à jour : après chaque run ETL (cache des agrégats)
+    - Exports Superset : JPEG
     """)
 
 # Footer
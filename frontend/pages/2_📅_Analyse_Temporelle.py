@@ -1,6 +1,7 @@
 import streamlit as st
-from PIL import Image
-from pathlib import Path
+import assets
+import db
+import manifest
 
 # Configuration de la page
 st.set_page_config(
@@ -110,55 +111,60 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Chemin vers les dashboards
-DASHBOARD_DIR = Path(__file__).parent.parent / "Dashboards" / "ANALYSE TEMPORELLE"
+# Informations sur le dashboard (manifeste construit avec l'image Docker)
+DASHBOARD_INFO = manifest.dashboard("ANALYSE TEMPORELLE")
+DASHBOARD_CHART = DASHBOARD_INFO['charts'][0]
 
-# Informations sur le dashboard
-DASHBOARD_INFO = {
-    "icon": "📅",
-    "color": "#764ba2",
-    "description": "Évolution temporelle et analyse des tendances",
-    "charts": [
-        {
-            "title": "Dashboard Complet",
-            "file": "ANALYSE TEMPORELLE dashboard.jpg",
-            "description": "Vue d'ensemble complète du tableau de bord"
-        },
-        {
-            "title": "Acquisitions par Année",
-            "file": "acquisitions-par-annee.jpg",
-            "description": "Évolution annuelle des acquisitions"
-        },
-        {
-            "title": "Acquisitions par Trimestre",
-            "file": "acquisitions-par-trimestre.jpg",
-            "description": "Répartition trimestrielle des acquisitions"
-        },
-        {
-            "title": "Acquisitions par Mois",
-            "file": "nombre-dacquisitions-par-mois-annee.jpg",
-            "description": "Distribution mensuelle des acquisitions par année"
-        },
-        {
-            "title": "Amortissement Cumulé",
-            "file": "amortissement-cumule.jpg",
-            "description": "Évolution de l'amortissement cumulé"
-        }
-    ]
-}
-
-def load_image(image_path):
-    """Charge une image avec gestion d'erreur"""
+def load_image(chart, variant='display'):
+    """Charge l'image d'un graphique du manifeste (variante WebP en cache)"""
     try:
-        if image_path.exists():
-            return Image.open(image_path)
-        else:
-            st.error(f"Image non trouvée: {image_path.name}")
-            return None
+        return assets.get_bytes(manifest.asset_path(chart), variant)
     except Exception as e:
         st.error(f"Erreur lors du chargement de l'image: {e}")
         return None
 
+def describe_asset(chart):
+    """Fichier, dimensions et taille d'une image (métadonnées du manifeste)"""
+    return f"📄 {chart['file']} · {chart['width']}×{chart['height']} px · {chart['bytes'] / 1024:.0f} Ko"
+
+MONTHS = ["Jan", "Fév", "Mar", "Avr", "Mai", "Juin", "Juil", "Août", "Sep", "Oct", "Nov", "Déc"]
+
+def render_live():
+    """Affiche les séries temporelles calculées sur MySQL (agrégats en cache)"""
+    version = db.data_version()
+    tabs = st.tabs([chart['title'] for chart in DASHBOARD_INFO['charts'][1:]])
+
+    with tabs[0]:
+        df = db.acquisitions_by_year(version)
+        st.bar_chart(df, x="annee", y="nb_acquisitions")
+        st.line_chart(df, x="annee", y="valeur_acquisition")
+
+    with tabs[1]:
+        df = db.acquisitions_by_quarter(version)
+        pivot = df.pivot(index="annee", columns="trimestre", values="nb_acquisitions").fillna(0)
+        pivot.columns = [f"T{int(q)}" for q in pivot.columns]
+        st.bar_chart(pivot)
+
+    with tabs[2]:
+        df = db.acquisitions_by_month(version)
+        years = sorted(df["annee"].unique(), reverse=True)
+        selected = st.multiselect("Années", years, default=years[:3])
+        pivot = (
+            df[df["annee"].isin(selected)]
+            .pivot(index="mois", columns="annee", values="nb_acquisitions")
+            .reindex(range(1, 13))
+            .fillna(0)
+        )
+        pivot.index = MONTHS
+        pivot.columns = [str(int(year)) for year in pivot.columns]
+        st.line_chart(pivot)
+
+    with tabs[3]:
+        df = db.cumulative_depreciation(version)
+        st.area_chart(df, x="annee", y=["valeur_cumulee", "amortissement_cumule"])
+
+    st.caption(f"🔄 Version des données : {version} (recalcul après chaque run ETL)")
+
 # Header
 st.markdown(f"""
 <div class="dashboard-header">
@@ -170,30 +176,35 @@ st.markdown(f"""
 # Mode d'affichage
 view_mode = st.radio(
     "Mode d'affichage",
-    ["📊 Dashboard Complet", "📈 Graphiques Détaillés"],
+    ["⚡ Données en Direct", "📊 Dashboard Complet", "📈 Graphiques Détaillés"],
     horizontal=True,
     help="Choisissez le mode de visualisation"
 )
 
 st.markdown("---")
 
-if view_mode == "📊 Dashboard Complet":
+if view_mode == "⚡ Données en Direct":
+    try:
+        render_live()
+    except Exception as e:
+        st.error(f"Base de données indisponible : {e}")
+        st.info("Les exports Superset restent consultables via les autres modes d'affichage.")
+
+elif view_mode == "📊 Dashboard Complet":
     # Affichage du dashboard complet
-    dashboard_file = DASHBOARD_DIR / "ANALYSE TEMPORELLE dashboard.jpg"
-    dashboard_img = load_image(dashboard_file)
+    dashboard_img = load_image(DASHBOARD_CHART)
     
     if dashboard_img:
         st.markdown("### 📊 Vue d'Ensemble")
         st.image(dashboard_img, use_column_width=True)
         
         # Bouton de téléchargement
-        with open(dashboard_file, "rb") as file:
-            btn = st.download_button(
-                label="📥 Télécharger le Dashboard",
-                data=file,
-                file_name="analyse_temporelle_dashboard.jpg",
-                mime="image/jpeg"
-            )
+        btn = st.download_button(
+            label="📥 Télécharger le Dashboard",
+            data=assets.get_bytes(manifest.asset_path(DASHBOARD_CHART), assets.ORIGINAL),
+            file_name="analyse_temporelle_dashboard.jpg",
+            mime="image/jpeg"
+        )
     else:
         st.warning("Le dashboard complet n'est pas disponible actuellement.")
 
@@ -202,14 +213,13 @@ elif view_mode == "📈 Graphiques Détaillés":
     st.markdown("### 📈 Graphiques Détaillés")
     
     # Créer les onglets pour chaque graphique (sauf le dashboard complet)
-    chart_list = [chart for chart in DASHBOARD_INFO['charts'] if chart['title'] != "Dashboard Complet"]
+    chart_list = DASHBOARD_INFO['charts'][1:]
     tab_names = [chart['title'] for chart in chart_list]
     tabs = st.tabs(tab_names)
     
     for tab, chart in zip(tabs, chart_list):
         with tab:
-            chart_file = DASHBOARD_DIR / chart['file']
-            chart_img = load_image(chart_file)
+            chart_img = load_image(chart)
             
             if chart_img:
                 st.markdown(f"""
@@ -224,16 +234,15 @@ elif view_mode == "📈 Graphiques Détaillés":
                 # Informations sur l'image
                 col1, col2 = st.columns([3, 1])
                 with col1:
-                    st.caption(f"📄 {chart['file']}")
+                    st.caption(describe_asset(chart))
                 with col2:
-                    with open(chart_file, "rb") as file:
-                        st.download_button(
-                            label="📥 Télécharger",
-                            data=file,
-                            file_name=chart['file'],
-                            mime="image/jpeg",
-                            key=f"download_{chart['file']}"
-                        )
+                    st.download_button(
+                        label="📥 Télécharger",
+                        data=assets.get_bytes(manifest.asset_path(chart), assets.ORIGINAL),
+                        file_name=chart['file'],
+                        mime="image/jpeg",
+                        key=f"download_{chart['file']}"
+                    )
             else:
                 st.warning(f"Le graphique '{chart['title']}' n'est pas disponible actuellement.")
 
@@ -258,6 +267,7 @@ with col1:
 with col2:
     st.success("""
     **Formats disponibles :**
+    - Données en direct (MySQL, mises à jour après chaque run ETL)
     - Images haute résolution (JPEG)
     - Dashboard complet
     - Graphiques individuels
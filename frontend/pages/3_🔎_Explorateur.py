@@ -0,0 +1,282 @@
+import os
+import streamlit as st
+import db
+import export
+import search
+import snapshot
+
+# Configuration de la page
+st.set_page_config(
+    page_title="Explorateur - Immobilisations",
+    page_icon="🔎",
+    layout="wide"
+)
+
+# CSS personnalisé
+st.markdown("""
+<style>
+    @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;600;700&display=swap');
+
+    * {
+        font-family: 'Inter', sans-serif;
+    }
+
+    .main {
+        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    }
+
+    [data-testid="stSidebar"] {
+        background: linear-gradient(180deg, #1e3a8a 0%, #1e40af 100%);
+        box-shadow: 4px 0 20px rgba(0,0,0,0.1);
+    }
+
+    [data-testid="stSidebar"] h1, [data-testid="stSidebar"] h2, [data-testid="stSidebar"] h3 {
+        color: white !important;
+    }
+
+    [data-testid="stSidebar"] label, [data-testid="stSidebar"] p {
+        color: #e0e7ff !important;
+    }
+
+    .dashboard-header {
+        background: white;
+        border-radius: 20px;
+        padding: 2rem;
+        margin-bottom: 2rem;
+        box-shadow: 0 10px 40px rgba(0,0,0,0.1);
+        border-left: 6px solid #0ea5e9;
+    }
+
+    .dashboard-header h1 {
+        color: #1e293b !important;
+        font-size: 2.5rem;
+        margin: 0;
+    }
+
+    .dashboard-header p {
+        color: #64748b !important;
+    }
+
+    .result-card {
+        background: white;
+        border-radius: 12px;
+        padding: 0.8rem 1.2rem;
+        margin-bottom: 0.6rem;
+        box-shadow: 0 2px 10px rgba(0,0,0,0.05);
+    }
+
+    .result-card p {
+        margin: 0;
+    }
+
+    .result-title {
+        color: #1e293b !important;
+        font-weight: 600;
+    }
+
+    .result-meta {
+        color: #64748b !important;
+        font-size: 0.85rem;
+    }
+
+    .result-card mark {
+        background: #fde68a;
+        padding: 0 2px;
+        border-radius: 3px;
+    }
+
+    h3, h4 {
+        color: white !important;
+        background: rgba(255, 255, 255, 0.15);
+        padding: 0.8rem 1.2rem;
+        border-radius: 10px;
+        backdrop-filter: blur(10px);
+        box-shadow: 0 4px 15px rgba(0,0,0,0.1);
+    }
+</style>
+""", unsafe_allow_html=True)
+
+ALL = "Toutes"
+
+def read_filters(version):
+    """Filtres saisis dans la barre latérale (None : filtre inactif)"""
+    with st.sidebar:
+        st.markdown("### 🎛️ Filtres")
+        collectivite = st.selectbox("Collectivité", [ALL] + db.dimension_values(version, 'collectivite'))
+        nature = st.selectbox("Nature", [ALL] + db.dimension_values(version, 'nature'))
+        years = db.acquisitions_by_year(version)['annee']
+        annee_min, annee_max = (int(years.min()), int(years.max())) if len(years) else (1900, 2100)
+        if annee_min < annee_max:
+            annees = st.slider("Année d'acquisition", annee_min, annee_max, (annee_min, annee_max))
+        else:
+            # une seule année : st.slider refuse min_value == max_value
+            st.caption(f"Année d'acquisition : {annee_min}")
+            annees = (annee_min, annee_max)
+        valeur_min = st.number_input("Valeur minimale (€)", min_value=0.0, value=0.0, step=1000.0)
+        valeur_max = st.number_input("Valeur maximale (€, 0 : sans limite)", min_value=0.0, value=0.0, step=1000.0)
+
+        st.markdown("### ↕️ Tri")
+        sort_label = st.selectbox("Trier par", list(db.SORT_KEYS.values()))
+        sort = next(key for key, label in db.SORT_KEYS.items() if label == sort_label)
+        descending = st.toggle("Ordre décroissant", value=sort != 'id')
+
+    filters = {
+        'collectivite': None if collectivite == ALL else collectivite,
+        'nature': None if nature == ALL else nature,
+        # bornes d'années inactives tant qu'elles couvrent toute la plage
+        'annee_min': annees[0] if annees[0] > annee_min else None,
+        'annee_max': annees[1] if annees[1] < annee_max else None,
+        'valeur_min': valeur_min or None,
+        'valeur_max': valeur_max or None,
+    }
+    return filters, sort, descending
+
+def format_euros(value):
+    """Formate un montant en euros (séparateur de milliers : espace)"""
+    if value is None or value != value:
+        return "-"
+    return f"{value:,.0f} €".replace(",", " ")
+
+def render_search(version, query):
+    """Affiche les résultats classés d'une recherche, correspondances surlignées"""
+    terms = search.query_terms(query)
+    if not terms:
+        st.warning(f"Saisissez au moins un mot de {search.MIN_TOKEN_SIZE} caractères.")
+        return
+    results = db.search_designations(version, query)
+    if results.empty:
+        st.info("Aucune désignation ne contient tous ces termes.")
+        return
+    st.caption(f"{len(results)} résultats les plus pertinents (limite : {db.SEARCH_LIMIT}) · toute la base, hors filtres")
+    for row in results.itertuples():
+        st.markdown(f"""
+        <div class="result-card">
+            <p class="result-title">{search.highlight(row.designation_des_ensembles, terms)}</p>
+            <p class="result-meta">N° {row.ndeg_immobilisation or '-'} · {row.collectivite or '-'} · {row.nature or '-'}
+            · {row.date_d_acquisition or '-'} · {format_euros(row.valeur_d_acquisition)}</p>
+        </div>
+        """, unsafe_allow_html=True)
+
+def render_snapshot_summary(table, filters):
+    """Synthèse des lignes filtrées, calculée sur l'instantané Arrow partagé"""
+    by_year = snapshot.summary_by_year(table, filters)
+    col1, col2 = st.columns(2)
+    col1.metric("🏢 Lignes filtrées", f"{int(by_year['nb_acquisitions'].sum()):,}".replace(",", " "),
+                help="Lignes datées correspondant aux filtres")
+    col2.metric("💶 Valeur d'acquisition", format_euros(by_year['valeur_acquisition'].sum()))
+    if not by_year.empty:
+        st.bar_chart(by_year, x="annee", y="valeur_acquisition")
+    st.caption(f"⚡ Instantané Arrow (version {snapshot.snapshot_version(table)}), projeté en mémoire et partagé par toutes les sessions")
+
+EXPORT_FORMATS = {"CSV": 'csv', "Parquet": 'parquet'}
+
+def render_export(version, filters):
+    """Export des lignes filtrées : encodage par tranches sur disque puis téléchargement"""
+    with st.expander("📤 Exporter les lignes filtrées"):
+        fmt = EXPORT_FORMATS[st.radio("Format", list(EXPORT_FORMATS), horizontal=True)]
+        signature = (version, tuple(sorted(filters.items())), fmt)
+        prepared = st.session_state.get('export_file')
+        if prepared is not None and (prepared[0] != signature or not os.path.exists(prepared[1])):
+            # export d'autres filtres (ou expiré) : fichier libéré
+            export.remove_export(prepared[1])
+            del st.session_state.export_file
+            prepared = None
+        if st.button("Préparer l'export"):
+            if prepared is not None:
+                export.remove_export(prepared[1])
+                del st.session_state.export_file
+                prepared = None
+            progress = st.empty()
+            try:
+                path, rows = export.export_rows(
+                    filters, fmt, on_progress=lambda done: progress.caption(f"⏳ {done:,} lignes encodées".replace(",", " "))
+                )
+            except export.ExportTooLarge:
+                progress.empty()
+                st.error(f"Export limité à {export.EXPORT_MAX_MB} Mo : affinez les filtres.")
+            else:
+                # la session ne garde que le chemin : le fichier est servi depuis le disque
+                prepared = st.session_state.export_file = (signature, path, rows)
+                progress.empty()
+
+        if prepared is not None:
+            _, path, rows = prepared
+            _, extension = export.FORMATS[fmt]
+            label = f"📥 Télécharger ({rows:,} lignes)".replace(",", " ")
+            st.markdown(
+                f'<a href="{export.export_url(path)}" download="immobilisations.{extension}">{label}</a>',
+                unsafe_allow_html=True,
+            )
+        st.caption(f"Lecture par curseur côté serveur, {export.EXPORT_CHUNK_ROWS} lignes par tranche ; "
+                   f"fichier conservé {export.EXPORT_TTL_S // 60} min")
+
+def render_explorer():
+    """Affiche la page courante et la navigation (pagination par clé)"""
+    version = db.data_version()
+    query = st.text_input("🔍 Rechercher dans les désignations", placeholder="ex. : école élémentaire")
+    if query.strip():
+        render_search(version, query)
+        return
+
+    filters, sort, descending = read_filters(version)
+
+    # Pile des curseurs de début de page ; remise à zéro si la requête change
+    signature = (version, tuple(sorted(filters.items())), sort, descending)
+    if st.session_state.get('explorer_query') != signature:
+        st.session_state.explorer_query = signature
+        st.session_state.explorer_cursors = [None]
+    cursors = st.session_state.explorer_cursors
+
+    table = snapshot.load_snapshot()
+    if table is not None:
+        render_snapshot_summary(table, filters)
+
+    page_size = db.EXPLORER_PAGE_SIZE
+    df = db.explore_page(version, filters, sort, descending, cursors[-1], page_size)
+    has_next = len(df) > page_size
+    page = df.iloc[:page_size]
+
+    if page.empty:
+        st.info("Aucune immobilisation ne correspond aux filtres.")
+    else:
+        st.dataframe(page, use_container_width=True, hide_index=True)
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col1:
+        st.button("⬅️ Précédente", disabled=len(cursors) == 1, use_container_width=True,
+                  on_click=cursors.pop)
+    with col2:
+        st.markdown(
+            f"<p style='text-align: center; color: white;'>Page {len(cursors)} · {len(page)} lignes</p>",
+            unsafe_allow_html=True
+        )
+    with col3:
+        # la page suivante commence après la dernière ligne affichée
+        next_cursor = db.page_cursor(page.iloc[-1], sort) if has_next else None
+        st.button("Suivante ➡️", disabled=not has_next, use_container_width=True,
+                  on_click=cursors.append, args=(next_cursor,))
+
+    st.caption(f"🔄 Version des données : {version} · {page_size} lignes par page, lues par l'index de tri")
+
+    render_export(version, filters)
+
+# Header
+st.markdown("""
+<div class="dashboard-header">
+    <h1>🔎 Explorateur des Immobilisations</h1>
+    <p style="color: #64748b; font-size: 1.1rem; margin-top: 0.5rem;">Parcours filtré et trié des lignes de la base</p>
+</div>
+""", unsafe_allow_html=True)
+
+try:
+    render_explorer()
+except Exception as e:
+    st.error(f"Base de données indisponible : {e}")
+
+# Footer
+st.markdown("---")
+st.markdown("""
+<div style="text-align: center; color: white; padding: 1rem;">
+    <p style="font-size: 0.9rem;">🔎 Explorateur - Tableau de Bord Immobilisations</p>
+</div>
+""", unsafe_allow_html=True)
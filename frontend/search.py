@@ -0,0 +1,125 @@
+"""Recherche plein texte dans les désignations des immobilisations.
+
+Sur MySQL, la recherche passe par l'index FULLTEXT ft_immob_designation
+(voir db.search_designations). Pour un autre moteur (base locale SQLite),
+ce module fournit un index inversé en mémoire, construit une fois par
+version des données : termes normalisés (minuscules, sans accents) ->
+identifiants des lignes, avec un score tf-idf proche du classement MySQL.
+
+Les deux chemins partagent la découpe de la requête en termes et la mise
+en évidence des correspondances.
+"""
+import re
+import html
+import math
+import unicodedata
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+# Longueur minimale d'un terme indexé (innodb_ft_min_token_size)
+MIN_TOKEN_SIZE = 3
+
+# Termes retenus au plus par requête
+MAX_QUERY_TERMS = 8
+
+_WORD = re.compile(r'\w+')
+
+
+def normalize(text: str) -> str:
+    """Minuscules sans accents (comparaison insensible comme utf8mb4_0900_ai_ci)."""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    """Termes normalisés d'un texte (les termes trop courts sont ignorés)."""
+    return [t for t in _WORD.findall(normalize(text or '')) if len(t) >= MIN_TOKEN_SIZE]
+
+
+def query_terms(query: str) -> List[str]:
+    """Termes distincts d'une requête saisie (opérateurs et ponctuation ignorés)."""
+    return list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+
+
+def boolean_query(terms: List[str]) -> str:
+    """Requête MATCH ... AGAINST en mode booléen : tous les termes, par préfixe."""
+    return ' '.join(f'+{term}*' for term in terms)
+
+
+def highlight(text: str, terms: List[str]) -> str:
+    """
+    Échappe `text` en HTML et entoure de <mark> les mots commençant par un terme.
+
+    Args:
+        text: Désignation d'origine
+        terms: Termes normalisés de la requête
+
+    Returns:
+        Fragment HTML
+    """
+    if not text:
+        return ''
+    parts, last = [], 0
+    for match in _WORD.finditer(text):
+        word = match.group()
+        if any(normalize(word).startswith(term) for term in terms):
+            parts.append(html.escape(text[last:match.start()]))
+            parts.append(f'<mark>{html.escape(word)}</mark>')
+            last = match.end()
+    parts.append(html.escape(text[last:]))
+    return ''.join(parts)
+
+
+class InvertedIndex:
+    """Index inversé des désignations : terme -> {id de ligne: occurrences}."""
+
+    def __init__(self, documents: Iterable[Tuple[int, str]]):
+        postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        count = 0
+        for doc_id, text in documents:
+            count += 1
+            for term, tf in Counter(tokenize(text)).items():
+                postings[term][doc_id] = tf
+        self.documents = count
+        self.postings = dict(postings)
+        # vocabulaire trié : les termes d'un préfixe sont contigus
+        self.vocabulary = sorted(self.postings)
+
+    def _expand(self, prefix: str) -> List[str]:
+        """Termes de l'index commençant par `prefix`."""
+        start = bisect_left(self.vocabulary, prefix)
+        end = start
+        while end < len(self.vocabulary) and self.vocabulary[end].startswith(prefix):
+            end += 1
+        return self.vocabulary[start:end]
+
+    def search(self, terms: List[str], limit: int = 50) -> List[Tuple[int, float]]:
+        """
+        Lignes contenant tous les termes (par préfixe), par pertinence décroissante.
+
+        Args:
+            terms: Termes normalisés (query_terms)
+            limit: Nombre maximal de résultats
+
+        Returns:
+            Liste de (id de ligne, score)
+        """
+        scores = None
+        for prefix in terms:
+            term_scores: Dict[int, float] = defaultdict(float)
+            for term in self._expand(prefix):
+                posting = self.postings[term]
+                idf = math.log(1 + self.documents / len(posting))
+                for doc_id, tf in posting.items():
+                    term_scores[doc_id] += (1 + math.log(tf)) * idf
+            if scores is None:
+                scores = term_scores
+            else:
+                # intersection : chaque terme est requis
+                scores = {doc_id: score + term_scores[doc_id]
+                          for doc_id, score in scores.items() if doc_id in term_scores}
+            if not scores:
+                return []
+        ranked = sorted((scores or {}).items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit]
@@ -0,0 +1,108 @@
+"""Instantané Arrow publié par l'ETL, projeté en mémoire.
+
+L'ETL écrit après chaque run un fichier Arrow IPC non compressé
+(FRONTEND_SNAPSHOT_PATH, volume partagé). Il est projeté en mémoire
+(mmap) une fois par processus et partagé par toutes les sessions : les
+colonnes pointent directement sur les pages du fichier, que le système
+garde une seule fois en cache quel que soit le nombre d'utilisateurs.
+
+Sélections de colonnes et tranches de lignes sont sans copie ; un filtre
+ne matérialise que les lignes retenues, un agrégat que son résultat.
+Un nouvel instantané (renommé par l'ETL) est détecté par sa date de
+modification ; l'ancien reste valide pour les lectures en cours.
+"""
+import os
+from typing import Optional
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc
+import streamlit as st
+
+SNAPSHOT_PATH = os.getenv('FRONTEND_SNAPSHOT_PATH', '')
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _map_snapshot(path: str, mtime_ns: int) -> pa.Table:
+    """Projette l'instantané en mémoire (une fois par fichier publié)."""
+    source = pa.memory_map(path, 'r')
+    return pa.ipc.open_file(source).read_all()
+
+
+def load_snapshot(path: str = SNAPSHOT_PATH) -> Optional[pa.Table]:
+    """
+    Table Arrow de l'instantané courant.
+
+    Returns:
+        Table partagée (lecture seule), None si aucun instantané n'est publié
+    """
+    if not path:
+        return None
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return _map_snapshot(path, mtime_ns)
+
+
+def snapshot_version(table: pa.Table) -> str:
+    """Version des données inscrite par l'ETL dans les métadonnées."""
+    return (table.schema.metadata or {}).get(b'data_version', b'').decode()
+
+
+# Filtre de l'explorateur -> (colonne, opérateur)
+FILTER_COLUMNS = {
+    'collectivite': ('collectivite', '=='),
+    'nature': ('nature', '=='),
+    'annee_min': ('annee_acquisition', '>='),
+    'annee_max': ('annee_acquisition', '<='),
+    'valeur_min': ('valeur_d_acquisition', '>='),
+    'valeur_max': ('valeur_d_acquisition', '<='),
+}
+
+
+def filter_expression(filters: dict):
+    """
+    Filtres de l'explorateur (voir db.filter_clauses) en expression Arrow.
+
+    Returns:
+        Expression pyarrow.compute, None si aucun filtre n'est actif
+    """
+    expression = None
+    for name, value in filters.items():
+        if value is None or name not in FILTER_COLUMNS:
+            continue
+        column, op = FILTER_COLUMNS[name]
+        field = pc.field(column)
+        condition = {'==': field == value, '>=': field >= value, '<=': field <= value}[op]
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def filtered(table: pa.Table, filters: dict, columns: list) -> pa.Table:
+    """Colonnes `columns` des lignes retenues (sans copie si aucun filtre n'est actif)."""
+    expression = filter_expression(filters)
+    if expression is None:
+        return table.select(columns)
+    used = [FILTER_COLUMNS[name][0] for name, value in filters.items()
+            if value is not None and name in FILTER_COLUMNS]
+    return table.select(list(dict.fromkeys(columns + used))).filter(expression).select(columns)
+
+
+def summary_by_year(table: pa.Table, filters: dict):
+    """
+    Nombre et valeur des acquisitions par année, pour les lignes filtrées.
+
+    Returns:
+        DataFrame (annee, nb_acquisitions, valeur_acquisition), trié par année
+    """
+    rows = filtered(table, filters, ['annee_acquisition', 'valeur_d_acquisition'])
+    grouped = rows.group_by('annee_acquisition').aggregate([
+        ([], 'count_all'),
+        ('valeur_d_acquisition', 'sum'),
+    ])
+    df = grouped.to_pandas().rename(columns={
+        'annee_acquisition': 'annee',
+        'count_all': 'nb_acquisitions',
+        'valeur_d_acquisition_sum': 'valeur_acquisition',
+    })
+    return df.dropna(subset=['annee']).sort_values('annee', ignore_index=True)
@@ -0,0 +1,75 @@
+import sys
+import os
+sys.path.insert(0, os.getcwd())
+import pytest
+from sqlalchemy import create_engine, text
+import db
+
+# Lignes de la table de faits : (collectivite, nature, valeur, date, designation)
+ROWS = [
+    ('VILLE', 'Batiments', 300.0, '2010-01-05', 'Ecole élémentaire Buffon'),
+    ('VILLE', 'Batiments', 100.0, '2011-03-01', 'Gymnase <Buffon> & piscine'),
+    ('VILLE', 'Mobilier', 200.0, '2012-06-15', 'Mobilier scolaire'),
+    ('DEPARTEMENT', 'Batiments', 100.0, '2009-09-09', 'College Buffon'),
+    ('DEPARTEMENT', 'Mobilier', None, '2015-02-02', 'Bureaux'),
+    ('DEPARTEMENT', 'Mobilier', 50.0, '2016-07-14', 'Ecole maternelle'),
+    ('VILLE', 'Batiments', 100.0, '2018-11-30', 'Piscine Pontoise'),
+]
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Base SQLite au schéma de la table de faits et de sa vue (un run validé)."""
+    monkeypatch.setenv('FRONTEND_DATABASE_URL', f"sqlite:///{tmp_path / 'frontend.db'}")
+    db.get_engine.clear()
+    engine = db.get_engine()
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE etl_runs (run_id INTEGER PRIMARY KEY, dataset_id TEXT, status TEXT)"))
+        conn.execute(text("CREATE TABLE dim_collectivite (id INTEGER PRIMARY KEY, libelle TEXT)"))
+        conn.execute(text("CREATE TABLE dim_nature (id INTEGER PRIMARY KEY, libelle TEXT)"))
+        conn.execute(text(
+            f"CREATE TABLE {db.FACT_TABLE} (id INTEGER PRIMARY KEY, ndeg_immobilisation TEXT, "
+            "publication TEXT, collectivite_id INTEGER, nature_id INTEGER, date_d_acquisition DATE, "
+            "designation_des_ensembles TEXT, valeur_d_acquisition NUMERIC, duree_amort INTEGER, "
+            "cumul_amort_anterieurs NUMERIC, vnc_debut_exercice NUMERIC, amort_exercice NUMERIC, "
+            "vnc_fin_exercice NUMERIC, taux_amortissement NUMERIC, amortissement_total NUMERIC, "
+            "pct_valeur_restante NUMERIC, annee_acquisition INTEGER, run_id INTEGER, first_run_id INTEGER, retired_run_id INTEGER)"
+        ))
+        conn.execute(text(
+            f"CREATE VIEW {db.SOURCE_VIEW} AS SELECT f.id, f.ndeg_immobilisation, f.publication, "
+            "collectivite.libelle AS collectivite, nature.libelle AS nature, f.date_d_acquisition, "
+            "f.designation_des_ensembles, f.valeur_d_acquisition, f.duree_amort, f.cumul_amort_anterieurs, "
+            "f.vnc_debut_exercice, f.amort_exercice, f.vnc_fin_exercice, f.taux_amortissement, "
+            "f.amortissement_total, f.pct_valeur_restante, f.annee_acquisition "
+            f"FROM {db.FACT_TABLE} f "
+            "LEFT JOIN dim_collectivite collectivite ON collectivite.id = f.collectivite_id "
+            "LEFT JOIN dim_nature nature ON nature.id = f.nature_id "
+            f"WHERE {db.VISIBLE_ROWS}"
+        ))
+        conn.execute(text("INSERT INTO dim_collectivite VALUES (1, 'VILLE'), (2, 'DEPARTEMENT')"))
+        conn.execute(text("INSERT INTO dim_nature VALUES (1, 'Batiments'), (2, 'Mobilier')"))
+        conn.execute(text("INSERT INTO etl_runs VALUES (1, :dataset, 'committed'), (2, :dataset, 'running')"),
+                     {'dataset': db.DATASET_ID})
+        collectivites, natures = {'VILLE': 1, 'DEPARTEMENT': 2}, {'Batiments': 1, 'Mobilier': 2}
+        conn.execute(
+            text(
+                f"INSERT INTO {db.FACT_TABLE} (id, ndeg_immobilisation, collectivite_id, nature_id, "
+                "valeur_d_acquisition, date_d_acquisition, designation_des_ensembles, duree_amort, "
+                "vnc_fin_exercice, annee_acquisition, run_id, first_run_id, retired_run_id) "
+                "VALUES (:id, :ndeg, :coll, :nature, :valeur, :date, :designation, 5, :valeur, "
+                ":annee, :run, :run, :retired)"
+            ),
+            [
+                {'id': i + 1, 'ndeg': f'N{i + 1}', 'coll': collectivites[coll], 'nature': natures[nature],
+                 'valeur': valeur, 'date': date, 'designation': designation,
+                 'annee': int(date[:4]), 'run': 1, 'retired': None}
+                for i, (coll, nature, valeur, date, designation) in enumerate(ROWS)
+            ]
+            # ligne d'un run en cours, ligne retirée par le run validé : invisibles
+            + [{'id': 99, 'ndeg': 'N99', 'coll': 1, 'nature': 1, 'valeur': 150.0, 'date': '2020-01-01',
+                'designation': 'Ecole en travaux', 'annee': 2020, 'run': 2, 'retired': None},
+               {'id': 98, 'ndeg': 'N98', 'coll': 1, 'nature': 1, 'valeur': 150.0, 'date': '2008-01-01',
+                'designation': 'Ecole démolie', 'annee': 2008, 'run': 0, 'retired': 1}]
+        )
+    yield engine
+    db.get_engine.clear()
@@ -0,0 +1,42 @@
+import sys
+import os
+sys.path.insert(0, os.getcwd())
+import pytest
+import db
+
+
+def _pages(filters, sort, descending, page_size=2):
+    """Parcourt toutes les pages de l'explorateur ; ids dans l'ordre affiché."""
+    ids, after = [], None
+    while True:
+        sql, params = db.keyset_query(filters, sort, descending, after, page_size + 1)
+        page = db.run_query(sql, **params)
+        ids.extend(page['id'].tolist()[:page_size])
+        if len(page) <= page_size:
+            return ids
+        after = db.page_cursor(page.iloc[page_size - 1], sort)
+
+
+def test_keyset_pages_follow_sort_key_then_id(database):
+    # valeurs ex aequo (100) départagées par id, valeur NULL exclue
+    assert _pages({}, 'valeur_d_acquisition', False) == [6, 2, 4, 7, 3, 1]
+    assert _pages({}, 'valeur_d_acquisition', True) == [1, 3, 7, 4, 2, 6]
+    assert _pages({}, 'id', False, page_size=3) == [1, 2, 3, 4, 5, 6, 7]
+    assert _pages({}, 'id', True, page_size=3) == [7, 6, 5, 4, 3, 2, 1]
+
+
+def test_keyset_filters_by_dimension_keys(database):
+    assert _pages({'nature': 'Batiments'}, 'valeur_d_acquisition', False) == [2, 4, 7, 1]
+    assert _pages({'collectivite': 'VILLE'}, 'date_d_acquisition', True) == [7, 3, 2, 1]
+    assert _pages({'collectivite': 'VILLE', 'nature': 'Batiments', 'valeur_min': 150},
+                  'valeur_d_acquisition', False) == [1]
+    assert _pages({'collectivite': 'inconnue'}, 'id', False) == []
+
+
+def test_keyset_cursor_is_strictly_after_the_last_row():
+    sql, params = db.keyset_query({}, 'valeur_d_acquisition', True, after=(100.0, 4), limit=3)
+    assert '(f.valeur_d_acquisition, f.id) < (:after_key, :after_id)' in sql
+    assert 'ORDER BY f.valeur_d_acquisition DESC, f.id DESC LIMIT :limit' in sql
+    assert params == {'after_key': 100.0, 'after_id': 4, 'limit': 3}
+    with pytest.raises(ValueError, match='Unknown sort key'):
+        db.keyset_query({}, 'designation_des_ensembles', False)
@@ -0,0 +1,60 @@
+import sys
+import os
+sys.path.insert(0, os.getcwd())
+import time
+from decimal import Decimal
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+import export
+
+
+@pytest.fixture
+def exports(tmp_path):
+    return tmp_path / 'exports'
+
+
+def test_csv_export_streams_filtered_rows_to_disk(database, exports):
+    progress = []
+    path, rows = export.export_rows({'nature': 'Batiments'}, 'csv', on_progress=progress.append,
+                                    directory=str(exports))
+    df = pd.read_csv(path, dtype=str)
+    assert rows == 4 and progress == [4]
+    assert path.endswith('.csv') and os.listdir(exports) == [os.path.basename(path)]
+    assert export.export_url(path) == f'app/static/exports/{os.path.basename(path)}'
+    assert df.columns.tolist() == export.EXPORT_SCHEMA.names
+    assert df['id'].tolist() == ['1', '2', '4', '7']
+    # montants à l'échelle de DECIMAL(14,2)
+    assert df['valeur_d_acquisition'].tolist() == ['300.00', '100.00', '100.00', '100.00']
+    header_only, none = export.export_rows({'collectivite': 'inconnue'}, 'csv', directory=str(exports))
+    assert none == 0
+    with open(header_only) as f:
+        assert f.read().strip() == ','.join(export.EXPORT_SCHEMA.names)
+
+
+def test_parquet_export_keeps_exact_decimals(database, exports):
+    path, rows = export.export_rows({}, 'parquet', directory=str(exports))
+    table = pq.read_table(path)
+    assert rows == 7
+    assert table.schema.equals(export.EXPORT_SCHEMA)
+    assert table.column('valeur_d_acquisition').to_pylist()[:2] == [Decimal('300.00'), Decimal('100.00')]
+    assert table.column('valeur_d_acquisition').to_pylist()[4] is None
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_export_stops_past_the_size_cap(database, exports, fmt):
+    with pytest.raises(export.ExportTooLarge, match='after 7 rows'):
+        export.export_rows({}, fmt, max_mb=0, directory=str(exports))
+    # fichier partiel supprimé : jamais servi
+    assert os.listdir(exports) == []
+
+
+def test_stale_exports_are_purged(database, exports):
+    stale, _ = export.export_rows({}, 'csv', directory=str(exports))
+    past = time.time() - export.EXPORT_TTL_S - 1
+    os.utime(stale, (past, past))
+    fresh, _ = export.export_rows({}, 'csv', directory=str(exports))
+    assert os.listdir(exports) == [os.path.basename(fresh)]
+    export.remove_export(fresh)
+    export.remove_export(fresh)
+    assert export.purge_exports(str(exports / 'missing')) == 0
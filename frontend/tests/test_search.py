@@ -0,0 +1,41 @@
+import sys
+import os
+sys.path.insert(0, os.getcwd())
+from search import InvertedIndex, boolean_query, highlight, query_terms
+
+DOCUMENTS = [
+    (1, 'École élémentaire Buffon'),
+    (2, 'Gymnase Buffon, piscine et école'),
+    (3, 'Piscine Pontoise'),
+    (4, 'Ecole ecole maternelle'),
+]
+
+
+def test_query_terms_are_normalized_and_deduplicated():
+    assert query_terms("L'École, école ; de Buffon") == ['ecole', 'buffon']
+    assert boolean_query(['ecole', 'buff']) == '+ecole* +buff*'
+
+
+def test_search_matches_prefixes_and_requires_every_term():
+    index = InvertedIndex(DOCUMENTS)
+    assert {doc for doc, _ in index.search(['pisc'])} == {2, 3}
+    # intersection : chaque terme (préfixe) est requis
+    assert {doc for doc, _ in index.search(['ecol', 'buff'])} == {1, 2}
+    assert index.search(['ecole', 'inconnu']) == []
+    assert index.search(['zzz']) == []
+
+
+def test_search_ranks_by_term_frequency_then_id():
+    index = InvertedIndex(DOCUMENTS)
+    ranked = index.search(['ecole'])
+    # deux occurrences dans le document 4 ; ex aequo ordonnés par id
+    assert [doc for doc, _ in ranked] == [4, 1, 2]
+    assert ranked[0][1] > ranked[1][1] == ranked[2][1]
+    assert index.search(['ecole'], limit=1) == ranked[:1]
+
+
+def test_highlight_escapes_html_around_marks():
+    fragment = highlight('Gymnase <Buffon> & École', ['buffon', 'ecole'])
+    assert fragment == 'Gymnase &lt;<mark>Buffon</mark>&gt; &amp; <mark>École</mark>'
+    assert highlight('<script>alert(1)</script>', []) == '&lt;script&gt;alert(1)&lt;/script&gt;'
+    assert highlight(None, ['ecole']) == ''
@@ -2,13 +2,32 @@
 CREATE DATABASE IF NOT EXISTS paris_immobilisations_db;
 USE paris_immobilisations_db;
 
--- Table structurée pour Immobilisations - Etat des Amortissements
-CREATE TABLE IF NOT EXISTS immobilisations_amortissements (
+-- Dimensions : libellés répétés remplacés par des clés SMALLINT dans la table de faits
+CREATE TABLE IF NOT EXISTS dim_publication (
+  id SMALLINT AUTO_INCREMENT PRIMARY KEY,
+  libelle VARCHAR(100) COLLATE utf8mb4_bin NOT NULL,
+  UNIQUE KEY uq_dim_publication_libelle (libelle)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS dim_collectivite (
+  id SMALLINT AUTO_INCREMENT PRIMARY KEY,
+  libelle VARCHAR(80) COLLATE utf8mb4_bin NOT NULL,
+  UNIQUE KEY uq_dim_collectivite_libelle (libelle)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS dim_nature (
+  id SMALLINT AUTO_INCREMENT PRIMARY KEY,
+  libelle VARCHAR(80) COLLATE utf8mb4_bin NOT NULL,
+  UNIQUE KEY uq_dim_nature_libelle (libelle)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Table de faits pour Immobilisations - Etat des Amortissements
+CREATE TABLE IF NOT EXISTS immobilisations_amortissements_fact (
   id BIGINT AUTO_INCREMENT PRIMARY KEY,
   ndeg_immobilisation VARCHAR(64) NULL,
-  publication VARCHAR(100),
-  collectivite VARCHAR(80),
-  nature VARCHAR(80),
+  publication_id SMALLINT,
+  collectivite_id SMALLINT,
+  nature_id SMALLINT,
   date_d_acquisition DATE,
   designation_des_ensembles TEXT,
   valeur_d_acquisition DECIMAL(14,2),
@@ -19,16 +38,464 @@ CREATE TABLE IF NOT EXISTS immobilisations_amortissements (
   vnc_fin_exercice DECIMAL(14,2),
   -- legacy columns removed: source_id, properties
   fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  -- Dernier run (etl_runs) qui a modifié la ligne : un rechargement à
+  -- l'identique ne la réécrit pas
+  run_id INT NULL,
+  -- Run qui a introduit la ligne (masque les lignes des runs non validés ;
+  -- annulation par suppression indexée)
+  first_run_id INT NULL,
+  -- Premier run validé dont la ligne était absente (supprimée à la source),
+  -- écrit à sa validation ; NULL tant que la source a la ligne
+  retired_run_id INT NULL,
+  -- Identité de la ligne source (clé métier ndeg/publication/collectivite et
+  -- rang parmi les lignes du run qui la partagent) : un rechargement met à jour
+  row_key BIGINT UNSIGNED NOT NULL,
+  -- Empreinte des valeurs source : une ligne inchangée n'est jamais réécrite
+  source_hash BIGINT UNSIGNED NOT NULL,
   -- Derived / KPI columns
   taux_amortissement DECIMAL(12,6) DEFAULT NULL,
   amortissement_total DECIMAL(14,2) DEFAULT NULL,
   pct_valeur_restante DECIMAL(6,2) DEFAULT NULL,
-  age_immobilisation DECIMAL(6,2) DEFAULT NULL,
-  annee_acquisition INT DEFAULT NULL,
-  mois_acquisition INT DEFAULT NULL,
-  jour_acquisition INT DEFAULT NULL,
-  trimestre_acquisition INT DEFAULT NULL
+  -- Composants de date générés par MySQL (l'âge est calculé par la vue)
+  annee_acquisition INT GENERATED ALWAYS AS (YEAR(date_d_acquisition)) STORED,
+  mois_acquisition INT GENERATED ALWAYS AS (MONTH(date_d_acquisition)) STORED,
+  jour_acquisition INT GENERATED ALWAYS AS (DAYOFMONTH(date_d_acquisition)) STORED,
+  trimestre_acquisition INT GENERATED ALWAYS AS (QUARTER(date_d_acquisition)) STORED,
+  UNIQUE KEY uq_immob_row_key (row_key),
+  INDEX idx_immob_source_hash (source_hash),
+  INDEX idx_immob_fetched_at (fetched_at),
+  INDEX idx_immob_run (run_id),
+  -- Annulation d'un run : lignes qu'il a introduites, paginées sur id
+  INDEX idx_immob_first_run (first_run_id, id),
+  INDEX idx_immob_retired (retired_run_id),
+  -- Pagination par clé (keyset) de l'explorateur : (clé de tri, id)
+  INDEX idx_immob_valeur (valeur_d_acquisition, id),
+  INDEX idx_immob_date (date_d_acquisition, id),
+  INDEX idx_immob_vnc (vnc_fin_exercice, id),
+  -- Mêmes recherches sous chaque combinaison des filtres de l'explorateur
+  -- (collectivité et nature, collectivité seule, nature seule) ; ils servent
+  -- aussi les clés étrangères des dimensions
+  INDEX idx_immob_coll_nature_valeur (collectivite_id, nature_id, valeur_d_acquisition, id),
+  INDEX idx_immob_coll_nature_date (collectivite_id, nature_id, date_d_acquisition, id),
+  INDEX idx_immob_coll_nature_vnc (collectivite_id, nature_id, vnc_fin_exercice, id),
+  INDEX idx_immob_coll_valeur (collectivite_id, valeur_d_acquisition, id),
+  INDEX idx_immob_coll_date (collectivite_id, date_d_acquisition, id),
+  INDEX idx_immob_coll_vnc (collectivite_id, vnc_fin_exercice, id),
+  INDEX idx_immob_nature_valeur (nature_id, valeur_d_acquisition, id),
+  INDEX idx_immob_nature_date (nature_id, date_d_acquisition, id),
+  INDEX idx_immob_nature_vnc (nature_id, vnc_fin_exercice, id),
+  -- Recherche plein texte des désignations (frontend)
+  FULLTEXT KEY ft_immob_designation (designation_des_ensembles),
+  FOREIGN KEY (publication_id) REFERENCES dim_publication (id),
+  FOREIGN KEY (collectivite_id) REFERENCES dim_collectivite (id),
+  FOREIGN KEY (nature_id) REFERENCES dim_nature (id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Ancienne table physique (avant les dimensions) : renommée pour libérer le nom de la vue
+SET @legacy_table := (
+  SELECT COUNT(*) FROM information_schema.TABLES
+  WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'immobilisations_amortissements'
+    AND TABLE_TYPE = 'BASE TABLE'
+);
+SET @ddl := IF(@legacy_table > 0,
+  'RENAME TABLE immobilisations_amortissements TO immobilisations_amortissements_legacy',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Suivi des runs ETL : checkpoint (offset validé) et compteurs par étape
+-- (créée avant la vue, qui n'expose que les lignes des runs validés)
+CREATE TABLE IF NOT EXISTS etl_runs (
+  run_id INT AUTO_INCREMENT PRIMARY KEY,
+  dataset_id VARCHAR(100) NOT NULL,
+  status VARCHAR(16) NOT NULL DEFAULT 'running',
+  started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  finished_at DATETIME NULL,
+  last_offset INT NOT NULL DEFAULT 0,
+  batches INT NOT NULL DEFAULT 0,
+  rows_extracted INT NOT NULL DEFAULT 0,
+  rows_transformed INT NOT NULL DEFAULT 0,
+  rows_loaded INT NOT NULL DEFAULT 0,
+  -- Identité de la source lue (manifeste du spool, NULL pour l'API) : un run
+  -- n'est repris que sur la même source
+  source_id VARCHAR(100) NULL,
+  -- Mesures du run (durée, débit, octets téléchargés, pic RSS, totaux par étape)
+  wall_time_s DOUBLE NULL,
+  rows_per_s DOUBLE NULL,
+  bytes_downloaded BIGINT NULL,
+  peak_rss_mb DOUBLE NULL,
+  stage_metrics JSON NULL,
+  INDEX idx_etl_runs_dataset_status (dataset_id, status)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Version des données visibles, incrémentée à chaque run validé ou annulé
+-- (clé des caches du frontend : lecture par clé primaire)
+CREATE TABLE IF NOT EXISTS etl_metadata (
+  name VARCHAR(64) NOT NULL PRIMARY KEY,
+  value BIGINT NOT NULL DEFAULT 0,
+  updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
--- create index for immobilisations (no IF NOT EXISTS)
-CREATE INDEX idx_immob_fetched_at ON immobilisations_amortissements(fetched_at);
+INSERT IGNORE INTO etl_metadata (name, value) VALUES ('data_version', 0);
+
+-- etl_runs créée avant le suivi de la source des runs (reprise d'un spool)
+SET @has_source_id := (
+  SELECT COUNT(*) FROM information_schema.COLUMNS
+  WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'etl_runs'
+    AND COLUMN_NAME = 'source_id'
+);
+SET @ddl := IF(@has_source_id = 0,
+  'ALTER TABLE etl_runs ADD COLUMN source_id VARCHAR(100) NULL AFTER rows_loaded',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Table de faits créée avant le suivi par run : ajout de run_id et de son index
+SET @has_run_id := (
+  SELECT COUNT(*) FROM information_schema.COLUMNS
+  WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'immobilisations_amortissements_fact'
+    AND COLUMN_NAME = 'run_id'
+);
+SET @ddl := IF(@has_run_id = 0,
+  'ALTER TABLE immobilisations_amortissements_fact ADD COLUMN run_id INT NULL AFTER fetched_at, ADD INDEX idx_immob_run (run_id)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Table de faits créée avant le suivi du run d'introduction : first_run_id = run_id
+SET @has_first_run := (
+  SELECT COUNT(*) FROM information_schema.COLUMNS
+  WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'immobilisations_amortissements_fact'
+    AND COLUMN_NAME = 'first_run_id'
+);
+SET @ddl := IF(@has_first_run = 0,
+  'ALTER TABLE immobilisations_amortissements_fact ADD COLUMN first_run_id INT NULL AFTER run_id',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+SET @ddl := IF(@has_first_run = 0,
+  'UPDATE immobilisations_amortissements_fact SET first_run_id = run_id',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Table de faits créée avant l'identité par clé métier : row_key remplace la
+-- clé unique sur source_hash (les lignes existantes gardent leur empreinte
+-- comme identité et sont remplacées par le run suivant)
+SET @has_row_key := (
+  SELECT COUNT(*) FROM information_schema.COLUMNS
+  WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'immobilisations_amortissements_fact'
+    AND COLUMN_NAME = 'row_key'
+);
+SET @ddl := IF(@has_row_key = 0,
+  'ALTER TABLE immobilisations_amortissements_fact ADD COLUMN row_key BIGINT UNSIGNED NULL AFTER first_run_id',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+SET @ddl := IF(@has_row_key = 0,
+  'UPDATE immobilisations_amortissements_fact SET row_key = source_hash',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+SET @ddl := IF(@has_row_key = 0,
+  'ALTER TABLE immobilisations_amortissements_fact MODIFY row_key BIGINT UNSIGNED NOT NULL, DROP INDEX uq_immob_source_hash, ADD UNIQUE KEY uq_immob_row_key (row_key), ADD INDEX idx_immob_source_hash (source_hash)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Table de faits créée avant le retrait des lignes absentes d'un run : les
+-- lignes que le dernier run validé n'a pas rechargées sont retirées par lui
+SET @has_retired := (
+  SELECT COUNT(*) FROM information_schema.COLUMNS
+  WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'immobilisations_amortissements_fact'
+    AND COLUMN_NAME = 'retired_run_id'
+);
+SET @ddl := IF(@has_retired = 0,
+  'ALTER TABLE immobilisations_amortissements_fact ADD COLUMN retired_run_id INT NULL AFTER first_run_id, ADD INDEX idx_immob_retired (retired_run_id)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+SET @latest_run := (SELECT MAX(run_id) FROM etl_runs WHERE status = 'committed' AND (dataset_id = 'immobilisations-etat-des-amortissements' OR dataset_id LIKE 'immobilisations-etat-des-amortissements:%'));
+SET @ddl := IF(@has_retired = 0 AND @latest_run IS NOT NULL,
+  CONCAT('UPDATE immobilisations_amortissements_fact SET retired_run_id = ', @latest_run, ' WHERE run_id < ', @latest_run),
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Table de faits créée avant l'annulation paginée : index des lignes par run d'introduction
+SET @has_first_run_idx := (
+  SELECT COUNT(*) FROM information_schema.STATISTICS
+  WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'immobilisations_amortissements_fact'
+    AND INDEX_NAME = 'idx_immob_first_run'
+);
+SET @ddl := IF(@has_first_run_idx = 0,
+  'ALTER TABLE immobilisations_amortissements_fact ADD INDEX idx_immob_first_run (first_run_id, id)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Table de faits créée avant l'explorateur : ajout des index de pagination
+SET @has_keyset_idx := (
+  SELECT COUNT(*) FROM information_schema.STATISTICS
+  WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'immobilisations_amortissements_fact'
+    AND INDEX_NAME = 'idx_immob_valeur'
+);
+SET @ddl := IF(@has_keyset_idx = 0,
+  'ALTER TABLE immobilisations_amortissements_fact ADD INDEX idx_immob_valeur (valeur_d_acquisition, id), ADD INDEX idx_immob_date (date_d_acquisition, id), ADD INDEX idx_immob_vnc (vnc_fin_exercice, id)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Table de faits créée avant les filtres de l'explorateur : index (dimensions, clé de tri, id)
+SET @has_filtered_keyset_idx := (
+  SELECT COUNT(*) FROM information_schema.STATISTICS
+  WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'immobilisations_amortissements_fact'
+    AND INDEX_NAME = 'idx_immob_coll_nature_valeur'
+);
+SET @ddl := IF(@has_filtered_keyset_idx = 0,
+  'ALTER TABLE immobilisations_amortissements_fact ADD INDEX idx_immob_coll_nature_valeur (collectivite_id, nature_id, valeur_d_acquisition, id), ADD INDEX idx_immob_coll_nature_date (collectivite_id, nature_id, date_d_acquisition, id), ADD INDEX idx_immob_coll_nature_vnc (collectivite_id, nature_id, vnc_fin_exercice, id)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Table de faits créée avant les filtres séparés de l'explorateur : index
+-- (dimension, clé de tri, id), qui remplacent les index des seules dimensions
+SET @has_single_filter_idx := (
+  SELECT COUNT(*) FROM information_schema.STATISTICS
+  WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'immobilisations_amortissements_fact'
+    AND INDEX_NAME = 'idx_immob_nature_valeur'
+);
+SET @ddl := IF(@has_single_filter_idx = 0,
+  'ALTER TABLE immobilisations_amortissements_fact ADD INDEX idx_immob_coll_valeur (collectivite_id, valeur_d_acquisition, id), ADD INDEX idx_immob_coll_date (collectivite_id, date_d_acquisition, id), ADD INDEX idx_immob_coll_vnc (collectivite_id, vnc_fin_exercice, id), ADD INDEX idx_immob_nature_valeur (nature_id, valeur_d_acquisition, id), ADD INDEX idx_immob_nature_date (nature_id, date_d_acquisition, id), ADD INDEX idx_immob_nature_vnc (nature_id, vnc_fin_exercice, id)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+SET @has_dimension_idx := (
+  SELECT COUNT(*) FROM information_schema.STATISTICS
+  WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'immobilisations_amortissements_fact'
+    AND INDEX_NAME = 'idx_immob_nature'
+);
+SET @ddl := IF(@has_dimension_idx > 0,
+  'ALTER TABLE immobilisations_amortissements_fact DROP INDEX idx_immob_collectivite_nature, DROP INDEX idx_immob_nature',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Table de faits créée avant la recherche plein texte : ajout de l'index FULLTEXT
+SET @has_fulltext := (
+  SELECT COUNT(*) FROM information_schema.STATISTICS
+  WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = 'immobilisations_amortissements_fact'
+    AND INDEX_NAME = 'ft_immob_designation'
+);
+SET @ddl := IF(@has_fulltext = 0,
+  'ALTER TABLE immobilisations_amortissements_fact ADD FULLTEXT KEY ft_immob_designation (designation_des_ensembles)',
+  'DO 0');
+PREPARE stmt FROM @ddl;
+EXECUTE stmt;
+DEALLOCATE PREPARE stmt;
+
+-- Vue de compatibilité : mêmes noms de colonnes que l'ancienne table (Superset),
+-- limitée aux lignes du dernier run validé du dataset (un run en cours ou en
+-- échec reste invisible ; l'ETL recrée la vue avec son DATASET_ID)
+CREATE OR REPLACE VIEW immobilisations_amortissements AS
+SELECT
+  f.id,
+  f.ndeg_immobilisation,
+  publication.libelle AS publication,
+  collectivite.libelle AS collectivite,
+  nature.libelle AS nature,
+  f.date_d_acquisition,
+  f.designation_des_ensembles,
+  f.valeur_d_acquisition,
+  f.duree_amort,
+  f.cumul_amort_anterieurs,
+  f.vnc_debut_exercice,
+  f.amort_exercice,
+  f.vnc_fin_exercice,
+  f.fetched_at,
+  f.run_id,
+  f.taux_amortissement,
+  f.amortissement_total,
+  f.pct_valeur_restante,
+  f.annee_acquisition,
+  f.mois_acquisition,
+  f.jour_acquisition,
+  f.trimestre_acquisition,
+  -- Champs relatifs à la date du jour, calculés à la lecture
+  ROUND(DATEDIFF(CURDATE(), f.date_d_acquisition) / 365.25, 2) AS age_immobilisation,
+  ROUND(GREATEST(f.duree_amort - DATEDIFF(CURDATE(), f.date_d_acquisition) / 365.25, 0), 2) AS duree_amort_restante
+FROM immobilisations_amortissements_fact f
+LEFT JOIN dim_publication publication ON publication.id = f.publication_id
+LEFT JOIN dim_collectivite collectivite ON collectivite.id = f.collectivite_id
+LEFT JOIN dim_nature nature ON nature.id = f.nature_id
+WHERE (f.first_run_id <= (SELECT MAX(run_id) FROM etl_runs WHERE status = 'committed' AND (dataset_id = 'immobilisations-etat-des-amortissements' OR dataset_id LIKE 'immobilisations-etat-des-amortissements:%'))
+    AND (f.retired_run_id IS NULL OR f.retired_run_id > (SELECT MAX(run_id) FROM etl_runs WHERE status = 'committed' AND (dataset_id = 'immobilisations-etat-des-amortissements' OR dataset_id LIKE 'immobilisations-etat-des-amortissements:%'))))
+  OR (f.first_run_id IS NULL AND (SELECT MAX(run_id) FROM etl_runs WHERE status = 'committed' AND (dataset_id = 'immobilisations-etat-des-amortissements' OR dataset_id LIKE 'immobilisations-etat-des-amortissements:%')) IS NULL);
+
+-- Projection vectorisée des plans d'amortissement (recalculée à chaque run)
+CREATE TABLE IF NOT EXISTS amortissement_projection (
+  immobilisation_id BIGINT NOT NULL,
+  annee SMALLINT NOT NULL,
+  dotation DECIMAL(14,2),
+  vnc DECIMAL(14,2),
+  PRIMARY KEY (immobilisation_id, annee)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Agrégat de la projection par nature et collectivité (0 = inconnue)
+CREATE TABLE IF NOT EXISTS amortissement_projection_agregat (
+  nature_id SMALLINT NOT NULL,
+  collectivite_id SMALLINT NOT NULL,
+  annee SMALLINT NOT NULL,
+  nb_actifs INT,
+  dotation DECIMAL(16,2),
+  vnc DECIMAL(16,2),
+  PRIMARY KEY (nature_id, collectivite_id, annee)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Mesures par lot et par étape (extract, transform, derive, profile, load)
+CREATE TABLE IF NOT EXISTS etl_batch_metrics (
+  run_id INT NOT NULL,
+  batch_no INT NOT NULL,
+  stage VARCHAR(16) NOT NULL,
+  wall_s DOUBLE,
+  db_s DOUBLE,
+  `rows` INT,
+  rows_per_s DOUBLE,
+  bytes BIGINT,
+  peak_rss_mb DOUBLE,
+  recorded_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (run_id, batch_no, stage)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Identités (row_key) attribuées par un run en cours, une ligne par lot
+-- validé : rang des clés métier répétées d'un lot à l'autre, relu par une
+-- reprise (voir etl/src/load/run_keys.py) ; supprimées à la fin du run
+CREATE TABLE IF NOT EXISTS etl_run_keys (
+  run_id INT NOT NULL,
+  batch_no INT NOT NULL,
+  row_keys MEDIUMBLOB NOT NULL,
+  PRIMARY KEY (run_id, batch_no)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Profil des données de chaque run, par colonne : statistiques, dérive par
+-- rapport au run validé précédent et résumés fusionnables (sketches)
+CREATE TABLE IF NOT EXISTS etl_profiles (
+  run_id INT NOT NULL,
+  column_name VARCHAR(64) NOT NULL,
+  `rows` BIGINT NOT NULL DEFAULT 0,
+  nulls BIGINT NOT NULL DEFAULT 0,
+  distinct_estimate BIGINT,
+  stats JSON,
+  drift JSON,
+  sketch MEDIUMBLOB NOT NULL,
+  updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (run_id, column_name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Lignes signalées par la détection d'anomalies (score robuste médiane/MAD
+-- dans leur groupe nature x collectivité)
+CREATE TABLE IF NOT EXISTS etl_anomalies (
+  id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  run_id INT NOT NULL,
+  source_hash BIGINT UNSIGNED,
+  ndeg_immobilisation VARCHAR(255),
+  collectivite VARCHAR(80),
+  nature VARCHAR(80),
+  column_name VARCHAR(64) NOT NULL,
+  value DOUBLE,
+  group_level VARCHAR(24) NOT NULL,
+  group_median DOUBLE,
+  group_mad DOUBLE,
+  score DOUBLE NOT NULL,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  INDEX idx_anomalies_run (run_id, column_name),
+  INDEX idx_anomalies_source_hash (source_hash)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Histogrammes par groupe de chaque run (référence du run suivant, reprise)
+-- et nombre de lignes notées et signalées par colonne
+CREATE TABLE IF NOT EXISTS etl_anomaly_stats (
+  run_id INT NOT NULL,
+  column_name VARCHAR(64) NOT NULL,
+  rows_scored BIGINT NOT NULL DEFAULT 0,
+  rows_flagged BIGINT NOT NULL DEFAULT 0,
+  `groups` INT NOT NULL DEFAULT 0,
+  histograms MEDIUMBLOB NOT NULL,
+  updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (run_id, column_name)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Index des quasi-doublons (MinHash/LSH sur les désignations) : signature
+-- de chaque ligne chargée, buckets LSH et paires retenues
+CREATE TABLE IF NOT EXISTS etl_minhash (
+  source_hash BIGINT UNSIGNED NOT NULL PRIMARY KEY,
+  run_id INT,
+  collectivite VARCHAR(80),
+  ndeg_immobilisation VARCHAR(255),
+  designation VARCHAR(255),
+  signature BLOB NOT NULL,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS etl_lsh_buckets (
+  bucket BIGINT NOT NULL,
+  source_hash BIGINT UNSIGNED NOT NULL,
+  PRIMARY KEY (bucket, source_hash),
+  INDEX idx_lsh_buckets_source_hash (source_hash)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS etl_near_duplicates (
+  id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  run_id INT,
+  collectivite VARCHAR(80),
+  source_hash BIGINT UNSIGNED NOT NULL,
+  match_hash BIGINT UNSIGNED NOT NULL,
+  ndeg_immobilisation VARCHAR(255),
+  match_ndeg VARCHAR(255),
+  similarity DOUBLE NOT NULL,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  INDEX idx_near_duplicates_source_hash (source_hash),
+  INDEX idx_near_duplicates_match_hash (match_hash),
+  INDEX idx_near_duplicates_run (run_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Lignes rejetées (échec de transformation ou de chargement) et leur erreur
+CREATE TABLE IF NOT EXISTS etl_dead_letters (
+  id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+  run_id INT,
+  stage VARCHAR(16) NOT NULL,
+  source_offset INT,
+  ndeg_immobilisation VARCHAR(255),
+  payload JSON,
+  error TEXT,
+  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+  INDEX idx_dead_letters_run (run_id, stage)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;